@@ -3,15 +3,35 @@ import os
 import secrets
 
 
+def admin_token_valido(token: str) -> bool:
+    """Confronto a tempo costante con ADMIN_TOKEN (False se non configurato)."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    return bool(admin_token and token) and secrets.compare_digest(token, admin_token)
+
+
 def verify_admin_token(x_admin_token: str = Header(...)):
     """
     Protegge gli endpoint admin tramite header X-Admin-Token.
     Imposta ADMIN_TOKEN nelle variabili d'ambiente Vercel.
     """
-    admin_token = os.getenv("ADMIN_TOKEN")
-    if not admin_token:
+    if not os.getenv("ADMIN_TOKEN"):
         raise HTTPException(
             status_code=503, detail="ADMIN_TOKEN non configurato sul server."
         )
-    if not secrets.compare_digest(x_admin_token, admin_token):
+    if not admin_token_valido(x_admin_token):
         raise HTTPException(status_code=403, detail="Token admin non valido.")
+
+
+def verify_cron_secret(authorization: str = Header("")):
+    """
+    Protegge gli endpoint chiamati dai cron di Vercel (vercel.json "crons"):
+    Vercel li chiama in GET con "Authorization: Bearer $CRON_SECRET".
+    """
+    cron_secret = os.getenv("CRON_SECRET")
+    if not cron_secret:
+        raise HTTPException(
+            status_code=503, detail="CRON_SECRET non configurato sul server."
+        )
+    token = authorization.removeprefix("Bearer ").strip()
+    if not (token and secrets.compare_digest(token, cron_secret)):
+        raise HTTPException(status_code=403, detail="Token cron non valido.")
@@ -0,0 +1,52 @@
+"""company_ai_usage
+
+Revision ID: l0m1n2o3p4q5
+Revises: k9l0m1n2o3p4
+Create Date: 2026-10-19 00:00:00.000000
+
+Quota AI aziendale su una sola riga: aggiunge Company.monthly_ai_usage e
+Company.last_monthly_reset, valorizzati con la somma dei membri per il mese
+corrente. Prima check_company_limits('ai_call') caricava tutti gli account
+dell'azienda e sommava in Python a ogni chiamata.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'l0m1n2o3p4q5'
+down_revision: Union[str, Sequence[str], None] = 'k9l0m1n2o3p4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'company',
+        sa.Column('monthly_ai_usage', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.add_column(
+        'company',
+        sa.Column('last_monthly_reset', sa.String(), nullable=True),
+    )
+
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    op.execute(
+        sa.text(
+            """
+            UPDATE company SET
+                monthly_ai_usage = COALESCE((
+                    SELECT SUM(a.monthly_ai_usage) FROM account a
+                    WHERE a.company_id = company.id AND a.last_monthly_reset = :mese
+                ), 0),
+                last_monthly_reset = :mese
+            """
+        ).bindparams(mese=current_month)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('company', 'last_monthly_reset')
+    op.drop_column('company', 'monthly_ai_usage')
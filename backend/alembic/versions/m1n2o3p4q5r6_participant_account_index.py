@@ -0,0 +1,31 @@
+"""participant_account_index
+
+Revision ID: m1n2o3p4q5r6
+Revises: l0m1n2o3p4q5
+Create Date: 2026-10-19 00:10:00.000000
+
+Indice composito Participant(account_id, is_active, trip_id): la lista
+viaggi a cursore (/trips/my-trips) ricava gli id dei viaggi dell'utente
+dal solo indice.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = 'm1n2o3p4q5r6'
+down_revision: Union[str, Sequence[str], None] = 'l0m1n2o3p4q5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_participant_account_active_trip',
+        'participant',
+        ['account_id', 'is_active', 'trip_id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_participant_account_active_trip', table_name='participant')
@@ -0,0 +1,77 @@
+"""vote_tally
+
+Revision ID: n2o3p4q5r6s7
+Revises: m1n2o3p4q5r6
+Create Date: 2026-10-19 00:20:00.000000
+
+Conteggio incrementale dei voti (services/vote_tally): aggiunge
+Proposal.vote_score, Participant.has_voted e Trip.voters_count, valorizzati
+dai voti esistenti, e il vincolo di unicita' (proposal_id, user_id) su vote.
+I voti doppi gia' presenti vengono ridotti al piu' recente.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'n2o3p4q5r6s7'
+down_revision: Union[str, Sequence[str], None] = 'm1n2o3p4q5r6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'proposal',
+        sa.Column('vote_score', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.add_column(
+        'participant',
+        sa.Column('has_voted', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.add_column(
+        'trip',
+        sa.Column('voters_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    op.execute(
+        """
+        DELETE FROM vote WHERE id NOT IN (
+            SELECT MAX(id) FROM vote GROUP BY proposal_id, user_id
+        )
+        """
+    )
+    with op.batch_alter_table('vote') as batch_op:
+        batch_op.create_unique_constraint('uq_vote_proposal_user', ['proposal_id', 'user_id'])
+
+    op.execute(
+        """
+        UPDATE proposal SET vote_score = COALESCE((
+            SELECT SUM(v.score) FROM vote v WHERE v.proposal_id = proposal.id
+        ), 0)
+        """
+    )
+    op.execute(
+        """
+        UPDATE participant SET has_voted = EXISTS (
+            SELECT 1 FROM vote v WHERE v.user_id = participant.id
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE trip SET voters_count = (
+            SELECT COUNT(*) FROM participant p
+            WHERE p.trip_id = trip.id AND p.has_voted
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('vote') as batch_op:
+        batch_op.drop_constraint('uq_vote_proposal_user', type_='unique')
+    op.drop_column('trip', 'voters_count')
+    op.drop_column('participant', 'has_voted')
+    op.drop_column('proposal', 'vote_score')
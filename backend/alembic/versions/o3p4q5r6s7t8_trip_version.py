@@ -0,0 +1,36 @@
+"""trip_version
+
+Revision ID: o3p4q5r6s7t8
+Revises: n2o3p4q5r6s7
+Create Date: 2026-10-19 00:30:00.000000
+
+Trip.version e Trip.updated_at, incrementati a ogni scrittura sul viaggio o
+sui suoi dati (services/trip_changes): ETag e Last-Modified delle letture
+(utils/conditional.py).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'o3p4q5r6s7t8'
+down_revision: Union[str, Sequence[str], None] = 'n2o3p4q5r6s7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'trip',
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.add_column(
+        'trip',
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('trip', 'updated_at')
+    op.drop_column('trip', 'version')
@@ -0,0 +1,43 @@
+"""trip_change_log
+
+Revision ID: p4q5r6s7t8u9
+Revises: o3p4q5r6s7t8
+Create Date: 2026-10-19 00:40:00.000000
+
+Registro tripchange per la sincronizzazione incrementale
+(GET /trips/{id}/changes): una riga per ogni riga di itinerario, spese,
+partecipanti, foto e voti inserita, modificata o cancellata. Parte vuoto:
+i client senza cursore ricevono lo stato completo.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'p4q5r6s7t8u9'
+down_revision: Union[str, Sequence[str], None] = 'o3p4q5r6s7t8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tripchange',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('trip_id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['trip_id'], ['trip.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_tripchange_trip_id_id', 'tripchange', ['trip_id', 'id'])
+    op.create_index('ix_tripchange_created_at', 'tripchange', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tripchange_created_at', table_name='tripchange')
+    op.drop_index('ix_tripchange_trip_id_id', table_name='tripchange')
+    op.drop_table('tripchange')
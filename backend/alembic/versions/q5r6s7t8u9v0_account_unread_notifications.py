@@ -0,0 +1,39 @@
+"""account_unread_notifications
+
+Revision ID: q5r6s7t8u9v0
+Revises: p4q5r6s7t8u9
+Create Date: 2026-10-19 02:00:00.000000
+
+Account.unread_notifications: contatore delle notifiche non lette, tenuto
+aggiornato a ogni inserimento e lettura (services/unread_counter). Il
+backfill lo parte dal COUNT attuale.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'q5r6s7t8u9v0'
+down_revision: Union[str, Sequence[str], None] = 'p4q5r6s7t8u9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'account',
+        sa.Column('unread_notifications', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.execute(
+        """
+        UPDATE account SET unread_notifications = (
+            SELECT COUNT(*) FROM notification
+            WHERE notification.account_id = account.id AND notification.is_read = false
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('account', 'unread_notifications')
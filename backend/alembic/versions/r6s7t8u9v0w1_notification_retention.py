@@ -0,0 +1,57 @@
+"""notification_retention
+
+Revision ID: r6s7t8u9v0w1
+Revises: q5r6s7t8u9v0
+Create Date: 2026-10-19 03:00:00.000000
+
+Indice composto (account_id, is_read, created_at) su notification al posto
+di quello sul solo account_id: serve la lista paginata per data e il
+conteggio delle non lette. Tabella fredda notification_archive per le
+notifiche lette piu' vecchie di NOTIF_ARCHIVE_DAYS
+(services/notification_service.archivia_notifiche).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'r6s7t8u9v0w1'
+down_revision: Union[str, Sequence[str], None] = 'q5r6s7t8u9v0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_notification_account_read_created',
+        'notification',
+        ['account_id', 'is_read', 'created_at'],
+    )
+    op.drop_index('ix_notification_account_id', table_name='notification')
+
+    op.create_table(
+        'notification_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('message', sa.String(), nullable=False),
+        sa.Column('trip_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['account.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_notification_archive_account_created',
+        'notification_archive',
+        ['account_id', 'created_at'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_archive_account_created', table_name='notification_archive')
+    op.drop_table('notification_archive')
+    op.create_index('ix_notification_account_id', 'notification', ['account_id'])
+    op.drop_index('ix_notification_account_read_created', table_name='notification')
@@ -0,0 +1,48 @@
+"""invite_batch
+
+Revision ID: t8u9v0w1x2y3
+Revises: s7t8u9v0w1x2
+Create Date: 2026-10-19 05:00:00.000000
+
+Tabella invite_batch per gli inviti massivi e colonna email_outbox.batch_id
+per leggere lo stato di ogni destinatario.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 't8u9v0w1x2y3'
+down_revision: Union[str, Sequence[str], None] = 's7t8u9v0w1x2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'invite_batch',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('invalid', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['company.id']),
+        sa.ForeignKeyConstraint(['created_by'], ['account.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_invite_batch_company_id', 'invite_batch', ['company_id'])
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.add_column(sa.Column('batch_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_email_outbox_batch_id', 'invite_batch', ['batch_id'], ['id'])
+        batch_op.create_index('ix_email_outbox_batch_id', ['batch_id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.drop_index('ix_email_outbox_batch_id')
+        batch_op.drop_constraint('fk_email_outbox_batch_id', type_='foreignkey')
+        batch_op.drop_column('batch_id')
+    op.drop_index('ix_invite_batch_company_id', table_name='invite_batch')
+    op.drop_table('invite_batch')
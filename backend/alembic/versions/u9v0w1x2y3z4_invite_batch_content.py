@@ -0,0 +1,43 @@
+"""invite_batch_content
+
+Revision ID: u9v0w1x2y3z4
+Revises: t8u9v0w1x2y3
+Create Date: 2026-10-19 09:00:00.000000
+
+Oggetto e HTML dell'invito una volta sola su invite_batch: le righe di
+email_outbox di un invio massivo li lasciano NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'u9v0w1x2y3z4'
+down_revision: Union[str, Sequence[str], None] = 't8u9v0w1x2y3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('invite_batch') as batch_op:
+        batch_op.add_column(sa.Column('subject', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('html', sa.String(), nullable=True))
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.alter_column('subject', existing_type=sa.String(), nullable=True)
+        batch_op.alter_column('html', existing_type=sa.String(), nullable=True)
+
+
+def downgrade() -> None:
+    # Le righe di un invio massivo riprendono oggetto e corpo dal loro batch.
+    op.execute(
+        "UPDATE email_outbox SET subject = (SELECT subject FROM invite_batch WHERE invite_batch.id = email_outbox.batch_id), "
+        "html = (SELECT html FROM invite_batch WHERE invite_batch.id = email_outbox.batch_id) "
+        "WHERE html IS NULL AND batch_id IS NOT NULL"
+    )
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.alter_column('html', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('subject', existing_type=sa.String(), nullable=False)
+    with op.batch_alter_table('invite_batch') as batch_op:
+        batch_op.drop_column('html')
+        batch_op.drop_column('subject')
@@ -0,0 +1,134 @@
+"""
+Benchmark della resa PDF (services/pdf_service via services/pdf_render).
+
+Misura quanto tempo tiene occupata la CPU un PDF al crescere dei dati:
+per ogni combinazione di righe di itinerario e di spese rende il PDF del
+viaggio ("trip") e la nota spese ("nota_spese") con dati sintetici e stampa
+il tempo migliore su --runs ripetizioni e la dimensione del file.
+
+E' il tempo che, prima del pool, ogni altra richiesta dello stesso worker
+passava ad aspettare; ora e' il tempo di occupazione di un processo del pool.
+Serve a scegliere PDF_RENDER_WORKERS, PDF_RENDER_TIMEOUT e da quante righe
+conviene suggerire mode=job.
+
+Con --pool N misura anche il giro completo attraverso il pool (pickle delle
+istantanee, processo figlio, ritorno dei byte) con N rese concorrenti.
+
+Uso (dalla cartella backend):
+    python bench_pdf_render.py
+    python bench_pdf_render.py --itinerary 10 100 --expenses 10 100 1000
+    python bench_pdf_render.py --pool 2
+    python bench_pdf_render.py --json      # per confronti automatici
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import time
+from types import SimpleNamespace
+
+from services import pdf_render
+
+CATEGORIE = ["Cibo", "Trasporti", "Alloggio", "Attività", "Altro"]
+
+
+def _dati(tipo: str, righe_itinerario: int, righe_spese: int) -> dict:
+    trip = SimpleNamespace(
+        name="Offsite Lisbona", destination="Lisbona", real_destination="Lisbona, PT",
+        start_date="2026-05-02", end_date="2026-05-09", accommodation="Hotel Avenida",
+        accommodation_location="Av. da Liberdade", budget=4000.0, budget_max=5000.0, status="APPROVED",
+    )
+    itinerario = [
+        SimpleNamespace(
+            start_time=f"2026-05-{2 + i % 7:02d}T{8 + i % 12:02d}:00",
+            title=f"Tappa {i}", description="Visita guidata con pranzo incluso",
+        )
+        for i in range(righe_itinerario)
+    ]
+    spese = [
+        SimpleNamespace(
+            date=f"2026-05-{2 + i % 7:02d}", description=f"Ricevuta n. {i} - Ristorante Tasca",
+            category=CATEGORIE[i % len(CATEGORIE)], amount=12.5 + i % 90,
+        )
+        for i in range(righe_spese)
+    ]
+    if tipo == "trip":
+        return pdf_render.dati_viaggio(trip, itinerario, spese, "it")
+    account = SimpleNamespace(name="Giulia", surname="Bianchi", email="giulia@acme.it")
+    company = SimpleNamespace(name="Acme S.p.A.", max_budget_per_trip=5000.0)
+    return pdf_render.dati_nota_spese(trip, account, company, spese)
+
+
+def misura(tipo: str, dati: dict, runs: int) -> tuple:
+    funzione = pdf_render._funzione(tipo)
+    migliore = float("inf")
+    for _ in range(runs):
+        gc.collect()
+        inizio = time.perf_counter()
+        pdf = funzione(**dati)
+        migliore = min(migliore, time.perf_counter() - inizio)
+    return migliore, len(pdf)
+
+
+def misura_pool(tipo: str, dati: dict, concorrenti: int) -> float:
+    async def giro():
+        inizio = time.perf_counter()
+        await asyncio.gather(*(pdf_render.attendi(tipo, dati) for _ in range(concorrenti)))
+        return time.perf_counter() - inizio
+
+    return asyncio.run(giro())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itinerary", type=int, nargs="+", default=[10, 50, 200], help="righe di itinerario")
+    parser.add_argument("--expenses", type=int, nargs="+", default=[10, 100, 500], help="righe di spesa")
+    parser.add_argument("--runs", type=int, default=3, help="ripetizioni (vale la migliore)")
+    parser.add_argument("--pool", type=int, default=0, help="processi del pool (0 = solo resa diretta)")
+    parser.add_argument("--json", action="store_true", help="output JSON")
+    args = parser.parse_args()
+
+    if args.pool:
+        pdf_render.PDF_RENDER_WORKERS = args.pool
+        pdf_render.PDF_RENDER_MAX_QUEUE = max(pdf_render.PDF_RENDER_MAX_QUEUE, args.pool)
+        # Avvio dei processi fuori dalla misura.
+        misura_pool("trip", _dati("trip", 1, 1), args.pool)
+
+    risultati = []
+    try:
+        for tipo in ("trip", "nota_spese"):
+            # La nota spese non ha itinerario: una sola riga per numero di spese.
+            itinerari = args.itinerary if tipo == "trip" else [0]
+            for righe_itinerario in itinerari:
+                for righe_spese in args.expenses:
+                    dati = _dati(tipo, righe_itinerario, righe_spese)
+                    secondi, dimensione = misura(tipo, dati, args.runs)
+                    riga = {
+                        "kind": tipo, "itinerary": righe_itinerario, "expenses": righe_spese,
+                        "seconds": round(secondi, 6), "bytes": dimensione,
+                    }
+                    if args.pool:
+                        riga["pool_seconds"] = round(misura_pool(tipo, dati, args.pool), 6)
+                    risultati.append(riga)
+    finally:
+        pdf_render.chiudi()
+
+    if args.json:
+        print(json.dumps({"runs": args.runs, "pool": args.pool, "results": risultati}, indent=2))
+        return
+
+    print(f"Resa PDF, migliore di {args.runs} giri" + (f", pool da {args.pool} processi" if args.pool else "") + "\n")
+    intestazione = f"{'tipo':<11} {'itin.':>6} {'spese':>6} {'ms':>9} {'KB':>7}"
+    if args.pool:
+        intestazione += f" {'pool ms (x' + str(args.pool) + ')':>16}"
+    print(intestazione)
+    for r in risultati:
+        riga = f"{r['kind']:<11} {r['itinerary']:>6} {r['expenses']:>6} {r['seconds'] * 1000:>9.1f} {r['bytes'] / 1024:>7.1f}"
+        if args.pool:
+            riga += f" {r['pool_seconds'] * 1000:>16.1f}"
+        print(riga)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,251 @@
 import hashlib
 import logging
 import os
+import threading
+import time
+from collections import deque
 
 from dotenv import load_dotenv
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 from sqlmodel import create_engine, Session
 
+from services.metrics import REGISTRY, counter, gauge, histogram
+from services.timing import traccia_query
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Replica in sola lettura (opzionale). Se assente, le letture pesanti restano
+# sul primario e get_read_session equivale a get_session.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 
-if DATABASE_URL:
+
+def _impronta(url: str) -> str:
     # Impronta della connection string, per capire se il valore configurato
     # nell'ambiente e' quello atteso senza mai stamparne il contenuto.
     # Un fallimento di autenticazione non distingue "password sbagliata" da
     # "variabile con uno spazio in fondo" o "troncata": questi tre numeri si'.
-    logger.info(
-        "Using PostgreSQL: %s... (len=%d fp=%s pulita=%s)",
-        DATABASE_URL[:30],
-        len(DATABASE_URL),
-        hashlib.sha256(DATABASE_URL.encode()).hexdigest()[:8],
-        DATABASE_URL == DATABASE_URL.strip(),
+    return "%s... (len=%d fp=%s pulita=%s)" % (
+        url[:30],
+        len(url),
+        hashlib.sha256(url.encode()).hexdigest()[:8],
+        url == url.strip(),
     )
 
+
+_ATTESA_CHECKOUT = histogram(
+    "db_pool_checkout_wait_seconds",
+    "Attesa per ottenere una connessione dal pool",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class StatistichePool:
+    """Contatori di un pool di connessioni, aggiornati dagli eventi SQLAlchemy.
+
+    L'attesa al checkout (quanto una richiesta resta ferma ad aspettare una
+    connessione libera) e i timeout non hanno un evento dedicato: li misura
+    _QueuePoolStrumentato. Il resto arriva da checkout/checkin/connect/invalidate.
+    """
+
+    CAMPIONI = 1000  # ultime attese tenute per i percentili
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.checkouts = 0
+        self.checkins = 0
+        self.connessioni_aperte = 0
+        self.invalidazioni = 0
+        self.timeouts = 0
+        self.attese_totali = 0
+        self.attesa_totale_s = 0.0
+        self.attesa_max_s = 0.0
+        self._attese = deque(maxlen=self.CAMPIONI)
+        self._lock = threading.Lock()
+
+    def registra_attesa(self, secondi: float):
+        with self._lock:
+            self.attese_totali += 1
+            self.attesa_totale_s += secondi
+            self.attesa_max_s = max(self.attesa_max_s, secondi)
+            self._attese.append(secondi)
+        _ATTESA_CHECKOUT.observe(secondi, pool=self.nome)
+
+    def _incrementa(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def _percentile(self, ordinati, q: float) -> float:
+        if not ordinati:
+            return 0.0
+        return ordinati[min(len(ordinati) - 1, int(q * len(ordinati)))]
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            ordinati = sorted(self._attese)
+            attese = {
+                "count": self.attese_totali,
+                "avg_ms": round(self.attesa_totale_s / self.attese_totali * 1000, 3) if self.attese_totali else 0.0,
+                "p50_ms": round(self._percentile(ordinati, 0.50) * 1000, 3),
+                "p95_ms": round(self._percentile(ordinati, 0.95) * 1000, 3),
+                "p99_ms": round(self._percentile(ordinati, 0.99) * 1000, 3),
+                "max_ms": round(self.attesa_max_s * 1000, 3),
+            }
+            contatori = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connessioni_aperte,
+                "invalidations": self.invalidazioni,
+                "timeouts": self.timeouts,
+            }
+
+        stato = {"pool_class": type(pool).__name__, "in_use": contatori["checkouts"] - contatori["checkins"]}
+        if isinstance(pool, QueuePool):
+            stato.update({
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout_s": pool.timeout(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                # overflow() parte da -size: conta solo le connessioni oltre pool_size
+                "overflow": max(pool.overflow(), 0),
+            })
+        return {**stato, **contatori, "checkout_wait": attese}
+
+
+class _QueuePoolStrumentato(QueuePool):
+    # Sottoclassi concrete create da _classe_pool: recreate() (dopo dispose)
+    # istanzia self.__class__, quindi le statistiche sopravvivono al ricambio.
+    _statistiche: StatistichePool
+
+    def _do_get(self):
+        inizio = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            self._statistiche._incrementa("timeouts")
+            logger.warning(f"[DBPool] Timeout al checkout sul pool {self._statistiche.nome}: {self.status()}")
+            raise
+        self._statistiche.registra_attesa(time.perf_counter() - inizio)
+        return conn
+
+
+def _classe_pool(statistiche: StatistichePool):
+    return type(f"QueuePool_{statistiche.nome}", (_QueuePoolStrumentato,), {"_statistiche": statistiche})
+
+
+# Statistiche per engine ("primario", "replica"), lette da /health/db-pool.
+POOL_STATS: dict = {}
+
+
+def strumenta_engine(eng, nome: str, statistiche: StatistichePool = None) -> StatistichePool:
+    """Aggancia i contatori del pool a un engine e li registra in POOL_STATS."""
+    statistiche = statistiche or StatistichePool(nome)
+    # Gli eventi registrati sull'engine valgono anche per i pool ricreati.
+    event.listen(eng, "checkout", lambda *a: statistiche._incrementa("checkouts"))
+    event.listen(eng, "checkin", lambda *a: statistiche._incrementa("checkins"))
+    event.listen(eng, "connect", lambda *a: statistiche._incrementa("connessioni_aperte"))
+    event.listen(eng, "invalidate", lambda *a: statistiche._incrementa("invalidazioni"))
+    POOL_STATS[nome] = statistiche
+    return statistiche
+
+
+def _env_numero(nomi, default, tipo=int):
+    # Il primo nome valorizzato vince: DB_READ_POOL_SIZE prima di DB_POOL_SIZE.
+    for nome in nomi:
+        valore = os.getenv(nome)
+        if valore not in (None, ""):
+            try:
+                return tipo(valore)
+            except ValueError:
+                logger.warning(f"[DBPool] {nome}={valore!r} non valido, uso {default}")
+    return default
+
+
+def parametri_pool(url: str, prefissi=("DB",)) -> dict:
+    """Dimensionamento del pool, sovrascrivibile da ambiente senza toccare il codice.
+
+    Variabili: <PREFISSO>_POOL_SIZE, _MAX_OVERFLOW, _POOL_TIMEOUT, _POOL_RECYCLE.
+    Per la replica si leggono prima le DB_READ_*, poi le DB_* come fallback.
+    """
     # Supabase Supavisor/pgbouncer (URL contiene "pooler"): usa transaction-mode pooling.
     # In questo caso SQLAlchemy non deve gestire il pool — ci pensa pgbouncer.
     # Direct connection (porta 5432): SQLAlchemy gestisce il pool direttamente.
     # Supabase free tier ha solo 2 connessioni dirette → usare sempre l'URL pooler in prod.
-    is_pooler = "pooler" in DATABASE_URL or "pgbouncer" in DATABASE_URL
+    is_pooler = "pooler" in url or "pgbouncer" in url
+
+    def nomi(suffisso):
+        return [f"{p}_{suffisso}" for p in prefissi]
+
+    return {
+        # Con pgbouncer/Supavisor: disabilita il pool SQLAlchemy (usa NullPool equivalente)
+        "pool_size": _env_numero(nomi("POOL_SIZE"), 0 if is_pooler else 5),
+        "max_overflow": _env_numero(nomi("MAX_OVERFLOW"), -1 if is_pooler else 10),
+        "pool_timeout": _env_numero(nomi("POOL_TIMEOUT"), 30.0, float),
+        "pool_recycle": _env_numero(nomi("POOL_RECYCLE"), 300),
+    }
 
-    engine = create_engine(
-        DATABASE_URL,
+
+def _crea_engine_postgres(url: str, nome: str, prefissi=("DB",)):
+    parametri = parametri_pool(url, prefissi)
+    statistiche = StatistichePool(nome)
+    nuovo = create_engine(
+        url,
         echo=False,
         pool_pre_ping=True,
-        pool_recycle=300,
-        # Con pgbouncer/Supavisor: disabilita il pool SQLAlchemy (usa NullPool equivalente)
-        pool_size=0 if is_pooler else 5,
-        max_overflow=-1 if is_pooler else 10,
+        poolclass=_classe_pool(statistiche),
+        **parametri,
     )
-    logger.info(f"DB pool mode: {'supavisor/pgbouncer (pool_size=0)' if is_pooler else 'direct (pool_size=5, max_overflow=10)'}")
+    strumenta_engine(nuovo, nome, statistiche)
+    logger.info(f"DB pool [{nome}]: {parametri}")
+    return nuovo
+
+
+if DATABASE_URL:
+    logger.info("Using PostgreSQL: %s", _impronta(DATABASE_URL))
+    engine = _crea_engine_postgres(DATABASE_URL, "primario")
 else:
     logger.warning("DATABASE_URL not found, using SQLite fallback (IN-MEMORY)")
     engine = create_engine("sqlite://", connect_args={"check_same_thread": False})
+    strumenta_engine(engine, "primario")
+
+if DATABASE_READ_URL:
+    logger.info("Using read replica: %s", _impronta(DATABASE_READ_URL))
+    read_engine = _crea_engine_postgres(DATABASE_READ_URL, "replica", prefissi=("DB_READ", "DB"))
+else:
+    read_engine = engine
+
+# Ogni query diventa uno span "db" (Server-Timing, log richieste lente).
+traccia_query(engine)
+if read_engine is not engine:
+    traccia_query(read_engine)
+
+_POOL_IN_USO = gauge("db_pool_connections_in_use", "Connessioni in uso (checkout)", ["pool"])
+_POOL_LIBERE = gauge("db_pool_connections_idle", "Connessioni aperte e libere nel pool", ["pool"])
+_POOL_OVERFLOW = gauge("db_pool_overflow", "Connessioni aperte oltre pool_size", ["pool"])
+_POOL_CHECKOUTS = counter("db_pool_checkouts_total", "Checkout di connessioni dal pool", ["pool"])
+_POOL_TIMEOUTS = counter("db_pool_checkout_timeouts_total", "Checkout falliti per pool esaurito", ["pool"])
+
+
+@REGISTRY.collettore
+def _esporta_statistiche_pool():
+    # Gli stessi numeri di /health/db-pool, copiati nel registro a ogni lettura.
+    for nome, eng in (("primario", engine), ("replica", read_engine)):
+        statistiche = POOL_STATS.get(nome)
+        if statistiche is None or (nome == "replica" and read_engine is engine):
+            continue
+        stato = statistiche.snapshot(eng.pool)
+        _POOL_IN_USO.set(stato["in_use"], pool=nome)
+        _POOL_LIBERE.set(stato.get("idle", 0), pool=nome)
+        _POOL_OVERFLOW.set(stato.get("overflow", 0), pool=nome)
+        _POOL_CHECKOUTS.set_total(stato["checkouts"], pool=nome)
+        _POOL_TIMEOUTS.set_total(stato["timeouts"], pool=nome)
+
 
 # def create_db_and_tables():
 #     SQLModel.metadata.create_all(engine)
@@ -51,3 +254,34 @@ else:
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+class ReadSession(Session):
+    """Sessione per gli endpoint di sola lettura: le SELECT vanno sulla replica.
+
+    Read-your-writes: appena la sessione scrive qualcosa (flush, oppure un
+    INSERT/UPDATE/DELETE esplicito) resta agganciata al primario fino alla
+    chiusura, cosi' nella stessa richiesta non si rilegge mai dalla replica
+    un dato appena modificato e non ancora replicato.
+    """
+
+    _ha_scritto = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._ha_scritto or self._flushing:
+            return engine
+        if isinstance(clause, UpdateBase):
+            self._ha_scritto = True
+            return engine
+        return read_engine
+
+
+@event.listens_for(ReadSession, "after_flush")
+def _aggancia_al_primario(session, flush_context):
+    session._ha_scritto = True
+
+
+def get_read_session():
+    """Dependency per dashboard ed export: letture pesanti sulla replica."""
+    with ReadSession() as session:
+        yield session
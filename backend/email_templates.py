@@ -1,12 +1,25 @@
 """
 Template HTML premium per le email transazionali di SplitPlan.
 Tutti i template usano inline CSS per massima compatibilità con i client email.
+
+Ogni template e' un Modello: al primo uso il sorgente (corpo gia' inserito
+nel guscio comune con header e footer) viene diviso una volta sola in parti
+statiche e slot `{nome}` e compilato in una funzione; da li' in poi rendere
+vuol dire solo unire le parti con i valori, senza ricostruire header e
+footer a ogni chiamata.
+
+Per gli invii massivi rendi_molti() fissa prima i valori comuni a tutti i
+destinatari (vincola) e poi rende solo gli slot che cambiano; se non ne
+cambia nessuno la stessa stringa vale per tutti. I valori entrano cosi' come
+sono, come nelle vecchie f-string: l'escape HTML resta a carico del chiamante.
+
+Benchmark: python bench_email_templates.py (dalla cartella backend).
 """
 
+from string import Formatter
+from typing import Iterable, List, Optional
 
-def base_template(content: str) -> str:
-    """Layout wrapper con header SplitPlan, footer e branding."""
-    return f"""
+_GUSCIO = """
     <!DOCTYPE html>
     <html lang="it">
     <head>
@@ -69,9 +82,100 @@ def base_template(content: str) -> str:
     """
 
 
-def verification_email(name: str, verification_url: str) -> str:
-    """Template email per la verifica dell'account."""
-    content = f"""
+class Modello:
+    """
+    Template compilato al primo uso in una funzione Python: le parti statiche
+    diventano costanti e il corpo e' una sola f-string con gli slot, quindi
+    una resa costa quanto la vecchia f-string ma senza ricostruire il guscio.
+    """
+
+    __slots__ = ("_sorgente", "_parti", "_slot", "_funzione")
+
+    def __init__(self, corpo: str, guscio: Optional[str] = _GUSCIO):
+        self._sorgente = corpo if guscio is None else guscio.replace("{content}", corpo, 1)
+        self._parti: Optional[tuple] = None
+        self._slot: Optional[tuple] = None
+        self._funzione = None
+
+    @classmethod
+    def _da_parti(cls, parti: List[str], slot: List[str]) -> "Modello":
+        modello = cls.__new__(cls)
+        modello._sorgente = None
+        modello._imposta(parti, slot)
+        return modello
+
+    def _compila(self):
+        parti, slot = [""], []
+        for testo, campo, _, _ in Formatter().parse(self._sorgente):
+            parti[-1] += testo
+            if campo is not None:
+                if not campo.isidentifier():
+                    raise ValueError(f"Slot non valido nel template: {{{campo}}}")
+                slot.append(campo)
+                parti.append("")
+        self._imposta(parti, slot)
+
+    def _imposta(self, parti: List[str], slot: List[str]):
+        costanti = {f"_p{i}": p for i, p in enumerate(parti)}
+        corpo = "".join(
+            "{_p%d}" % i + ("{%s}" % slot[i] if i < len(slot) else "") for i in range(len(parti))
+        )
+        parametri = "".join(f"{nome}, " for nome in dict.fromkeys(slot))
+        codice = f"def _rendi({'*, ' if slot else ''}{parametri}**_):\n    return f{corpo!r}\n"
+        exec(compile(codice, "<email_templates>", "exec"), costanti)
+        # Assegnazione in blocco: due thread che compilano insieme producono
+        # lo stesso risultato.
+        self._parti, self._slot, self._funzione = tuple(parti), tuple(slot), costanti["_rendi"]
+
+    @property
+    def slot(self) -> tuple:
+        if self._funzione is None:
+            self._compila()
+        return self._slot
+
+    @property
+    def rendi(self):
+        """La funzione compilata: `modello.rendi(nome=valore, ...)` -> HTML.
+        Restituirla invece di avvolgerla evita una chiamata e un passaggio di
+        kwargs in piu' per ogni email."""
+        if self._funzione is None:
+            self._compila()
+        return self._funzione
+
+    def vincola(self, **valori) -> "Modello":
+        """Nuovo Modello con gli slot dati gia' sostituiti e fusi nelle parti
+        statiche: restano solo quelli che cambiano tra un destinatario e l'altro."""
+        if self._funzione is None:
+            self._compila()
+        parti, slot = [self._parti[0]], []
+        for i, nome in enumerate(self._slot, 1):
+            if nome in valori:
+                parti[-1] += str(valori[nome]) + self._parti[i]
+            else:
+                slot.append(nome)
+                parti.append(self._parti[i])
+        return Modello._da_parti(parti, slot)
+
+    def rendi_molti(self, destinatari: Iterable[dict], **comuni) -> List[str]:
+        """Una email per destinatario: `comuni` vale per tutti, ogni dict di
+        `destinatari` porta i valori propri (anche vuoto)."""
+        modello = self.vincola(**comuni)
+        if not modello._slot:
+            html = modello._parti[0]
+            return [html for _ in destinatari]
+        funzione = modello._funzione
+        return [funzione(**valori) for valori in destinatari]
+
+
+BASE = Modello("{content}")
+
+
+def base_template(content: str) -> str:
+    """Layout wrapper con header SplitPlan, footer e branding."""
+    return BASE.rendi(content=content)
+
+
+VERIFICATION = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #e8f4fd; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \U0001f510
@@ -109,17 +213,15 @@ def verification_email(name: str, verification_url: str) -> str:
         <p style="color: #23599E; font-size: 12px; word-break: break-all; margin: 8px 0 0 0;">
             <a href="{verification_url}" style="color: #23599E; text-decoration: underline;">{verification_url}</a>
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def account_exists_attempt_email(name: str, login_url: str, reset_url: str) -> str:
-    """
-    Notifica silenziosa: qualcuno ha tentato di registrare un account con
-    un'email già esistente. Serve a non rivelare la presenza dell'account
-    al chiamante (protezione contro l'account enumeration).
-    """
-    content = f"""
+def verification_email(name: str, verification_url: str) -> str:
+    """Template email per la verifica dell'account."""
+    return VERIFICATION.rendi(name=name, verification_url=verification_url)
+
+
+ACCOUNT_EXISTS_ATTEMPT = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #fff8f3; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \u26a0\ufe0f
@@ -161,13 +263,19 @@ def account_exists_attempt_email(name: str, login_url: str, reset_url: str) -> s
                 \U0001f512 Se non sei stato tu, ignora pure questa email: il tuo account resta al sicuro e nessuna modifica è stata effettuata.
             </p>
         </div>
+    """)
+
+
+def account_exists_attempt_email(name: str, login_url: str, reset_url: str) -> str:
+    """
+    Notifica silenziosa: qualcuno ha tentato di registrare un account con
+    un'email già esistente. Serve a non rivelare la presenza dell'account
+    al chiamante (protezione contro l'account enumeration).
     """
-    return base_template(content)
+    return ACCOUNT_EXISTS_ATTEMPT.rendi(name=name, login_url=login_url, reset_url=reset_url)
 
 
-def reset_password_email(name: str, reset_url: str) -> str:
-    """Template email per il reset della password."""
-    content = f"""
+RESET_PASSWORD = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #fef3e8; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \U0001f511
@@ -212,20 +320,15 @@ def reset_password_email(name: str, reset_url: str) -> str:
         <p style="color: #23599E; font-size: 12px; word-break: break-all; margin: 8px 0 0 0;">
             <a href="{reset_url}" style="color: #23599E; text-decoration: underline;">{reset_url}</a>
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def booking_confirmation_email(
-    name: str,
-    trip_name: str,
-    destination: str,
-    dates: str,
-    price: str,
-    itinerary_url: str,
-) -> str:
-    """Template email per la conferma della prenotazione del viaggio."""
-    content = f"""
+def reset_password_email(name: str, reset_url: str) -> str:
+    """Template email per il reset della password."""
+    return RESET_PASSWORD.rendi(name=name, reset_url=reset_url)
+
+
+BOOKING_CONFIRMATION = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #e8f5e9; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \U0001f389
@@ -283,15 +386,29 @@ def booking_confirmation_email(
         <p style="color: #777; font-size: 13px; line-height: 1.6; text-align: center; margin: 0;">
             Puoi accedere ai dettagli del volo, hotel e costi nella sezione "CFO & Spese" dell'app.
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def purchase_receipt_email(
-    name: str, product_name: str, amount: str, credits_added: str, market_url: str
+def booking_confirmation_email(
+    name: str,
+    trip_name: str,
+    destination: str,
+    dates: str,
+    price: str,
+    itinerary_url: str,
 ) -> str:
-    """Template email per la ricevuta d'acquisto."""
-    content = f"""
+    """Template email per la conferma della prenotazione del viaggio."""
+    return BOOKING_CONFIRMATION.rendi(
+        name=name,
+        trip_name=trip_name,
+        destination=destination,
+        dates=dates,
+        price=price,
+        itinerary_url=itinerary_url,
+    )
+
+
+PURCHASE_RECEIPT = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #e8f5e9; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \U0001f4b3
@@ -347,21 +464,23 @@ def purchase_receipt_email(
 
         <p style="color: #777; font-size: 13px; line-height: 1.6; text-align: center; margin: 0;">
             Grazie per aver scelto SplitPlan per i tuoi viaggi di gruppo!
-    """
-    return base_template(content)
+    """)
 
 
-def demo_request_notification_email(
-    full_name: str,
-    company_name: str,
-    work_email: str,
-    phone_number: str,
-    team_size: str,
-    travel_frequency: str,
-    message: str,
+def purchase_receipt_email(
+    name: str, product_name: str, amount: str, credits_added: str, market_url: str
 ) -> str:
-    """Template email per notificare l'admin di una nuova richiesta demo B2B."""
-    content = f"""
+    """Template email per la ricevuta d'acquisto."""
+    return PURCHASE_RECEIPT.rendi(
+        name=name,
+        product_name=product_name,
+        amount=amount,
+        credits_added=credits_added,
+        market_url=market_url,
+    )
+
+
+DEMO_REQUEST_NOTIFICATION = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #f0f7ff; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \U0001f4bc
@@ -399,7 +518,7 @@ def demo_request_notification_email(
                 <tr>
                     <td style="padding: 10px 0; border-bottom: 1px solid #f0f2f5;">
                         <span style="color: #999; font-size: 12px; font-weight: 700; text-transform: uppercase; display: block; margin-bottom: 4px;">Telefono</span>
-                        <span style="color: #1a1a1a; font-size: 15px; font-weight: 600;">{phone_number or "Non fornito"}</span>
+                        <span style="color: #1a1a1a; font-size: 15px; font-weight: 600;">{phone_number}</span>
                     </td>
                 </tr>
                 <tr>
@@ -422,7 +541,7 @@ def demo_request_notification_email(
                     <td style="padding: 10px 0;">
                         <span style="color: #999; font-size: 12px; font-weight: 700; text-transform: uppercase; display: block; margin-bottom: 4px;">Messaggio/Note</span>
                         <p style="color: #555; font-size: 14px; line-height: 1.6; margin: 0; font-style: italic;">
-                            "{message or "Nessun messaggio aggiuntivo."}"
+                            "{message}"
                         </p>
                     </td>
                 </tr>
@@ -432,13 +551,31 @@ def demo_request_notification_email(
         <p style="color: #777; font-size: 13px; line-height: 1.6; text-align: center; margin: 0;">
             Si prega di ricontattare il potenziale cliente entro le prossime 24 ore lavorative.
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def welcome_email(name: str, login_url: str) -> str:
-    """Email di benvenuto per nuovo utente registrato."""
-    content = f"""
+def demo_request_notification_email(
+    full_name: str,
+    company_name: str,
+    work_email: str,
+    phone_number: str,
+    team_size: str,
+    travel_frequency: str,
+    message: str,
+) -> str:
+    """Template email per notificare l'admin di una nuova richiesta demo B2B."""
+    return DEMO_REQUEST_NOTIFICATION.rendi(
+        full_name=full_name,
+        company_name=company_name,
+        work_email=work_email,
+        phone_number=phone_number or "Non fornito",
+        team_size=team_size,
+        travel_frequency=travel_frequency,
+        message=message or "Nessun messaggio aggiuntivo.",
+    )
+
+
+WELCOME = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #e8f5e9; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#127881;
@@ -487,13 +624,15 @@ def welcome_email(name: str, login_url: str) -> str:
                 &#9992;&#65039;&nbsp;&nbsp;Inizia a Pianificare
             </a>
         </div>
-    """
-    return base_template(content)
+    """)
 
 
-def company_invite_email(company_name: str, invite_url: str) -> str:
-    """Email di invito a unirsi a un'azienda su SplitPlan."""
-    content = f"""
+def welcome_email(name: str, login_url: str) -> str:
+    """Email di benvenuto per nuovo utente registrato."""
+    return WELCOME.rendi(name=name, login_url=login_url)
+
+
+COMPANY_INVITE = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #f0f7ff; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#127970;
@@ -531,13 +670,15 @@ def company_invite_email(company_name: str, invite_url: str) -> str:
             Se il pulsante non funziona, copia e incolla questo link nel browser:<br>
             <a href="{invite_url}" style="color: #23599E; text-decoration: underline;">{invite_url}</a>
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def b2b_manager_welcome_email(company_name: str, register_url: str) -> str:
-    """Email al referente B2B dopo l'approvazione: crea l'account per diventare manager."""
-    content = f"""
+def company_invite_email(company_name: str, invite_url: str) -> str:
+    """Email di invito a unirsi a un'azienda su SplitPlan."""
+    return COMPANY_INVITE.rendi(company_name=company_name, invite_url=invite_url)
+
+
+B2B_MANAGER_WELCOME = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #f0f7ff; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#127881;
@@ -577,13 +718,15 @@ def b2b_manager_welcome_email(company_name: str, register_url: str) -> str:
             non verrà collegato all'azienda. Se il pulsante non funziona, copia e incolla questo link:<br>
             <a href="{register_url}" style="color: #23599E; text-decoration: underline;">{register_url}</a>
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def email_approval_requested(manager_name: str, trip_name: str, requester_name: str, manager_url: str) -> str:
-    """Email al manager: dipendente ha richiesto approvazione trasferta."""
-    content = f"""
+def b2b_manager_welcome_email(company_name: str, register_url: str) -> str:
+    """Email al referente B2B dopo l'approvazione: crea l'account per diventare manager."""
+    return B2B_MANAGER_WELCOME.rendi(company_name=company_name, register_url=register_url)
+
+
+APPROVAL_REQUESTED = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #fffbeb; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#9203;
@@ -618,13 +761,20 @@ def email_approval_requested(manager_name: str, trip_name: str, requester_name:
         <p style="color: #999; font-size: 12px; text-align: center; margin: 0;">
             Accedi alla dashboard manager per visualizzare i dettagli e prendere una decisione.
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def email_trip_approved(organizer_name: str, trip_name: str, manager_name: str, trip_url: str) -> str:
-    """Email all'organizzatore: trasferta approvata dal manager."""
-    content = f"""
+def email_approval_requested(manager_name: str, trip_name: str, requester_name: str, manager_url: str) -> str:
+    """Email al manager: dipendente ha richiesto approvazione trasferta."""
+    return APPROVAL_REQUESTED.rendi(
+        manager_name=manager_name,
+        requester_name=requester_name,
+        trip_name=trip_name,
+        manager_url=manager_url,
+    )
+
+
+TRIP_APPROVED = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #f0fdf4; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#9989;
@@ -655,20 +805,27 @@ def email_trip_approved(organizer_name: str, trip_name: str, manager_name: str,
                 &#9992;&#65039;&nbsp;&nbsp;Vai alla Trasferta
             </a>
         </div>
-    """
-    return base_template(content)
+    """)
 
 
-def email_trip_rejected(organizer_name: str, trip_name: str, manager_name: str, trip_url: str, reason: str = None) -> str:
-    """Email all'organizzatore: trasferta rifiutata dal manager."""
-    reason_block = f"""
+def email_trip_approved(organizer_name: str, trip_name: str, manager_name: str, trip_url: str) -> str:
+    """Email all'organizzatore: trasferta approvata dal manager."""
+    return TRIP_APPROVED.rendi(
+        organizer_name=organizer_name,
+        manager_name=manager_name,
+        trip_name=trip_name,
+        trip_url=trip_url,
+    )
+
+
+_REASON_BLOCK = Modello("""
         <div style="background-color: #fef2f2; border-left: 4px solid #ef4444; border-radius: 0 12px 12px 0; padding: 16px 20px; margin: 20px 0;">
             <p style="color: #991b1b; font-size: 12px; font-weight: 700; text-transform: uppercase; margin: 0 0 6px 0;">Motivazione</p>
             <p style="color: #7f1d1d; font-size: 14px; line-height: 1.6; margin: 0;">{reason}</p>
         </div>
-    """ if reason else ""
+    """, guscio=None)
 
-    content = f"""
+TRIP_REJECTED = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #fef2f2; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 &#10060;
@@ -700,13 +857,22 @@ def email_trip_rejected(organizer_name: str, trip_name: str, manager_name: str,
         <p style="color: #999; font-size: 12px; text-align: center; margin: 0;">
             Puoi rivedere il piano e richiedere nuovamente l'approvazione.
         </p>
-    """
-    return base_template(content)
+    """)
 
 
-def demo_request_confirmation_email(full_name: str, company_name: str) -> str:
-    """Template email di conferma/ringraziamento per il cliente che richiede la demo."""
-    content = f"""
+def email_trip_rejected(organizer_name: str, trip_name: str, manager_name: str, trip_url: str, reason: str = None) -> str:
+    """Email all'organizzatore: trasferta rifiutata dal manager."""
+    reason_block = _REASON_BLOCK.rendi(reason=reason) if reason else ""
+    return TRIP_REJECTED.rendi(
+        organizer_name=organizer_name,
+        trip_name=trip_name,
+        manager_name=manager_name,
+        reason_block=reason_block,
+        trip_url=trip_url,
+    )
+
+
+DEMO_REQUEST_CONFIRMATION = Modello("""
         <div style="text-align: center; margin-bottom: 30px;">
             <div style="display: inline-block; background-color: #e8f5e9; border-radius: 50%; width: 64px; height: 64px; line-height: 64px; font-size: 28px; margin-bottom: 16px;">
                 \u2705
@@ -737,5 +903,9 @@ def demo_request_confirmation_email(full_name: str, company_name: str) -> str:
             A presto,<br>
             Il Team di SplitPlan Corporate
         </p>
-    """
-    return base_template(content)
+    """)
+
+
+def demo_request_confirmation_email(full_name: str, company_name: str) -> str:
+    """Template email di conferma/ringraziamento per il cliente che richiede la demo."""
+    return DEMO_REQUEST_CONFIRMATION.rendi(full_name=full_name, company_name=company_name)
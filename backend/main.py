@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 import logging
 import traceback
 from contextlib import asynccontextmanager
@@ -11,13 +12,18 @@ load_dotenv(os.path.join(base_dir, "..", ".env"))
 
 from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from datetime import datetime, timezone
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from routers import trips, photos, users, expenses, itinerary, payments, calendar, leads, flights, sso, companies, admin, notifications
+from routers import trips, photos, users, expenses, itinerary, payments, calendar, leads, flights, sso, companies, admin, notifications, stream, cron
 from admin_auth import verify_admin_token
+from services import email_outbox, pdf_render, quota_service, unread_counter
+from services.event_bus import bus
+from services.redis_service import get_redis_client
+from services.profiler import ProfilingMiddleware
+from services.timing import TimingMiddleware
 
 # ---------------------------------------------------------------------------
 # LOGGING
@@ -37,7 +43,33 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     logger.info("Avvio applicazione...")
     # create_db_and_tables() # Gestito da Alembic
+    # Write-back delle quote AI da Redis al DB. Su Vercel l'istanza non vive
+    # abbastanza: li' lo fa il cron di vercel.json su GET /cron/quotas-sync.
+    sync_quote = None
+    if os.getenv("REDIS_URL") and not os.getenv("VERCEL"):
+        from sqlmodel import Session
+        from database import engine
+        sync_quote = asyncio.create_task(quota_service.ciclo_sincronizzazione(lambda: Session(engine)))
+    # Coda email: il worker resta vivo fra le richieste solo fuori da Vercel;
+    # li' la svuotano il giro dopo ogni risposta (SvuotaDopoRispostaMiddleware)
+    # e il cron di vercel.json su GET /cron/email-outbox.
+    worker_email = None
+    if not os.getenv("VERCEL"):
+        from sqlmodel import Session
+        from database import engine
+        worker_email = asyncio.create_task(email_outbox.ciclo_outbox(lambda: Session(engine)))
+    # Stream SSE: con Redis gli eventi arrivano a tutti i worker, non solo al proprio.
+    if os.getenv("REDIS_URL"):
+        await bus.avvia(get_redis_client())
+        unread_counter.avvia(get_redis_client())
     yield
+    if sync_quote:
+        sync_quote.cancel()
+    if worker_email:
+        worker_email.cancel()
+    await bus.ferma()
+    unread_counter.ferma()
+    pdf_render.chiudi()
     logger.info("Spegnimento applicazione.")
 
 
@@ -71,6 +103,11 @@ CORS_HEADERS = [
     "Origin",
     "X-Requested-With",
     "X-Admin-Token",
+    "X-Profile",
+    "If-None-Match",
+    "If-Modified-Since",
+    "Range",
+    "If-Range",
 ]
 
 app.add_middleware(
@@ -80,9 +117,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=CORS_METHODS,
     allow_headers=CORS_HEADERS,
+    expose_headers=["ETag", "Last-Modified", "Content-Range", "Accept-Ranges"],
     max_age=600,
 )
 
+# cProfile opt-in (header X-Profile + token admin, o richieste sopra
+# PROFILE_SLOW_MS). Interno al timing, che resta la misura di riferimento.
+app.add_middleware(ProfilingMiddleware)
+
+# Latenza per route/status, header Server-Timing e log delle richieste lente.
+# Aggiunto dopo CORS quindi piu' esterno: misura anche il preflight.
+app.add_middleware(TimingMiddleware)
+
+# Senza worker email (Vercel): a risposta inviata, un giro della coda per le
+# email accodate dalla richiesta. Il piu' esterno: il timing non lo conta.
+app.add_middleware(email_outbox.SvuotaDopoRispostaMiddleware)
+
 # ---------------------------------------------------------------------------
 # ROUTER
 # ---------------------------------------------------------------------------
@@ -99,6 +149,8 @@ app.include_router(sso.router)
 app.include_router(companies.router)
 app.include_router(admin.router)
 app.include_router(notifications.router)
+app.include_router(stream.router)
+app.include_router(cron.router)
 
 
 # ---------------------------------------------------------------------------
@@ -149,23 +201,66 @@ def root():
 @app.get("/health", tags=["ops"])
 def health_check():
     """Verifica lo stato del backend e della connessione al database."""
-    from database import engine
+    from database import engine, read_engine
     from sqlalchemy import text
 
-    db_ok = False
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        db_ok = True
-    except Exception as e:
-        logger.error(f"[Health] DB check failed: {e}")
+    def _ping(eng, nome):
+        try:
+            with eng.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.error(f"[Health] DB check failed ({nome}): {e}")
+            return False
 
+    db_ok = _ping(engine, "primario")
+    services = {
+        "database": "ok" if db_ok else "error",
+        "gemini": "configured" if os.getenv("GOOGLE_API_KEY") else "missing",
+    }
     status = "ok" if db_ok else "degraded"
+
+    # La replica e' opzionale: se manca, dashboard ed export leggono dal primario.
+    if read_engine is not engine:
+        replica_ok = _ping(read_engine, "replica")
+        services["database_replica"] = "ok" if replica_ok else "error"
+        if not replica_ok:
+            status = "degraded"
+
     return {
         "status": status,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "services": {
-            "database": "ok" if db_ok else "error",
-            "gemini": "configured" if os.getenv("GOOGLE_API_KEY") else "missing",
-        },
+        "services": services,
+    }
+
+
+@app.get("/health/db-pool", tags=["ops"], dependencies=[Depends(verify_admin_token)])
+def db_pool_stats():
+    """Stato dei pool di connessioni: attesa al checkout, connessioni in uso, overflow, timeout.
+
+    Serve a dimensionare DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT sui
+    numeri reali: timeout o p95 di attesa alti indicano un pool troppo piccolo.
+    """
+    from database import engine, read_engine, POOL_STATS
+
+    pools = {}
+    for nome, eng in (("primario", engine), ("replica", read_engine)):
+        if nome == "replica" and read_engine is engine:
+            continue
+        statistiche = POOL_STATS.get(nome)
+        pools[nome] = statistiche.snapshot(eng.pool) if statistiche else {"pool_class": type(eng.pool).__name__}
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "pools": pools,
     }
+
+
+@app.get("/metrics", tags=["ops"], dependencies=[Depends(verify_admin_token)], response_class=PlainTextResponse)
+def metrics():
+    """Metriche in formato testo Prometheus: latenze, chiamate AI, cache OSRM,
+    solver, rate limit e pool DB. Da configurare nello scraper con l'header
+    X-Admin-Token. I valori sono per istanza e ripartono da zero a ogni cold start."""
+    from services.metrics import render_prometheus
+
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
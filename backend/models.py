@@ -1,6 +1,6 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, Index, JSON, UniqueConstraint
 from datetime import datetime, timezone
 
 
@@ -16,6 +16,9 @@ class Company(SQLModel, table=True):
     max_active_users: int = Field(default=30)
     max_trips_per_month: int = Field(default=15)
     max_ai_calls_per_month: int = Field(default=200)
+    # Chiamate AI del mese corrente (copia per report, vedi services/quota_service)
+    monthly_ai_usage: int = Field(default=0)
+    last_monthly_reset: Optional[str] = Field(default=None)  # formato YYYY-MM
 
     # Billing & identità (per fatturazione B2B)
     vat_number: Optional[str] = Field(default=None)
@@ -56,6 +59,7 @@ class Account(SQLModel, table=True):
     is_manager: bool = Field(default=False)
     company_id: Optional[int] = Field(default=None, foreign_key="company.id")
     token_version: int = Field(default=0)  # incrementato da logout-all per invalidare tutti i JWT precedenti
+    unread_notifications: int = Field(default=0)  # contatore notifiche non lette (services/unread_counter)
 
     company: Optional[Company] = Relationship(back_populates="accounts")
 
@@ -111,6 +115,12 @@ class TripBase(SQLModel):
 
 class Trip(TripBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Partecipanti che hanno votato almeno una proposta (vedi services/vote_tally)
+    voters_count: int = Field(default=0)
+    # Incrementati a ogni scrittura sul viaggio o sui suoi dati
+    # (services/trip_changes): ETag e Last-Modified delle letture.
+    version: int = Field(default=0)
+    updated_at: Optional[datetime] = Field(default=None)
     participants: List["Participant"] = Relationship(back_populates="trip")
     proposals: List["Proposal"] = Relationship(back_populates="trip")
     itinerary_items: List["ItineraryItem"] = Relationship(back_populates="trip")
@@ -125,9 +135,16 @@ class ParticipantBase(SQLModel):
 
 
 class Participant(ParticipantBase, table=True):
+    # Viaggi di un account (/trips/my-trips, /trips/stats) senza leggere la tabella.
+    __table_args__ = (
+        Index("ix_participant_account_active_trip", "account_id", "is_active", "trip_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     trip_id: Optional[int] = Field(default=None, foreign_key="trip.id", index=True)
     account_id: Optional[int] = Field(default=None, foreign_key="account.id", index=True)
+    # Gia' contato in Trip.voters_count
+    has_voted: bool = Field(default=False)
 
     trip: Optional[Trip] = Relationship(back_populates="participants")
     votes: List["Vote"] = Relationship(back_populates="participant")
@@ -143,12 +160,20 @@ class Proposal(SQLModel, table=True):
     price_estimate: float
     image_url: str
     real_destination: Optional[str] = ""
+    # Somma dei punteggi dei voti, aggiornata a ogni voto
+    vote_score: int = Field(default=0)
 
     trip: Optional[Trip] = Relationship(back_populates="proposals")
     votes: List["Vote"] = Relationship(back_populates="proposal")
 
 
 class Vote(SQLModel, table=True):
+    # Un voto per partecipante e proposta: il doppio click concorrente non
+    # conta due volte.
+    __table_args__ = (
+        UniqueConstraint("proposal_id", "user_id", name="uq_vote_proposal_user"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     proposal_id: int = Field(foreign_key="proposal.id", index=True)
     user_id: int = Field(foreign_key="participant.id", index=True)
@@ -235,11 +260,109 @@ class RefreshToken(SQLModel, table=True):
 
 
 class Notification(SQLModel, table=True):
+    # Lista per account in ordine di data e contatori sulle non lette; copre
+    # anche le ricerche per solo account_id (prefisso).
+    __table_args__ = (
+        Index("ix_notification_account_read_created", "account_id", "is_read", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    account_id: int = Field(foreign_key="account.id", index=True)
+    account_id: int = Field(foreign_key="account.id")
     type: str
     title: str
     message: str
     trip_id: Optional[int] = Field(default=None, foreign_key="trip.id")
     is_read: bool = Field(default=False)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class NotificationArchive(SQLModel, table=True):
+    """
+    Notifiche lette piu' vecchie di NOTIF_ARCHIVE_DAYS, spostate qui a blocchi
+    da services/notification_service.archivia_notifiche(): la tabella calda
+    resta piccola. Stesso id della riga originale; nessuna FK verso trip,
+    che nel frattempo puo' essere stato eliminato.
+    """
+    __tablename__ = "notification_archive"
+    __table_args__ = (
+        Index("ix_notification_archive_account_created", "account_id", "created_at"),
+    )
+
+    id: int = Field(primary_key=True)
+    account_id: int = Field(foreign_key="account.id")
+    type: str
+    title: str
+    message: str
+    trip_id: Optional[int] = Field(default=None)
+    created_at: datetime
+    archived_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class EmailOutbox(SQLModel, table=True):
+    """
+    Email in uscita. Gli endpoint la accodano nella stessa transazione della
+    scrittura che la motiva e rispondono subito; services/email_outbox la
+    invia in background su una connessione SMTP riusata, con tentativi e
+    backoff. status: PENDING, SENDING (presa in carico), SENT, FAILED.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    recipient: str
+    # NULL per le email di un invio massivo: oggetto e corpo stanno una volta
+    # sola sull'InviteBatch (batch_id).
+    subject: Optional[str] = None
+    html: Optional[str] = None
+    kind: str = Field(default="generic")
+    status: str = Field(default="PENDING")
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    claimed_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    sent_at: Optional[datetime] = Field(default=None)
+    # Invio massivo di appartenenza (InviteBatch), per lo stato per destinatario.
+    batch_id: Optional[int] = Field(default=None, foreign_key="invite_batch.id", index=True)
+
+
+class InviteBatch(SQLModel, table=True):
+    """
+    Invio massivo di inviti aziendali (POST /companies/{id}/invite-bulk): una
+    riga per richiesta, le email in email_outbox con batch_id. Lo stato per
+    destinatario si legge da GET /companies/{id}/invite-bulk/{batch_id}.
+    L'invito e' uguale per tutti: oggetto e HTML stanno qui, non su ogni riga
+    della coda.
+    """
+    __tablename__ = "invite_batch"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    company_id: int = Field(foreign_key="company.id", index=True)
+    created_by: Optional[int] = Field(default=None, foreign_key="account.id")
+    total: int = Field(default=0)
+    invalid: int = Field(default=0)
+    subject: Optional[str] = None
+    html: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class TripChange(SQLModel, table=True):
+    """
+    Registro delle modifiche ai dati di un viaggio per la sincronizzazione
+    incrementale (GET /trips/{id}/changes). Una riga per riga toccata:
+    `entity` e' l'area (itinerary, expenses, participants, photos, votes),
+    `op` e' "upsert" o "delete". L'id crescente fa da cursore.
+    Scritto da services/trip_changes nella stessa transazione della modifica.
+    """
+    __table_args__ = (
+        Index("ix_tripchange_trip_id_id", "trip_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    trip_id: int = Field(foreign_key="trip.id")
+    entity: str
+    entity_id: int
+    op: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
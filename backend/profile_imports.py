@@ -0,0 +1,147 @@
+"""
+Profilo del tempo di import all'avvio del backend.
+
+Lancia `python -X importtime -c "import main"` in un processo pulito, legge
+l'output di importtime (stderr) e stampa un report: tempo totale, moduli piu'
+lenti (cumulativo e self) e quali SDK pesanti vengono caricati gia' all'avvio.
+E' il cold start che paga ogni funzione Vercel, anche per /health.
+
+Uso (dalla cartella backend):
+    python profile_imports.py                 # report leggibile
+    python profile_imports.py --top 40 --runs 5
+    python profile_imports.py --json          # per confronti automatici
+    python profile_imports.py --prefix routers.trips   # costo dei sotto-router
+
+Nessun SDK di HEAVY_SDKS dovrebbe comparire: vanno importati al primo uso
+(utils/lazy.py). tests/test_startup_imports.py verifica la stessa cosa.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# SDK che non devono essere importati da `import main`.
+HEAVY_SDKS = (
+    "google.genai",
+    "googleapiclient",
+    "google.oauth2",
+    "google_auth_oauthlib",
+    "fpdf",
+    "ortools",
+    "stripe",
+    "supabase",
+)
+
+
+def misura_import(modulo: str = "main") -> list:
+    """Importa `modulo` in un sottoprocesso con -X importtime.
+
+    Ritorna una riga per modulo importato, nell'ordine di importtime:
+    {"module", "self_us", "cumulative_us", "depth"}.
+    """
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # auth.py si rifiuta di partire senza SECRET_KEY: per misurare basta un segnaposto.
+    env.setdefault("SECRET_KEY", "profile-imports")
+    risultato = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if risultato.returncode != 0:
+        raise RuntimeError(f"import {modulo} fallito:\n{risultato.stderr[-2000:]}")
+
+    righe = []
+    for riga in risultato.stderr.splitlines():
+        # "import time:       self [us] |     cumulative | imported package"
+        if not riga.startswith("import time:") or "[us]" in riga:
+            continue
+        try:
+            self_us, cumulativo_us, nome = riga[len("import time:"):].split("|", 2)
+            righe.append({
+                "module": nome.strip(),
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulativo_us),
+                "depth": (len(nome) - len(nome.lstrip())) // 2,
+            })
+        except ValueError:
+            continue
+    return righe
+
+
+def totale_ms(righe: list, modulo: str = "main") -> float:
+    """Tempo cumulativo dell'import di primo livello di `modulo`, in ms."""
+    for riga in righe:
+        if riga["module"] == modulo and riga["depth"] == 0:
+            return riga["cumulative_us"] / 1000
+    return sum(r["self_us"] for r in righe) / 1000
+
+
+def sdk_caricati(righe: list) -> list:
+    nomi = {r["module"] for r in righe}
+    return [sdk for sdk in HEAVY_SDKS if sdk in nomi]
+
+
+def report(modulo: str = "main", top: int = 20, runs: int = 3, prefisso: str = None) -> dict:
+    # Si tiene la misura migliore: la prima esecuzione paga anche la cache del disco.
+    migliore = None
+    for _ in range(max(runs, 1)):
+        righe = misura_import(modulo)
+        if migliore is None or totale_ms(righe, modulo) < totale_ms(migliore, modulo):
+            migliore = righe
+
+    def in_ms(righe, campo):
+        return [{"module": r["module"], "ms": round(r[campo] / 1000, 1)} for r in righe]
+
+    dati = {
+        "module": modulo,
+        "total_ms": round(totale_ms(migliore, modulo), 1),
+        "modules_imported": len(migliore),
+        "heavy_sdks_loaded": sdk_caricati(migliore),
+        "top_cumulative": in_ms(sorted(migliore, key=lambda r: -r["cumulative_us"])[:top], "cumulative_us"),
+        "top_self": in_ms(sorted(migliore, key=lambda r: -r["self_us"])[:top], "self_us"),
+    }
+    if prefisso:
+        # Es. --prefix routers.trips: un modulo per sotto-router, nell'ordine di import.
+        dati["prefix"] = prefisso
+        dati["prefix_modules"] = in_ms(
+            [r for r in migliore if r["module"] == prefisso or r["module"].startswith(prefisso + ".")],
+            "cumulative_us",
+        )
+    return dati
+
+
+def _stampa(dati: dict):
+    print(f"import {dati['module']}: {dati['total_ms']} ms ({dati['modules_imported']} moduli)")
+    sdk = dati["heavy_sdks_loaded"]
+    print(f"SDK pesanti caricati all'avvio: {', '.join(sdk) if sdk else 'nessuno'}")
+    for titolo, chiave in (("cumulativo", "top_cumulative"), ("self", "top_self")):
+        print(f"\nModuli piu' lenti ({titolo}):")
+        for riga in dati[chiave]:
+            print(f"  {riga['ms']:>9.1f} ms  {riga['module']}")
+    if "prefix_modules" in dati:
+        print(f"\nModuli {dati['prefix']} (cumulativo):")
+        for riga in dati["prefix_modules"]:
+            print(f"  {riga['ms']:>9.1f} ms  {riga['module']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profilo del tempo di import all'avvio")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--prefix", help="dettaglio dei moduli sotto questo package")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    dati = report(args.module, top=args.top, runs=args.runs, prefisso=args.prefix)
+    if args.json:
+        print(json.dumps(dati, indent=2))
+    else:
+        _stampa(dati)
+    sys.exit(1 if dati["heavy_sdks_loaded"] else 0)
@@ -1,7 +1,8 @@
 import os
 import logging
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi.responses import PlainTextResponse, Response
 from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import BaseModel
 from sqlmodel import Session, select, func
@@ -11,6 +12,7 @@ from admin_auth import verify_admin_token
 from models import Account, Company, DemoLead
 from utils.email_utils import get_smtp_config
 from email_templates import b2b_manager_welcome_email
+from services import email_outbox, notification_service, profiler, quota_service, trip_changes, unread_counter
 
 logger = logging.getLogger(__name__)
 
@@ -184,3 +186,112 @@ def approve_b2b(
         "max_budget": company.max_budget_per_trip,
         "pending_manager": True,
     }
+
+
+# ---------------------------------------------------------------------------
+# GET /admin/profiles
+# ---------------------------------------------------------------------------
+
+@router.get("/profiles")
+def list_profiles():
+    """Profili cProfile catturati da questa istanza, dal piu' recente."""
+    return {
+        "slow_ms": profiler.PROFILE_SLOW_MS or None,
+        "sample_rate": profiler.PROFILE_SAMPLE_RATE,
+        "keep": profiler.PROFILE_KEEP,
+        "profiles": profiler.elenco_profili(),
+    }
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: int, format: str = "pstats", limit: int = 40):
+    """
+    Scarica un profilo. format=pstats (default) restituisce il file binario
+    leggibile con `python -m pstats` o snakeviz; format=text il riepilogo
+    delle `limit` funzioni piu' costose.
+    """
+    voce = profiler.profilo(profile_id)
+    if not voce:
+        raise HTTPException(status_code=404, detail="Profilo non trovato (forse gia' scartato).")
+    if format == "text":
+        return PlainTextResponse(profiler.testo_profilo(voce, righe=limit))
+    if format != "pstats":
+        raise HTTPException(status_code=400, detail="Formato non supportato: usa 'pstats' o 'text'.")
+    return Response(
+        content=voce["dati"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'},
+    )
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/quotas/sync
+# ---------------------------------------------------------------------------
+
+@router.post("/quotas/sync")
+async def sync_quotas(session: Session = Depends(get_session)):
+    """
+    Riscrive nelle colonne Account/Company i contatori AI tenuti in Redis.
+    Per l'uso manuale: su Vercel lo fa il cron su GET /cron/quotas-sync.
+    """
+    return await quota_service.sincronizza_quote(session)
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/trip-changes/prune
+# ---------------------------------------------------------------------------
+
+@router.post("/trip-changes/prune")
+async def prune_trip_changes(session: Session = Depends(get_session)):
+    """
+    Pota il registro delle modifiche ai viaggi (GET /trips/{id}/changes) oltre
+    CHANGELOG_RETENTION_DAYS. I client con un cursore piu' vecchio ricevono
+    lo stato completo. Per l'uso manuale: ogni giorno lo fa il cron su
+    GET /cron/trip-changes-prune.
+    """
+    return {"deleted": trip_changes.pota_registro(session)}
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/notifications/reconcile
+# ---------------------------------------------------------------------------
+
+@router.post("/notifications/reconcile")
+async def reconcile_unread_notifications(session: Session = Depends(get_session)):
+    """
+    Riallinea i contatori delle notifiche non lette (Account.unread_notifications
+    e chiavi Redis) al conteggio reale. Per l'uso manuale: ogni giorno lo fa
+    il cron su GET /cron/notifications-reconcile.
+    """
+    return unread_counter.riconcilia(session)
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/notifications/archive
+# ---------------------------------------------------------------------------
+
+@router.post("/notifications/archive")
+async def archive_notifications(
+    days: int = Query(notification_service.NOTIF_ARCHIVE_DAYS, ge=1),
+    session: Session = Depends(get_session),
+):
+    """
+    Sposta in notification_archive le notifiche lette piu' vecchie di `days`
+    giorni, a blocchi. Restituisce righe spostate, blocchi e durata; con
+    "done": false il tetto di tempo e' scaduto e il giro successivo continua.
+    Per l'uso manuale: ogni giorno lo fa il cron su GET /cron/notifications-archive.
+    """
+    return notification_service.archivia_notifiche(session, giorni=days)
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/email-outbox/flush
+# ---------------------------------------------------------------------------
+
+@router.post("/email-outbox/flush")
+async def flush_email_outbox(session: Session = Depends(get_session)):
+    """
+    Invia un blocco di email in coda (EMAIL_OUTBOX_BATCH). Per svuotare la
+    coda a mano; su Vercel il cron chiama GET /cron/email-outbox.
+    """
+    return await email_outbox.elabora_coda(session)
@@ -8,7 +8,6 @@ from models import Account
 from utils.crypto import encrypt_text, decrypt_text
 import os
 import logging
-from google_auth_oauthlib.flow import Flow
 import urllib.parse
 import traceback
 
@@ -35,6 +34,8 @@ def get_flow(redirect_uri=None):
     Crea e restituisce un oggetto Flow configurato per Google OAuth2.
     Supporta sia credenziali da file locale (dev) che da variabili d'ambiente (prod/Vercel).
     """
+    from google_auth_oauthlib.flow import Flow
+
     client_id = os.getenv("GOOGLE_CLIENT_ID")
     client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
 
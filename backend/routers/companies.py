@@ -1,21 +1,24 @@
 import csv
 import io
 import logging
+import os
+import re
 from collections import defaultdict
 from datetime import timedelta, datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from fastapi.responses import StreamingResponse
-from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import BaseModel
+from sqlalchemy import case, func, or_
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_read_session
 from auth import get_current_user, create_access_token, decode_token
-from models import Account, Company, Trip, Participant, Expense
-from utils.email_utils import get_smtp_config
+from models import Account, Company, EmailOutbox, InviteBatch, Trip, Participant, Expense
 from email_templates import company_invite_email
+from services import email_outbox
 from services.notification_service import notify_managers
+from utils.pagination import codifica_cursore, decodifica_cursore, dopo_cursore, ordinamento
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/companies", tags=["Companies"])
@@ -46,11 +49,25 @@ class CompanyDashboardResponse(BaseModel):
     vat_number: Optional[str]
     billing_address: Optional[str]
     total_members: int
+    # Prima pagina di GET /companies/{id}/members; le successive dal cursore.
     members: list[AccountSummary]
+    members_next_cursor: Optional[str] = None
 
     model_config = {"from_attributes": True}
 
 
+class MembersPage(BaseModel):
+    members: list[AccountSummary]
+    next_cursor: Optional[str]
+
+
+class MembersSummary(BaseModel):
+    total_members: int
+    managers: int
+    employees: int
+    max_active_users: int
+
+
 class JoinCompanyRequest(BaseModel):
     token: str
 
@@ -61,6 +78,73 @@ class JoinCompanyRequest(BaseModel):
 # ---------------------------------------------------------------------------
 
 
+def _require_company_manager(company_id: int, current_user: Account):
+    if not current_user.is_manager or current_user.company_id != company_id:
+        raise HTTPException(
+            status_code=403,
+            detail="Accesso negato. Solo i manager dell'azienda possono accedere a questa dashboard.",
+        )
+
+
+# Colonne lette per la lista membri: niente hash password o token calendario.
+_COLONNE_MEMBRO = (Account.id, Account.email, Account.name, Account.surname, Account.is_manager)
+
+# sort -> colonne della chiave keyset (id in coda per renderla univoca)
+_ORDINAMENTI_MEMBRI = {
+    "name": (Account.surname, Account.name, Account.id),
+    "email": (Account.email, Account.id),
+    "id": (Account.id,),
+}
+MEMBERS_PAGE_DEFAULT = 50
+MEMBERS_PAGE_MAX = 200
+
+
+def _conta_membri(session: Session, company_id: int) -> tuple:
+    """(totale, manager) con una sola query aggregata."""
+    totale, manager = session.exec(
+        select(
+            func.count(Account.id),
+            func.coalesce(func.sum(case((Account.is_manager == True, 1), else_=0)), 0),
+        ).where(Account.company_id == company_id)
+    ).one()
+    return totale, manager
+
+
+def _pagina_membri(
+    session: Session,
+    company_id: int,
+    limit: int = MEMBERS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    sort: str = "name",
+    desc: bool = False,
+) -> MembersPage:
+    colonne = _ORDINAMENTI_MEMBRI[sort]
+    query = select(*_COLONNE_MEMBRO).where(Account.company_id == company_id)
+
+    if q and q.strip():
+        termine = q.strip().lower()
+        query = query.where(or_(
+            func.lower(Account.name).contains(termine, autoescape=True),
+            func.lower(Account.surname).contains(termine, autoescape=True),
+            func.lower(Account.email).contains(termine, autoescape=True),
+        ))
+
+    valori = decodifica_cursore(cursor, len(colonne))
+    if valori is not None:
+        query = query.where(dopo_cursore(colonne, valori, desc))
+
+    # Una riga in piu' per sapere se esiste la pagina successiva.
+    righe = session.exec(query.order_by(*ordinamento(colonne, desc)).limit(limit + 1)).all()
+    membri = [AccountSummary.model_validate(r._mapping) for r in righe[:limit]]
+
+    prossimo = None
+    if len(righe) > limit:
+        ultimo = righe[limit - 1]._mapping
+        prossimo = codifica_cursore([ultimo[c.key] for c in colonne])
+    return MembersPage(members=membri, next_cursor=prossimo)
+
+
 # ---------------------------------------------------------------------------
 # GET /companies/{company_id}/dashboard
 # ---------------------------------------------------------------------------
@@ -72,22 +156,16 @@ async def get_company_dashboard(
     current_user: Account = Depends(get_current_user),
 ):
     """
-    Restituisce i dettagli dell'azienda e la lista dei membri.
-    Accessibile solo dal manager della stessa azienda.
+    Restituisce i dettagli dell'azienda, il numero di membri e la prima
+    pagina della lista membri. Accessibile solo dal manager della stessa azienda.
     """
     company = session.get(Company, company_id)
     if not company:
         raise HTTPException(status_code=404, detail="Azienda non trovata.")
+    _require_company_manager(company_id, current_user)
 
-    if not current_user.is_manager or current_user.company_id != company_id:
-        raise HTTPException(
-            status_code=403,
-            detail="Accesso negato. Solo i manager dell'azienda possono accedere a questa dashboard.",
-        )
-
-    members = session.exec(
-        select(Account).where(Account.company_id == company_id)
-    ).all()
+    totale, _ = _conta_membri(session, company_id)
+    pagina = _pagina_membri(session, company_id)
 
     return CompanyDashboardResponse(
         id=company.id,
@@ -96,17 +174,53 @@ async def get_company_dashboard(
         billing_email=company.billing_email,
         vat_number=company.vat_number,
         billing_address=company.billing_address,
-        total_members=len(members),
-        members=[
-            AccountSummary(
-                id=m.id,
-                email=m.email,
-                name=m.name,
-                surname=m.surname,
-                is_manager=m.is_manager,
-            )
-            for m in members
-        ],
+        total_members=totale,
+        members=pagina.members,
+        members_next_cursor=pagina.next_cursor,
+    )
+
+
+# ---------------------------------------------------------------------------
+# GET /companies/{company_id}/members (+ /summary)
+# ---------------------------------------------------------------------------
+
+@router.get("/{company_id}/members", response_model=MembersPage)
+async def list_company_members(
+    company_id: int,
+    limit: int = Query(MEMBERS_PAGE_DEFAULT, ge=1, le=MEMBERS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=100),
+    sort: str = Query("name", pattern="^(name|email|id)$"),
+    desc: bool = False,
+    session: Session = Depends(get_read_session),
+    current_user: Account = Depends(get_current_user),
+):
+    """
+    Membri dell'azienda a pagine (keyset): `next_cursor` va ripassato come
+    `cursor` con gli stessi q/sort/desc. `q` cerca in nome, cognome ed email.
+    """
+    _require_company_manager(company_id, current_user)
+    return _pagina_membri(session, company_id, limit, cursor, q, sort, desc)
+
+
+@router.get("/{company_id}/members/summary", response_model=MembersSummary)
+async def get_company_members_summary(
+    company_id: int,
+    session: Session = Depends(get_read_session),
+    current_user: Account = Depends(get_current_user),
+):
+    """Solo i conteggi, per i widget in testata della dashboard."""
+    _require_company_manager(company_id, current_user)
+    company = session.get(Company, company_id)
+    if not company:
+        raise HTTPException(status_code=404, detail="Azienda non trovata.")
+
+    totale, manager = _conta_membri(session, company_id)
+    return MembersSummary(
+        total_members=totale,
+        managers=manager,
+        employees=totale - manager,
+        max_active_users=company.max_active_users,
     )
 
 
@@ -191,67 +305,210 @@ class BulkInviteRequest(BaseModel):
     emails: List[str]
 
 
-@router.post("/{company_id}/invite-bulk")
-async def invite_bulk(
-    company_id: int,
-    body: BulkInviteRequest,
-    session: Session = Depends(get_session),
-    current_user: Account = Depends(get_current_user),
-):
+class InviteRecipient(BaseModel):
+    email: str
+    status: str
+    attempts: int
+    error: Optional[str]
+
+
+class BulkInviteStatus(BaseModel):
+    job_id: int
+    total: int
+    invalid: int
+    # Conteggio per stato della coda email: PENDING, SENDING, SENT, FAILED.
+    counts: dict
+    done: bool
+    recipients: list[InviteRecipient]
+    next_cursor: Optional[str]
+
+
+# Tetto per singola richiesta (testo o CSV): l'invio vero e' del worker della
+# coda email, qui si scrivono solo le righe.
+INVITE_BULK_MAX = int(os.getenv("INVITE_BULK_MAX", "5000"))
+INVITE_CSV_MAX_BYTES = int(os.getenv("INVITE_CSV_MAX_BYTES", str(1024 * 1024)))
+INVITE_STATUS_PAGE_MAX = 500
+
+_EMAIL_RE = re.compile(r"^[^@\s,;]+@[^@\s,;]+\.[^@\s,;]+$")
+_COLONNE_EMAIL_CSV = {"email", "e-mail", "mail", "indirizzo email"}
+
+
+def _normalizza_indirizzi(grezzi: List[str]) -> tuple:
+    """(validi senza duplicati nell'ordine dato, non validi)."""
+    validi: dict = {}
+    non_validi: List[str] = []
+    for email in grezzi:
+        email = (email or "").strip().strip("\"'").lower()
+        if not email:
+            continue
+        if _EMAIL_RE.match(email):
+            validi.setdefault(email, None)
+        else:
+            non_validi.append(email)
+    return list(validi), non_validi
+
+
+def _indirizzi_da_csv(contenuto: bytes) -> List[str]:
     """
-    Invia email di invito a una lista di indirizzi (max 50).
-    Solo i manager della stessa company possono usarlo.
+    Email da un CSV (separatore , ; o tab). Usa la colonna con intestazione
+    email/mail se c'e', altrimenti la prima; la prima riga e' saltata se non
+    contiene un indirizzo.
     """
-    company = session.get(Company, company_id)
-    if not company:
-        raise HTTPException(status_code=404, detail="Azienda non trovata.")
-    if not current_user.is_manager or current_user.company_id != company_id:
-        raise HTTPException(status_code=403, detail="Solo i manager possono inviare inviti.")
-
-    emails = body.emails[:50]  # hard cap
-    if not emails:
+    try:
+        testo = contenuto.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        testo = contenuto.decode("latin-1")
+    try:
+        dialetto = csv.Sniffer().sniff(testo[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialetto = csv.excel
+    righe = [r for r in csv.reader(io.StringIO(testo), dialetto) if any(c.strip() for c in r)]
+    if not righe:
+        return []
+
+    colonna = 0
+    intestazione = [c.strip().lower() for c in righe[0]]
+    for i, nome in enumerate(intestazione):
+        if nome in _COLONNE_EMAIL_CSV:
+            colonna = i
+            break
+    if not _EMAIL_RE.match(intestazione[colonna] if colonna < len(intestazione) else ""):
+        righe = righe[1:]
+    return [r[colonna] for r in righe if colonna < len(r)]
+
+
+def _accoda_inviti(session: Session, company: Company, manager: Account, grezzi: List[str]) -> dict:
+    if len(grezzi) > INVITE_BULK_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Troppi indirizzi: massimo {INVITE_BULK_MAX} per invio.",
+        )
+    if not grezzi:
         raise HTTPException(status_code=400, detail="Nessuna email fornita.")
+    emails, non_validi = _normalizza_indirizzi(grezzi)
+    if not emails:
+        raise HTTPException(status_code=400, detail="Nessuna email valida fornita.")
 
     # Genera token d'invito condiviso
     invite_token = create_access_token(
-        data={"action": "join_company", "company_id": company_id},
+        data={"action": "join_company", "company_id": company.id},
         expires_delta=INVITE_TOKEN_EXPIRE,
     )
-    frontend_url = __import__("os").getenv("FRONTEND_URL", "https://splitplan.ai")
+    frontend_url = os.getenv("FRONTEND_URL", "https://splitplan.ai")
     invite_url = f"{frontend_url}/join?token={invite_token}"
 
-    _, _, smtp_conf = get_smtp_config()
+    # Stesso invito per tutti: renderizzato e salvato una volta sul batch, le
+    # righe della coda (un solo INSERT) hanno solo il destinatario. Lo invia
+    # il worker di services/email_outbox.
+    batch = InviteBatch(
+        company_id=company.id, created_by=manager.id, total=len(emails), invalid=len(non_validi),
+        subject=f"Sei invitato a {company.name} su SplitPlan",
+        html=company_invite_email(company_name=company.name, invite_url=invite_url),
+    )
+    session.add(batch)
+    session.flush()
+    email_outbox.accoda_molti(session, emails, None, None, tipo="invite", batch_id=batch.id)
+    session.commit()
 
-    sent: List[str] = []
-    failed: List[str] = []
+    logger.info(
+        f"[INVITE-BULK] Manager {manager.email}: {len(emails)} accodati, "
+        f"{len(non_validi)} non validi (job {batch.id})"
+    )
+    # "sent" conta gli inviti accettati e accodati: l'esito reale di ognuno
+    # arriva da GET /companies/{id}/invite-bulk/{job_id}.
+    return {"job_id": batch.id, "sent": len(emails), "failed": non_validi, "invite_url": invite_url}
 
-    for email in emails:
-        email = email.strip().lower()
-        if not email or "@" not in email:
-            failed.append(email)
-            continue
 
-        if smtp_conf:
-            try:
-                message = MessageSchema(
-                    subject=f"Sei invitato a {company.name} su SplitPlan",
-                    recipients=[email],
-                    body=company_invite_email(company_name=company.name, invite_url=invite_url),
-                    subtype=MessageType.html,
-                )
-                fm = FastMail(smtp_conf)
-                await fm.send_message(message)
-                sent.append(email)
-            except Exception as e:
-                logger.warning(f"[INVITE-BULK] Email fallita per {email}: {e}")
-                failed.append(email)
-        else:
-            # SMTP non configurato: logga l'URL e segna come "inviato" in test/dev
-            logger.info(f"[INVITE-BULK] (no SMTP) {email} → {invite_url}")
-            sent.append(email)
+def _company_del_manager(session: Session, company_id: int, current_user: Account) -> Company:
+    company = session.get(Company, company_id)
+    if not company:
+        raise HTTPException(status_code=404, detail="Azienda non trovata.")
+    if not current_user.is_manager or current_user.company_id != company_id:
+        raise HTTPException(status_code=403, detail="Solo i manager possono inviare inviti.")
+    return company
+
+
+@router.post("/{company_id}/invite-bulk")
+async def invite_bulk(
+    company_id: int,
+    body: BulkInviteRequest,
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(get_current_user),
+):
+    """
+    Accoda le email di invito per una lista di indirizzi (max INVITE_BULK_MAX)
+    e risponde subito con il `job_id` da interrogare per lo stato.
+    Solo i manager della stessa company possono usarlo.
+    """
+    company = _company_del_manager(session, company_id, current_user)
+    return _accoda_inviti(session, company, current_user, body.emails)
+
+
+@router.post("/{company_id}/invite-bulk/csv")
+async def invite_bulk_csv(
+    company_id: int,
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(get_current_user),
+):
+    """Come invite-bulk, con gli indirizzi presi da un file CSV."""
+    company = _company_del_manager(session, company_id, current_user)
+    contenuto = await file.read(INVITE_CSV_MAX_BYTES + 1)
+    if len(contenuto) > INVITE_CSV_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File CSV troppo grande.")
+    return _accoda_inviti(session, company, current_user, _indirizzi_da_csv(contenuto))
 
-    logger.info(f"[INVITE-BULK] Manager {current_user.email}: {len(sent)} inviati, {len(failed)} falliti")
-    return {"sent": len(sent), "failed": failed, "invite_url": invite_url}
+
+@router.get("/{company_id}/invite-bulk/{job_id}", response_model=BulkInviteStatus)
+async def invite_bulk_status(
+    company_id: int,
+    job_id: int,
+    status: Optional[str] = Query(None, pattern="^(PENDING|SENDING|SENT|FAILED)$"),
+    limit: int = Query(100, ge=1, le=INVITE_STATUS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(get_current_user),
+):
+    """
+    Stato di un invio massivo: conteggi per stato e, a pagine, l'esito di ogni
+    destinatario (filtrabile per `status`, es. FAILED). Legge dal primario:
+    interrogato subito dopo il POST, su una replica in ritardo il job non
+    esisterebbe ancora.
+    """
+    _require_company_manager(company_id, current_user)
+    batch = session.get(InviteBatch, job_id)
+    if not batch or batch.company_id != company_id:
+        raise HTTPException(status_code=404, detail="Invio non trovato.")
+
+    conteggi = dict(session.exec(
+        select(EmailOutbox.status, func.count(EmailOutbox.id))
+        .where(EmailOutbox.batch_id == job_id)
+        .group_by(EmailOutbox.status)
+    ).all())
+
+    query = select(
+        EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.status,
+        EmailOutbox.attempts, EmailOutbox.last_error,
+    ).where(EmailOutbox.batch_id == job_id)
+    if status:
+        query = query.where(EmailOutbox.status == status)
+    valori = decodifica_cursore(cursor, 1)
+    if valori is not None:
+        query = query.where(dopo_cursore((EmailOutbox.id,), valori))
+    righe = session.exec(query.order_by(EmailOutbox.id).limit(limit + 1)).all()
+
+    return BulkInviteStatus(
+        job_id=batch.id,
+        total=batch.total,
+        invalid=batch.invalid,
+        counts=conteggi,
+        done=not (conteggi.get("PENDING") or conteggi.get("SENDING")),
+        recipients=[
+            InviteRecipient(email=r.recipient, status=r.status, attempts=r.attempts, error=r.last_error)
+            for r in righe[:limit]
+        ],
+        next_cursor=codifica_cursore([righe[limit - 1].id]) if len(righe) > limit else None,
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -266,7 +523,7 @@ async def export_company_expenses(
     date_to: Optional[str] = Query(None, description="Data fine YYYY-MM-DD"),
     employee_id: Optional[int] = Query(None, description="ID account dipendente"),
     status: Optional[str] = Query(None, description="Stato trip: APPROVED, COMPLETED, ecc."),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: Account = Depends(get_current_user),
 ):
     """
@@ -411,7 +668,7 @@ async def update_company_settings(
 @router.get("/{company_id}/analytics")
 async def get_company_analytics(
     company_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: Account = Depends(get_current_user),
 ):
     """
@@ -0,0 +1,68 @@
+"""
+Endpoint per i cron di Vercel (vercel.json "crons").
+
+Vercel chiama in GET con "Authorization: Bearer $CRON_SECRET", non con
+X-Admin-Token: per questo stanno fuori dal router admin. Fanno lo stesso
+lavoro dei corrispondenti POST /admin/..., che restano per l'uso manuale.
+
+Le pianificazioni piu' fitte di una volta al giorno (email-outbox ogni
+minuto, quotas-sync ogni 5 minuti) richiedono un piano Vercel Pro: su Hobby
+il deploy con questo vercel.json viene rifiutato. Su Hobby vanno portate a
+una volta al giorno: le email partono comunque dopo la risposta che le
+accoda (SvuotaDopoRispostaMiddleware), ma restano indietro i tentativi in
+backoff e i blocchi oltre il primo di un invio massivo.
+"""
+
+from fastapi import APIRouter, Depends
+from sqlmodel import Session
+
+from admin_auth import verify_cron_secret
+from database import get_session
+from services import email_outbox, notification_service, quota_service, trip_changes, unread_counter
+
+router = APIRouter(
+    prefix="/cron",
+    tags=["Cron"],
+    dependencies=[Depends(verify_cron_secret)],
+)
+
+
+@router.get("/email-outbox")
+async def cron_email_outbox(session: Session = Depends(get_session)):
+    """
+    Un blocco della coda email: le righe che il giro dopo la risposta non ha
+    preso (oltre EMAIL_OUTBOX_BATCH) e i tentativi in backoff. Ogni minuto.
+    """
+    return await email_outbox.elabora_coda(session)
+
+
+@router.get("/quotas-sync")
+async def cron_quotas_sync(session: Session = Depends(get_session)):
+    """
+    Write-back dei contatori AI da Redis alle colonne Account/Company, che
+    su Vercel nessun processo fa da solo. Ogni 5 minuti: le colonne servono
+    ai report e a ripartire dopo una chiave scaduta o con Redis giu'.
+    """
+    return await quota_service.sincronizza_quote(session)
+
+
+@router.get("/notifications-archive")
+def cron_notifications_archive(session: Session = Depends(get_session)):
+    """
+    Archiviazione giornaliera delle notifiche lette oltre NOTIF_ARCHIVE_DAYS.
+    Un giro dura al massimo NOTIF_ARCHIVE_MAX_SECONDS: con "done": false il
+    resto lo sposta il giro del giorno dopo.
+    """
+    return notification_service.archivia_notifiche(session)
+
+
+@router.get("/notifications-reconcile")
+def cron_notifications_reconcile(session: Session = Depends(get_session)):
+    """Riallineamento giornaliero dei contatori delle notifiche non lette."""
+    return unread_counter.riconcilia(session)
+
+
+@router.get("/trip-changes-prune")
+def cron_trip_changes_prune(session: Session = Depends(get_session)):
+    """Potatura giornaliera del registro TripChange oltre CHANGELOG_RETENTION_DAYS."""
+    return {"deleted": trip_changes.pota_registro(session)}
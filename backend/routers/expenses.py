@@ -9,13 +9,14 @@ import csv
 import io
 from fastapi.responses import StreamingResponse
 
-from database import get_session
+from database import get_session, get_read_session
 from models import Trip, Participant, Account, Expense, SQLModel
 from utils.currency import get_exchange_rates
 from admin_auth import verify_admin_token
 from services.ocr_service import process_receipt_image, SUPPORTED_MIME_TYPES
 from services.notification_service import create_notification, notify_managers
 from utils.access import check_participant
+from utils.conditional import RichiestaCondizionale, richiesta_condizionale
 
 logger = logging.getLogger(__name__)
 
@@ -194,8 +195,10 @@ async def get_expenses(
     trip_id: int,
     session: Session = Depends(get_session),
     current_user: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
 ):
     check_participant(trip_id, current_user, session)
+    condizionale.verifica_viaggio(session, trip_id, "expenses")
     return session.exec(select(Expense).where(Expense.trip_id == trip_id)).all()
 
 
@@ -204,8 +207,10 @@ async def get_balances(
     trip_id: int,
     session: Session = Depends(get_session),
     current_user: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
 ):
     check_participant(trip_id, current_user, session)
+    condizionale.verifica_viaggio(session, trip_id, "balances")
     # Fetch all expenses and participants
     expenses = session.exec(select(Expense).where(Expense.trip_id == trip_id)).all()
     participants = session.exec(
@@ -417,7 +422,7 @@ async def delete_expense(
 @router.get("/{trip_id}/export", response_class=StreamingResponse)
 async def export_expenses_csv(
     trip_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: Account = Depends(get_current_user),
 ):
     # 1. Verifica autorizzazione (l'utente deve far parte del viaggio)
@@ -7,16 +7,20 @@ from database import get_session
 from models import Trip, Account
 from routers.users import get_current_user
 from utils.access import check_participant
-from google import genai
-from google.genai import types
+from utils.lazy import LazyModule, LazyObject
+from services.timing import span
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-try:
-    ai_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-except Exception:
-    ai_client = None
+genai = LazyModule("google.genai")
+
+# Il client viene creato al primo uso: senza chiave resta None come prima.
+ai_client = (
+    LazyObject(lambda: genai.Client(api_key=os.getenv("GOOGLE_API_KEY")))
+    if os.getenv("GOOGLE_API_KEY")
+    else None
+)
 
 DUFFEL_API_KEY = os.getenv("DUFFEL_API_KEY")
 DUFFEL_BASE_URL = "https://api.duffel.com"
@@ -89,10 +93,11 @@ def search_flights(
                 logger.info(f"[Duffel] Inferring IATA codes via AI for: {origin_iata} -> {dest_iata}")
                 prompt = f"Trova i codici aeroportuali IATA ufficiali di 3 lettere. Partenza: '{origin_iata}' (es. Bologna è BLQ). Destinazione: '{dest_iata}'. Rispondi RIGOROSAMENTE E SOLO con i due codici separati da virgola (es. BLQ,JFK). Attenzione ai codici corretti!"
                 
-                resp = ai_client.models.generate_content(
-                    model='gemini-3.1-flash-lite',
-                    contents=prompt,
-                )
+                with span("gemini"):
+                    resp = ai_client.models.generate_content(
+                        model='gemini-3.1-flash-lite',
+                        contents=prompt,
+                    )
                 parts = [p.strip().upper()[:3] for p in resp.text.split(',')]
                 if len(parts) >= 2:
                     origin_iata = parts[0]
@@ -158,7 +163,7 @@ def search_flights(
     }
 
     try:
-        with httpx.Client(timeout=30.0) as client:
+        with httpx.Client(timeout=30.0) as client, span("duffel"):
             resp = client.post(
                 f"{DUFFEL_BASE_URL}/air/offer_requests?return_offers=true",
                 json=payload,
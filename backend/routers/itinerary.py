@@ -8,6 +8,7 @@ from auth import get_current_user
 from database import get_session
 from models import Account, ItineraryItem, Participant
 from utils.access import check_participant
+from utils.conditional import RichiestaCondizionale, richiesta_condizionale
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +29,11 @@ async def get_itinerary(
     trip_id: int,
     session: Session = Depends(get_session),
     current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
 ):
     check_participant(trip_id, current_account, session)
+    # Stessa risorsa di GET /trips/{id}/itinerary ma ordinata diversamente: ETag propri.
+    condizionale.verifica_viaggio(session, trip_id, "itinerary-raw")
     return session.exec(
         select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
     ).all()
@@ -2,11 +2,16 @@
 Router notifiche — endpoint per gestire le notifiche in-app degli utenti.
 """
 import logging
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, func
+from sqlalchemy import update
+from sqlmodel import Session, select
 from database import get_session
 from auth import get_current_user
 from models import Account, Notification
+from services import unread_counter
+from utils.pagination import codifica_cursore, decodifica_cursore, dopo_cursore, ordinamento
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
@@ -14,16 +19,10 @@ router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
 @router.get("/unread-count")
 async def get_unread_count(
-    session: Session = Depends(get_session),
     current_user: Account = Depends(get_current_user),
 ):
-    count = session.exec(
-        select(func.count(Notification.id)).where(
-            Notification.account_id == current_user.id,
-            Notification.is_read == False,
-        )
-    ).one()
-    return {"count": count}
+    # Contatore per account (services/unread_counter): nessun COUNT(*).
+    return {"count": await unread_counter.leggi(current_user)}
 
 
 @router.get("")
@@ -32,15 +31,37 @@ async def get_notifications(
     current_user: Account = Depends(get_current_user),
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    unread_only: bool = False,
 ):
-    notifications = session.exec(
-        select(Notification)
-        .where(Notification.account_id == current_user.id)
-        .order_by(Notification.created_at.desc())
-        .offset(offset)
-        .limit(min(limit, 50))
-    ).all()
-    return {"notifications": notifications}
+    """
+    Notifiche dell'account, dalla piu' recente. Paginazione keyset su
+    (created_at, id) con `cursor` = `next_cursor` della pagina precedente;
+    `offset` resta per i client che non passano il cursore.
+    """
+    limit = max(1, min(limit, 50))
+    query = select(Notification).where(Notification.account_id == current_user.id)
+    if unread_only:
+        query = query.where(Notification.is_read == False)
+
+    colonne = (Notification.created_at, Notification.id)
+    valori = decodifica_cursore(cursor, 2)
+    if valori is not None:
+        try:
+            valori = [datetime.fromisoformat(valori[0]), int(valori[1])]
+        except (TypeError, ValueError):
+            raise HTTPException(400, "Cursore di paginazione non valido.")
+        query = query.where(dopo_cursore(colonne, valori, discendente=True))
+    elif offset:
+        query = query.offset(offset)
+
+    righe = session.exec(query.order_by(*ordinamento(colonne, discendente=True)).limit(limit + 1)).all()
+    notifications = righe[:limit]
+    prossimo = None
+    if len(righe) > limit:
+        ultima = notifications[-1]
+        prossimo = codifica_cursore([ultima.created_at.isoformat(), ultima.id])
+    return {"notifications": notifications, "next_cursor": prossimo}
 
 
 @router.post("/{notification_id}/read")
@@ -65,14 +86,16 @@ async def mark_all_read(
     session: Session = Depends(get_session),
     current_user: Account = Depends(get_current_user),
 ):
-    unread = session.exec(
-        select(Notification).where(
+    marcate = session.execute(
+        update(Notification)
+        .where(
             Notification.account_id == current_user.id,
             Notification.is_read == False,
         )
-    ).all()
-    for notif in unread:
-        notif.is_read = True
-        session.add(notif)
+        .values(is_read=True)
+    ).rowcount
+    # Sottrae le righe marcate invece di azzerare: una notifica inserita in
+    # parallelo, non toccata dall'UPDATE, resta fra le non lette.
+    unread_counter.incrementa(session, {current_user.id: -marcate})
     session.commit()
-    return {"marked": len(unread)}
+    return {"marked": marcate}
@@ -2,9 +2,7 @@ import logging
 import os
 from datetime import datetime, timezone, timedelta
 
-import stripe
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import BaseModel
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
@@ -13,12 +11,18 @@ from auth import get_current_user
 from database import get_session
 from email_templates import purchase_receipt_email
 from models import Account, ProcessedStripeEvent
-from utils.email_utils import get_smtp_config
+from utils.lazy import LazyModule
+from services import email_outbox
+from services.timing import span
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/payments", tags=["payments"])
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# stripe e' importato alla prima chiamata, non al cold start: la chiave viene
+# impostata in quel momento.
+stripe = LazyModule(
+    "stripe", on_load=lambda modulo: setattr(modulo, "api_key", os.getenv("STRIPE_SECRET_KEY"))
+)
 WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://splitplan-ai.vercel.app")
 
@@ -87,7 +91,8 @@ def _account_from_stripe_customer(customer_id, session: Session):
     if not customer_id:
         return None
     try:
-        customer = stripe.Customer.retrieve(customer_id)
+        with span("stripe"):
+            customer = stripe.Customer.retrieve(customer_id)
         email = getattr(customer, "email", None)
     except stripe.error.StripeError as e:
         logger.error(f"[Webhook] Customer {customer_id} non recuperabile: {e}")
@@ -173,7 +178,8 @@ async def create_checkout(
                 }
             ]
 
-        checkout_session = stripe.checkout.Session.create(**params)
+        with span("stripe"):
+            checkout_session = stripe.checkout.Session.create(**params)
         logger.info(
             f"Checkout creato per account {current_account.id}, prodotto {req.product_type}"
         )
@@ -222,39 +228,34 @@ async def process_successful_checkout(
             f"[Activation] Abbonamento {product['plan']} attivato per account {account.id}"
         )
 
-    # Marker e accredito vengono resi persistenti insieme: o entrambi o nessuno.
+    # Ricevuta accodata (services/email_outbox): il webhook risponde a Stripe
+    # senza aspettare SMTP.
+    amount_str = f"EUR{product['amount']/100:.2f}"
+    credits_text = (
+        f"+{product['credits']} Crediti"
+        if "credits" in product
+        else f"Piano {product['plan']}"
+    )
+    email_outbox.accoda(
+        session,
+        account.email,
+        "Ricevuta di acquisto SplitPlan",
+        purchase_receipt_email(
+            name=account.name,
+            product_name=product["name"],
+            amount=amount_str,
+            credits_added=credits_text,
+            market_url=f"{FRONTEND_URL}/market",
+        ),
+        tipo="receipt",
+    )
+
+    # Marker, accredito e ricevuta vengono resi persistenti insieme: o tutti o nessuno.
     session.add(account)
     session.commit()
     session.refresh(account)
     logger.info(f"[Idempotency] {idempotency_key} completato.")
 
-    # Email ricevuta
-    try:
-        smtp_user, smtp_password, smtp_conf = get_smtp_config()
-        if smtp_user and smtp_password:
-            amount_str = f"EUR{product['amount']/100:.2f}"
-            credits_text = (
-                f"+{product['credits']} Crediti"
-                if "credits" in product
-                else f"Piano {product['plan']}"
-            )
-            message = MessageSchema(
-                subject="Ricevuta di acquisto SplitPlan",
-                recipients=[account.email],
-                body=purchase_receipt_email(
-                    name=account.name,
-                    product_name=product["name"],
-                    amount=amount_str,
-                    credits_added=credits_text,
-                    market_url=f"{FRONTEND_URL}/market",
-                ),
-                subtype=MessageType.html,
-            )
-            await FastMail(smtp_conf).send_message(message)
-            logger.info(f"Ricevuta email inviata a {account.email}")
-    except Exception as e:
-        logger.error(f"Invio ricevuta fallito per account {account.id}: {e}")
-
 
 # ---- WEBHOOK ----
 
@@ -345,7 +346,8 @@ async def verify_session(
     current_account: Account = Depends(get_current_user),
 ):
     try:
-        cs = stripe.checkout.Session.retrieve(session_id)
+        with span("stripe"):
+            cs = stripe.checkout.Session.retrieve(session_id)
         if cs.payment_status == "paid":
             meta = cs.metadata or {}
             product_type, account_id = meta.get("product_type"), meta.get("account_id")
@@ -387,14 +389,16 @@ async def create_portal_session(
     current_account: Account = Depends(get_current_user),
 ):
     try:
-        customers = stripe.Customer.list(email=current_account.email, limit=1)
+        with span("stripe"):
+            customers = stripe.Customer.list(email=current_account.email, limit=1)
         if not customers.data:
             raise HTTPException(
                 status_code=404, detail="Nessun abbonamento attivo trovato"
             )
-        portal = stripe.billing_portal.Session.create(
-            customer=customers.data[0].id, return_url=f"{FRONTEND_URL}/market"
-        )
+        with span("stripe"):
+            portal = stripe.billing_portal.Session.create(
+                customer=customers.data[0].id, return_url=f"{FRONTEND_URL}/market"
+            )
         return {"url": portal.url}
     except stripe.error.StripeError as e:
         logger.error(f"[Portal] {e}")
@@ -5,12 +5,13 @@ from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlmodel import Session, select
-from supabase import create_client, Client
 
 from auth import get_current_user
 from database import get_session
 from models import Photo, Trip, Account, Participant
 from utils.access import check_participant
+from utils.conditional import RichiestaCondizionale, richiesta_condizionale
+from utils.lazy import LazyModule
 
 logger = logging.getLogger(__name__)
 
@@ -21,15 +22,18 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 BUCKET_NAME = "trip-photos"
 
+# Importato al primo upload/lettura: supabase porta con se' mezzo ecosistema HTTP.
+supabase = LazyModule("supabase")
+
 # Verifica configurazione
 if not SUPABASE_URL or not SUPABASE_KEY:
     logger.warning("Supabase credentials not found. Photo upload will fail.")
 
 
-def get_supabase() -> Client:
+def get_supabase() -> "supabase.Client":
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 
@@ -87,8 +91,10 @@ async def get_photos(
     trip_id: int,
     session: Session = Depends(get_session),
     current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
 ):
     check_participant(trip_id, current_account, session)
+    condizionale.verifica_viaggio(session, trip_id, "photos")
     return session.exec(select(Photo).where(Photo.trip_id == trip_id)).all()
 
 
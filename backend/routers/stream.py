@@ -0,0 +1,123 @@
+"""
+Stream di eventi (Server-Sent Events) per viaggio e per account.
+
+Sostituiscono il polling di saldi, partecipanti, itinerario e contatore
+notifiche: il client apre uno stream e ricarica solo quando arriva un evento
+dell'area che gli interessa (vedi services/event_bus).
+
+    GET /stream/trips/{trip_id}   trip.changed {trip_id, areas}
+    GET /stream/me                notifications.changed, trips.changed
+
+Ogni stream apre con "ready" (il client ricarica lo stato: puo' aver perso
+eventi mentre era disconnesso), manda un commento di keep-alive ogni
+STREAM_HEARTBEAT_SECONDS e chiude dopo STREAM_MAX_SECONDS: EventSource si
+riconnette da solo, e sulle piattaforme serverless la risposta non supera il
+timeout della funzione.
+
+EventSource non puo' impostare header: il token si puo' passare anche come
+?access_token=.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from auth import get_current_user
+from database import get_session
+from models import Account
+from services.event_bus import bus, canale_account, canale_trip
+from utils.access import check_participant
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_MAX_SECONDS = float(
+    os.getenv("STREAM_MAX_SECONDS", "25" if os.getenv("VERCEL") else "300")
+)
+STREAM_RETRY_MS = 3000
+
+
+async def utente_stream(
+    request: Request,
+    access_token: Optional[str] = Query(None),
+    session: Session = Depends(get_session),
+) -> Account:
+    token = access_token
+    autorizzazione = request.headers.get("authorization", "")
+    if autorizzazione.lower().startswith("bearer "):
+        token = autorizzazione[7:]
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token=token, session=session)
+
+
+def _evento_sse(tipo: str, dati: dict) -> str:
+    return f"event: {tipo}\ndata: {json.dumps(dati, separators=(',', ':'))}\n\n"
+
+
+async def _flusso(request: Request, canali: List[str]):
+    async with bus.iscrivi(*canali) as iscrizione:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        yield _evento_sse("ready", {"channels": canali})
+        scadenza = time.monotonic() + STREAM_MAX_SECONDS
+        while True:
+            restante = scadenza - time.monotonic()
+            if restante <= 0 or await request.is_disconnected():
+                break
+            try:
+                evento = await asyncio.wait_for(
+                    iscrizione.coda.get(), timeout=min(STREAM_HEARTBEAT_SECONDS, restante)
+                )
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield _evento_sse(evento["type"], {**evento["data"], "channel": evento["channel"]})
+            if iscrizione.persa:
+                yield _evento_sse("resync", {})
+                break
+
+
+def _risposta(request: Request, canali: List[str]) -> StreamingResponse:
+    return StreamingResponse(
+        _flusso(request, canali),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/trips/{trip_id}")
+async def stream_trip(
+    trip_id: int,
+    request: Request,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(utente_stream),
+):
+    check_participant(trip_id, current_account, session)
+    # Lo stream puo' restare aperto minuti: la connessione al DB torna al
+    # pool subito, non quando la risposta finisce.
+    session.close()
+    return _risposta(request, [canale_trip(trip_id)])
+
+
+@router.get("/me")
+async def stream_account(
+    request: Request,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(utente_stream),
+):
+    canali = [canale_account(current_account.id)]
+    session.close()
+    return _risposta(request, canali)
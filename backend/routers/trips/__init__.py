@@ -1,3388 +1,41 @@
-from fastapi import (
-    APIRouter,
-    Depends,
-    HTTPException,
-    status,
-    UploadFile,
-    File,
-    Form,
+"""
+Router dei viaggi (/trips), diviso per area:
+
+    core       creazione, elenco, dettaglio, modifica, condivisione, partecipanti
+    ai         proposte, itinerario, stime di budget, chat, scontrini
+    voting     voto delle proposte
+    sync       modifiche incrementali per i client offline (/changes)
+    export     PDF del viaggio e nota spese
+    events     eventi in destinazione
+    approvals  workflow di approvazione delle trasferte business
+
+Gli SDK pesanti (google-genai, fpdf, ortools, fastapi-mail, client Google
+Calendar) non vengono importati qui: ogni sotto-router li carica al primo
+endpoint che ne ha bisogno. `python profile_imports.py --prefix routers.trips`
+mostra il costo di import di ciascun modulo.
+
+L'ordine di inclusione conta: /my-trips, /stats, /business-overview e
+/share/{token} devono essere registrati prima di GET /{trip_id}, che
+altrimenti li intercetterebbe. Gli URL restano quelli del modulo unico.
+"""
+
+from fastapi import APIRouter
+
+from routers.trips import ai, approvals, core, events, export, sync, voting
+from routers.trips._common import (
+    AI_MODEL,
+    AI_MODELS,
+    FREE_LIMIT,
+    _a_datetime,
+    _gemini_call_with_retry,
+    ai_client,
+    auto_approva_se_manager,
+    check_rate_limit,
+    require_manager,
+    require_premium,
 )
-from fastapi.responses import StreamingResponse, Response
-from urllib.parse import quote
-import io
-from fpdf import FPDF
 
-from sqlmodel import Session, select, func, delete, Field
-from typing import List, Dict, Optional, Literal
+router = APIRouter()
 
-import logging
-import os
-import json
-from datetime import datetime, timezone
-import httpx
-from sqlalchemy import update
-from google import genai
-from google.genai import types
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
-import re
-
-from database import get_session
-from auth import get_current_user
-from models import (
-    Trip,
-    TripBase,
-    Participant,
-    Proposal,
-    Vote,
-    ItineraryItem,
-    SQLModel,
-    Account,
-    Company,
-    Expense,
-    Photo,
-    Notification,
-)
-
-
-class RejectTripRequest(SQLModel):
-    rejection_reason: Optional[str] = None
-
-
-def require_manager(current_user: Account = Depends(get_current_user)) -> Account:
-    """Dependency riusabile: verifica che l'utente sia un manager aziendale."""
-    if not current_user.is_manager:
-        raise HTTPException(status_code=403, detail="Accesso riservato ai manager aziendali")
-    return current_user
-from fastapi_mail import FastMail, MessageSchema, MessageType
-from email_templates import booking_confirmation_email
-from utils.email_utils import get_smtp_config
-from utils.crypto import decrypt_text
-from utils.access import (
-    check_company_limits,
-    check_participant,
-    check_tenant_for_trip,
-    require_same_company,
-)
-from services.notification_service import (
-    create_notification,
-    notify_managers,
-    send_notification_email,
-)
-from email_templates import (
-    email_approval_requested,
-    email_trip_approved,
-    email_trip_rejected,
-)
-from services.itinerary_optimizer import optimize_travel_itinerary
-from services.maps_service import get_route_geometry
-
-
-load_dotenv()
-
-logger = logging.getLogger(__name__)
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-ai_client = None
-
-# I nomi dei modelli vengono ritirati o vanno in sovraccarico senza preavviso:
-# gemini-2.5-flash risponde 404 ("no longer available to new users") e
-# gemini-3.5-flash risponde 503 ("currently overloaded"). Insistere su un solo
-# nome significava ritentarlo con backoff per minuti e poi fallire con un 500.
-# Si prova quindi una catena: al primo errore transient si passa al successivo.
-# Ordine scelto misurando latenza e affidabilita' con la chiave del progetto.
-AI_MODELS = ["gemini-3.1-flash-lite", "gemini-3-flash-preview"]
-AI_MODEL = AI_MODELS[0]   # usato dalle chiamate diverse da _gemini_call_with_retry
-
-# ── Retry helper per chiamate Gemini (gestisce 503/429 transient) ──────────
-import asyncio as _asyncio
-
-
-def _e_transient(errore: str) -> bool:
-    """Errore temporaneo o modello non disponibile: conviene cambiare modello."""
-    return any(
-        segnale in errore
-        for segnale in ("503", "UNAVAILABLE", "429", "RESOURCE_EXHAUSTED", "404", "NOT_FOUND")
-    )
-
-
-async def _gemini_call_with_retry(contents, *, json_mode=False, max_retries=2):
-    """Chiama Gemini provando i modelli in ordine, con un breve retry ciascuno.
-
-    Prima si ritentava sempre lo stesso modello con backoff esponenziale: con un
-    modello in sovraccarico l'utente restava ad aspettare minuti per poi vedere
-    comunque un errore, e su Vercel la funzione veniva uccisa prima ancora di
-    rispondere. Ora al secondo fallimento si passa al modello successivo.
-    """
-    config = (
-        types.GenerateContentConfig(response_mime_type="application/json")
-        if json_mode
-        else None
-    )
-    last_exc = None
-
-    for modello in AI_MODELS:
-        for attempt in range(max_retries):
-            try:
-                response = await ai_client.aio.models.generate_content(
-                    model=modello,
-                    contents=contents,
-                    **({"config": config} if config else {}),
-                )
-                if modello != AI_MODELS[0]:
-                    logger.info(f"[Gemini] Risposta ottenuta dal modello di riserva {modello}")
-                return response
-            except Exception as e:
-                last_exc = e
-                err_str = str(e)
-                if not _e_transient(err_str):
-                    raise  # errore vero (prompt, auth): inutile insistere
-                ultimo_tentativo = attempt == max_retries - 1
-                logger.warning(
-                    f"[Gemini] {modello} tentativo {attempt + 1}/{max_retries} "
-                    f"fallito ({err_str[:70]})"
-                    + ("; passo al modello successivo" if ultimo_tentativo else "; ritento fra 1s")
-                )
-                if not ultimo_tentativo:
-                    await _asyncio.sleep(1)
-
-    logger.error("[Gemini] Nessun modello disponibile ha risposto.")
-    raise last_exc
-
-if GOOGLE_API_KEY:
-    logger.info("[OK] System: Google Gemini Client initialized.")
-    ai_client = genai.Client(api_key=GOOGLE_API_KEY)
-else:
-    logger.warning(
-        "[WARNING] System: GOOGLE_API_KEY missing. Running in Mock/Manual mode."
-    )
-
-router = APIRouter(prefix="/trips", tags=["trips"])
-
-
-class PreferencesRequest(SQLModel):
-    destination: str
-    departure_airport: str
-    budget: float
-    budget_max: float = 0.0
-    num_people: int = 1
-    start_date: str
-    end_date: str
-    must_have: Optional[str] = ""
-    must_avoid: Optional[str] = ""
-    vibe: Optional[str] = ""
-    participant_names: List[str] = []
-    transport_mode: Optional[str] = None
-    trip_intent: str = "LEISURE"
-    work_start_time: Optional[str] = "09:00"
-    work_end_time: Optional[str] = "18:00"
-    work_days: Optional[str] = "Monday,Tuesday,Wednesday,Thursday,Friday"
-    office_address: Optional[str] = None
-
-
-class SurveyBudgetRequest(SQLModel):
-    destination: str
-    departure_airport: str
-    start_date: str
-    end_date: str
-    transport_mode: Optional[str] = "FLIGHT"
-    num_people: int = 1
-
-
-class SearchOptionRequest(SQLModel):
-    type: str  # 'flight' or 'hotel'
-
-
-class ConfirmOptionRequest(SQLModel):
-    type: str
-    price: float
-    provider: str
-    details: str
-
-
-class HotelSelectionRequest(SQLModel):
-    hotel_name: str
-    hotel_address: str
-    transport_mode: Optional[str] = None
-    transport_cost: Optional[float] = 0.0
-    hotel_cost: Optional[float] = 0.0
-    arrival_time: Optional[str] = None
-    return_time: Optional[str] = None
-
-
-class TripCreateRequest(SQLModel):
-    """Campi che il client puo' impostare creando un viaggio via POST /trips/.
-
-    NON usare TripBase come body: e' il modello della tabella e include campi
-    controllati dal server (is_premium, status, company_id, approved_by,
-    share_token, ...). Accettarli dal client permetteva di sbloccare il premium
-    senza pagare, di auto-approvare una trasferta scavalcando il manager e di
-    attribuire un viaggio all'azienda di un altro tenant.
-    """
-
-    name: str
-    trip_type: str
-    trip_intent: Literal["LEISURE", "BUSINESS"] = "LEISURE"
-    destination: str = ""
-    description: Optional[str] = None
-
-    budget: float = Field(default=0.0, ge=0)
-    budget_max: float = Field(default=0.0, ge=0)
-    num_people: int = Field(default=1, ge=1, le=50)
-    start_date: Optional[datetime] = None
-    end_date: Optional[datetime] = None
-
-    must_have: Optional[str] = ""
-    must_avoid: Optional[str] = ""
-    vibe: Optional[str] = ""
-    transport_mode: str = "FLIGHT"
-    departure_city: Optional[str] = None
-    accommodation: Optional[str] = None
-    accommodation_location: Optional[str] = None
-
-    office_address: Optional[str] = None
-    work_start_time: Optional[str] = "09:00"
-    work_end_time: Optional[str] = "18:00"
-    work_days: Optional[str] = "Monday,Tuesday,Wednesday,Thursday,Friday"
-
-
-class TripUpdateRequest(SQLModel):
-    """Campi modificabili dall'organizzatore via PATCH /trips/{id}.
-    Tutti opzionali: si aggiornano solo i campi presenti nel body."""
-    name: Optional[str] = None
-    destination: Optional[str] = None
-    start_date: Optional[str] = None
-    end_date: Optional[str] = None
-    budget: Optional[float] = None
-    budget_max: Optional[float] = None
-    num_people: Optional[int] = None
-    accommodation: Optional[str] = None
-    transport_mode: Optional[str] = None
-    notes: Optional[str] = None
-    office_address: Optional[str] = None
-    work_start_time: Optional[str] = None
-    work_end_time: Optional[str] = None
-    work_days: Optional[str] = None
-
-
-FREE_LIMIT = 20
-
-
-def check_rate_limit(account: Account, session: Session):
-    """
-    Tracciamento e rate limit AI.
-
-    - B2B (account.company_id): incrementa monthly_ai_usage (reset mensile).
-      L'enforcement aggregato avviene in check_company_limits('ai_call').
-    - B2C subscribed (Pro): nessun limite, nessun tracciamento.
-    - B2C free: 20 chiamate/giorno via FREE_LIMIT.
-
-    L'UPDATE atomico evita race condition su reset/incremento.
-    """
-    from sqlalchemy import case as sa_case, text as sa_text
-
-    # B2B: tracciamento mensile, nessun cap individuale (cap aggregato a livello company)
-    if account.company_id is not None:
-        current_month = datetime.now(timezone.utc).strftime("%Y-%m")
-        session.execute(
-            update(Account)
-            .where(Account.id == account.id)
-            .values(
-                monthly_ai_usage=sa_case(
-                    (Account.last_monthly_reset != current_month, 1),
-                    else_=Account.monthly_ai_usage + 1,
-                ),
-                last_monthly_reset=current_month,
-            )
-        )
-        session.commit()
-        return
-
-    if account.is_subscribed:
-        return
-
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-
-    result = session.execute(
-        update(Account)
-        .where(
-            Account.id == account.id,
-            # Passa solo se è un nuovo giorno OPPURE siamo ancora sotto il limite
-            sa_text(
-                "(:today != last_usage_reset OR daily_ai_usage < :limit)"
-            ).bindparams(today=today, limit=FREE_LIMIT),
-        )
-        .values(
-            daily_ai_usage=sa_case(
-                (Account.last_usage_reset != today, 1),
-                else_=Account.daily_ai_usage + 1,
-            ),
-            last_usage_reset=today,
-        )
-    )
-    session.commit()
-
-    if result.rowcount == 0:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Hai raggiunto il limite giornaliero di {FREE_LIMIT} chiamate AI per utenti Free. Passa a Pro per navigare senza limiti!",
-        )
-
-
-def _a_datetime(valore):
-    """Converte in datetime una data che puo' arrivare come stringa ISO.
-
-    Le richieste del client dichiarano start_date/end_date come str, mentre sul
-    modello sono datetime. Assegnare la stringa direttamente lasciava il campo
-    come str finche' l'oggetto non veniva ricaricato dal DB: da qui gli
-    `trip.start_date.replace("Z", "")` sparsi nel codice, che funzionano su una
-    stringa e sollevano TypeError su un datetime (e viceversa). Postgres accetta
-    la stringa in scrittura e maschera il problema; SQLite no.
-    """
-    if valore is None or isinstance(valore, datetime):
-        return valore
-    try:
-        return datetime.fromisoformat(str(valore).replace("Z", "+00:00"))
-    except ValueError:
-        logger.warning(f"Data non interpretabile: {valore!r}")
-        return None
-
-
-def auto_approva_se_manager(trip: Trip, account: Account) -> bool:
-    """Approva la trasferta se a organizzarla e' il manager stesso.
-
-    Il workflow di approvazione esiste perche' un dipendente non decida da solo
-    su budget e policy. Quando la trasferta la crea il manager dell'azienda,
-    quel controllo non ha senso: gli veniva chiesto di inviare una richiesta a
-    se stesso, e finche' non la approvava il flusso restava bloccato.
-    """
-    if trip.trip_intent != "BUSINESS":
-        return False
-    if not account.is_manager or not account.company_id:
-        return False
-    if trip.company_id and trip.company_id != account.company_id:
-        return False
-
-    trip.status = "APPROVED"
-    trip.approved_by = account.id
-    trip.approval_requested_at = datetime.now(timezone.utc)
-    logger.info(
-        f"Trip {trip.id} approvato automaticamente: l'organizzatore {account.id} "
-        f"e' manager della company {account.company_id}"
-    )
-    return True
-
-
-def require_premium(account: Account, trip: Trip):
-    """Solleva un 403 se l'utente non è abbonato e il viaggio non è sbloccato.
-    Gli utenti aziendali (company_id impostato) o i viaggi BUSINESS bypassano il check."""
-    if account.company_id:
-        return  # utenti aziendali usano il piano della company
-    if trip.trip_intent == "BUSINESS":
-        return  # viaggi business non richiedono premium individuale
-    if not account.is_subscribed and not trip.is_premium:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Funzionalità Premium. Sblocca il viaggio con un credito o abbonati per accedere.",
-        )
-
-
-@router.post("/extract-receipt")
-async def extract_receipt(
-    type: str = Form(...),
-    file: UploadFile = File(...),
-    current_user: Account = Depends(get_current_user),
-    session: Session = Depends(get_session),
-):
-    check_rate_limit(current_user, session)
-    if not ai_client:
-        raise HTTPException(status_code=500, detail="AI Client non inizializzato.")
-
-    MAX_FILE_SIZE = 3 * 1024 * 1024  # 3 MB
-    if getattr(file, "size", 0) and file.size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail="File troppo grande. Il limite è di 3 MB.",
-        )
-
-    try:
-        contents = await file.read()
-
-        if type == "hotel":
-            prompt = f"""
-            Analizza questa ricevuta o conferma di prenotazione HOTEL / AIRBNB.
-            Estrai i seguenti dati in formato JSON puro, senza markdown:
-            {{
-                "hotel_name": "Nome della struttura",
-                "hotel_address": "Indirizzo completo",
-                "hotel_cost": 0.0 (costo totale in Euro),
-                "arrival_time": "HH:MM" (orario di check-in o arrivo previsto),
-                "return_time": "HH:MM" (orario di check-out o partenza prevista)
-            }}
-            Se un dato non è presente, usa null o 0.0.
-            LINGUA: {current_user.language.upper()}.
-            """
-        else:
-            prompt = f"""
-            Analizza questa ricevuta o conferma di prenotazione VOLO / TRENO / BUS.
-            Estrai i seguenti dati in formato JSON puro, senza markdown:
-            {{
-                "transport_cost": 0.0 (costo totale in Euro),
-                "arrival_time": "HH:MM" (orario di arrivo a destinazione),
-                "return_time": "HH:MM" (orario di partenza per il ritorno)
-            }}
-            Se un dato non è presente, usa null o 0.0.
-            LINGUA: {current_user.language.upper()}.
-            """
-
-        response = await ai_client.aio.models.generate_content(
-            model=AI_MODEL,
-            contents=[
-                prompt,
-                genai.types.Part.from_bytes(data=contents, mime_type=file.content_type),
-            ],
-            config=types.GenerateContentConfig(response_mime_type="application/json"),
-        )
-
-        raw_text = response.text.strip()
-        logger.info(f"[DEBUG] Receipt AI Response: {raw_text}")
-
-        try:
-            data = json.loads(raw_text)
-            return {"success": True, "data": data}
-        except (json.JSONDecodeError, ValueError) as je:
-            logger.error(f"[JSON Error] {je}")
-
-        return {
-            "success": False,
-            "data": {},
-            "message": "L'IA non è riuscita a estrarre i dati. Compila pure a mano.",
-        }
-
-    except Exception as e:
-        logger.error(f"[Receipt Error] {e}")
-        return {"success": False, "data": {}, "message": f"Errore tecnico: {str(e)}"}
-
-
-class ChatRequest(SQLModel):
-    message: str
-    history: Optional[List[Dict]] = []
-
-
-class JoinRequest(SQLModel):
-    share_token: str
-    participant_name: str
-
-
-async def get_coordinates(address: str):
-    """Trasforma un indirizzo in coordinate Lat/Lon usando Nominatim (OSM)"""
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {"q": address, "format": "json", "limit": 1}
-        headers = {
-            "User-Agent": f'SplitPlanApp/1.0 (contact: ({os.getenv("EMAIL_OSM")})'
-        }
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url, params=params, headers=headers, timeout=5.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    return float(data[0]["lat"]), float(data[0]["lon"])
-    except Exception as e:
-        logger.error(f"[OSM Error] Geocoding fallito per {address}: {e}")
-    return None, None
-
-
-async def get_places_from_overpass(lat: float, lon: float, radius: int = 800):
-    """Query Overpass API per trovare nomi reali di ristoranti e bar vicini"""
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    query = f"""
-    [out:json][timeout:25];
-    (
-      node["amenity"~"restaurant|bar|cafe|pub|fast_food"](around:{radius},{lat},{lon});
-      way["amenity"~"restaurant|bar|cafe|pub|fast_food"](around:{radius},{lat},{lon});
-      node["leisure"~"beach_resort|bath"](around:{radius},{lat},{lon});
-      way["leisure"~"beach_resort|bath"](around:{radius},{lat},{lon});
-    );
-    out center 50;
-    """
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                overpass_url, data={"data": query}, timeout=15.0
-            )
-            if response.status_code == 200:
-                elements = response.json().get("elements", [])
-                places_map = {}
-
-                for e in elements:
-                    tags = e.get("tags", {})
-                    name = tags.get("name")
-                    if name:
-                        lat_val = e.get("lat") or e.get("center", {}).get("lat")
-                        lon_val = e.get("lon") or e.get("center", {}).get("lon")
-                        if lat_val and lon_val:
-                            if name not in places_map or e.get("type") == "node":
-                                places_map[name] = {
-                                    "name": name,
-                                    "lat": lat_val,
-                                    "lon": lon_val,
-                                }
-
-                return list(places_map.values())
-    except Exception as e:
-        logger.error(f"[OSM Error] Overpass fallito: {e}")
-    return []
-
-
-@router.post("/{trip_id}/optimize")
-async def optimize_itinerary(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Ottimizza l'ordine delle attività per ridurre gli spostamenti (TSP semplice)"""
-    check_participant(trip_id, current_account, session)
-    try:
-        trip = session.get(Trip, trip_id)
-        items = session.exec(
-            select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
-        ).all()
-
-        if len(items) < 3:
-            return {
-                "status": "skipped",
-                "message": "Troppi pochi elementi per ottimizzare.",
-            }
-
-        by_day = {}
-        for item in items:
-            day = item.start_time.split("T")[0]
-            if day not in by_day:
-                by_day[day] = []
-            by_day[day].append(item)
-
-        total_updated = 0
-        for day, day_items in by_day.items():
-            fixed = [i for i in day_items if i.type in ["CHECKIN", "CHECKOUT"]]
-            to_optimize = [
-                i
-                for i in day_items
-                if i.type not in ["CHECKIN", "CHECKOUT"] and i.latitude and i.longitude
-            ]
-
-            if not to_optimize:
-                continue
-            start_lat, start_lon = None, None
-            if trip.accommodation_location:
-                start_lat, start_lon = await get_coordinates(
-                    trip.accommodation_location
-                )
-
-            if not start_lat and fixed:
-                start_lat, start_lon = fixed[0].latitude, fixed[0].longitude
-
-            curr_lat, curr_lon = start_lat or 0, start_lon or 0
-            ordered = []
-            pool = to_optimize[:]
-
-            while pool:
-                best_idx = 0
-                min_dist = float("inf")
-                for idx, p in enumerate(pool):
-                    dist = (
-                        (p.latitude - curr_lat) ** 2 + (p.longitude - curr_lon) ** 2
-                    ) ** 0.5
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_idx = idx
-
-                next_item = pool.pop(best_idx)
-                ordered.append(next_item)
-                curr_lat, curr_lon = next_item.latitude, next_item.longitude
-
-            times = sorted([i.start_time for i in to_optimize])
-            for i, item in enumerate(ordered):
-                item.start_time = times[i]
-                session.add(item)
-                total_updated += 1
-
-        session.commit()
-        return {"status": "success", "updated_count": total_updated}
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/estimate-survey-budget")
-async def estimate_survey_budget(
-    request: SurveyBudgetRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Stima il budget iniziale durante il Survey, senza salvare il viaggio"""
-    check_rate_limit(current_account, session)
-    if not ai_client:
-        return {"budget_min": 0, "budget_max": 0, "breakdown": {}}
-
-    try:
-        try:
-            d1 = datetime.fromisoformat(request.start_date.replace("Z", ""))
-            d2 = datetime.fromisoformat(request.end_date.replace("Z", ""))
-            days = abs((d2 - d1).days) + 1
-        except Exception:
-            days = 7
-
-        prompt = f"""
-        L'utente sta pianificando un viaggio. Destinazione: {request.destination}. Partenza da: {request.departure_airport}.
-        Dati: {request.num_people} persona/e, durata {days} giorni. Mezzo: {request.transport_mode}.
-        
-        Calcola un range di BUDJET IDEALE per l'INTERO GRUPPO ({request.num_people} persone), tenendo conto del costo stimato dei trasporti ({request.transport_mode}), del costo medio degli hotel ({days} notti), e dei costi di vita (pasti, trasporti locali).
-        RESTITUISCI SOLO JSON (senza testo descrittivo aggiuntivo, senza formattazione markdown).
-        {{
-            "budget_min": 1000,
-            "budget_max": 1500
-        }}
-        """
-        response = await _gemini_call_with_retry(prompt, json_mode=True)
-        data = json.loads(response.text)
-
-        return {
-            "budget_min": float(data.get("budget_min", 0)),
-            "budget_max": float(data.get("budget_max", 0)),
-        }
-    except Exception as e:
-        logger.error(f"[AI Error] Stima budget survey fallita: {e}")
-        return {"budget_min": 0, "budget_max": 0}
-
-
-@router.post("/{trip_id}/search-options")
-async def search_trip_options(
-    trip_id: int,
-    request: SearchOptionRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Simula una ricerca OTA (Voli o Hotel) tramite AI restituendo 6 opzioni"""
-    # Il controllo di partecipazione precede il consumo di quota AI: altrimenti
-    # un estraneo brucia le chiamate AI leggendo i dati di un viaggio altrui.
-    check_participant(trip_id, current_account, session)
-    check_rate_limit(current_account, session)
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    if not ai_client:
-        return []
-
-    try:
-        try:
-            d1 = datetime.fromisoformat(trip.start_date.replace("Z", ""))
-            d2 = datetime.fromisoformat(trip.end_date.replace("Z", ""))
-            days = abs((d2 - d1).days) + 1
-        except Exception:
-            days = 7
-
-        if request.type == "hotel":
-            office_prompt = ""
-            if trip.trip_intent == "BUSINESS" and trip.office_address:
-                office_prompt = f"IMPORTANTE: L'utente deve lavorare in {trip.office_address}. Suggerisci hotel vicini a questo indirizzo e specifica la distanza nei 'details'."
-
-            prompt = f"""
-            Agisci come l'API di un aggregatore alberghiero (es. Booking.com).
-            L'utente sta cercando un Hotel a {trip.destination} per {days} notti per {trip.num_people} persone.
-            {office_prompt}
-            Genera esattamente 6 opzioni RESTITUENDOLE esclusivamente in formato JSON. 
-            Il formato DEVE essere un array di oggetti, senza markdown o testo extra:
-            [
-              {{
-                "id": "h1",
-                "provider": "Booking.com",
-                "title": "Hotel Stella Alpine ***",
-                "price": 450.0,
-                "details": "Colazione inclusa, 2km dal centro",
-                "booking_url": "https://www.booking.com/searchresults.html?ss={quote(trip.destination or '')}"
-              }}
-            ]
-            Dai prezzi realistici in EURO per {days} notti totali e varia da budget ostello a hotel lusso.
-            """
-        else:
-            prompt = f"""
-            Agisci come l'API di Skyscanner/Trainline.
-            L'utente sta cercando trasporti andata/ritorno ({trip.transport_mode}) per {trip.destination} per {trip.num_people} persone.
-            Genera esattamente 6 opzioni RESTITUENDOLE esclusivamente in formato JSON.
-            Il formato DEVE essere un array di oggetti, senza markdown o testo extra:
-            [
-              {{
-                "id": "f1",
-                "provider": "Ryanair",
-                "title": "Volo Diretto A/R",
-                "price": 120.5,
-                "details": "Partenza 08:00 - Arrivo 10:15 / Bagaglio a mano",
-                "booking_url": "https://www.skyscanner.net/"
-              }}
-            ]
-            Dai prezzi realistici in EURO per tutto il gruppo ({trip.num_people} persone) e varia le compagnie.
-            """
-
-        response = await _gemini_call_with_retry(prompt, json_mode=True)
-        data = json.loads(response.text)
-
-        # Sostituisci booking_url con deep link parametrici reali
-        dest_enc = quote(trip.destination or trip.real_destination or "")
-        depart_str = (
-            trip.start_date if isinstance(trip.start_date, str) else trip.start_date.strftime("%Y-%m-%d")
-        ).split("T")[0] if trip.start_date else ""
-        return_str = (
-            trip.end_date if isinstance(trip.end_date, str) else trip.end_date.strftime("%Y-%m-%d")
-        ).split("T")[0] if trip.end_date else ""
-
-        for opt in data:
-            if request.type == "hotel":
-                opt["booking_url"] = (
-                    f"https://www.booking.com/searchresults.html"
-                    f"?ss={dest_enc}&checkin={depart_str}&checkout={return_str}"
-                    f"&group_adults={max(1, trip.num_people or 1)}&no_rooms=1"
-                )
-            else:
-                origin = trip.departure_airport or trip.departure_city or ""
-                origin_enc = quote(origin)
-                if len(origin) == 3 and origin.isupper():
-                    # IATA code disponibile → Skyscanner
-                    def _fmt(d: str) -> str:
-                        return d.replace("-", "")[2:]
-                    dest_iata = (trip.destination_iata or "").lower() or dest_enc.lower()
-                    base = (
-                        f"https://www.skyscanner.net/transport/flights"
-                        f"/{origin.lower()}/{dest_iata}/{_fmt(depart_str)}"
-                    )
-                    if return_str and return_str != depart_str:
-                        base += f"/{_fmt(return_str)}"
-                    opt["booking_url"] = f"{base}/?adults={max(1, trip.num_people or 1)}&currency=EUR"
-                else:
-                    # Fallback Kiwi con nome città
-                    opt["booking_url"] = (
-                        f"https://www.kiwi.com/it/search/results/{origin_enc}/{dest_enc}"
-                        f"/{depart_str}/{return_str}?adults={max(1, trip.num_people or 1)}"
-                    )
-
-        return {"options": data}
-    except Exception as e:
-        logger.error(f"[AI Error] Errore simulazione OTA: {e}")
-        return {"options": []}
-
-
-@router.post("/{trip_id}/confirm-option")
-async def confirm_trip_option(
-    trip_id: int,
-    request: ConfirmOptionRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Salva il costo dell'opzione selezionata (Volo/Hotel) sul budget del viaggio"""
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    participant = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id, Participant.account_id == current_account.id
-        )
-    ).first()
-    if not participant:
-        raise HTTPException(status_code=403, detail="Non autorizzato")
-
-    try:
-        if request.type == "hotel":
-            trip.hotel_cost = request.price
-            trip.accommodation_location = request.provider  # store the name dynamically
-        else:
-            trip.transport_cost = request.price
-
-        session.add(trip)
-        session.commit()
-        session.refresh(trip)
-        return {"status": "success", "trip": trip}
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/{trip_id}/estimate-budget")
-async def estimate_budget(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Stima i costi della vita locale tramite AI"""
-    check_participant(trip_id, current_account, session)
-    check_rate_limit(current_account, session)
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        if not ai_client:
-            return {"suggestion": "AI non disponibile", "breakdown": {}}
-
-        try:
-            d1 = datetime.fromisoformat(trip.start_date.replace("Z", ""))
-            d2 = datetime.fromisoformat(trip.end_date.replace("Z", ""))
-            days = abs((d2 - d1).days) + 1
-        except Exception:
-            logger.error(
-                "Errore durante il calcolo dei giorni, utilizzo 7 giorni di default"
-            )
-            days = 7
-
-        car_prompt = ""
-        if trip.transport_mode == "CAR":
-            car_prompt = f"""
-            4. COSTI STRADALI: Il viaggio è in AUTO PROPRIA da {trip.departure_city or trip.departure_airport} a {trip.destination}. 
-               CALCOLA L'ESATTO PEDAGGIO E CARBURANTE basandoti sulla rotta specifica e reale delle autostrade italiane/europee. 
-               NON usare stime generiche regionali. Sii preciso sui pedaggi reali (es. Bologna-Bressanone).
-               Stima il costo totale A/R per {trip.num_people} persone e dividilo per loro.
-            """
-
-        company_ctx = ""
-        if current_account.company_id:
-            company = session.get(Company, current_account.company_id)
-            if company and company.max_budget_per_trip:
-                company_ctx = (
-                    f"La policy aziendale prevede un budget massimo di "
-                    f"{company.max_budget_per_trip:.0f} EUR per trasferta."
-                )
-
-        budget_ref = trip.budget_max or trip.budget or 0
-
-        prompt = f"""
-        Sei un esperto analista di viaggi d'affari. Analizza i costi di vita locale
-        (ESCLUSO alloggio) per un viaggio a: {trip.destination}.
-        Dati: {trip.num_people} persona/e, durata {days} giorni, mezzo: {trip.transport_mode}.
-        Budget totale autorizzato: {budget_ref} EUR.
-        {company_ctx}
-
-        {car_prompt}
-
-        Fornisci una stima REALISTICA per un viaggiatore medio (non lussuoso).
-        Valuta il costo della vita specifico di {trip.destination}
-        (es. Est Europa = economico, Scandinavia = caro).
-
-        Determina anche:
-        - "budget_status": confronta (total_estimated_per_person * {trip.num_people})
-          con il budget totale {budget_ref} EUR.
-          Usa "ON_TRACK" se la proiezione e <= 80% del budget,
-          "WARNING" se 80-100%, "CRITICAL" se supera il budget.
-          Se budget_ref = 0, usa sempre "ON_TRACK".
-        - "savings_advice": 3 consigli BREVI e AZIONABILI specifici per {trip.destination}
-          (es. "Usa i mezzi pubblici invece del taxi", "Mangia nei mercati locali").
-        - "confidence_score": da 0 a 100, quanto sei sicuro della previsione
-          (100 = dati certi, 50 = stima ragionevole, 20 = destinazione poco comune).
-
-        RESTITUISCI SOLO JSON valido:
-        {{
-            "daily_meal_mid": 35.0,
-            "daily_meal_cheap": 20.0,
-            "daily_transport": 10.0,
-            "road_costs_total_per_person": 0.0,
-            "total_estimated_per_person": 0.0,
-            "advice": "Un consiglio utile...",
-            "savings_advice": ["consiglio 1", "consiglio 2", "consiglio 3"],
-            "confidence_score": 75
-        }}
-        LINGUA: {current_account.language.upper()}.
-        """
-
-        response = await _gemini_call_with_retry(prompt, json_mode=True)
-        data = json.loads(response.text)
-        data["days_count"] = days
-
-        # ── Server-side derived fields ────────────────────────────────────────
-        per_person = float(data.get("total_estimated_per_person") or 0)
-        projected  = round(per_person * (trip.num_people or 1), 2)
-        data["projected_total"] = projected
-
-        # budget_status: override Gemini's value with a deterministic server calc
-        budget_ref = float(trip.budget_max or trip.budget or 0)
-        if budget_ref > 0:
-            ratio = projected / budget_ref
-            if ratio > 1.0:
-                data["budget_status"] = "CRITICAL"
-            elif ratio > 0.80:
-                data["budget_status"] = "WARNING"
-            else:
-                data["budget_status"] = "ON_TRACK"
-        else:
-            data["budget_status"] = data.get("budget_status", "ON_TRACK")
-
-        # Ensure savings_advice is always a list
-        if not isinstance(data.get("savings_advice"), list):
-            advice = data.get("advice", "")
-            data["savings_advice"] = [advice] if advice else []
-
-        # Ensure confidence_score is int 0-100
-        try:
-            data["confidence_score"] = max(0, min(100, int(data.get("confidence_score", 70))))
-        except (TypeError, ValueError):
-            data["confidence_score"] = 70
-
-        return data
-    except Exception as e:
-        logger.error(f"[AI Error] Stima budget fallita: {e}")
-        raise HTTPException(status_code=500, detail="Errore interno del server. Riprova.")
-
-
-@router.post("/", response_model=Dict)
-async def create_trip(
-    trip_data: TripCreateRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Crea un nuovo viaggio e assegna l'organizzatore"""
-    # Verifica limiti aziendali per trip BUSINESS
-    if trip_data.trip_intent == "BUSINESS" and current_account.company_id:
-        company = session.get(Company, current_account.company_id)
-        if company:
-            check_company_limits(company, session, "create_trip")
-
-    try:
-        # I campi privilegiati non arrivano dal client: TripCreateRequest non li
-        # espone e il Trip parte sempre dai default del modello
-        # (status=PLANNING, is_premium=False, approved_by=None, share_token=None).
-        db_trip = Trip(**trip_data.model_dump())
-        if trip_data.trip_type == "SOLO":
-            db_trip.num_people = 1
-
-        # Il company_id e' sempre quello dell'organizzatore, mai un valore scelto
-        # dal client: e' cio' che tiene separati i tenant B2B.
-        if current_account.company_id and trip_data.trip_intent == "BUSINESS":
-            db_trip.company_id = current_account.company_id
-
-        session.add(db_trip)
-        session.commit()
-        session.refresh(db_trip)
-
-        organizer = Participant(
-            name=current_account.name,
-            is_organizer=True,
-            trip_id=db_trip.id,
-            account_id=current_account.id,
-        )
-        session.add(organizer)
-        session.commit()
-
-        # Notifica manager aziendali alla creazione di un trip BUSINESS
-        if db_trip.trip_intent == "BUSINESS" and current_account.company_id:
-            notify_managers(
-                session=session,
-                company_id=current_account.company_id,
-                type="trip_created",
-                title="Nuovo viaggio aziendale creato",
-                message=f"{current_account.name} ha creato un nuovo viaggio: \"{db_trip.name}\" verso {db_trip.destination or 'destinazione TBD'}.",
-                trip_id=db_trip.id,
-            )
-            session.commit()
-
-        return {"trip_id": db_trip.id, "trip": db_trip}
-    except HTTPException:
-        session.rollback()
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] create_trip: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/my-trips")
-async def get_my_trips(
-    skip: int = 0,
-    limit: int = 20,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Ritorna i viaggi dell'utente corrente con paginazione (skip/limit)."""
-    try:
-        participants = session.exec(
-            select(Participant).where(
-                Participant.account_id == current_account.id,
-                Participant.is_active == True,
-            )
-        ).all()
-
-        trip_ids = [p.trip_id for p in participants]
-        if not trip_ids:
-            return {"trips": [], "total": 0, "skip": skip, "limit": limit}
-
-        total = session.exec(
-            select(func.count()).where(Trip.id.in_(trip_ids))
-        ).one()
-
-        trips = session.exec(
-            select(Trip)
-            .where(Trip.id.in_(trip_ids))
-            .order_by(Trip.id.desc())
-            .offset(skip)
-            .limit(limit)
-        ).all()
-
-        return {"trips": trips, "total": total, "skip": skip, "limit": limit}
-    except Exception as e:
-        logger.error(f"[ERROR] get_my_trips: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/stats")
-async def get_user_stats(
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Calcola statistiche aggregate per l'utente corrente"""
-    try:
-        participants = session.exec(
-            select(Participant).where(
-                Participant.account_id == current_account.id,
-                Participant.is_active == True,
-            )
-        ).all()
-
-        trip_ids = [p.trip_id for p in participants]
-        if not trip_ids:
-            return {
-                "total_trips": 0,
-                "completed_trips": 0,
-                "total_spent": 0.0,
-                "total_days": 0,
-                "unique_cities": 0,
-                "cities_list": [],
-            }
-
-        trips = session.exec(select(Trip).where(Trip.id.in_(trip_ids))).all()
-
-        completed_trips = [t for t in trips if t.status == "COMPLETED"]
-
-        total_spent = (
-            session.exec(
-                select(func.sum(Expense.amount)).where(
-                    Expense.trip_id.in_(trip_ids),
-                    Expense.payer_id.in_([p.id for p in participants]),
-                )
-            ).one()
-            or 0.0
-        )
-
-        for t in trips:
-            num = t.num_people or 1
-            total_spent += (t.transport_cost or 0) / num
-            total_spent += (t.hotel_cost or 0) / num
-        total_days = 0
-        unique_cities = set()
-        for t in completed_trips:
-            unique_cities.add(t.destination or t.real_destination)
-            try:
-                d1 = datetime.fromisoformat(t.start_date.replace("Z", ""))
-                d2 = datetime.fromisoformat(t.end_date.replace("Z", ""))
-                total_days += abs((d2 - d1).days) + 1
-            except Exception:
-                logger.error(
-                    "Errore durante il calcolo dei giorni, utilizzo 7 giorni di default"
-                )
-
-        return {
-            "total_trips": len(trips),
-            "completed_trips": len(completed_trips),
-            "total_spent": round(total_spent, 2),
-            "total_days": total_days,
-            "unique_cities": len(unique_cities),
-            "cities_list": list(unique_cities),
-        }
-    except Exception as e:
-        logger.error(f"[ERROR] get_user_stats: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/{trip_id}/complete")
-async def complete_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Segna un viaggio come concluso"""
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        participant = session.exec(
-            select(Participant).where(
-                Participant.trip_id == trip_id,
-                Participant.account_id == current_account.id,
-            )
-        ).first()
-
-        if not participant or not participant.is_organizer:
-            raise HTTPException(
-                status_code=403,
-                detail="Solo l'organizzatore può segnare il viaggio come concluso",
-            )
-
-        trip.status = "COMPLETED"
-        session.add(trip)
-        session.commit()
-        return {"status": "success", "message": "Viaggio archiviato con successo"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] complete_trip: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/{trip_id}/hide")
-async def hide_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Nasconde un viaggio dalla cronologia dell'utente (imposta is_active=False per il partecipante)"""
-    try:
-        participant = session.exec(
-            select(Participant).where(
-                Participant.trip_id == trip_id,
-                Participant.account_id == current_account.id,
-            )
-        ).first()
-
-        if not participant:
-            raise HTTPException(
-                status_code=404, detail="Partecipante non trovato in questo viaggio"
-            )
-
-        participant.is_active = False
-        session.add(participant)
-        session.commit()
-        return {"status": "success", "message": "Viaggio nascosto correttamente"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] hide_trip: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/business-overview")
-async def get_business_overview(
-    session: Session = Depends(get_session),
-    current_user: Account = Depends(get_current_user)
-):
-    if not current_user.is_manager:
-        raise HTTPException(403, "Accesso riservato ai manager aziendali")
-
-    # Filtra per company_id se impostato, altrimenti mostra tutti (utile per demo)
-    if current_user.company_id is not None:
-        company_accounts = session.exec(
-            select(Account.id).where(Account.company_id == current_user.company_id)
-        ).all()
-        company_trip_ids = session.exec(
-            select(Participant.trip_id).where(Participant.account_id.in_(company_accounts))
-        ).all()
-        trips = session.exec(
-            select(Trip).where(Trip.trip_intent == "BUSINESS", Trip.id.in_(company_trip_ids))
-        ).all()
-    else:
-        trips = session.exec(select(Trip).where(Trip.trip_intent == "BUSINESS")).all()
-
-    trip_ids_all = [t.id for t in trips]
-
-    # Fetch bulk: organizzatori (1 query invece di N)
-    organizers_bulk = {}
-    if trip_ids_all:
-        for p in session.exec(
-            select(Participant).where(
-                Participant.trip_id.in_(trip_ids_all),
-                Participant.is_organizer == True,
-            )
-        ).all():
-            organizers_bulk[p.trip_id] = p
-
-    # Fetch bulk: proposte vincitrici (1 query invece di N)
-    winning_ids = [t.winning_proposal_id for t in trips if t.winning_proposal_id]
-    proposals_bulk = {}
-    if winning_ids:
-        for prop in session.exec(
-            select(Proposal).where(Proposal.id.in_(winning_ids))
-        ).all():
-            proposals_bulk[prop.id] = prop
-
-    result = []
-    for trip in trips:
-        organizer = organizers_bulk.get(trip.id)
-        organizer_name = organizer.name if organizer else "N/A"
-
-        estimated_cost = None
-        if trip.winning_proposal_id and trip.winning_proposal_id in proposals_bulk:
-            estimated_cost = proposals_bulk[trip.winning_proposal_id].price_estimate
-
-        result.append({
-            "id": trip.id,
-            "name": trip.name,
-            "destination": trip.destination or trip.real_destination or "",
-            "start_date": trip.start_date.isoformat() if trip.start_date else None,
-            "end_date": trip.end_date.isoformat() if trip.end_date else None,
-            "status": trip.status,
-            "num_people": trip.num_people,
-            "organizer_name": organizer_name,
-            "estimated_cost": estimated_cost,
-            "transport_mode": trip.transport_mode,
-        })
-
-    # ── Analytics ─────────────────────────────────────────────────────────────
-
-    # trips_by_status
-    trips_by_status: dict = {}
-    for trip in trips:
-        trips_by_status[trip.status] = trips_by_status.get(trip.status, 0) + 1
-
-    # top_destinations (top 5 per frequenza)
-    dest_count: dict = {}
-    for trip in trips:
-        dest = trip.destination or trip.real_destination or ""
-        if dest:
-            dest_count[dest] = dest_count.get(dest, 0) + 1
-    top_destinations = [
-        {"destination": d, "count": c}
-        for d, c in sorted(dest_count.items(), key=lambda x: -x[1])[:5]
-    ]
-
-    # monthly_spend + employees_traveled: ultimi 6 mesi
-    trip_ids = [t.id for t in trips]
-    monthly_spend_map: dict = {}
-    employees_per_month: dict = {}  # month_key → set of account_ids
-
-    now_dt = datetime.now(timezone.utc)
-
-    if trip_ids:
-        all_expenses = session.exec(
-            select(Expense).where(Expense.trip_id.in_(trip_ids))
-        ).all()
-        for exp in all_expenses:
-            if exp.date:
-                month_key = str(exp.date)[:7]  # "YYYY-MM"
-                monthly_spend_map[month_key] = monthly_spend_map.get(month_key, 0.0) + (exp.amount or 0.0)
-
-        # Partecipanti per trip (per calcolare employees_traveled)
-        all_participants = session.exec(
-            select(Participant).where(Participant.trip_id.in_(trip_ids))
-        ).all()
-        # Mappa trip_id → month_key usando start_date del trip
-        trip_month_map = {}
-        for t in trips:
-            if t.start_date:
-                trip_month_map[t.id] = str(t.start_date)[:7]
-        for p in all_participants:
-            if p.account_id and p.trip_id in trip_month_map:
-                mk = trip_month_map[p.trip_id]
-                employees_per_month.setdefault(mk, set()).add(p.account_id)
-
-    # Genera 6 mesi in ordine cronologico
-    monthly_spend = []
-    for i in range(5, -1, -1):
-        month = (now_dt.month - i - 1) % 12 + 1
-        year = now_dt.year + ((now_dt.month - i - 1) // 12)
-        key = f"{year:04d}-{month:02d}"
-        monthly_spend.append({
-            "month": key,
-            "total": round(monthly_spend_map.get(key, 0.0), 2),
-            "employees_traveled": len(employees_per_month.get(key, set())),
-        })
-
-    return {
-        "trips": result,
-        "analytics": {
-            "trips_by_status": trips_by_status,
-            "top_destinations": top_destinations,
-            "monthly_spend": monthly_spend,
-        },
-    }
-
-
-@router.get("/{trip_id}", response_model=Trip)
-async def read_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Recupera i dettagli del viaggio verificando l'appartenenza dell'account"""
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    # I manager possono vedere i viaggi BUSINESS *della propria azienda*.
-    # Senza il confronto su company_id un manager qualsiasi leggeva le trasferte
-    # di tutti i clienti B2B. Il manager senza company non ha alcun privilegio.
-    if (
-        current_account.is_manager
-        and trip.trip_intent == "BUSINESS"
-        and current_account.company_id is not None
-        and trip.company_id == current_account.company_id
-    ):
-        return trip
-
-    participant = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id, Participant.account_id == current_account.id
-        )
-    ).first()
-    if not participant:
-        raise HTTPException(status_code=403, detail="Non partecipi a questo viaggio")
-
-    return trip
-
-
-@router.get("/{trip_id}/proposals", response_model=List[Proposal])
-async def get_proposals(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Recupera le proposte generate per un viaggio. Solo per i partecipanti.
-
-    Era pubblico "per le votazioni", ma gli ospiti non registrati passano da
-    GET /trips/share/{token}, che restituisce gia' tutti i dati necessari.
-    Con gli id sequenziali, l'accesso libero permetteva di enumerare le
-    proposte di qualunque viaggio, incluse le trasferte aziendali.
-    """
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    check_participant(trip_id, current_account, session)
-    return session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all()
-
-
-@router.post("/{trip_id}/share")
-async def generate_share_token(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Genera o restituisce il token di condivisione del viaggio"""
-    import secrets
-
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    participant = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id, Participant.account_id == current_account.id
-        )
-    ).first()
-    if not participant or not participant.is_organizer:
-        raise HTTPException(
-            status_code=403,
-            detail="Solo l'organizzatore può generare il link di condivisione",
-        )
-
-    if not trip.share_token:
-        trip.share_token = secrets.token_urlsafe(16)
-        session.add(trip)
-        session.commit()
-        session.refresh(trip)
-
-    return {"share_token": trip.share_token}
-
-
-@router.get("/share/{token}")
-async def get_shared_trip(token: str, session: Session = Depends(get_session)):
-    trip = session.exec(select(Trip).where(Trip.share_token == token)).first()
-    if not trip:
-        raise HTTPException(
-            status_code=404, detail="Link di condivisione non valido o scaduto"
-        )
-
-    itinerary = session.exec(
-        select(ItineraryItem)
-        .where(ItineraryItem.trip_id == trip.id)
-        .order_by(ItineraryItem.start_time)
-    ).all()
-    expenses = session.exec(select(Expense).where(Expense.trip_id == trip.id)).all()
-    photos = session.exec(select(Photo).where(Photo.trip_id == trip.id)).all()
-    participants = session.exec(
-        select(Participant).where(Participant.trip_id == trip.id)
-    ).all()
-
-    return {
-        "trip": trip.model_dump(
-            exclude={
-                "participants",
-                "proposals",
-                "itinerary_items",
-                "expenses",
-                "photos",
-            }
-        ),
-        "itinerary": [i.model_dump() for i in itinerary],
-        "expenses": [e.model_dump() for e in expenses],
-        "photos": [p.model_dump() for p in photos],
-        "participants": [
-            {
-                "id": p.id,
-                "name": p.name,
-                "has_voted": session.exec(
-                    select(func.count(Vote.id)).where(Vote.user_id == p.id)
-                ).one()
-                > 0,
-            }
-            for p in participants
-        ],
-    }
-
-
-@router.post("/join/{token}")
-async def join_trip(
-    token: str,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Unisce un utente a un viaggio tramite token di condivisione.
-    Tenta di far corrispondere l'account corrente con un partecipante 'ospite' creato dall'organizzatore.
-    """
-    try:
-        trip = session.exec(select(Trip).where(Trip.share_token == token)).first()
-        if not trip:
-            raise HTTPException(
-                status_code=404, detail="Link di condivisione non valido o scaduto"
-            )
-
-        # P0-6: un utente di un'altra company non può entrare in un trip BUSINESS
-        check_tenant_for_trip(trip, current_account)
-
-        existing = session.exec(
-            select(Participant).where(
-                Participant.trip_id == trip.id,
-                Participant.account_id == current_account.id,
-            )
-        ).first()
-        if existing:
-            return {
-                "status": "success",
-                "message": "Fai già parte di questo viaggio",
-                "trip_id": trip.id,
-            }
-
-        search_names = [
-            current_account.name.strip().lower(),
-            f"{current_account.name} {current_account.surname}".strip().lower(),
-        ]
-
-        guest_participant = None
-        all_guests = session.exec(
-            select(Participant).where(
-                Participant.trip_id == trip.id, Participant.account_id == None
-            )
-        ).all()
-
-        for g in all_guests:
-            g_name = g.name.strip().lower()
-            if g_name in search_names or any(s in g_name for s in search_names):
-                guest_participant = g
-                break
-
-        if guest_participant:
-            guest_participant.account_id = current_account.id
-            guest_participant.name = f"{current_account.name} {current_account.surname}"
-            session.add(guest_participant)
-            session.commit()
-            return {
-                "status": "success",
-                "message": f"Benvenuto a bordo, {current_account.name}!",
-                "trip_id": trip.id,
-            }
-
-        # Nessun segnaposto con un nome compatibile: si entra comunque.
-        # Prima qui c'era un 403 e chi aveva il link restava fuori se
-        # l'organizzatore non aveva digitato il suo nome *esattamente* durante il
-        # survey. Per le trasferte aziendali significava che un collega non
-        # poteva proprio essere aggiunto, rendendo impossibile la trasferta di
-        # gruppo; per i viaggi fra amici era il punto in cui si perdeva l'invitato.
-        # Chi possiede il link di condivisione e' gia' autorizzato, e per i trip
-        # BUSINESS check_tenant_for_trip sopra ha gia' verificato l'azienda.
-        nuovo_partecipante = Participant(
-            name=f"{current_account.name} {current_account.surname}".strip(),
-            trip_id=trip.id,
-            account_id=current_account.id,
-            is_organizer=False,
-        )
-        session.add(nuovo_partecipante)
-
-        # num_people guida la chiusura della votazione: va tenuto allineato ai
-        # partecipanti reali, altrimenti il consenso non si raggiunge mai.
-        conteggio = session.exec(
-            select(func.count(Participant.id)).where(Participant.trip_id == trip.id)
-        ).one()
-        if (trip.num_people or 0) < conteggio + 1:
-            trip.num_people = conteggio + 1
-            session.add(trip)
-
-        session.commit()
-        return {
-            "status": "success",
-            "message": f"Benvenuto a bordo, {current_account.name}!",
-            "trip_id": trip.id,
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] join_trip: {e}")
-        raise HTTPException(
-            status_code=500, detail="Errore durante l'adesione al viaggio."
-        )
-
-
-@router.patch("/{trip_id}")
-async def update_trip(
-    trip_id: int,
-    updates: TripUpdateRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Aggiorna parzialmente i dati di un viaggio"""
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        check = session.exec(
-            select(Participant).where(
-                Participant.trip_id == trip_id,
-                Participant.account_id == current_account.id,
-            )
-        ).first()
-        if not check:
-            raise HTTPException(status_code=403, detail="Non autorizzato")
-        if not check.is_organizer:
-            raise HTTPException(status_code=403, detail="Solo l'organizzatore può modificare il viaggio")
-
-        for key, value in updates.model_dump(exclude_none=True).items():
-            setattr(trip, key, value)
-
-        session.add(trip)
-        session.commit()
-        session.refresh(trip)
-        return trip
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.delete("/{trip_id}")
-async def delete_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Elimina un viaggio. Solo l'organizzatore può eliminarlo."""
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    member = check_participant(trip_id, current_account, session)
-    if not member.is_organizer:
-        raise HTTPException(status_code=403, detail="Solo l'organizzatore può eliminare il viaggio")
-
-    # Elimina dati collegati
-    session.exec(delete(Photo).where(Photo.trip_id == trip_id))
-    session.exec(delete(ItineraryItem).where(ItineraryItem.trip_id == trip_id))
-    session.exec(delete(Expense).where(Expense.trip_id == trip_id))
-    # Notification.trip_id e' una FK verso trip.id senza ON DELETE: senza questa
-    # riga ogni viaggio con almeno una notifica (tutti i BUSINESS, che notificano
-    # i manager alla creazione) e' ineliminabile con un IntegrityError.
-    session.exec(delete(Notification).where(Notification.trip_id == trip_id))
-
-    for proposal in session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all():
-        session.exec(delete(Vote).where(Vote.proposal_id == proposal.id))
-        session.delete(proposal)
-
-    session.exec(delete(Participant).where(Participant.trip_id == trip_id))
-    session.delete(trip)
-    session.commit()
-
-    logger.info(f"Viaggio {trip_id} eliminato da account {current_account.id}")
-    return {"message": "Viaggio eliminato con successo."}
-
-
-@router.post("/{trip_id}/generate-proposals", response_model=List[Proposal])
-async def generate_proposals(
-    trip_id: int,
-    prefs: PreferencesRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Genera 3 proposte e salva tutti i partecipanti nel Database"""
-    try:
-        check_participant(trip_id, current_account, session)
-
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        check_rate_limit(current_account, session)
-        require_premium(current_account, trip)
-
-        # B2B budget cap e limiti aziendali
-        company_budget: float | None = None
-        if current_account.company_id:
-            company = session.get(Company, current_account.company_id)
-            if company:
-                check_company_limits(company, session, "ai_call")
-                if company.max_budget_per_trip:
-                    company_budget = company.max_budget_per_trip
-
-        trip.budget = prefs.budget
-        trip.budget_max = prefs.budget_max
-        trip.budget_per_person = (prefs.budget_max or prefs.budget) / prefs.num_people
-        trip.num_people = prefs.num_people
-        trip.start_date = _a_datetime(prefs.start_date)
-        trip.end_date = _a_datetime(prefs.end_date)
-        trip.departure_airport = prefs.departure_airport
-        trip.departure_city = prefs.departure_airport
-        trip.destination = prefs.destination
-        trip.must_have = prefs.must_have
-        trip.must_avoid = prefs.must_avoid
-        trip.trip_intent = prefs.trip_intent
-        trip.work_start_time = prefs.work_start_time
-        trip.work_end_time = prefs.work_end_time
-        trip.work_days = prefs.work_days
-        trip.office_address = prefs.office_address
-
-        # Il viaggio diventa BUSINESS qui, non alla creazione: il frontend crea
-        # il trip con solo nome e tipo, e l'intent arriva dal survey. Senza
-        # questa riga company_id restava NULL su TUTTE le trasferte, e le query
-        # aziendali che filtrano su Trip.company_id (export contabile, analytics,
-        # corsia di lettura del manager) non trovavano mai niente.
-        if trip.trip_intent == "BUSINESS" and current_account.company_id:
-            trip.company_id = current_account.company_id
-
-        if prefs.transport_mode:
-            trip.transport_mode = prefs.transport_mode
-
-        session.add(trip)
-
-        if prefs.participant_names:
-            for name in prefs.participant_names:
-                exists = session.exec(
-                    select(Participant).where(
-                        Participant.trip_id == trip_id, Participant.name == name
-                    )
-                ).first()
-                if not exists:
-                    session.add(
-                        Participant(name=name, trip_id=trip.id, is_organizer=False)
-                    )
-        session.commit()
-
-        if ai_client:
-            try:
-                num_props = 3
-                if prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO":
-                    num_props = 1
-
-                prompt = f"""
-                Agisci come un Travel Agent esperto. 
-                TASK 1: Trova il codice aeroportuale IATA UFFICIALE E CORRETTO di 3 lettere (es. Bologna è BLQ) per la partenza: "{prefs.departure_airport}". Se la parola è una città generica ignora aeroporti militari o cargo e prendi l'aeroporto civile principale.
-                TASK 2: Genera {num_props} {"proposta" if num_props == 1 else "proposte UNICHE"} per: {prefs.destination}. Attribuisci a ciascuna proposta il GIUSTO codice IATA di partenza ("XXX" in JSON) e destinazione.
-                {"Sia che la destinazione sia un Paese o una singola città, le 3 proposte devono avere TEMI DIVERSI (es. uno Artistico, uno Gastronomico, uno Storico)." if num_props > 1 else ""}
-                SE la destinazione è una singola città (es. Parigi), usa titoli creativi e accattivanti (es. 'Parigi Bohemienne') per differenziarle.
-                {f"CRITICAL B2B POLICY: L'utente appartiene a un'azienda che ha imposto un budget MASSIMO RIGOROSO di {company_budget:.0f} EUR per questa trasferta (inclusi voli e hotel). TUTTE le proposte che generi DEVONO rimanere tassativamente sotto questo budget. Ignora le opzioni di lusso se superano il limite." if company_budget else ""}
-                Dati: {f"Budget tra {prefs.budget}€ e {prefs.budget_max if prefs.budget_max > 0 else prefs.budget}€ (totale gruppo), " if prefs.budget > 0 else ""}{prefs.num_people} persone, dal {prefs.start_date} al {prefs.end_date}.
-                Preferenze: {prefs.must_have}, Evitare: {prefs.must_avoid}, Vibe: {prefs.vibe}.
-                {"ORARIO LAVORO: dalle " + prefs.work_start_time + " alle " + prefs.work_end_time + " nei giorni: " + prefs.work_days if prefs.trip_intent == "BUSINESS" else ""}
-                {"INDIRIZZO UFFICIO (Sede Operativa): " + prefs.office_address + " - IMPORTANTE: Scegli zone comode per raggiungere questo indirizzo." if prefs.trip_intent == "BUSINESS" and prefs.office_address else ""}
-
-                TASK 3: Analizza la distanza tra la partenza ({prefs.departure_airport}) e la destinazione ({prefs.destination}).
-                Scegli il "suggested_transport_mode" tra: FLIGHT, TRAIN, CAR.
-                REGOLA: Se la destinazione è raggiungibile via terra in meno di 6 ore (es. Milano-Roma, Parigi-Lione), preferisci sempre TRAIN o CAR. Altrimenti usa FLIGHT.
-
-                RESTITUISCI SOLO JSON:
-                {{
-                    "departure_iata_normalized": "XXX",
-                    "departure_city_normalized": "Nome Città (es. Milano)",
-                    "suggested_transport_mode": "FLIGHT",
-                    "proposals": [
-                        {{
-                            "destination": "Titolo Creativo (es. Parigi dei Musei)", 
-                            "destination_iata": "XXX", 
-                            "destination_english": "Paris",
-                            "destination_italian": "Parigi",
-                            "description": "...", 
-                            "price_estimate": 1000, 
-                            "image_search_term": "louvre,museum"
-                        }}
-                    ]
-                }}
-                NOTE: 
-                - 'destination' deve essere il TITOLO CREATIVO (unico per ogni proposta).
-                - 'destination_english' deve essere il nome della città principale in INGLESE.
-                - 'destination_italian' deve essere il nome della città principale in ITALIANO.
-                - 'image_search_term' deve contenere 1 o 2 parole chiave in INGLESE specifiche per quel tema.
-                LINGUA: {current_account.language.upper()}.
-                """
-
-                response = await _gemini_call_with_retry(prompt, json_mode=True)
-                data = json.loads(response.text)
-
-                if data.get("departure_iata_normalized"):
-                    trip.departure_airport = data["departure_iata_normalized"].upper()
-
-                if data.get("departure_city_normalized"):
-                    trip.departure_city = data["departure_city_normalized"]
-
-                ai_suggested = data.get("suggested_transport_mode")
-                if ai_suggested and (
-                    trip.transport_mode == "FLIGHT" or not trip.transport_mode
-                ):
-                    trip.transport_mode = ai_suggested
-
-                session.add(trip)
-
-                existing = session.exec(
-                    select(Proposal).where(Proposal.trip_id == trip_id)
-                ).all()
-                for e in existing:
-                    session.delete(e)
-
-                import random
-                import urllib.parse
-
-                new_proposals = []
-                for p in data.get("proposals", []):
-                    search = p.get("image_search_term") or ""
-                    dest_en = p.get("destination_english") or ""
-                    curated_tags = f"{dest_en},{search},travel".lower().replace(
-                        " ", ","
-                    )
-                    tag_list = [t.strip() for t in curated_tags.split(",") if t.strip()]
-                    final_tags = ",".join(tag_list[:3])
-
-                    seed = random.randint(1, 10000)
-                    encoded_tags = urllib.parse.quote(final_tags, safe=",")
-                    img_url = f"https://loremflickr.com/1080/720/{encoded_tags}/all?lock={seed}"
-
-                    prop = Proposal(
-                        trip_id=trip_id,
-                        destination=p["destination"],
-                        real_destination=p.get("destination_italian")
-                        or p.get("destination_english")
-                        or "",
-                        destination_iata=p.get("destination_iata"),
-                        description=p["description"],
-                        price_estimate=p["price_estimate"],
-                        image_url=img_url,
-                    )
-                    session.add(prop)
-                    new_proposals.append(prop)
-
-                session.commit()
-
-                if (prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO") and new_proposals:
-                    trip.status = "BOOKED"
-                    trip.winning_proposal_id = new_proposals[0].id
-                    # Assicuriamoci che la destinazione del viaggio coincida con la proposta scelta
-                    trip.destination = new_proposals[0].real_destination or new_proposals[0].destination
-                    trip.destination_iata = new_proposals[0].destination_iata
-                    auto_approva_se_manager(trip, current_account)
-                else:
-                    trip.status = "VOTING"
-
-                session.add(trip)
-                session.commit()
-                return session.exec(
-                    select(Proposal).where(Proposal.trip_id == trip_id)
-                ).all()
-
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.error(f"[AI Error] Generazione fallita: {e}")
-
-        logger.info("AI fallita. Uso Mock Data.")
-        iata_map = {
-            "roma": "ROM",
-            "milano": "MIL",
-            "napoli": "NAP",
-            "venezia": "VCE",
-            "londra": "LON",
-            "parigi": "PAR",
-        }
-        trip.departure_airport = iata_map.get(
-            prefs.departure_airport.lower(), prefs.departure_airport[:3].upper()
-        )
-
-        if not trip.transport_mode:
-            trip.transport_mode = "FLIGHT"
-
-        mock_options = []
-        if trip.trip_type == "SOLO":
-            mock_dest = prefs.destination
-            mock_options.append(
-                Proposal(
-                    trip_id=trip_id,
-                    destination=mock_dest,
-                    real_destination=mock_dest,
-                    destination_iata="ROM",
-                    price_estimate=prefs.budget,
-                    description="Il tuo viaggio perfetto.",
-                    image_url="https://images.unsplash.com/photo-1469854523086-cc02fe5d8800",
-                )
-            )
-        else:
-            mock_dest = prefs.destination
-            mock_options = [
-                Proposal(
-                    trip_id=trip_id,
-                    destination=mock_dest,
-                    real_destination=mock_dest,
-                    destination_iata="JFK",
-                    price_estimate=prefs.budget,
-                    description="Opzione equilibrata.",
-                    image_url="https://images.unsplash.com/photo-1469854523086-cc02fe5d8800",
-                ),
-                Proposal(
-                    trip_id=trip_id,
-                    destination=f"{prefs.destination} Budget",
-                    destination_iata="LHR",
-                    price_estimate=prefs.budget * 0.7,
-                    description="Viaggio economico.",
-                    image_url="https://images.unsplash.com/photo-1476514525535-07fb3b4ae5f1",
-                ),
-                Proposal(
-                    trip_id=trip_id,
-                    destination=f"{prefs.destination} Luxury",
-                    destination_iata="CDG",
-                    price_estimate=prefs.budget * 1.5,
-                    description="Esperienza premium.",
-                    image_url="https://images.unsplash.com/photo-1522071820081-009f0129c71c",
-                ),
-            ]
-
-        existing = session.exec(
-            select(Proposal).where(Proposal.trip_id == trip_id)
-        ).all()
-        for e in existing:
-            session.delete(e)
-
-        final_props = []
-        for o in mock_options:
-            session.add(o)
-            final_props.append(o)
-
-        session.commit()
-
-        session.commit()
-
-        if prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO":
-            trip.status = "BOOKED"
-            if final_props:
-                trip.winning_proposal_id = final_props[0].id
-                trip.destination = final_props[0].real_destination or final_props[0].destination
-            auto_approva_se_manager(trip, current_account)
-        else:
-            trip.status = "VOTING"
-
-        session.add(trip)
-        session.commit()
-        return session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all()
-
-    except HTTPException:
-        session.rollback()
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] generate_proposals: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500, detail="Errore interno del server. Riprova."
-        )
-
-
-async def generate_itinerary_content(trip: Trip, proposal: Proposal, session: Session):
-    """Genera l'itinerario finale integrando nomi reali da OSM e AI avanzata"""
-    logger.info(f"[System] Generating itinerary for Trip {trip.id}...")
-
-    if not ai_client:
-        logger.warning(
-            "[Warning] AI Client not available, skipping itinerary generation."
-        )
-        return
-
-    try:
-        logger.info(f"[ITI-1] trip_id={trip.id} intent={trip.trip_intent} status={trip.status}")
-        try:
-            start_raw = trip.start_date
-            end_raw = trip.end_date
-            # start_date può essere datetime o str a seconda di come è stato salvato
-            if hasattr(start_raw, 'strftime'):
-                d1 = start_raw.replace(tzinfo=None) if start_raw.tzinfo else start_raw
-                d2 = end_raw.replace(tzinfo=None) if end_raw.tzinfo else end_raw
-            else:
-                d1 = datetime.fromisoformat(str(start_raw).replace("Z", ""))
-                d2 = datetime.fromisoformat(str(end_raw).replace("Z", ""))
-            num_days = abs((d2 - d1).days) + 1
-        except Exception as e:
-            logger.warning(f"[Warning] Date parsing failed: {e}")
-            num_days = 5
-        logger.info(f"[ITI-2] num_days={num_days}")
-
-        hotel_lat = trip.hotel_latitude
-        hotel_lon = trip.hotel_longitude
-        locali_reali = (
-            await get_places_from_overpass(hotel_lat, hotel_lon) if hotel_lat else []
-        )
-        logger.info(f"[ITI-3] overpass done, places={len(locali_reali)}")
-
-        places_prompt = ""
-        if locali_reali:
-            places_list_str = "\n".join(
-                [
-                    f"- {p['name']} (Lat: {p['lat']}, Lon: {p['lon']})"
-                    for p in locali_reali[:15]
-                ]
-            )
-            places_prompt = f"""
-            Ecco alcuni luoghi reali verificati vicino all'alloggio (ristoranti, bar, lidi/bagni):
-            {places_list_str}
-            
-            REQUISITO CRITICO PER LA MAPPA:
-            Se usi uno di questi luoghi:
-            1. Usa il suo NOME REALE come 'title'.
-            2. Usa LE SUE COORDINATE (Lat/Lon) esatte fornite sopra nel JSON. NON cambiarle di un solo decimale (Precisione chirurgica).
-            3. Se l'attività riguarda la spiaggia o il relax al mare, l'attività DEVE essere posizionata sulla costa (usando i 'Bagni' o 'Lidi' sopra indicati).
-            4. Se un luogo NON è nella lista sopra, imposta "lat": 0 e "lon": 0. Il sistema le cercherà. NON INVENTARE COORDINATE.
-            """
-
-        calendar_prompt = ""
-        organization_name = ""
-        organizer_part = next((p for p in trip.participants if p.is_organizer), None)
-        organizer_account = None
-        if organizer_part and organizer_part.account_id:
-            organizer_account = session.get(Account, organizer_part.account_id)
-
-        lang = organizer_account.language.upper() if organizer_account else "ITALIANO"
-        logger.info(f"[ITI-4] organizer_found={organizer_account is not None} lang={lang}")
-
-        if trip.trip_intent == "BUSINESS" and organizer_account:
-            if (
-                organizer_account
-                and organizer_account.is_calendar_connected
-                and organizer_account.google_calendar_token
-            ):
-                try:
-                    logger.info(
-                        f"[System] Fetching calendar events for Organizer {organizer_account.email}..."
-                    )
-                    creds = Credentials.from_authorized_user_info(
-                        json.loads(decrypt_text(organizer_account.google_calendar_token)),
-                        ["https://www.googleapis.com/auth/calendar.events.readonly"],
-                    )
-                    service = build("calendar", "v3", credentials=creds)
-
-                    t_min = (
-                        datetime.fromisoformat(
-                            trip.start_date.replace("Z", "")
-                        ).isoformat()
-                        + "Z"
-                    )
-                    t_max = (
-                        datetime.fromisoformat(
-                            trip.end_date.replace("Z", "")
-                        ).isoformat()
-                        + "Z"
-                    )
-
-                    events_result = (
-                        service.events()
-                        .list(
-                            calendarId="primary",
-                            timeMin=t_min,
-                            timeMax=t_max,
-                            singleEvents=True,
-                            orderBy="startTime",
-                        )
-                        .execute()
-                    )
-
-                    events = events_result.get("items", [])
-                    if events:
-                        event_lines = []
-                        for event in events:
-                            start = event["start"].get(
-                                "dateTime", event["start"].get("date")
-                            )
-                            end = event["end"].get("dateTime", event["end"].get("date"))
-                            summary = event.get("summary", "Impegno")
-                            event_lines.append(f"- {summary}: {start} - {end}")
-
-                        calendar_prompt = f"""
-                         IMPEGNI DI LAVORO ESISTENTI (DA RISPETTARE TASSATIVAMENTE):
-                         L'utente ha già i seguenti impegni fissati nel calendario. 
-                         NON sovrapporre nessuna attività turistica a questi orari.
-                         Pianifica spostamenti, pranzi e relax INTORNO a questi blocchi.
-                         
-                         {chr(10).join(event_lines)}
-                         """
-                        logger.info(f"[System] Found {len(events)} calendar events.")
-                except Exception as exc:
-                    logger.warning(f"[Warning] Failed to fetch calendar events: {exc}")
-
-        prompt = f"""
-        Sei un esperto Travel Agent. Genera un itinerario di {num_days} giorni per il viaggio "{trip.name}" a {trip.destination}.
-        TEMA: {proposal.destination}. DESCRIZIONE: {proposal.description}.
-        PARTENZA: {trip.departure_city or trip.departure_airport}.
-        ALLOGGIO: {trip.accommodation or "Hotel centrale"} (Coordinate: {hotel_lat}, {hotel_lon}).
-        MEZZO PRINCIPALE: {trip.transport_mode}.
-        ARRIVO: {trip.start_date} ore {trip.arrival_time or '14:00'}.
-        RITORNO: {trip.end_date} ore {trip.return_time or '18:00'}.
-
-        {places_prompt}
-
-        {calendar_prompt}
-
-        SCOPO DEL VIAGGIO: {trip.trip_intent}
-        {"INDIRIZZO UFFICIO/SEDE (LUOGO DI LAVORO): " + trip.office_address if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
-        
-        {"Se il viaggio è BUSINESS (LAVORO):" if trip.trip_intent == "BUSINESS" else ""}
-        {"- PRIORITÀ ASSOLUTA: Efficienza e produttività." if trip.trip_intent == "BUSINESS" else ""}
-        {"- LUOGO DI LAVORO: Tutte le sessioni di lavoro si svolgono all'indirizzo " + trip.office_address + ". NON scrivere mai che l'utente lavora dall'hotel (NO 'lavoro dall'hotel')." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
-        {"- COMMUTING: Includi esplicitamente gli spostamenti (tipo TRANSPORT) tra l'hotel e l'ufficio all'inizio e alla fine di ogni sessione lavorativa." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
-        {"- ORARIO DI LAVORO: Rispetta tassativamente " + (trip.work_start_time or '09:00') + " - " + (trip.work_end_time or '18:00') + " nei giorni " + (trip.work_days or 'Lun-Ven') + ". Dentro questa fascia NON inserire nulla che non sia lavoro o la pausa pranzo." if trip.trip_intent == "BUSINESS" else ""}
-        {"- NIENTE TURISMO: non inserire musei, monumenti, visite guidate, shopping o attrazioni. Questa e' una trasferta di lavoro: l'itinerario contiene solo spostamenti, sessioni di lavoro e pasti. Anche la sera non proporre attivita' turistiche." if trip.trip_intent == "BUSINESS" else ""}
-        {"- COERENZA DEI NOMI: se un'attivita' si chiama 'Lavoro Mattutino' deve stare al mattino, 'Lavoro Pomeridiano' al pomeriggio. Il titolo deve corrispondere alla fascia oraria in cui la collochi." if trip.trip_intent == "BUSINESS" else ""}
-        {"- ORDINE DEGLI SPOSTAMENTI: il tragitto hotel->ufficio precede SEMPRE la sessione di lavoro, quello ufficio->hotel la segue. Mai il contrario." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
-
-        {"" if trip.trip_intent == "BUSINESS" else "Se il viaggio è LEISURE, bilancia relax e scoperta. Includi esperienze locali autentiche, tempo libero e varietà di attività."}
-
-        REGOLE CRITICHE:
-        1. SEQUENZA LOGICA: Rispetta l'ordine cronologico (Colazione -> Mattina -> Pranzo -> Pomeriggio -> Cena).
-        2. TIMING DINAMICO: Non usare orari fissi. Ogni attività deve avere ora inizio e fine realistica.
-           - Colazione: ~45 min (07:30-09:00).
-           - Pranzo: ~1-1.5 ore (12:30-14:00).
-           - Cena: ~1.5-2 ore (19:30-21:30).
-           - Attività: Durata variabile 1-4 ore.
-        3. LOGISTICA E ORARI: 
-           - Il Giorno 1 deve iniziare TASSATIVAMENTE DOPO l'ora di ARRIVO ({trip.arrival_time or '14:00'}).
-           - L'ultimo giorno deve terminare il più vicino possibile all'ora di RITORNO ({trip.return_time or '19:00'}). 
-           - NON terminare l'itinerario troppo presto se il ritorno è tardi (es. se si parte alle 19:00, pianifica attività/pranzo/relax fino almeno alle 17:30-18:00).
-           - NON pianificare nulla DOPO l'ora di ritorno.
-        4. TRASPORTI (CAR): Se il mezzo è CAR, calcola l'ESATTA stima di CARBURANTE e PEDAGGI per il viaggio A/R tra {trip.departure_city or trip.departure_airport} e {trip.destination}. Usa i dati reali delle autostrade (es. Autostrade per l'Italia). NON essere generico.
-        5. MAPPA: Fornisci COORDINATE GPS (lat, lon) REALI per ogni luogo.
-        6. NO TRANSIT FOR LEISURE: Evita stazioni o aeroporti per attività di svago. Se l'attività parla di spiaggia, mare o lungomare, il luogo DEVI posizionarlo sulla costa (Lido/Bagno).
-        7. NO NOTES: Non includere MAI note, commenti, disclaimer o spiegazioni (es. "I costi sono calcolati su...") né nel testo delle attività né esternamente. Solo i dati richiesti nel JSON.
-        
-        RISPONDI SOLO IN JSON:
-        {{
-            "estimated_road_costs": {{"fuel": 0.0, "tolls": 0.0}},
-            "itinerary": [
-                {{
-                    "title": "...", 
-                    "description": "...", 
-                    "start_time": "YYYY-MM-DDTHH:MM:SS",
-                    "end_time": "YYYY-MM-DDTHH:MM:SS",
-                    "type": "ACTIVITY|FOOD|TRANSPORT|CHECKIN",
-                    "lat": 0.0,
-                    "lon": 0.0
-                }}
-            ]
-        }}
-        LINGUA: {lang}.
-        """
-
-        logger.info(f"[ITI-5] calling Gemini for itinerary trip={trip.id}")
-        response = await _gemini_call_with_retry(prompt, json_mode=True)
-        logger.info(f"[ITI-6] Gemini responded, text_len={len(response.text) if response.text else 0}")
-        data = json.loads(response.text)
-
-        # ── Step B: Validate and fix timings with CP-SAT optimizer ──────────
-        raw_activities = data.get("itinerary", [])
-        logger.info(f"[ITI-7] raw_activities={len(raw_activities)}")
-        if raw_activities:
-            opt_result = await optimize_travel_itinerary(raw_activities)
-            logger.info(f"[ITI-8] optimizer done, scheduled={len(opt_result.get('schedule', []))}")
-
-            if opt_result["dropped"]:
-                dropped_titles = [d["title"] for d in opt_result["dropped"]]
-                logger.warning(
-                    f"[Optimizer] Trip {trip.id}: {len(opt_result['dropped'])} activities "
-                    f"dropped as physically infeasible: {dropped_titles}"
-                )
-
-                if not opt_result["feasible"] and not opt_result["partial"]:
-                    # Completely infeasible (anchor conflict) — ask Gemini to explain
-                    explain_prompt = (
-                        f"L'itinerario generato per il viaggio a {trip.destination} è "
-                        f"matematicamente impossibile. Le seguenti attività non possono "
-                        f"essere inserite nel giorno senza sovrapporre orari fissi o voli: "
-                        f"{', '.join(dropped_titles)}. "
-                        f"Spiega in modo chiaro e breve (massimo 2 frasi) perché e cosa "
-                        f"dovrebbe tagliare l'utente. Lingua: {lang}."
-                    )
-                    try:
-                        explain_resp = await _gemini_call_with_retry(explain_prompt)
-                        logger.info(
-                            f"[Optimizer] Infeasibility explanation: {explain_resp.text}"
-                        )
-                    except Exception as ex:
-                        logger.warning(f"[Optimizer] Could not generate explanation: {ex}")
-
-            # ── Step C: Replace Gemini times with optimizer-validated times ──
-            # Strip internal optimizer metadata before passing to process_item
-            optimized = []
-            for item in opt_result["schedule"]:
-                clean = {k: v for k, v in item.items() if not k.startswith("_")}
-                optimized.append(clean)
-            data["itinerary"] = optimized
-            logger.info(
-                f"[Optimizer] Trip {trip.id}: schedule locked "
-                f"({len(optimized)} activities, {len(opt_result['dropped'])} dropped)."
-            )
-
-        logger.info(f"[ITI-9] saving itinerary items trip={trip.id}")
-        session.exec(delete(ItineraryItem).where(ItineraryItem.trip_id == trip.id))
-        session.commit()
-
-        import asyncio
-
-        async def process_item(item):
-            try:
-                try:
-                    i_lat = float(item.get("lat", 0))
-                    i_lon = float(item.get("lon", 0))
-                except:
-                    i_lat, i_lon = 0.0, 0.0
-
-                if not i_lat or i_lat == 0:
-                    title_clean = item["title"].lower()
-                    query = f"{item['title']}, {trip.destination}"
-
-                    if any(word in title_clean for word in ["bagno", "lido", "mare"]):
-                        if "bagno" in title_clean or "lido" in title_clean:
-                            query = f"{item['title']}, {trip.destination}"
-                        else:
-                            query = f"{item['title']}, Lungomare, {trip.destination}"
-
-                    i_lat, i_lon = await get_coordinates(query)
-
-                    if (not i_lat or i_lat == 0) and trip.hotel_latitude:
-                        i_lat, i_lon = trip.hotel_latitude, trip.hotel_longitude
-
-                return ItineraryItem(
-                    trip_id=trip.id,
-                    title=item["title"],
-                    description=item["description"],
-                    start_time=item["start_time"],
-                    end_time=item.get("end_time"),
-                    type=item["type"],
-                    latitude=i_lat,
-                    longitude=i_lon,
-                )
-            except Exception as ei:
-                logger.error(f"[ERROR] Skip item {item.get('title')}: {ei}")
-                return None
-
-        tasks = [process_item(item) for item in data.get("itinerary", [])]
-        results = await asyncio.gather(*tasks)
-
-        for db_item in results:
-            if db_item:
-                session.add(db_item)
-
-        # La stima di carburante e pedaggi non viene piu' inserita come spesa.
-        # Era una previsione generata dal modello che finiva mescolata alle spese
-        # reali: nessuno la verificava e in nota spese i costi auto vanno
-        # rendicontati con le ricevute, non con una stima. La categoria
-        # Travel_Road resta disponibile per le spese vere, inserite a mano o
-        # lette da ricevuta.
-        session.exec(
-            delete(Expense).where(
-                Expense.trip_id == trip.id,
-                Expense.category == "Travel_Road",
-                Expense.description.like("Stima%"),
-            )
-        )
-
-        session.commit()
-        logger.info(f"[ITI-10] DONE. Itinerary for Trip {trip.id} generated correctly.")
-        return True
-
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[AI Error] Generazione itinerario fallita: {e}", exc_info=True)
-        return False
-
-
-@router.post("/{trip_id}/confirm-hotel")
-async def confirm_hotel(
-    trip_id: int,
-    hotel_data: HotelSelectionRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Conferma i dati logistici finali e genera l'itinerario"""
-    # Endpoint distruttivo: sovrascrive hotel/costi e RIGENERA l'itinerario da
-    # zero. Senza questo controllo chiunque poteva azzerare il viaggio altrui.
-    check_participant(trip_id, current_account, session)
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        # check_rate_limit traccia monthly_ai_usage per B2B e applica FREE_LIMIT per B2C
-        check_rate_limit(current_account, session)
-        require_premium(current_account, trip)
-
-        trip.accommodation = hotel_data.hotel_name
-        trip.accommodation_location = hotel_data.hotel_address
-        trip.hotel_cost = hotel_data.hotel_cost or 0.0
-        trip.transport_cost = hotel_data.transport_cost or 0.0
-        trip.arrival_time = hotel_data.arrival_time
-        trip.return_time = hotel_data.return_time
-
-        if hotel_data.transport_mode and hotel_data.transport_mode != "None":
-            trip.transport_mode = hotel_data.transport_mode
-
-        lat, lon = await get_coordinates(
-            f"{hotel_data.hotel_name}, {hotel_data.hotel_address}"
-        )
-        trip.hotel_latitude = lat
-        trip.hotel_longitude = lon
-
-        session.add(trip)
-        session.commit()
-
-        proposal = session.get(Proposal, trip.winning_proposal_id)
-        if not proposal:
-            proposal = Proposal(
-                destination=trip.destination,
-                trip_id=trip.id,
-                price_estimate=0,
-                description="",
-            )
-
-        itinerary_ok = await generate_itinerary_content(trip, proposal, session)
-        return {
-            "status": "success",
-            "itinerary_generated": itinerary_ok,
-            "message": "Logistica confermata. Itinerario generato." if itinerary_ok else "Logistica confermata. Generazione itinerario in corso.",
-        }
-    except HTTPException:
-        session.rollback()
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] confirm_hotel: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/{trip_id}/reset-hotel")
-async def reset_hotel(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Resetta i dati dell'hotel per permettere la modifica e la rigenerazione dell'itinerario"""
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        participant = check_participant(trip_id, current_account, session)
-        if not participant.is_organizer:
-            raise HTTPException(
-                status_code=403,
-                detail="Solo l'organizzatore può resettare la logistica",
-            )
-
-        trip.accommodation = None
-        trip.accommodation_location = None
-        trip.hotel_latitude = None
-        trip.hotel_longitude = None
-        trip.hotel_cost = 0.0
-        trip.transport_cost = 0.0
-
-        session.exec(delete(ItineraryItem).where(ItineraryItem.trip_id == trip_id))
-        session.exec(
-            delete(Expense).where(
-                Expense.trip_id == trip_id,
-                Expense.category == "Travel_Road",
-                Expense.description.like("Stima%"),
-            )
-        )
-
-        session.add(trip)
-        session.commit()
-        return {
-            "status": "success",
-            "message": "Logistica resettata. Ora puoi inserire nuovi dati.",
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] reset_hotel: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/vote/{proposal_id}")
-async def vote_proposal(
-    proposal_id: int,
-    score: int,
-    user_id: Optional[int] = None,
-    session: Session = Depends(get_session),
-    current_account: Optional[Account] = Depends(get_current_user, use_cache=True),
-):
-    """Registra il voto (Demo mode con user_id o Secure con token)"""
-    try:
-        proposal = session.get(Proposal, proposal_id)
-        if not proposal:
-            raise HTTPException(status_code=404, detail="Proposta non trovata")
-
-        # P0-6: enforcement tenant sul trip prima del voto
-        trip_for_vote = session.get(Trip, proposal.trip_id)
-        if trip_for_vote:
-            check_tenant_for_trip(trip_for_vote, current_account)
-
-        participant = None
-        if user_id and user_id > 0:
-            participant = session.get(Participant, user_id)
-            # Il participant passato deve appartenere al trip della proposal
-            if participant and participant.trip_id != proposal.trip_id:
-                raise HTTPException(status_code=403, detail="Partecipante non valido")
-        else:
-            participant = session.exec(
-                select(Participant).where(
-                    Participant.trip_id == proposal.trip_id,
-                    Participant.account_id == current_account.id,
-                )
-            ).first()
-
-        if not participant:
-            raise HTTPException(status_code=403, detail="Partecipante non trovato")
-
-        existing = session.exec(
-            select(Vote).where(
-                Vote.proposal_id == proposal_id, Vote.user_id == participant.id
-            )
-        ).first()
-
-        if existing:
-            existing.score = score
-            session.add(existing)
-        else:
-            session.add(
-                Vote(proposal_id=proposal_id, user_id=participant.id, score=score)
-            )
-
-        session.commit()
-
-        trip = session.get(Trip, proposal.trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        total_voters_query = (
-            select(func.count(func.distinct(Vote.user_id)))
-            .join(Proposal)
-            .where(Proposal.trip_id == trip.id)
-        )
-
-        total_voters = session.exec(total_voters_query).one() or 0
-
-        logger.info(f"[DEBUG] Voti: {total_voters}/{trip.num_people}")
-
-        if total_voters >= trip.num_people:
-            all_props = session.exec(
-                select(Proposal).where(Proposal.trip_id == trip.id)
-            ).all()
-
-            best_p = None
-            best_score = -1
-
-            for p in all_props:
-                score_query = select(func.sum(Vote.score)).where(
-                    Vote.proposal_id == p.id
-                )
-                total_score = session.exec(score_query).one() or 0
-
-                if total_score > best_score:
-                    best_score = total_score
-                    best_p = p
-
-            if best_p:
-                trip.winning_proposal_id = best_p.id
-                trip.destination = best_p.destination
-                trip.real_destination = best_p.real_destination
-                trip.destination_iata = best_p.destination_iata
-                trip.status = "BOOKED"
-                session.add(trip)
-                session.commit()
-                logger.info(
-                    f"[SUCCESS] Consenso raggiunto! Vincitore: {best_p.destination}"
-                )
-
-                try:
-                    organizer = session.exec(
-                        select(Participant).where(
-                            Participant.trip_id == trip.id,
-                            Participant.is_organizer == True,
-                        )
-                    ).first()
-                    organizer_account = (
-                        session.get(Account, organizer.account_id)
-                        if organizer and organizer.account_id
-                        else None
-                    )
-
-                    if organizer_account:
-                        smtp_user, smtp_password, smtp_conf = get_smtp_config()
-                        if smtp_user and smtp_password:
-                            frontend_url = os.getenv(
-                                "FRONTEND_URL", "https://splitplan-ai.vercel.app"
-                            )
-                            itinerary_url = f"{frontend_url}/dashboard/{trip.id}"
-
-                            message = MessageSchema(
-                                subject=f"SplitPlan: Viaggio Confermato! \u2708\ufe0f {trip.name}",
-                                recipients=[organizer_account.email],
-                                body=booking_confirmation_email(
-                                    name=organizer_account.name,
-                                    trip_name=trip.name,
-                                    destination=trip.destination,
-                                    dates=f"{trip.start_date} - {trip.end_date}",
-                                    price=f"€{best_p.price_estimate}",
-                                    itinerary_url=itinerary_url,
-                                ),
-                                subtype=MessageType.html,
-                            )
-                            fm = FastMail(smtp_conf)
-                            await fm.send_message(message)
-                            logger.info(
-                                f"[OK] Email di conferma inviata a {organizer_account.email}"
-                            )
-                except Exception as email_err:
-                    logger.error(f"[ERROR] Invio email conferma fallito: {email_err}")
-
-        return {
-            "status": "voted",
-            "current_voters": total_voters,
-            "required": trip.num_people,
-            "trip_status": trip.status,
-            "votes_count": total_voters,
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[ERROR] vote_proposal: {e}")
-        raise HTTPException(status_code=500, detail="Errore interno del server. Riprova.")
-
-
-@router.post("/{trip_id}/simulate-votes")
-async def simulate_votes(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Simula i voti mancanti per chiudere il viaggio in DEMO"""
-    # Vota al posto di tutti i partecipanti e puo' chiudere la votazione
-    # decidendo la destinazione: riservato all'organizzatore del viaggio.
-    member = check_participant(trip_id, current_account, session)
-    if not member.is_organizer:
-        raise HTTPException(
-            status_code=403,
-            detail="Solo l'organizzatore può simulare i voti mancanti.",
-        )
-    try:
-        trip = session.get(Trip, trip_id)
-        proposals = session.exec(
-            select(Proposal).where(Proposal.trip_id == trip_id)
-        ).all()
-        participants = session.exec(
-            select(Participant).where(Participant.trip_id == trip_id)
-        ).all()
-
-        if not proposals:
-            return {"error": "Nessuna proposta"}
-
-        for p in participants:
-            voted = session.exec(select(Vote).where(Vote.user_id == p.id)).first()
-            if not voted:
-                await vote_proposal(
-                    proposals[0].id,
-                    1,
-                    session=session,
-                    current_account=current_account,
-                    user_id=p.id,
-                )
-
-        return {"status": "votes_simulated", "voters": len(participants)}
-    except Exception as e:
-        logger.error(f"[ERROR] simulate_votes: {e}")
-        return {"status": "error", "message": "Errore durante la simulazione dei voti."}
-
-
-@router.get("/{trip_id}/itinerary", response_model=List[ItineraryItem])
-async def get_itinerary(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Itinerario del viaggio. Solo per i partecipanti: esponeva tappe con
-    coordinate e orari di qualunque viaggio a chiunque conoscesse l'id."""
-    check_participant(trip_id, current_account, session)
-    return session.exec(
-        select(ItineraryItem)
-        .where(ItineraryItem.trip_id == trip_id)
-        .order_by(ItineraryItem.start_time)
-    ).all()
-
-
-@router.get("/{trip_id}/route-geometry")
-async def get_trip_route_geometry(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """
-    Returns the OSRM-encoded polyline for the itinerary route.
-    Called async from the frontend after the itinerary loads — map never blocks.
-    Falls back gracefully: returns {"polyline": null} on any OSRM failure.
-    """
-    check_participant(trip_id, current_account, session)
-    items = session.exec(
-        select(ItineraryItem)
-        .where(ItineraryItem.trip_id == trip_id)
-        .order_by(ItineraryItem.start_time)
-    ).all()
-
-    waypoints = [
-        (i.latitude, i.longitude)
-        for i in items
-        if i.latitude and i.longitude
-    ]
-
-    if len(waypoints) < 2:
-        return {"polyline": None}
-
-    polyline_str = await get_route_geometry(waypoints, profile="foot")
-    return {"polyline": polyline_str}
-
-
-@router.get("/{trip_id}/participants")
-async def get_participants(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Partecipanti al viaggio. Solo per i partecipanti stessi: l'accesso libero
-    esponeva i nomi dei membri di qualunque viaggio, trasferte aziendali incluse.
-    Gli ospiti con link di condivisione li ricevono da GET /trips/share/{token}."""
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    check_participant(trip_id, current_account, session)
-    results = session.exec(
-        select(Participant).where(Participant.trip_id == trip_id)
-    ).all()
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "is_organizer": p.is_organizer,
-            "has_voted": session.exec(
-                select(func.count(Vote.id)).where(Vote.user_id == p.id)
-            ).one()
-            > 0,
-        }
-        for p in results
-    ]
-
-
-@router.post("/{trip_id}/chat")
-async def chat_with_ai(
-    trip_id: int,
-    req: ChatRequest,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Chat AI evoluta: gestisce contesto temporale, history e comandi multipli"""
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        # P0-6: solo i partecipanti (same-tenant su BUSINESS) possono chattare
-        check_participant(trip_id, current_account, session)
-
-        check_rate_limit(current_account, session)
-        if current_account.company_id:
-            _chat_company = session.get(Company, current_account.company_id)
-            if _chat_company:
-                check_company_limits(_chat_company, session, "ai_call")
-        require_premium(current_account, trip)
-
-        itinerary = session.exec(
-            select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
-        ).all()
-
-        history_text = ""
-        if req.history:
-            history_text = "\n".join(
-                [
-                    f"{m.get('role', 'user').upper()}: {m.get('text', '')}"
-                    for m in req.history[-5:]
-                ]
-            )
-
-        prompt = f"""
-        Sei SplitPlan Assistant, un esperto Travel Agent. 
-        VIAGGIO: {trip.name} a {trip.destination}
-        DATE: dal {trip.start_date} al {trip.end_date}
-        
-        ITINERARIO ATTUALE (Lista di oggetti JSON con ID, Titolo, Orario):
-        {json.dumps([i.model_dump() for i in itinerary], indent=2)}
-        
-        CRONOLOGIA RECENTE:
-        {history_text}
-        
-        RICHIESTA UTENTE: "{req.message}"
-        
-        ISTRUZIONI:
-        1. Rispondi cordialmente in {current_account.language.upper()}.
-        2. Se l'utente vuole CAMBIARE o SPOSTARE qualcosa, devi fare DELETE dell'item corrente (usando il suo ID) e ADD di quello nuovo con i dati corretti.
-        3. IMPORTANTE: Se riorganizzi l'itinerario, assicurati di NON PERDERE attività. Se cancelli un giorno per spostarlo, devi RIGENERARE tutte le attività di quel giorno.
-        4. Se l'utente vuole aggiungere attività ricorrenti (es. ogni mattina), crea un comando ADD per ogni giorno del viaggio.
-        5. AZIONI:
-           - ADD: {{"action": "ADD", "item": {{"title": "..", "description": "..", "start_time": "ISO8601", "type": "ACTIVITY|FOOD|TRANSPORT"}}}}
-           - DELETE: {{"action": "DELETE", "id": 123}}
-        
-        RISPONDI SEMPRE E SOLO IN JSON (senza testo fuori dal blocco):
-        {{
-            "reply": "Messaggio di conferma",
-            "commands": []
-        }}
-        LINGUA: {current_account.language.upper()}.
-        """
-
-        if not ai_client:
-            return {
-                "reply": "AI non disponibile.",
-                "itinerary": [i.model_dump() for i in itinerary],
-            }
-
-        response = await _gemini_call_with_retry(prompt, json_mode=True)
-        raw_text = response.text.strip()
-
-        logger.info(f"[DEBUG] Raw AI Response: {raw_text}")
-
-        try:
-            data = json.loads(raw_text)
-        except (json.JSONDecodeError, ValueError):
-            return {
-                "reply": "C'è stato un errore nel formato della risposta AI. Riprova tra un istante.",
-                "itinerary": [i.model_dump() for i in itinerary],
-            }
-
-        for cmd in data.get("commands", []):
-            try:
-                if cmd["action"] == "ADD":
-                    item_data = cmd["item"].copy()
-                    item_data.pop("id", None)
-                    item_data.pop("trip_id", None)
-
-                    new_item = ItineraryItem(trip_id=trip_id, **item_data)
-                    session.add(new_item)
-                elif cmd["action"] == "DELETE":
-                    item_id = cmd.get("id")
-                    if item_id:
-                        item = session.get(ItineraryItem, item_id)
-                        if item and item.trip_id == trip_id:
-                            session.delete(item)
-            except Exception as e:
-                logger.error(f"[CMD Error] Fallito comando {cmd.get('action')}: {e}")
-
-        session.commit()
-
-        updated = session.exec(
-            select(ItineraryItem)
-            .where(ItineraryItem.trip_id == trip_id)
-            .order_by(ItineraryItem.start_time)
-        ).all()
-        return {
-            "reply": data.get("reply", "Itinerario aggiornato!"),
-            "itinerary": [i.model_dump() for i in updated],
-        }
-
-    except HTTPException:
-        session.rollback()
-        raise
-    except Exception as e:
-        session.rollback()
-        logger.error(f"[Chat Error] {e}")
-        raise HTTPException(
-            status_code=500, detail="Errore interno del server. Riprova."
-        )
-
-
-# NOTA: l'endpoint POST /buy-credits e' stato rimosso.
-# Era un residuo della fase demo ("Simula l'acquisto di crediti"): accettava un
-# `amount` arbitrario e lo sommava ai crediti dell'account senza alcun passaggio
-# da Stripe, permettendo a qualunque utente autenticato di ottenere crediti
-# illimitati. L'unico percorso valido per accreditare crediti e'
-# process_successful_checkout() in backend/routers/payments.py, invocato dal
-# webhook Stripe dopo un pagamento verificato.
-
-
-@router.post("/{trip_id}/unlock")
-async def unlock_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Sblocca un viaggio usando 1 credito"""
-    check_participant(trip_id, current_account, session)
-    try:
-        trip = session.get(Trip, trip_id)
-        if not trip:
-            raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-        if trip.is_premium:
-            return {"status": "error", "message": "Il viaggio è già premium"}
-
-        if current_account.credits < 1:
-            raise HTTPException(
-                status_code=403,
-                detail="Crediti insufficienti. Acquistane altri nel negozio!",
-            )
-
-        current_account.credits -= 1
-        trip.is_premium = True
-
-        session.add(current_account)
-        session.add(trip)
-        session.commit()
-
-        return {
-            "status": "success",
-            "message": "Viaggio sbloccato!",
-            "credits": current_account.credits,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/{trip_id}/export-pdf")
-async def export_trip_pdf(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """Esporta l'itinerario e le spese del viaggio in formato PDF"""
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    # require_premium e' un paywall, NON un controllo di ownership: per i trip
-    # BUSINESS fa return immediato, quindi da solo lasciava scaricare il PDF
-    # completo (itinerario, spese, partecipanti) di qualunque trasferta aziendale.
-    check_participant(trip_id, current_account, session)
-    require_premium(current_account, trip)
-
-    def format_pdf_datetime(dt_str):
-        if not dt_str:
-            return ""
-        try:
-            if "T" in dt_str:
-                dt = datetime.fromisoformat(dt_str.replace("Z", ""))
-                return dt
-            return None
-        except:
-            return None
-
-    def format_pdf_date_only(d_str):
-        if not d_str:
-            return ""
-        try:
-            dt = datetime.strptime(d_str, "%Y-%m-%d")
-            return dt.strftime("%d/%m/%Y")
-        except:
-            return d_str
-
-    pdf_labels = {
-        "it": {
-            "header": "SPLITPLAN",
-            "your_trip": "Il tuo viaggio a",
-            "period": "Periodo",
-            "lodging": "Alloggio",
-            "hotel": "Hotel",
-            "address": "Indirizzo",
-            "itinerary": "Itinerario del Viaggio",
-            "finances": "Riepilogo Spese",
-            "total_spent": "TOTALE SPESE",
-            "per_person": "a persona",
-            "date": "Data",
-            "description": "Descrizione",
-            "category": "Categoria",
-            "amount": "Importo (EUR)",
-            "payer": "Pagato da",
-            "day": "Giorno",
-        },
-        "en": {
-            "header": "SPLITPLAN",
-            "your_trip": "Your trip to",
-            "period": "Period",
-            "lodging": "Accommodation",
-            "hotel": "Hotel",
-            "address": "Address",
-            "itinerary": "Travel Itinerary",
-            "finances": "Expense Summary",
-            "total_spent": "TOTAL EXPENSES",
-            "per_person": "per person",
-            "date": "Date",
-            "description": "Description",
-            "category": "Category",
-            "amount": "Amount (EUR)",
-            "payer": "Paid by",
-            "day": "Day",
-        },
-    }
-    L = pdf_labels.get(current_account.language, pdf_labels["it"])
-
-    itinerary = sorted(trip.itinerary_items, key=lambda x: (x.start_time))
-    expenses = trip.expenses
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-
-    pdf.set_fill_color(25, 42, 86)
-    pdf.rect(0, 0, 210, 40, "F")
-
-    pdf.set_font("Helvetica", "B", 24)
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_y(10)
-    pdf.cell(0, 15, L["header"], ln=True, align="C")
-
-    pdf.set_font("Helvetica", "B", 14)
-    pdf.cell(
-        0,
-        10,
-        f"{L['your_trip']} {trip.real_destination or trip.destination}",
-        ln=True,
-        align="C",
-    )
-    pdf.ln(10)
-
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Helvetica", "B", 18)
-    pdf.cell(0, 10, f"{trip.name}", ln=True)
-
-    pdf.set_font("Helvetica", "I", 11)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(
-        0,
-        7,
-        f"{L['period']}: {format_pdf_date_only(trip.start_date)} - {format_pdf_date_only(trip.end_date)}",
-        ln=True,
-    )
-    pdf.ln(5)
-    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-    pdf.ln(10)
-
-    if trip.accommodation:
-        pdf.set_font("Helvetica", "B", 16)
-        pdf.set_fill_color(240, 244, 255)
-        pdf.set_text_color(25, 42, 86)
-        pdf.cell(0, 12, f"   {L['lodging']}", ln=True, fill=True)
-        pdf.ln(4)
-
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Helvetica", "B", 12)
-        pdf.cell(0, 8, f"{L['hotel']}: {trip.accommodation}", ln=True)
-        if trip.accommodation_location:
-            pdf.set_font("Helvetica", "", 10)
-            pdf.set_text_color(80, 80, 80)
-            pdf.multi_cell(0, 8, f"{L['address']}: {trip.accommodation_location}")
-        pdf.ln(10)
-
-    pdf.set_font("Helvetica", "B", 16)
-    pdf.set_fill_color(240, 244, 255)
-    pdf.set_text_color(25, 42, 86)
-    pdf.cell(0, 12, f"   {L['itinerary']}", ln=True, fill=True)
-    pdf.ln(5)
-
-    if not itinerary:
-        pdf.set_font("Helvetica", "", 12)
-        pdf.set_text_color(0, 0, 0)
-        pdf.cell(
-            0,
-            10,
-            (
-                "No itinerary generated yet."
-                if current_account.language == "en"
-                else "Nessun itinerario generato per questo viaggio."
-            ),
-            ln=True,
-        )
-    else:
-        current_date_str = None
-        day_count = 0
-
-        for item in itinerary:
-            dt = format_pdf_datetime(item.start_time)
-            if not dt:
-                continue
-
-            date_str = dt.strftime("%Y-%m-%d")
-
-            if date_str != current_date_str:
-                current_date_str = date_str
-                day_count += 1
-
-                if pdf.get_y() > 240:
-                    pdf.add_page()
-
-                pdf.ln(4)
-                pdf.set_font("Helvetica", "B", 14)
-                pdf.set_text_color(0, 122, 255)
-                pdf.cell(
-                    0,
-                    10,
-                    f"{L['day']} {day_count} - {dt.strftime('%d/%m/%Y')}",
-                    ln=True,
-                )
-                pdf.line(pdf.get_x(), pdf.get_y(), pdf.get_x() + 50, pdf.get_y())
-                pdf.ln(2)
-
-            pdf.set_font("Helvetica", "B", 11)
-            pdf.set_text_color(50, 50, 50)
-            time_display = dt.strftime("%H:%M")
-            pdf.cell(20, 8, f"{time_display}", ln=False)
-
-            pdf.set_font("Helvetica", "B", 11)
-            pdf.set_text_color(0, 0, 0)
-            pdf.cell(0, 8, f"{item.title}", ln=True)
-
-            if item.description:
-                pdf.set_font("Helvetica", "", 9)
-                pdf.set_text_color(100, 100, 100)
-                pdf.set_x(30)
-                pdf.multi_cell(0, 5, f"{item.description}")
-
-            pdf.ln(2)
-
-    pdf.ln(10)
-
-    if expenses:
-        if pdf.get_y() > 180:
-            pdf.add_page()
-        pdf.set_font("Helvetica", "B", 16)
-        pdf.set_fill_color(240, 244, 255)
-        pdf.set_text_color(25, 42, 86)
-        pdf.cell(0, 12, f"   {L['finances']}", ln=True, fill=True)
-        pdf.ln(5)
-
-        total_eur = sum(e.amount for e in expenses)
-
-        pdf.set_font("Helvetica", "B", 10)
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_fill_color(25, 42, 86)
-        pdf.cell(30, 8, f" {L['date']}", border=0, fill=True)
-        pdf.cell(80, 8, f" {L['description']}", border=0, fill=True)
-        pdf.cell(30, 8, f" {L['category']}", border=0, fill=True)
-        pdf.cell(50, 8, f" {L['amount']}", border=0, fill=True, ln=True)
-
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Helvetica", "", 9)
-        fill = False
-        for e in expenses:
-            (
-                pdf.set_fill_color(245, 247, 250)
-                if fill
-                else pdf.set_fill_color(255, 255, 255)
-            )
-            pdf.cell(30, 8, format_pdf_date_only(e.date), border=0, fill=True)
-            pdf.cell(80, 8, f" {str(e.description)[:40]}", border=0, fill=True)
-            pdf.cell(30, 8, f" {str(e.category)}", border=0, fill=True)
-            pdf.cell(50, 8, f" {e.amount:.2f} EUR", border=0, fill=True, ln=True)
-            fill = not fill
-
-        pdf.ln(5)
-        pdf.set_font("Helvetica", "B", 12)
-        pdf.set_text_color(0, 122, 255)
-        pdf.cell(0, 10, f"{L['total_spent']}: {total_eur:.2f} EUR", ln=True, align="R")
-
-    pdf_bytes = pdf.output()
-
-    if isinstance(pdf_bytes, bytearray):
-        pdf_bytes = bytes(pdf_bytes)
-
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=SplitPlan_{trip_id}.pdf"
-        },
-    )
-
-
-@router.get("/{trip_id}/export-nota-spese")
-async def export_nota_spese(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """
-    Genera la Nota Spese Ufficiale in PDF (B2B).
-    Include dati dipendente/azienda, dettagli trasferta, tabella spese,
-    e footer con l'analisi previsionale AI se disponibile.
-    """
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    check_participant(trip_id, current_account, session)
-
-    company = None
-    if current_account.company_id:
-        company = session.get(Company, current_account.company_id)
-
-    expenses = session.exec(
-        select(Expense)
-        .where(Expense.trip_id == trip_id)
-        .order_by(Expense.date)
-    ).all()
-
-    from services.pdf_service import generate_nota_spese
-    pdf_bytes = generate_nota_spese(trip, current_account, company, expenses)
-
-    filename = f"NotaSpese_SplitPlan_{trip_id}.pdf"
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
-
-
-@router.get("/{trip_id}/expense-report/pdf")
-async def export_expense_report_pdf(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    """
-    Genera la Nota Spese Ufficiale PDF per un viaggio.
-    Accessibile solo dai partecipanti del viaggio.
-    """
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    check_participant(trip_id, current_account, session)
-
-    company = None
-    if current_account.company_id:
-        company = session.get(Company, current_account.company_id)
-
-    expenses = session.exec(
-        select(Expense)
-        .where(Expense.trip_id == trip_id)
-        .order_by(Expense.date)
-    ).all()
-
-    from services.pdf_service import generate_nota_spese
-    pdf_bytes = generate_nota_spese(trip, current_account, company, expenses)
-
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="nota-spese-{trip_id}.pdf"'},
-    )
-
-
-@router.get("/{trip_id}/events")
-async def get_trip_events(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_account: Account = Depends(get_current_user),
-):
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(status_code=404, detail="Viaggio non trovato")
-
-    check = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id, Participant.account_id == current_account.id
-        )
-    ).first()
-    if not check:
-        raise HTTPException(
-            status_code=403, detail="Non sei un partecipante di questo viaggio."
-        )
-
-    now_utc = datetime.now(timezone.utc)
-    if trip.events_cache and trip.events_cache_date:
-        diff = (
-            now_utc.replace(tzinfo=None) - trip.events_cache_date.replace(tzinfo=None)
-        ).days
-        if diff < 3:
-            logger.info(
-                f"Cache eventi usata per viaggio {trip_id} (età: {diff} giorni)"
-            )
-            return json.loads(trip.events_cache)
-
-    if not ai_client:
-        raise HTTPException(status_code=503, detail="AI non disponibile.")
-
-    check_rate_limit(current_account, session)
-
-    destination = trip.real_destination or trip.destination
-    lang = current_account.language.upper()
-
-    prompt = f"""
-    Sei un esperto di viaggi e cultura locale. 
-    Il viaggio è a: {destination}
-    Periodo: dal {trip.start_date} al {trip.end_date}
-    
-    Elenca gli eventi REALI e RILEVANTI che potrebbero impattare questo viaggio:
-    - Festività nazionali o locali (musei chiusi, strade affollate)
-    - Grandi eventi sportivi (partite importanti, maratone)
-    - Festival, concerti, fiere famose
-    - Eventi politici o istituzionali (visite di stato, manifestazioni)
-    - Periodi di alta stagione turistica con zone molto affollate
-    - Lavori stradali o chiusure di attrazioni note
-    
-    Per ogni evento indica l'impatto pratico sul viaggiatore.
-    Se non sei sicuro di un evento specifico per quelle date, non inventarlo.
-    
-    RESTITUISCI SOLO JSON puro senza markdown:
-    {{
-        "events": [
-            {{
-                "title": "Nome evento",
-                "type": "festival|concert|sport|political|religious|market|exhibition|disruption|holiday|other",
-                "dates": "es. 15-17 agosto",
-                "impact": "high|medium|low",
-                "description": "Descrizione e impatto pratico",
-                "affected_places": ["luogo1", "luogo2"],
-                "travel_tip": "Consiglio pratico"
-            }}
-        ]
-    }}
-    Massimo 8 eventi. LINGUA: {lang}.
-    """
-
-    try:
-        response = await ai_client.aio.models.generate_content(
-            model=AI_MODEL,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                tools=[types.Tool(google_search=types.GoogleSearch())]
-            ),
-        )
-        raw = response.text.strip().replace("```json", "").replace("```", "")
-        json_match = re.search(r"\{.*\}", raw, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-        else:
-            logger.warning(f"Nessun JSON trovato nella risposta eventi: {raw[:200]}")
-            data = {"events": []}
-
-        trip.events_cache = json.dumps(data)
-        trip.events_cache_date = now_utc
-        session.add(trip)
-        session.commit()
-
-        logger.info(f"Eventi generati e cachati per viaggio {trip_id}")
-        return data
-
-    except json.JSONDecodeError as e:
-        logger.error(f"Errore parsing JSON eventi viaggio {trip_id}: {e}")
-        return {"events": []}
-    except Exception as e:
-        logger.error(f"Errore generazione eventi viaggio {trip_id}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/{trip_id}/request-approval")
-async def request_approval(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_user: Account = Depends(get_current_user)
-):
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(404, "Viaggio non trovato")
-    if trip.trip_intent != "BUSINESS":
-        raise HTTPException(400, "L'approvazione è disponibile solo per i viaggi aziendali")
-    participant = check_participant(trip_id, current_user, session)
-    if not participant.is_active:
-        raise HTTPException(403, "Non sei un partecipante di questo viaggio")
-
-    trip.status = "PENDING_APPROVAL"
-    trip.approval_requested_at = datetime.now(timezone.utc)
-    session.add(trip)
-
-    # Notifica tutti i manager della company
-    if current_user.company_id:
-        managers = notify_managers(
-            session,
-            company_id=current_user.company_id,
-            type="approval_requested",
-            title=f"Approvazione richiesta: {trip.name}",
-            message=f"{current_user.name} {current_user.surname} ha richiesto l'approvazione del viaggio '{trip.name}'.",
-            trip_id=trip_id,
-        )
-        session.commit()
-        # Email ai manager (fire-and-forget, non bloccare la risposta)
-        for manager_notif in managers:
-            manager_account = session.get(Account, manager_notif.account_id)
-            if manager_account:
-                try:
-                    send_notification_email(
-                        manager_account,
-                        subject=f"SplitPlan: Approvazione richiesta per '{trip.name}'",
-                        html_content=email_approval_requested(
-                            manager_name=manager_account.name,
-                            trip_name=trip.name,
-                            requester_name=f"{current_user.name} {current_user.surname}",
-                            manager_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/manager",
-                        ),
-                    )
-                except Exception as e:
-                    logger.warning(f"Email manager fallita: {e}")
-    else:
-        session.commit()
-
-    return {"status": "pending_approval"}
-
-
-@router.post("/{trip_id}/approve")
-async def approve_trip(
-    trip_id: int,
-    session: Session = Depends(get_session),
-    current_user: Account = Depends(require_manager)
-):
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(404, "Viaggio non trovato")
-
-    require_same_company(trip_id, current_user, session)
-
-    organizer_participant = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id,
-            Participant.is_organizer == True
-        )
-    ).first()
-    organizer_account = None
-    if organizer_participant and organizer_participant.account_id:
-        organizer_account = session.get(Account, organizer_participant.account_id)
-
-    trip.status = "APPROVED"
-    trip.approved_by = current_user.id
-    session.add(trip)
-
-    # Notifica organizzatore
-    if organizer_account:
-        create_notification(
-            session,
-            account_id=organizer_account.id,
-            type="trip_approved",
-            title=f"Viaggio approvato: {trip.name}",
-            message=f"Il tuo viaggio '{trip.name}' è stato approvato da {current_user.name} {current_user.surname}.",
-            trip_id=trip_id,
-        )
-    session.commit()
-
-    if organizer_account:
-        try:
-            send_notification_email(
-                organizer_account,
-                subject=f"SplitPlan: Il viaggio '{trip.name}' è stato approvato ✅",
-                html_content=email_trip_approved(
-                    organizer_name=organizer_account.name,
-                    trip_name=trip.name,
-                    manager_name=f"{current_user.name} {current_user.surname}",
-                    trip_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/trip/{trip_id}",
-                ),
-            )
-        except Exception as e:
-            logger.warning(f"Email approvazione fallita: {e}")
-
-    return {"status": "approved"}
-
-
-@router.post("/{trip_id}/reject")
-async def reject_trip(
-    trip_id: int,
-    body: RejectTripRequest,
-    session: Session = Depends(get_session),
-    current_user: Account = Depends(require_manager)
-):
-    trip = session.get(Trip, trip_id)
-    if not trip:
-        raise HTTPException(404, "Viaggio non trovato")
-
-    require_same_company(trip_id, current_user, session)
-
-    organizer_participant = session.exec(
-        select(Participant).where(
-            Participant.trip_id == trip_id,
-            Participant.is_organizer == True
-        )
-    ).first()
-    organizer_account = None
-    if organizer_participant and organizer_participant.account_id:
-        organizer_account = session.get(Account, organizer_participant.account_id)
-
-    trip.status = "REJECTED"
-    trip.rejection_reason = body.rejection_reason
-    session.add(trip)
-
-    # Notifica organizzatore
-    if organizer_account:
-        reason_text = f" Motivazione: {body.rejection_reason}" if body.rejection_reason else ""
-        create_notification(
-            session,
-            account_id=organizer_account.id,
-            type="trip_rejected",
-            title=f"Viaggio non approvato: {trip.name}",
-            message=f"Il tuo viaggio '{trip.name}' è stato rifiutato da {current_user.name} {current_user.surname}.{reason_text}",
-            trip_id=trip_id,
-        )
-    session.commit()
-
-    if organizer_account:
-        try:
-            send_notification_email(
-                organizer_account,
-                subject=f"SplitPlan: Il viaggio '{trip.name}' non è stato approvato",
-                html_content=email_trip_rejected(
-                    organizer_name=organizer_account.name,
-                    trip_name=trip.name,
-                    manager_name=f"{current_user.name} {current_user.surname}",
-                    trip_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/trip/{trip_id}",
-                    reason=body.rejection_reason,
-                ),
-            )
-        except Exception as e:
-            logger.warning(f"Email rifiuto fallita: {e}")
-
-    return {"status": "rejected"}
\ No newline at end of file
+for _sotto_router in (ai, core, voting, export, events, approvals, sync):
+    router.include_router(_sotto_router.router)
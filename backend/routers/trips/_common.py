@@ -0,0 +1,194 @@
+"""
+Parti condivise dai sotto-router dei viaggi: client Gemini con fallback fra
+modelli, rate limit AI, paywall premium e helper di approvazione.
+
+Qui non si registrano route. google-genai passa da LazyModule: viene importato
+alla prima chiamata AI, non quando si carica il pacchetto.
+"""
+
+from fastapi import Depends, HTTPException, status
+from sqlmodel import Session
+
+import logging
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import asyncio as _asyncio
+
+from auth import get_current_user
+from models import Trip, Account
+from utils.lazy import LazyModule, LazyObject
+from services.metrics import counter
+from services.timing import span
+from services.quota_service import FREE_LIMIT, consuma_chiamata_ai
+
+# SDK pesanti importati al primo uso, non al cold start (vedi utils/lazy.py).
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+ai_client = None
+
+# I nomi dei modelli vengono ritirati o vanno in sovraccarico senza preavviso:
+# gemini-2.5-flash risponde 404 ("no longer available to new users") e
+# gemini-3.5-flash risponde 503 ("currently overloaded"). Insistere su un solo
+# nome significava ritentarlo con backoff per minuti e poi fallire con un 500.
+# Si prova quindi una catena: al primo errore transient si passa al successivo.
+# Ordine scelto misurando latenza e affidabilita' con la chiave del progetto.
+AI_MODELS = ["gemini-3.1-flash-lite", "gemini-3-flash-preview"]
+AI_MODEL = AI_MODELS[0]   # usato dalle chiamate diverse da _gemini_call_with_retry
+
+# ── Retry helper per chiamate Gemini (gestisce 503/429 transient) ──────────
+# Ogni tentativo conta in ai_calls_total; ai_requests_total dice chi ha
+# risposto alla fine (primario, riserva o nessuno): da qui il tasso di fallback.
+AI_CALLS = counter("ai_calls_total", "Tentativi di chiamata a Gemini per modello ed esito", ["model", "outcome"])
+AI_REQUESTS = counter("ai_requests_total", "Richieste a _gemini_call_with_retry per modello che ha risposto", ["served_by"])
+
+
+def _e_transient(errore: str) -> bool:
+    """Errore temporaneo o modello non disponibile: conviene cambiare modello."""
+    return any(
+        segnale in errore
+        for segnale in ("503", "UNAVAILABLE", "429", "RESOURCE_EXHAUSTED", "404", "NOT_FOUND")
+    )
+
+
+async def _gemini_call_with_retry(contents, *, json_mode=False, max_retries=2):
+    """Chiama Gemini provando i modelli in ordine, con un breve retry ciascuno.
+
+    Prima si ritentava sempre lo stesso modello con backoff esponenziale: con un
+    modello in sovraccarico l'utente restava ad aspettare minuti per poi vedere
+    comunque un errore, e su Vercel la funzione veniva uccisa prima ancora di
+    rispondere. Ora al secondo fallimento si passa al modello successivo.
+    """
+    config = (
+        types.GenerateContentConfig(response_mime_type="application/json")
+        if json_mode
+        else None
+    )
+    last_exc = None
+
+    for modello in AI_MODELS:
+        for attempt in range(max_retries):
+            try:
+                with span("gemini"):
+                    response = await ai_client.aio.models.generate_content(
+                        model=modello,
+                        contents=contents,
+                        **({"config": config} if config else {}),
+                    )
+                AI_CALLS.inc(model=modello, outcome="ok")
+                if modello != AI_MODELS[0]:
+                    logger.info(f"[Gemini] Risposta ottenuta dal modello di riserva {modello}")
+                AI_REQUESTS.inc(served_by="primary" if modello == AI_MODELS[0] else "fallback")
+                return response
+            except Exception as e:
+                last_exc = e
+                err_str = str(e)
+                if not _e_transient(err_str):
+                    AI_CALLS.inc(model=modello, outcome="error")
+                    AI_REQUESTS.inc(served_by="none")
+                    raise  # errore vero (prompt, auth): inutile insistere
+                AI_CALLS.inc(model=modello, outcome="transient")
+                ultimo_tentativo = attempt == max_retries - 1
+                logger.warning(
+                    f"[Gemini] {modello} tentativo {attempt + 1}/{max_retries} "
+                    f"fallito ({err_str[:70]})"
+                    + ("; passo al modello successivo" if ultimo_tentativo else "; ritento fra 1s")
+                )
+                if not ultimo_tentativo:
+                    await _asyncio.sleep(1)
+
+    logger.error("[Gemini] Nessun modello disponibile ha risposto.")
+    AI_REQUESTS.inc(served_by="none")
+    raise last_exc
+
+if GOOGLE_API_KEY:
+    logger.info("[OK] System: Google Gemini Client initialized.")
+    ai_client = LazyObject(lambda: genai.Client(api_key=GOOGLE_API_KEY))
+else:
+    logger.warning(
+        "[WARNING] System: GOOGLE_API_KEY missing. Running in Mock/Manual mode."
+    )
+
+
+async def check_rate_limit(account: Account, session: Session):
+    """
+    Tracciamento e rate limit AI, delegati a services/quota_service.
+
+    - B2B (account.company_id): conta la chiamata per l'account e per
+      l'azienda nel mese; 429 oltre Company.max_ai_calls_per_month.
+    - B2C subscribed (Pro): nessun limite, nessun tracciamento.
+    - B2C free: 20 chiamate/giorno via FREE_LIMIT.
+    """
+    await consuma_chiamata_ai(account, session)
+
+
+def _a_datetime(valore):
+    """Converte in datetime una data che puo' arrivare come stringa ISO.
+
+    Le richieste del client dichiarano start_date/end_date come str, mentre sul
+    modello sono datetime. Assegnare la stringa direttamente lasciava il campo
+    come str finche' l'oggetto non veniva ricaricato dal DB: da qui gli
+    `trip.start_date.replace("Z", "")` sparsi nel codice, che funzionano su una
+    stringa e sollevano TypeError su un datetime (e viceversa). Postgres accetta
+    la stringa in scrittura e maschera il problema; SQLite no.
+    """
+    if valore is None or isinstance(valore, datetime):
+        return valore
+    try:
+        return datetime.fromisoformat(str(valore).replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning(f"Data non interpretabile: {valore!r}")
+        return None
+
+
+def auto_approva_se_manager(trip: Trip, account: Account) -> bool:
+    """Approva la trasferta se a organizzarla e' il manager stesso.
+
+    Il workflow di approvazione esiste perche' un dipendente non decida da solo
+    su budget e policy. Quando la trasferta la crea il manager dell'azienda,
+    quel controllo non ha senso: gli veniva chiesto di inviare una richiesta a
+    se stesso, e finche' non la approvava il flusso restava bloccato.
+    """
+    if trip.trip_intent != "BUSINESS":
+        return False
+    if not account.is_manager or not account.company_id:
+        return False
+    if trip.company_id and trip.company_id != account.company_id:
+        return False
+
+    trip.status = "APPROVED"
+    trip.approved_by = account.id
+    trip.approval_requested_at = datetime.now(timezone.utc)
+    logger.info(
+        f"Trip {trip.id} approvato automaticamente: l'organizzatore {account.id} "
+        f"e' manager della company {account.company_id}"
+    )
+    return True
+
+
+def require_premium(account: Account, trip: Trip):
+    """Solleva un 403 se l'utente non è abbonato e il viaggio non è sbloccato.
+    Gli utenti aziendali (company_id impostato) o i viaggi BUSINESS bypassano il check."""
+    if account.company_id:
+        return  # utenti aziendali usano il piano della company
+    if trip.trip_intent == "BUSINESS":
+        return  # viaggi business non richiedono premium individuale
+    if not account.is_subscribed and not trip.is_premium:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Funzionalità Premium. Sblocca il viaggio con un credito o abbonati per accedere.",
+        )
+
+
+def require_manager(current_user: Account = Depends(get_current_user)) -> Account:
+    """Dependency riusabile: verifica che l'utente sia un manager aziendale."""
+    if not current_user.is_manager:
+        raise HTTPException(status_code=403, detail="Accesso riservato ai manager aziendali")
+    return current_user
@@ -0,0 +1,1489 @@
+"""
+Endpoint AI dei viaggi: proposte, itinerario, stime di budget, chat, lettura scontrini.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from urllib.parse import quote
+
+from sqlmodel import Session, select
+from typing import List, Dict, Optional
+
+import logging
+import os
+import json
+from datetime import datetime
+import httpx
+
+from database import get_session
+from auth import get_current_user
+from models import (
+    Trip,
+    Participant,
+    Proposal,
+    ItineraryItem,
+    SQLModel,
+    Account,
+    Company,
+    Expense,
+)
+from utils.crypto import decrypt_text
+from utils.access import check_participant
+from services.itinerary_optimizer import optimize_travel_itinerary
+from services.timing import span
+from services.trip_changes import cancella_in_blocco
+from services.vote_tally import azzera_votazione
+from routers.trips._common import (
+    _a_datetime,
+    ai_client,
+    AI_MODEL,
+    auto_approva_se_manager,
+    check_rate_limit,
+    _gemini_call_with_retry,
+    genai,
+    require_premium,
+    types,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+class PreferencesRequest(SQLModel):
+    destination: str
+    departure_airport: str
+    budget: float
+    budget_max: float = 0.0
+    num_people: int = 1
+    start_date: str
+    end_date: str
+    must_have: Optional[str] = ""
+    must_avoid: Optional[str] = ""
+    vibe: Optional[str] = ""
+    participant_names: List[str] = []
+    transport_mode: Optional[str] = None
+    trip_intent: str = "LEISURE"
+    work_start_time: Optional[str] = "09:00"
+    work_end_time: Optional[str] = "18:00"
+    work_days: Optional[str] = "Monday,Tuesday,Wednesday,Thursday,Friday"
+    office_address: Optional[str] = None
+
+
+class SurveyBudgetRequest(SQLModel):
+    destination: str
+    departure_airport: str
+    start_date: str
+    end_date: str
+    transport_mode: Optional[str] = "FLIGHT"
+    num_people: int = 1
+
+
+class SearchOptionRequest(SQLModel):
+    type: str  # 'flight' or 'hotel'
+
+
+class ConfirmOptionRequest(SQLModel):
+    type: str
+    price: float
+    provider: str
+    details: str
+
+
+class HotelSelectionRequest(SQLModel):
+    hotel_name: str
+    hotel_address: str
+    transport_mode: Optional[str] = None
+    transport_cost: Optional[float] = 0.0
+    hotel_cost: Optional[float] = 0.0
+    arrival_time: Optional[str] = None
+    return_time: Optional[str] = None
+
+
+class ChatRequest(SQLModel):
+    message: str
+    history: Optional[List[Dict]] = []
+
+
+async def get_coordinates(address: str):
+    """Trasforma un indirizzo in coordinate Lat/Lon usando Nominatim (OSM)"""
+    try:
+        url = "https://nominatim.openstreetmap.org/search"
+        params = {"q": address, "format": "json", "limit": 1}
+        headers = {
+            "User-Agent": f'SplitPlanApp/1.0 (contact: ({os.getenv("EMAIL_OSM")})'
+        }
+        async with httpx.AsyncClient() as client, span("nominatim"):
+            response = await client.get(
+                url, params=params, headers=headers, timeout=5.0
+            )
+            if response.status_code == 200:
+                data = response.json()
+                if data:
+                    return float(data[0]["lat"]), float(data[0]["lon"])
+    except Exception as e:
+        logger.error(f"[OSM Error] Geocoding fallito per {address}: {e}")
+    return None, None
+
+
+async def get_places_from_overpass(lat: float, lon: float, radius: int = 800):
+    """Query Overpass API per trovare nomi reali di ristoranti e bar vicini"""
+    overpass_url = "https://overpass-api.de/api/interpreter"
+    query = f"""
+    [out:json][timeout:25];
+    (
+      node["amenity"~"restaurant|bar|cafe|pub|fast_food"](around:{radius},{lat},{lon});
+      way["amenity"~"restaurant|bar|cafe|pub|fast_food"](around:{radius},{lat},{lon});
+      node["leisure"~"beach_resort|bath"](around:{radius},{lat},{lon});
+      way["leisure"~"beach_resort|bath"](around:{radius},{lat},{lon});
+    );
+    out center 50;
+    """
+    try:
+        async with httpx.AsyncClient() as client, span("overpass"):
+            response = await client.post(
+                overpass_url, data={"data": query}, timeout=15.0
+            )
+            if response.status_code == 200:
+                elements = response.json().get("elements", [])
+                places_map = {}
+
+                for e in elements:
+                    tags = e.get("tags", {})
+                    name = tags.get("name")
+                    if name:
+                        lat_val = e.get("lat") or e.get("center", {}).get("lat")
+                        lon_val = e.get("lon") or e.get("center", {}).get("lon")
+                        if lat_val and lon_val:
+                            if name not in places_map or e.get("type") == "node":
+                                places_map[name] = {
+                                    "name": name,
+                                    "lat": lat_val,
+                                    "lon": lon_val,
+                                }
+
+                return list(places_map.values())
+    except Exception as e:
+        logger.error(f"[OSM Error] Overpass fallito: {e}")
+    return []
+
+
+@router.post("/extract-receipt")
+async def extract_receipt(
+    type: str = Form(...),
+    file: UploadFile = File(...),
+    current_user: Account = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    await check_rate_limit(current_user, session)
+    if not ai_client:
+        raise HTTPException(status_code=500, detail="AI Client non inizializzato.")
+
+    MAX_FILE_SIZE = 3 * 1024 * 1024  # 3 MB
+    if getattr(file, "size", 0) and file.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File troppo grande. Il limite è di 3 MB.",
+        )
+
+    try:
+        contents = await file.read()
+
+        if type == "hotel":
+            prompt = f"""
+            Analizza questa ricevuta o conferma di prenotazione HOTEL / AIRBNB.
+            Estrai i seguenti dati in formato JSON puro, senza markdown:
+            {{
+                "hotel_name": "Nome della struttura",
+                "hotel_address": "Indirizzo completo",
+                "hotel_cost": 0.0 (costo totale in Euro),
+                "arrival_time": "HH:MM" (orario di check-in o arrivo previsto),
+                "return_time": "HH:MM" (orario di check-out o partenza prevista)
+            }}
+            Se un dato non è presente, usa null o 0.0.
+            LINGUA: {current_user.language.upper()}.
+            """
+        else:
+            prompt = f"""
+            Analizza questa ricevuta o conferma di prenotazione VOLO / TRENO / BUS.
+            Estrai i seguenti dati in formato JSON puro, senza markdown:
+            {{
+                "transport_cost": 0.0 (costo totale in Euro),
+                "arrival_time": "HH:MM" (orario di arrivo a destinazione),
+                "return_time": "HH:MM" (orario di partenza per il ritorno)
+            }}
+            Se un dato non è presente, usa null o 0.0.
+            LINGUA: {current_user.language.upper()}.
+            """
+
+        with span("gemini"):
+            response = await ai_client.aio.models.generate_content(
+                model=AI_MODEL,
+                contents=[
+                    prompt,
+                    genai.types.Part.from_bytes(data=contents, mime_type=file.content_type),
+                ],
+                config=types.GenerateContentConfig(response_mime_type="application/json"),
+            )
+
+        raw_text = response.text.strip()
+        logger.info(f"[DEBUG] Receipt AI Response: {raw_text}")
+
+        try:
+            data = json.loads(raw_text)
+            return {"success": True, "data": data}
+        except (json.JSONDecodeError, ValueError) as je:
+            logger.error(f"[JSON Error] {je}")
+
+        return {
+            "success": False,
+            "data": {},
+            "message": "L'IA non è riuscita a estrarre i dati. Compila pure a mano.",
+        }
+
+    except Exception as e:
+        logger.error(f"[Receipt Error] {e}")
+        return {"success": False, "data": {}, "message": f"Errore tecnico: {str(e)}"}
+
+
+@router.post("/{trip_id}/optimize")
+async def optimize_itinerary(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Ottimizza l'ordine delle attività per ridurre gli spostamenti (TSP semplice)"""
+    check_participant(trip_id, current_account, session)
+    try:
+        trip = session.get(Trip, trip_id)
+        items = session.exec(
+            select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
+        ).all()
+
+        if len(items) < 3:
+            return {
+                "status": "skipped",
+                "message": "Troppi pochi elementi per ottimizzare.",
+            }
+
+        by_day = {}
+        for item in items:
+            day = item.start_time.split("T")[0]
+            if day not in by_day:
+                by_day[day] = []
+            by_day[day].append(item)
+
+        total_updated = 0
+        for day, day_items in by_day.items():
+            fixed = [i for i in day_items if i.type in ["CHECKIN", "CHECKOUT"]]
+            to_optimize = [
+                i
+                for i in day_items
+                if i.type not in ["CHECKIN", "CHECKOUT"] and i.latitude and i.longitude
+            ]
+
+            if not to_optimize:
+                continue
+            start_lat, start_lon = None, None
+            if trip.accommodation_location:
+                start_lat, start_lon = await get_coordinates(
+                    trip.accommodation_location
+                )
+
+            if not start_lat and fixed:
+                start_lat, start_lon = fixed[0].latitude, fixed[0].longitude
+
+            curr_lat, curr_lon = start_lat or 0, start_lon or 0
+            ordered = []
+            pool = to_optimize[:]
+
+            while pool:
+                best_idx = 0
+                min_dist = float("inf")
+                for idx, p in enumerate(pool):
+                    dist = (
+                        (p.latitude - curr_lat) ** 2 + (p.longitude - curr_lon) ** 2
+                    ) ** 0.5
+                    if dist < min_dist:
+                        min_dist = dist
+                        best_idx = idx
+
+                next_item = pool.pop(best_idx)
+                ordered.append(next_item)
+                curr_lat, curr_lon = next_item.latitude, next_item.longitude
+
+            times = sorted([i.start_time for i in to_optimize])
+            for i, item in enumerate(ordered):
+                item.start_time = times[i]
+                session.add(item)
+                total_updated += 1
+
+        session.commit()
+        return {"status": "success", "updated_count": total_updated}
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/estimate-survey-budget")
+async def estimate_survey_budget(
+    request: SurveyBudgetRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Stima il budget iniziale durante il Survey, senza salvare il viaggio"""
+    await check_rate_limit(current_account, session)
+    if not ai_client:
+        return {"budget_min": 0, "budget_max": 0, "breakdown": {}}
+
+    try:
+        try:
+            d1 = datetime.fromisoformat(request.start_date.replace("Z", ""))
+            d2 = datetime.fromisoformat(request.end_date.replace("Z", ""))
+            days = abs((d2 - d1).days) + 1
+        except Exception:
+            days = 7
+
+        prompt = f"""
+        L'utente sta pianificando un viaggio. Destinazione: {request.destination}. Partenza da: {request.departure_airport}.
+        Dati: {request.num_people} persona/e, durata {days} giorni. Mezzo: {request.transport_mode}.
+        
+        Calcola un range di BUDJET IDEALE per l'INTERO GRUPPO ({request.num_people} persone), tenendo conto del costo stimato dei trasporti ({request.transport_mode}), del costo medio degli hotel ({days} notti), e dei costi di vita (pasti, trasporti locali).
+        RESTITUISCI SOLO JSON (senza testo descrittivo aggiuntivo, senza formattazione markdown).
+        {{
+            "budget_min": 1000,
+            "budget_max": 1500
+        }}
+        """
+        response = await _gemini_call_with_retry(prompt, json_mode=True)
+        data = json.loads(response.text)
+
+        return {
+            "budget_min": float(data.get("budget_min", 0)),
+            "budget_max": float(data.get("budget_max", 0)),
+        }
+    except Exception as e:
+        logger.error(f"[AI Error] Stima budget survey fallita: {e}")
+        return {"budget_min": 0, "budget_max": 0}
+
+
+@router.post("/{trip_id}/search-options")
+async def search_trip_options(
+    trip_id: int,
+    request: SearchOptionRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Simula una ricerca OTA (Voli o Hotel) tramite AI restituendo 6 opzioni"""
+    # Il controllo di partecipazione precede il consumo di quota AI: altrimenti
+    # un estraneo brucia le chiamate AI leggendo i dati di un viaggio altrui.
+    check_participant(trip_id, current_account, session)
+    await check_rate_limit(current_account, session)
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    if not ai_client:
+        return []
+
+    try:
+        try:
+            d1 = datetime.fromisoformat(trip.start_date.replace("Z", ""))
+            d2 = datetime.fromisoformat(trip.end_date.replace("Z", ""))
+            days = abs((d2 - d1).days) + 1
+        except Exception:
+            days = 7
+
+        if request.type == "hotel":
+            office_prompt = ""
+            if trip.trip_intent == "BUSINESS" and trip.office_address:
+                office_prompt = f"IMPORTANTE: L'utente deve lavorare in {trip.office_address}. Suggerisci hotel vicini a questo indirizzo e specifica la distanza nei 'details'."
+
+            prompt = f"""
+            Agisci come l'API di un aggregatore alberghiero (es. Booking.com).
+            L'utente sta cercando un Hotel a {trip.destination} per {days} notti per {trip.num_people} persone.
+            {office_prompt}
+            Genera esattamente 6 opzioni RESTITUENDOLE esclusivamente in formato JSON. 
+            Il formato DEVE essere un array di oggetti, senza markdown o testo extra:
+            [
+              {{
+                "id": "h1",
+                "provider": "Booking.com",
+                "title": "Hotel Stella Alpine ***",
+                "price": 450.0,
+                "details": "Colazione inclusa, 2km dal centro",
+                "booking_url": "https://www.booking.com/searchresults.html?ss={quote(trip.destination or '')}"
+              }}
+            ]
+            Dai prezzi realistici in EURO per {days} notti totali e varia da budget ostello a hotel lusso.
+            """
+        else:
+            prompt = f"""
+            Agisci come l'API di Skyscanner/Trainline.
+            L'utente sta cercando trasporti andata/ritorno ({trip.transport_mode}) per {trip.destination} per {trip.num_people} persone.
+            Genera esattamente 6 opzioni RESTITUENDOLE esclusivamente in formato JSON.
+            Il formato DEVE essere un array di oggetti, senza markdown o testo extra:
+            [
+              {{
+                "id": "f1",
+                "provider": "Ryanair",
+                "title": "Volo Diretto A/R",
+                "price": 120.5,
+                "details": "Partenza 08:00 - Arrivo 10:15 / Bagaglio a mano",
+                "booking_url": "https://www.skyscanner.net/"
+              }}
+            ]
+            Dai prezzi realistici in EURO per tutto il gruppo ({trip.num_people} persone) e varia le compagnie.
+            """
+
+        response = await _gemini_call_with_retry(prompt, json_mode=True)
+        data = json.loads(response.text)
+
+        # Sostituisci booking_url con deep link parametrici reali
+        dest_enc = quote(trip.destination or trip.real_destination or "")
+        depart_str = (
+            trip.start_date if isinstance(trip.start_date, str) else trip.start_date.strftime("%Y-%m-%d")
+        ).split("T")[0] if trip.start_date else ""
+        return_str = (
+            trip.end_date if isinstance(trip.end_date, str) else trip.end_date.strftime("%Y-%m-%d")
+        ).split("T")[0] if trip.end_date else ""
+
+        for opt in data:
+            if request.type == "hotel":
+                opt["booking_url"] = (
+                    f"https://www.booking.com/searchresults.html"
+                    f"?ss={dest_enc}&checkin={depart_str}&checkout={return_str}"
+                    f"&group_adults={max(1, trip.num_people or 1)}&no_rooms=1"
+                )
+            else:
+                origin = trip.departure_airport or trip.departure_city or ""
+                origin_enc = quote(origin)
+                if len(origin) == 3 and origin.isupper():
+                    # IATA code disponibile → Skyscanner
+                    def _fmt(d: str) -> str:
+                        return d.replace("-", "")[2:]
+                    dest_iata = (trip.destination_iata or "").lower() or dest_enc.lower()
+                    base = (
+                        f"https://www.skyscanner.net/transport/flights"
+                        f"/{origin.lower()}/{dest_iata}/{_fmt(depart_str)}"
+                    )
+                    if return_str and return_str != depart_str:
+                        base += f"/{_fmt(return_str)}"
+                    opt["booking_url"] = f"{base}/?adults={max(1, trip.num_people or 1)}&currency=EUR"
+                else:
+                    # Fallback Kiwi con nome città
+                    opt["booking_url"] = (
+                        f"https://www.kiwi.com/it/search/results/{origin_enc}/{dest_enc}"
+                        f"/{depart_str}/{return_str}?adults={max(1, trip.num_people or 1)}"
+                    )
+
+        return {"options": data}
+    except Exception as e:
+        logger.error(f"[AI Error] Errore simulazione OTA: {e}")
+        return {"options": []}
+
+
+@router.post("/{trip_id}/confirm-option")
+async def confirm_trip_option(
+    trip_id: int,
+    request: ConfirmOptionRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Salva il costo dell'opzione selezionata (Volo/Hotel) sul budget del viaggio"""
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    participant = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id, Participant.account_id == current_account.id
+        )
+    ).first()
+    if not participant:
+        raise HTTPException(status_code=403, detail="Non autorizzato")
+
+    try:
+        if request.type == "hotel":
+            trip.hotel_cost = request.price
+            trip.accommodation_location = request.provider  # store the name dynamically
+        else:
+            trip.transport_cost = request.price
+
+        session.add(trip)
+        session.commit()
+        session.refresh(trip)
+        return {"status": "success", "trip": trip}
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{trip_id}/estimate-budget")
+async def estimate_budget(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Stima i costi della vita locale tramite AI"""
+    check_participant(trip_id, current_account, session)
+    await check_rate_limit(current_account, session)
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        if not ai_client:
+            return {"suggestion": "AI non disponibile", "breakdown": {}}
+
+        try:
+            d1 = datetime.fromisoformat(trip.start_date.replace("Z", ""))
+            d2 = datetime.fromisoformat(trip.end_date.replace("Z", ""))
+            days = abs((d2 - d1).days) + 1
+        except Exception:
+            logger.error(
+                "Errore durante il calcolo dei giorni, utilizzo 7 giorni di default"
+            )
+            days = 7
+
+        car_prompt = ""
+        if trip.transport_mode == "CAR":
+            car_prompt = f"""
+            4. COSTI STRADALI: Il viaggio è in AUTO PROPRIA da {trip.departure_city or trip.departure_airport} a {trip.destination}. 
+               CALCOLA L'ESATTO PEDAGGIO E CARBURANTE basandoti sulla rotta specifica e reale delle autostrade italiane/europee. 
+               NON usare stime generiche regionali. Sii preciso sui pedaggi reali (es. Bologna-Bressanone).
+               Stima il costo totale A/R per {trip.num_people} persone e dividilo per loro.
+            """
+
+        company_ctx = ""
+        if current_account.company_id:
+            company = session.get(Company, current_account.company_id)
+            if company and company.max_budget_per_trip:
+                company_ctx = (
+                    f"La policy aziendale prevede un budget massimo di "
+                    f"{company.max_budget_per_trip:.0f} EUR per trasferta."
+                )
+
+        budget_ref = trip.budget_max or trip.budget or 0
+
+        prompt = f"""
+        Sei un esperto analista di viaggi d'affari. Analizza i costi di vita locale
+        (ESCLUSO alloggio) per un viaggio a: {trip.destination}.
+        Dati: {trip.num_people} persona/e, durata {days} giorni, mezzo: {trip.transport_mode}.
+        Budget totale autorizzato: {budget_ref} EUR.
+        {company_ctx}
+
+        {car_prompt}
+
+        Fornisci una stima REALISTICA per un viaggiatore medio (non lussuoso).
+        Valuta il costo della vita specifico di {trip.destination}
+        (es. Est Europa = economico, Scandinavia = caro).
+
+        Determina anche:
+        - "budget_status": confronta (total_estimated_per_person * {trip.num_people})
+          con il budget totale {budget_ref} EUR.
+          Usa "ON_TRACK" se la proiezione e <= 80% del budget,
+          "WARNING" se 80-100%, "CRITICAL" se supera il budget.
+          Se budget_ref = 0, usa sempre "ON_TRACK".
+        - "savings_advice": 3 consigli BREVI e AZIONABILI specifici per {trip.destination}
+          (es. "Usa i mezzi pubblici invece del taxi", "Mangia nei mercati locali").
+        - "confidence_score": da 0 a 100, quanto sei sicuro della previsione
+          (100 = dati certi, 50 = stima ragionevole, 20 = destinazione poco comune).
+
+        RESTITUISCI SOLO JSON valido:
+        {{
+            "daily_meal_mid": 35.0,
+            "daily_meal_cheap": 20.0,
+            "daily_transport": 10.0,
+            "road_costs_total_per_person": 0.0,
+            "total_estimated_per_person": 0.0,
+            "advice": "Un consiglio utile...",
+            "savings_advice": ["consiglio 1", "consiglio 2", "consiglio 3"],
+            "confidence_score": 75
+        }}
+        LINGUA: {current_account.language.upper()}.
+        """
+
+        response = await _gemini_call_with_retry(prompt, json_mode=True)
+        data = json.loads(response.text)
+        data["days_count"] = days
+
+        # ── Server-side derived fields ────────────────────────────────────────
+        per_person = float(data.get("total_estimated_per_person") or 0)
+        projected  = round(per_person * (trip.num_people or 1), 2)
+        data["projected_total"] = projected
+
+        # budget_status: override Gemini's value with a deterministic server calc
+        budget_ref = float(trip.budget_max or trip.budget or 0)
+        if budget_ref > 0:
+            ratio = projected / budget_ref
+            if ratio > 1.0:
+                data["budget_status"] = "CRITICAL"
+            elif ratio > 0.80:
+                data["budget_status"] = "WARNING"
+            else:
+                data["budget_status"] = "ON_TRACK"
+        else:
+            data["budget_status"] = data.get("budget_status", "ON_TRACK")
+
+        # Ensure savings_advice is always a list
+        if not isinstance(data.get("savings_advice"), list):
+            advice = data.get("advice", "")
+            data["savings_advice"] = [advice] if advice else []
+
+        # Ensure confidence_score is int 0-100
+        try:
+            data["confidence_score"] = max(0, min(100, int(data.get("confidence_score", 70))))
+        except (TypeError, ValueError):
+            data["confidence_score"] = 70
+
+        return data
+    except Exception as e:
+        logger.error(f"[AI Error] Stima budget fallita: {e}")
+        raise HTTPException(status_code=500, detail="Errore interno del server. Riprova.")
+
+
+@router.post("/{trip_id}/generate-proposals", response_model=List[Proposal])
+async def generate_proposals(
+    trip_id: int,
+    prefs: PreferencesRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Genera 3 proposte e salva tutti i partecipanti nel Database"""
+    try:
+        check_participant(trip_id, current_account, session)
+
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        await check_rate_limit(current_account, session)
+        require_premium(current_account, trip)
+
+        # B2B budget cap e limiti aziendali
+        company_budget: float | None = None
+        if current_account.company_id:
+            company = session.get(Company, current_account.company_id)
+            if company and company.max_budget_per_trip:
+                company_budget = company.max_budget_per_trip
+
+        trip.budget = prefs.budget
+        trip.budget_max = prefs.budget_max
+        trip.budget_per_person = (prefs.budget_max or prefs.budget) / prefs.num_people
+        trip.num_people = prefs.num_people
+        trip.start_date = _a_datetime(prefs.start_date)
+        trip.end_date = _a_datetime(prefs.end_date)
+        trip.departure_airport = prefs.departure_airport
+        trip.departure_city = prefs.departure_airport
+        trip.destination = prefs.destination
+        trip.must_have = prefs.must_have
+        trip.must_avoid = prefs.must_avoid
+        trip.trip_intent = prefs.trip_intent
+        trip.work_start_time = prefs.work_start_time
+        trip.work_end_time = prefs.work_end_time
+        trip.work_days = prefs.work_days
+        trip.office_address = prefs.office_address
+
+        # Il viaggio diventa BUSINESS qui, non alla creazione: il frontend crea
+        # il trip con solo nome e tipo, e l'intent arriva dal survey. Senza
+        # questa riga company_id restava NULL su TUTTE le trasferte, e le query
+        # aziendali che filtrano su Trip.company_id (export contabile, analytics,
+        # corsia di lettura del manager) non trovavano mai niente.
+        if trip.trip_intent == "BUSINESS" and current_account.company_id:
+            trip.company_id = current_account.company_id
+
+        if prefs.transport_mode:
+            trip.transport_mode = prefs.transport_mode
+
+        session.add(trip)
+
+        if prefs.participant_names:
+            for name in prefs.participant_names:
+                exists = session.exec(
+                    select(Participant).where(
+                        Participant.trip_id == trip_id, Participant.name == name
+                    )
+                ).first()
+                if not exists:
+                    session.add(
+                        Participant(name=name, trip_id=trip.id, is_organizer=False)
+                    )
+        session.commit()
+
+        if ai_client:
+            try:
+                num_props = 3
+                if prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO":
+                    num_props = 1
+
+                prompt = f"""
+                Agisci come un Travel Agent esperto. 
+                TASK 1: Trova il codice aeroportuale IATA UFFICIALE E CORRETTO di 3 lettere (es. Bologna è BLQ) per la partenza: "{prefs.departure_airport}". Se la parola è una città generica ignora aeroporti militari o cargo e prendi l'aeroporto civile principale.
+                TASK 2: Genera {num_props} {"proposta" if num_props == 1 else "proposte UNICHE"} per: {prefs.destination}. Attribuisci a ciascuna proposta il GIUSTO codice IATA di partenza ("XXX" in JSON) e destinazione.
+                {"Sia che la destinazione sia un Paese o una singola città, le 3 proposte devono avere TEMI DIVERSI (es. uno Artistico, uno Gastronomico, uno Storico)." if num_props > 1 else ""}
+                SE la destinazione è una singola città (es. Parigi), usa titoli creativi e accattivanti (es. 'Parigi Bohemienne') per differenziarle.
+                {f"CRITICAL B2B POLICY: L'utente appartiene a un'azienda che ha imposto un budget MASSIMO RIGOROSO di {company_budget:.0f} EUR per questa trasferta (inclusi voli e hotel). TUTTE le proposte che generi DEVONO rimanere tassativamente sotto questo budget. Ignora le opzioni di lusso se superano il limite." if company_budget else ""}
+                Dati: {f"Budget tra {prefs.budget}€ e {prefs.budget_max if prefs.budget_max > 0 else prefs.budget}€ (totale gruppo), " if prefs.budget > 0 else ""}{prefs.num_people} persone, dal {prefs.start_date} al {prefs.end_date}.
+                Preferenze: {prefs.must_have}, Evitare: {prefs.must_avoid}, Vibe: {prefs.vibe}.
+                {"ORARIO LAVORO: dalle " + prefs.work_start_time + " alle " + prefs.work_end_time + " nei giorni: " + prefs.work_days if prefs.trip_intent == "BUSINESS" else ""}
+                {"INDIRIZZO UFFICIO (Sede Operativa): " + prefs.office_address + " - IMPORTANTE: Scegli zone comode per raggiungere questo indirizzo." if prefs.trip_intent == "BUSINESS" and prefs.office_address else ""}
+
+                TASK 3: Analizza la distanza tra la partenza ({prefs.departure_airport}) e la destinazione ({prefs.destination}).
+                Scegli il "suggested_transport_mode" tra: FLIGHT, TRAIN, CAR.
+                REGOLA: Se la destinazione è raggiungibile via terra in meno di 6 ore (es. Milano-Roma, Parigi-Lione), preferisci sempre TRAIN o CAR. Altrimenti usa FLIGHT.
+
+                RESTITUISCI SOLO JSON:
+                {{
+                    "departure_iata_normalized": "XXX",
+                    "departure_city_normalized": "Nome Città (es. Milano)",
+                    "suggested_transport_mode": "FLIGHT",
+                    "proposals": [
+                        {{
+                            "destination": "Titolo Creativo (es. Parigi dei Musei)", 
+                            "destination_iata": "XXX", 
+                            "destination_english": "Paris",
+                            "destination_italian": "Parigi",
+                            "description": "...", 
+                            "price_estimate": 1000, 
+                            "image_search_term": "louvre,museum"
+                        }}
+                    ]
+                }}
+                NOTE: 
+                - 'destination' deve essere il TITOLO CREATIVO (unico per ogni proposta).
+                - 'destination_english' deve essere il nome della città principale in INGLESE.
+                - 'destination_italian' deve essere il nome della città principale in ITALIANO.
+                - 'image_search_term' deve contenere 1 o 2 parole chiave in INGLESE specifiche per quel tema.
+                LINGUA: {current_account.language.upper()}.
+                """
+
+                response = await _gemini_call_with_retry(prompt, json_mode=True)
+                data = json.loads(response.text)
+
+                if data.get("departure_iata_normalized"):
+                    trip.departure_airport = data["departure_iata_normalized"].upper()
+
+                if data.get("departure_city_normalized"):
+                    trip.departure_city = data["departure_city_normalized"]
+
+                ai_suggested = data.get("suggested_transport_mode")
+                if ai_suggested and (
+                    trip.transport_mode == "FLIGHT" or not trip.transport_mode
+                ):
+                    trip.transport_mode = ai_suggested
+
+                session.add(trip)
+
+                # Le nuove proposte riaprono la votazione da zero.
+                azzera_votazione(session, trip_id)
+                existing = session.exec(
+                    select(Proposal).where(Proposal.trip_id == trip_id)
+                ).all()
+                for e in existing:
+                    session.delete(e)
+
+                import random
+                import urllib.parse
+
+                new_proposals = []
+                for p in data.get("proposals", []):
+                    search = p.get("image_search_term") or ""
+                    dest_en = p.get("destination_english") or ""
+                    curated_tags = f"{dest_en},{search},travel".lower().replace(
+                        " ", ","
+                    )
+                    tag_list = [t.strip() for t in curated_tags.split(",") if t.strip()]
+                    final_tags = ",".join(tag_list[:3])
+
+                    seed = random.randint(1, 10000)
+                    encoded_tags = urllib.parse.quote(final_tags, safe=",")
+                    img_url = f"https://loremflickr.com/1080/720/{encoded_tags}/all?lock={seed}"
+
+                    prop = Proposal(
+                        trip_id=trip_id,
+                        destination=p["destination"],
+                        real_destination=p.get("destination_italian")
+                        or p.get("destination_english")
+                        or "",
+                        destination_iata=p.get("destination_iata"),
+                        description=p["description"],
+                        price_estimate=p["price_estimate"],
+                        image_url=img_url,
+                    )
+                    session.add(prop)
+                    new_proposals.append(prop)
+
+                session.commit()
+
+                if (prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO") and new_proposals:
+                    trip.status = "BOOKED"
+                    trip.winning_proposal_id = new_proposals[0].id
+                    # Assicuriamoci che la destinazione del viaggio coincida con la proposta scelta
+                    trip.destination = new_proposals[0].real_destination or new_proposals[0].destination
+                    trip.destination_iata = new_proposals[0].destination_iata
+                    auto_approva_se_manager(trip, current_account)
+                else:
+                    trip.status = "VOTING"
+
+                session.add(trip)
+                session.commit()
+                return session.exec(
+                    select(Proposal).where(Proposal.trip_id == trip_id)
+                ).all()
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"[AI Error] Generazione fallita: {e}")
+
+        logger.info("AI fallita. Uso Mock Data.")
+        iata_map = {
+            "roma": "ROM",
+            "milano": "MIL",
+            "napoli": "NAP",
+            "venezia": "VCE",
+            "londra": "LON",
+            "parigi": "PAR",
+        }
+        trip.departure_airport = iata_map.get(
+            prefs.departure_airport.lower(), prefs.departure_airport[:3].upper()
+        )
+
+        if not trip.transport_mode:
+            trip.transport_mode = "FLIGHT"
+
+        mock_options = []
+        if trip.trip_type == "SOLO":
+            mock_dest = prefs.destination
+            mock_options.append(
+                Proposal(
+                    trip_id=trip_id,
+                    destination=mock_dest,
+                    real_destination=mock_dest,
+                    destination_iata="ROM",
+                    price_estimate=prefs.budget,
+                    description="Il tuo viaggio perfetto.",
+                    image_url="https://images.unsplash.com/photo-1469854523086-cc02fe5d8800",
+                )
+            )
+        else:
+            mock_dest = prefs.destination
+            mock_options = [
+                Proposal(
+                    trip_id=trip_id,
+                    destination=mock_dest,
+                    real_destination=mock_dest,
+                    destination_iata="JFK",
+                    price_estimate=prefs.budget,
+                    description="Opzione equilibrata.",
+                    image_url="https://images.unsplash.com/photo-1469854523086-cc02fe5d8800",
+                ),
+                Proposal(
+                    trip_id=trip_id,
+                    destination=f"{prefs.destination} Budget",
+                    destination_iata="LHR",
+                    price_estimate=prefs.budget * 0.7,
+                    description="Viaggio economico.",
+                    image_url="https://images.unsplash.com/photo-1476514525535-07fb3b4ae5f1",
+                ),
+                Proposal(
+                    trip_id=trip_id,
+                    destination=f"{prefs.destination} Luxury",
+                    destination_iata="CDG",
+                    price_estimate=prefs.budget * 1.5,
+                    description="Esperienza premium.",
+                    image_url="https://images.unsplash.com/photo-1522071820081-009f0129c71c",
+                ),
+            ]
+
+        azzera_votazione(session, trip_id)
+        existing = session.exec(
+            select(Proposal).where(Proposal.trip_id == trip_id)
+        ).all()
+        for e in existing:
+            session.delete(e)
+
+        final_props = []
+        for o in mock_options:
+            session.add(o)
+            final_props.append(o)
+
+        session.commit()
+
+        session.commit()
+
+        if prefs.trip_intent == "BUSINESS" or trip.trip_type == "SOLO":
+            trip.status = "BOOKED"
+            if final_props:
+                trip.winning_proposal_id = final_props[0].id
+                trip.destination = final_props[0].real_destination or final_props[0].destination
+            auto_approva_se_manager(trip, current_account)
+        else:
+            trip.status = "VOTING"
+
+        session.add(trip)
+        session.commit()
+        return session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all()
+
+    except HTTPException:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] generate_proposals: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail="Errore interno del server. Riprova."
+        )
+
+
+async def generate_itinerary_content(trip: Trip, proposal: Proposal, session: Session):
+    """Genera l'itinerario finale integrando nomi reali da OSM e AI avanzata"""
+    logger.info(f"[System] Generating itinerary for Trip {trip.id}...")
+
+    if not ai_client:
+        logger.warning(
+            "[Warning] AI Client not available, skipping itinerary generation."
+        )
+        return
+
+    try:
+        logger.info(f"[ITI-1] trip_id={trip.id} intent={trip.trip_intent} status={trip.status}")
+        try:
+            start_raw = trip.start_date
+            end_raw = trip.end_date
+            # start_date può essere datetime o str a seconda di come è stato salvato
+            if hasattr(start_raw, 'strftime'):
+                d1 = start_raw.replace(tzinfo=None) if start_raw.tzinfo else start_raw
+                d2 = end_raw.replace(tzinfo=None) if end_raw.tzinfo else end_raw
+            else:
+                d1 = datetime.fromisoformat(str(start_raw).replace("Z", ""))
+                d2 = datetime.fromisoformat(str(end_raw).replace("Z", ""))
+            num_days = abs((d2 - d1).days) + 1
+        except Exception as e:
+            logger.warning(f"[Warning] Date parsing failed: {e}")
+            num_days = 5
+        logger.info(f"[ITI-2] num_days={num_days}")
+
+        hotel_lat = trip.hotel_latitude
+        hotel_lon = trip.hotel_longitude
+        locali_reali = (
+            await get_places_from_overpass(hotel_lat, hotel_lon) if hotel_lat else []
+        )
+        logger.info(f"[ITI-3] overpass done, places={len(locali_reali)}")
+
+        places_prompt = ""
+        if locali_reali:
+            places_list_str = "\n".join(
+                [
+                    f"- {p['name']} (Lat: {p['lat']}, Lon: {p['lon']})"
+                    for p in locali_reali[:15]
+                ]
+            )
+            places_prompt = f"""
+            Ecco alcuni luoghi reali verificati vicino all'alloggio (ristoranti, bar, lidi/bagni):
+            {places_list_str}
+            
+            REQUISITO CRITICO PER LA MAPPA:
+            Se usi uno di questi luoghi:
+            1. Usa il suo NOME REALE come 'title'.
+            2. Usa LE SUE COORDINATE (Lat/Lon) esatte fornite sopra nel JSON. NON cambiarle di un solo decimale (Precisione chirurgica).
+            3. Se l'attività riguarda la spiaggia o il relax al mare, l'attività DEVE essere posizionata sulla costa (usando i 'Bagni' o 'Lidi' sopra indicati).
+            4. Se un luogo NON è nella lista sopra, imposta "lat": 0 e "lon": 0. Il sistema le cercherà. NON INVENTARE COORDINATE.
+            """
+
+        calendar_prompt = ""
+        organization_name = ""
+        organizer_part = next((p for p in trip.participants if p.is_organizer), None)
+        organizer_account = None
+        if organizer_part and organizer_part.account_id:
+            organizer_account = session.get(Account, organizer_part.account_id)
+
+        lang = organizer_account.language.upper() if organizer_account else "ITALIANO"
+        logger.info(f"[ITI-4] organizer_found={organizer_account is not None} lang={lang}")
+
+        if trip.trip_intent == "BUSINESS" and organizer_account:
+            if (
+                organizer_account
+                and organizer_account.is_calendar_connected
+                and organizer_account.google_calendar_token
+            ):
+                try:
+                    from google.oauth2.credentials import Credentials
+                    from googleapiclient.discovery import build
+
+                    logger.info(
+                        f"[System] Fetching calendar events for Organizer {organizer_account.email}..."
+                    )
+                    creds = Credentials.from_authorized_user_info(
+                        json.loads(decrypt_text(organizer_account.google_calendar_token)),
+                        ["https://www.googleapis.com/auth/calendar.events.readonly"],
+                    )
+                    service = build("calendar", "v3", credentials=creds)
+
+                    t_min = (
+                        datetime.fromisoformat(
+                            trip.start_date.replace("Z", "")
+                        ).isoformat()
+                        + "Z"
+                    )
+                    t_max = (
+                        datetime.fromisoformat(
+                            trip.end_date.replace("Z", "")
+                        ).isoformat()
+                        + "Z"
+                    )
+
+                    events_result = (
+                        service.events()
+                        .list(
+                            calendarId="primary",
+                            timeMin=t_min,
+                            timeMax=t_max,
+                            singleEvents=True,
+                            orderBy="startTime",
+                        )
+                        .execute()
+                    )
+
+                    events = events_result.get("items", [])
+                    if events:
+                        event_lines = []
+                        for event in events:
+                            start = event["start"].get(
+                                "dateTime", event["start"].get("date")
+                            )
+                            end = event["end"].get("dateTime", event["end"].get("date"))
+                            summary = event.get("summary", "Impegno")
+                            event_lines.append(f"- {summary}: {start} - {end}")
+
+                        calendar_prompt = f"""
+                         IMPEGNI DI LAVORO ESISTENTI (DA RISPETTARE TASSATIVAMENTE):
+                         L'utente ha già i seguenti impegni fissati nel calendario. 
+                         NON sovrapporre nessuna attività turistica a questi orari.
+                         Pianifica spostamenti, pranzi e relax INTORNO a questi blocchi.
+                         
+                         {chr(10).join(event_lines)}
+                         """
+                        logger.info(f"[System] Found {len(events)} calendar events.")
+                except Exception as exc:
+                    logger.warning(f"[Warning] Failed to fetch calendar events: {exc}")
+
+        prompt = f"""
+        Sei un esperto Travel Agent. Genera un itinerario di {num_days} giorni per il viaggio "{trip.name}" a {trip.destination}.
+        TEMA: {proposal.destination}. DESCRIZIONE: {proposal.description}.
+        PARTENZA: {trip.departure_city or trip.departure_airport}.
+        ALLOGGIO: {trip.accommodation or "Hotel centrale"} (Coordinate: {hotel_lat}, {hotel_lon}).
+        MEZZO PRINCIPALE: {trip.transport_mode}.
+        ARRIVO: {trip.start_date} ore {trip.arrival_time or '14:00'}.
+        RITORNO: {trip.end_date} ore {trip.return_time or '18:00'}.
+
+        {places_prompt}
+
+        {calendar_prompt}
+
+        SCOPO DEL VIAGGIO: {trip.trip_intent}
+        {"INDIRIZZO UFFICIO/SEDE (LUOGO DI LAVORO): " + trip.office_address if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
+        
+        {"Se il viaggio è BUSINESS (LAVORO):" if trip.trip_intent == "BUSINESS" else ""}
+        {"- PRIORITÀ ASSOLUTA: Efficienza e produttività." if trip.trip_intent == "BUSINESS" else ""}
+        {"- LUOGO DI LAVORO: Tutte le sessioni di lavoro si svolgono all'indirizzo " + trip.office_address + ". NON scrivere mai che l'utente lavora dall'hotel (NO 'lavoro dall'hotel')." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
+        {"- COMMUTING: Includi esplicitamente gli spostamenti (tipo TRANSPORT) tra l'hotel e l'ufficio all'inizio e alla fine di ogni sessione lavorativa." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
+        {"- ORARIO DI LAVORO: Rispetta tassativamente " + (trip.work_start_time or '09:00') + " - " + (trip.work_end_time or '18:00') + " nei giorni " + (trip.work_days or 'Lun-Ven') + ". Dentro questa fascia NON inserire nulla che non sia lavoro o la pausa pranzo." if trip.trip_intent == "BUSINESS" else ""}
+        {"- NIENTE TURISMO: non inserire musei, monumenti, visite guidate, shopping o attrazioni. Questa e' una trasferta di lavoro: l'itinerario contiene solo spostamenti, sessioni di lavoro e pasti. Anche la sera non proporre attivita' turistiche." if trip.trip_intent == "BUSINESS" else ""}
+        {"- COERENZA DEI NOMI: se un'attivita' si chiama 'Lavoro Mattutino' deve stare al mattino, 'Lavoro Pomeridiano' al pomeriggio. Il titolo deve corrispondere alla fascia oraria in cui la collochi." if trip.trip_intent == "BUSINESS" else ""}
+        {"- ORDINE DEGLI SPOSTAMENTI: il tragitto hotel->ufficio precede SEMPRE la sessione di lavoro, quello ufficio->hotel la segue. Mai il contrario." if trip.trip_intent == "BUSINESS" and trip.office_address else ""}
+
+        {"" if trip.trip_intent == "BUSINESS" else "Se il viaggio è LEISURE, bilancia relax e scoperta. Includi esperienze locali autentiche, tempo libero e varietà di attività."}
+
+        REGOLE CRITICHE:
+        1. SEQUENZA LOGICA: Rispetta l'ordine cronologico (Colazione -> Mattina -> Pranzo -> Pomeriggio -> Cena).
+        2. TIMING DINAMICO: Non usare orari fissi. Ogni attività deve avere ora inizio e fine realistica.
+           - Colazione: ~45 min (07:30-09:00).
+           - Pranzo: ~1-1.5 ore (12:30-14:00).
+           - Cena: ~1.5-2 ore (19:30-21:30).
+           - Attività: Durata variabile 1-4 ore.
+        3. LOGISTICA E ORARI: 
+           - Il Giorno 1 deve iniziare TASSATIVAMENTE DOPO l'ora di ARRIVO ({trip.arrival_time or '14:00'}).
+           - L'ultimo giorno deve terminare il più vicino possibile all'ora di RITORNO ({trip.return_time or '19:00'}). 
+           - NON terminare l'itinerario troppo presto se il ritorno è tardi (es. se si parte alle 19:00, pianifica attività/pranzo/relax fino almeno alle 17:30-18:00).
+           - NON pianificare nulla DOPO l'ora di ritorno.
+        4. TRASPORTI (CAR): Se il mezzo è CAR, calcola l'ESATTA stima di CARBURANTE e PEDAGGI per il viaggio A/R tra {trip.departure_city or trip.departure_airport} e {trip.destination}. Usa i dati reali delle autostrade (es. Autostrade per l'Italia). NON essere generico.
+        5. MAPPA: Fornisci COORDINATE GPS (lat, lon) REALI per ogni luogo.
+        6. NO TRANSIT FOR LEISURE: Evita stazioni o aeroporti per attività di svago. Se l'attività parla di spiaggia, mare o lungomare, il luogo DEVI posizionarlo sulla costa (Lido/Bagno).
+        7. NO NOTES: Non includere MAI note, commenti, disclaimer o spiegazioni (es. "I costi sono calcolati su...") né nel testo delle attività né esternamente. Solo i dati richiesti nel JSON.
+        
+        RISPONDI SOLO IN JSON:
+        {{
+            "estimated_road_costs": {{"fuel": 0.0, "tolls": 0.0}},
+            "itinerary": [
+                {{
+                    "title": "...", 
+                    "description": "...", 
+                    "start_time": "YYYY-MM-DDTHH:MM:SS",
+                    "end_time": "YYYY-MM-DDTHH:MM:SS",
+                    "type": "ACTIVITY|FOOD|TRANSPORT|CHECKIN",
+                    "lat": 0.0,
+                    "lon": 0.0
+                }}
+            ]
+        }}
+        LINGUA: {lang}.
+        """
+
+        logger.info(f"[ITI-5] calling Gemini for itinerary trip={trip.id}")
+        response = await _gemini_call_with_retry(prompt, json_mode=True)
+        logger.info(f"[ITI-6] Gemini responded, text_len={len(response.text) if response.text else 0}")
+        data = json.loads(response.text)
+
+        # ── Step B: Validate and fix timings with CP-SAT optimizer ──────────
+        raw_activities = data.get("itinerary", [])
+        logger.info(f"[ITI-7] raw_activities={len(raw_activities)}")
+        if raw_activities:
+            opt_result = await optimize_travel_itinerary(raw_activities)
+            logger.info(f"[ITI-8] optimizer done, scheduled={len(opt_result.get('schedule', []))}")
+
+            if opt_result["dropped"]:
+                dropped_titles = [d["title"] for d in opt_result["dropped"]]
+                logger.warning(
+                    f"[Optimizer] Trip {trip.id}: {len(opt_result['dropped'])} activities "
+                    f"dropped as physically infeasible: {dropped_titles}"
+                )
+
+                if not opt_result["feasible"] and not opt_result["partial"]:
+                    # Completely infeasible (anchor conflict) — ask Gemini to explain
+                    explain_prompt = (
+                        f"L'itinerario generato per il viaggio a {trip.destination} è "
+                        f"matematicamente impossibile. Le seguenti attività non possono "
+                        f"essere inserite nel giorno senza sovrapporre orari fissi o voli: "
+                        f"{', '.join(dropped_titles)}. "
+                        f"Spiega in modo chiaro e breve (massimo 2 frasi) perché e cosa "
+                        f"dovrebbe tagliare l'utente. Lingua: {lang}."
+                    )
+                    try:
+                        explain_resp = await _gemini_call_with_retry(explain_prompt)
+                        logger.info(
+                            f"[Optimizer] Infeasibility explanation: {explain_resp.text}"
+                        )
+                    except Exception as ex:
+                        logger.warning(f"[Optimizer] Could not generate explanation: {ex}")
+
+            # ── Step C: Replace Gemini times with optimizer-validated times ──
+            # Strip internal optimizer metadata before passing to process_item
+            optimized = []
+            for item in opt_result["schedule"]:
+                clean = {k: v for k, v in item.items() if not k.startswith("_")}
+                optimized.append(clean)
+            data["itinerary"] = optimized
+            logger.info(
+                f"[Optimizer] Trip {trip.id}: schedule locked "
+                f"({len(optimized)} activities, {len(opt_result['dropped'])} dropped)."
+            )
+
+        logger.info(f"[ITI-9] saving itinerary items trip={trip.id}")
+        cancella_in_blocco(session, trip.id, ItineraryItem, ItineraryItem.trip_id == trip.id)
+        session.commit()
+
+        import asyncio
+
+        async def process_item(item):
+            try:
+                try:
+                    i_lat = float(item.get("lat", 0))
+                    i_lon = float(item.get("lon", 0))
+                except:
+                    i_lat, i_lon = 0.0, 0.0
+
+                if not i_lat or i_lat == 0:
+                    title_clean = item["title"].lower()
+                    query = f"{item['title']}, {trip.destination}"
+
+                    if any(word in title_clean for word in ["bagno", "lido", "mare"]):
+                        if "bagno" in title_clean or "lido" in title_clean:
+                            query = f"{item['title']}, {trip.destination}"
+                        else:
+                            query = f"{item['title']}, Lungomare, {trip.destination}"
+
+                    i_lat, i_lon = await get_coordinates(query)
+
+                    if (not i_lat or i_lat == 0) and trip.hotel_latitude:
+                        i_lat, i_lon = trip.hotel_latitude, trip.hotel_longitude
+
+                return ItineraryItem(
+                    trip_id=trip.id,
+                    title=item["title"],
+                    description=item["description"],
+                    start_time=item["start_time"],
+                    end_time=item.get("end_time"),
+                    type=item["type"],
+                    latitude=i_lat,
+                    longitude=i_lon,
+                )
+            except Exception as ei:
+                logger.error(f"[ERROR] Skip item {item.get('title')}: {ei}")
+                return None
+
+        tasks = [process_item(item) for item in data.get("itinerary", [])]
+        results = await asyncio.gather(*tasks)
+
+        for db_item in results:
+            if db_item:
+                session.add(db_item)
+
+        # La stima di carburante e pedaggi non viene piu' inserita come spesa.
+        # Era una previsione generata dal modello che finiva mescolata alle spese
+        # reali: nessuno la verificava e in nota spese i costi auto vanno
+        # rendicontati con le ricevute, non con una stima. La categoria
+        # Travel_Road resta disponibile per le spese vere, inserite a mano o
+        # lette da ricevuta.
+        cancella_in_blocco(
+            session,
+            trip.id,
+            Expense,
+            Expense.trip_id == trip.id,
+            Expense.category == "Travel_Road",
+            Expense.description.like("Stima%"),
+        )
+
+        session.commit()
+        logger.info(f"[ITI-10] DONE. Itinerary for Trip {trip.id} generated correctly.")
+        return True
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[AI Error] Generazione itinerario fallita: {e}", exc_info=True)
+        return False
+
+
+@router.post("/{trip_id}/confirm-hotel")
+async def confirm_hotel(
+    trip_id: int,
+    hotel_data: HotelSelectionRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Conferma i dati logistici finali e genera l'itinerario"""
+    # Endpoint distruttivo: sovrascrive hotel/costi e RIGENERA l'itinerario da
+    # zero. Senza questo controllo chiunque poteva azzerare il viaggio altrui.
+    check_participant(trip_id, current_account, session)
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        # check_rate_limit applica la quota AI aziendale per B2B e FREE_LIMIT per B2C
+        await check_rate_limit(current_account, session)
+        require_premium(current_account, trip)
+
+        trip.accommodation = hotel_data.hotel_name
+        trip.accommodation_location = hotel_data.hotel_address
+        trip.hotel_cost = hotel_data.hotel_cost or 0.0
+        trip.transport_cost = hotel_data.transport_cost or 0.0
+        trip.arrival_time = hotel_data.arrival_time
+        trip.return_time = hotel_data.return_time
+
+        if hotel_data.transport_mode and hotel_data.transport_mode != "None":
+            trip.transport_mode = hotel_data.transport_mode
+
+        lat, lon = await get_coordinates(
+            f"{hotel_data.hotel_name}, {hotel_data.hotel_address}"
+        )
+        trip.hotel_latitude = lat
+        trip.hotel_longitude = lon
+
+        session.add(trip)
+        session.commit()
+
+        proposal = session.get(Proposal, trip.winning_proposal_id)
+        if not proposal:
+            proposal = Proposal(
+                destination=trip.destination,
+                trip_id=trip.id,
+                price_estimate=0,
+                description="",
+            )
+
+        itinerary_ok = await generate_itinerary_content(trip, proposal, session)
+        return {
+            "status": "success",
+            "itinerary_generated": itinerary_ok,
+            "message": "Logistica confermata. Itinerario generato." if itinerary_ok else "Logistica confermata. Generazione itinerario in corso.",
+        }
+    except HTTPException:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] confirm_hotel: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{trip_id}/reset-hotel")
+async def reset_hotel(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Resetta i dati dell'hotel per permettere la modifica e la rigenerazione dell'itinerario"""
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        participant = check_participant(trip_id, current_account, session)
+        if not participant.is_organizer:
+            raise HTTPException(
+                status_code=403,
+                detail="Solo l'organizzatore può resettare la logistica",
+            )
+
+        trip.accommodation = None
+        trip.accommodation_location = None
+        trip.hotel_latitude = None
+        trip.hotel_longitude = None
+        trip.hotel_cost = 0.0
+        trip.transport_cost = 0.0
+
+        cancella_in_blocco(session, trip_id, ItineraryItem, ItineraryItem.trip_id == trip_id)
+        cancella_in_blocco(
+            session,
+            trip_id,
+            Expense,
+            Expense.trip_id == trip_id,
+            Expense.category == "Travel_Road",
+            Expense.description.like("Stima%"),
+        )
+
+        session.add(trip)
+        session.commit()
+        return {
+            "status": "success",
+            "message": "Logistica resettata. Ora puoi inserire nuovi dati.",
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] reset_hotel: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{trip_id}/chat")
+async def chat_with_ai(
+    trip_id: int,
+    req: ChatRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Chat AI evoluta: gestisce contesto temporale, history e comandi multipli"""
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        # P0-6: solo i partecipanti (same-tenant su BUSINESS) possono chattare
+        check_participant(trip_id, current_account, session)
+
+        await check_rate_limit(current_account, session)
+        require_premium(current_account, trip)
+
+        itinerary = session.exec(
+            select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
+        ).all()
+
+        history_text = ""
+        if req.history:
+            history_text = "\n".join(
+                [
+                    f"{m.get('role', 'user').upper()}: {m.get('text', '')}"
+                    for m in req.history[-5:]
+                ]
+            )
+
+        prompt = f"""
+        Sei SplitPlan Assistant, un esperto Travel Agent. 
+        VIAGGIO: {trip.name} a {trip.destination}
+        DATE: dal {trip.start_date} al {trip.end_date}
+        
+        ITINERARIO ATTUALE (Lista di oggetti JSON con ID, Titolo, Orario):
+        {json.dumps([i.model_dump() for i in itinerary], indent=2)}
+        
+        CRONOLOGIA RECENTE:
+        {history_text}
+        
+        RICHIESTA UTENTE: "{req.message}"
+        
+        ISTRUZIONI:
+        1. Rispondi cordialmente in {current_account.language.upper()}.
+        2. Se l'utente vuole CAMBIARE o SPOSTARE qualcosa, devi fare DELETE dell'item corrente (usando il suo ID) e ADD di quello nuovo con i dati corretti.
+        3. IMPORTANTE: Se riorganizzi l'itinerario, assicurati di NON PERDERE attività. Se cancelli un giorno per spostarlo, devi RIGENERARE tutte le attività di quel giorno.
+        4. Se l'utente vuole aggiungere attività ricorrenti (es. ogni mattina), crea un comando ADD per ogni giorno del viaggio.
+        5. AZIONI:
+           - ADD: {{"action": "ADD", "item": {{"title": "..", "description": "..", "start_time": "ISO8601", "type": "ACTIVITY|FOOD|TRANSPORT"}}}}
+           - DELETE: {{"action": "DELETE", "id": 123}}
+        
+        RISPONDI SEMPRE E SOLO IN JSON (senza testo fuori dal blocco):
+        {{
+            "reply": "Messaggio di conferma",
+            "commands": []
+        }}
+        LINGUA: {current_account.language.upper()}.
+        """
+
+        if not ai_client:
+            return {
+                "reply": "AI non disponibile.",
+                "itinerary": [i.model_dump() for i in itinerary],
+            }
+
+        response = await _gemini_call_with_retry(prompt, json_mode=True)
+        raw_text = response.text.strip()
+
+        logger.info(f"[DEBUG] Raw AI Response: {raw_text}")
+
+        try:
+            data = json.loads(raw_text)
+        except (json.JSONDecodeError, ValueError):
+            return {
+                "reply": "C'è stato un errore nel formato della risposta AI. Riprova tra un istante.",
+                "itinerary": [i.model_dump() for i in itinerary],
+            }
+
+        for cmd in data.get("commands", []):
+            try:
+                if cmd["action"] == "ADD":
+                    item_data = cmd["item"].copy()
+                    item_data.pop("id", None)
+                    item_data.pop("trip_id", None)
+
+                    new_item = ItineraryItem(trip_id=trip_id, **item_data)
+                    session.add(new_item)
+                elif cmd["action"] == "DELETE":
+                    item_id = cmd.get("id")
+                    if item_id:
+                        item = session.get(ItineraryItem, item_id)
+                        if item and item.trip_id == trip_id:
+                            session.delete(item)
+            except Exception as e:
+                logger.error(f"[CMD Error] Fallito comando {cmd.get('action')}: {e}")
+
+        session.commit()
+
+        updated = session.exec(
+            select(ItineraryItem)
+            .where(ItineraryItem.trip_id == trip_id)
+            .order_by(ItineraryItem.start_time)
+        ).all()
+        return {
+            "reply": data.get("reply", "Itinerario aggiornato!"),
+            "itinerary": [i.model_dump() for i in updated],
+        }
+
+    except HTTPException:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[Chat Error] {e}")
+        raise HTTPException(
+            status_code=500, detail="Errore interno del server. Riprova."
+        )
@@ -0,0 +1,193 @@
+"""
+Workflow di approvazione delle trasferte business (richiesta, approva, rifiuta).
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from sqlmodel import Session, select
+from typing import Optional
+
+import logging
+import os
+from datetime import datetime, timezone
+
+from database import get_session
+from auth import get_current_user
+from models import Trip, Participant, SQLModel, Account
+from email_templates import (
+    APPROVAL_REQUESTED,
+    email_trip_approved,
+    email_trip_rejected,
+)
+from utils.access import check_participant, require_same_company
+from services.notification_service import (
+    create_notification,
+    notify_managers,
+    send_notification_email,
+)
+from routers.trips._common import require_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+class RejectTripRequest(SQLModel):
+    rejection_reason: Optional[str] = None
+
+
+@router.post("/{trip_id}/request-approval")
+async def request_approval(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(get_current_user)
+):
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(404, "Viaggio non trovato")
+    if trip.trip_intent != "BUSINESS":
+        raise HTTPException(400, "L'approvazione è disponibile solo per i viaggi aziendali")
+    participant = check_participant(trip_id, current_user, session)
+    if not participant.is_active:
+        raise HTTPException(403, "Non sei un partecipante di questo viaggio")
+
+    trip.status = "PENDING_APPROVAL"
+    trip.approval_requested_at = datetime.now(timezone.utc)
+    session.add(trip)
+
+    # Notifica tutti i manager della company, in-app e via email: tutto parte
+    # con lo stesso COMMIT del cambio di stato.
+    if current_user.company_id:
+        manager_ids = notify_managers(
+            session,
+            company_id=current_user.company_id,
+            type="approval_requested",
+            title=f"Approvazione richiesta: {trip.name}",
+            message=f"{current_user.name} {current_user.surname} ha richiesto l'approvazione del viaggio '{trip.name}'.",
+            trip_id=trip_id,
+        )
+        managers = session.exec(select(Account).where(Account.id.in_(manager_ids))).all()
+        # Stessa email per tutti i manager tranne il nome: una sola resa in blocco.
+        emails = APPROVAL_REQUESTED.rendi_molti(
+            [{"manager_name": m.name} for m in managers],
+            trip_name=trip.name,
+            requester_name=f"{current_user.name} {current_user.surname}",
+            manager_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/manager",
+        )
+        for manager_account, html in zip(managers, emails):
+            send_notification_email(
+                session,
+                manager_account,
+                subject=f"SplitPlan: Approvazione richiesta per '{trip.name}'",
+                html_content=html,
+            )
+    session.commit()
+
+    return {"status": "pending_approval"}
+
+
+@router.post("/{trip_id}/approve")
+async def approve_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(require_manager)
+):
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(404, "Viaggio non trovato")
+
+    require_same_company(trip_id, current_user, session)
+
+    organizer_participant = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id,
+            Participant.is_organizer == True
+        )
+    ).first()
+    organizer_account = None
+    if organizer_participant and organizer_participant.account_id:
+        organizer_account = session.get(Account, organizer_participant.account_id)
+
+    trip.status = "APPROVED"
+    trip.approved_by = current_user.id
+    session.add(trip)
+
+    # Notifica organizzatore
+    if organizer_account:
+        create_notification(
+            session,
+            account_id=organizer_account.id,
+            type="trip_approved",
+            title=f"Viaggio approvato: {trip.name}",
+            message=f"Il tuo viaggio '{trip.name}' è stato approvato da {current_user.name} {current_user.surname}.",
+            trip_id=trip_id,
+        )
+        send_notification_email(
+            session,
+            organizer_account,
+            subject=f"SplitPlan: Il viaggio '{trip.name}' è stato approvato ✅",
+            html_content=email_trip_approved(
+                organizer_name=organizer_account.name,
+                trip_name=trip.name,
+                manager_name=f"{current_user.name} {current_user.surname}",
+                trip_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/trip/{trip_id}",
+            ),
+        )
+    session.commit()
+
+    return {"status": "approved"}
+
+
+@router.post("/{trip_id}/reject")
+async def reject_trip(
+    trip_id: int,
+    body: RejectTripRequest,
+    session: Session = Depends(get_session),
+    current_user: Account = Depends(require_manager)
+):
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(404, "Viaggio non trovato")
+
+    require_same_company(trip_id, current_user, session)
+
+    organizer_participant = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id,
+            Participant.is_organizer == True
+        )
+    ).first()
+    organizer_account = None
+    if organizer_participant and organizer_participant.account_id:
+        organizer_account = session.get(Account, organizer_participant.account_id)
+
+    trip.status = "REJECTED"
+    trip.rejection_reason = body.rejection_reason
+    session.add(trip)
+
+    # Notifica organizzatore
+    if organizer_account:
+        reason_text = f" Motivazione: {body.rejection_reason}" if body.rejection_reason else ""
+        create_notification(
+            session,
+            account_id=organizer_account.id,
+            type="trip_rejected",
+            title=f"Viaggio non approvato: {trip.name}",
+            message=f"Il tuo viaggio '{trip.name}' è stato rifiutato da {current_user.name} {current_user.surname}.{reason_text}",
+            trip_id=trip_id,
+        )
+        send_notification_email(
+            session,
+            organizer_account,
+            subject=f"SplitPlan: Il viaggio '{trip.name}' non è stato approvato",
+            html_content=email_trip_rejected(
+                organizer_name=organizer_account.name,
+                trip_name=trip.name,
+                manager_name=f"{current_user.name} {current_user.surname}",
+                trip_url=f"{os.getenv('FRONTEND_URL', 'https://splitplan-ai.vercel.app')}/trip/{trip_id}",
+                reason=body.rejection_reason,
+            ),
+        )
+    session.commit()
+
+    return {"status": "rejected"}
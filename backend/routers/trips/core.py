@@ -0,0 +1,912 @@
+"""
+Endpoint base dei viaggi: creazione, elenco, dettaglio, modifica, condivisione,
+partecipanti, itinerario salvato e sblocco premium.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from sqlmodel import Session, select, func, delete, Field
+from sqlalchemy.orm import selectinload
+from typing import List, Dict, Optional, Literal
+
+import logging
+from datetime import datetime, timezone
+
+from database import get_session, get_read_session
+from auth import get_current_user
+from models import (
+    Trip,
+    Participant,
+    Proposal,
+    Vote,
+    ItineraryItem,
+    SQLModel,
+    Account,
+    Company,
+    Expense,
+    Photo,
+    Notification,
+    TripChange,
+)
+from utils.access import check_company_limits, check_participant, check_tenant_for_trip
+from utils.conditional import RichiestaCondizionale, richiesta_condizionale
+from services.notification_service import notify_managers
+from services import unread_counter
+from services.maps_service import get_route_geometry
+from services.stats_service import statistiche_utente
+from utils.pagination import codifica_cursore, decodifica_cursore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+class TripCreateRequest(SQLModel):
+    """Campi che il client puo' impostare creando un viaggio via POST /trips/.
+
+    NON usare TripBase come body: e' il modello della tabella e include campi
+    controllati dal server (is_premium, status, company_id, approved_by,
+    share_token, ...). Accettarli dal client permetteva di sbloccare il premium
+    senza pagare, di auto-approvare una trasferta scavalcando il manager e di
+    attribuire un viaggio all'azienda di un altro tenant.
+    """
+
+    name: str
+    trip_type: str
+    trip_intent: Literal["LEISURE", "BUSINESS"] = "LEISURE"
+    destination: str = ""
+    description: Optional[str] = None
+
+    budget: float = Field(default=0.0, ge=0)
+    budget_max: float = Field(default=0.0, ge=0)
+    num_people: int = Field(default=1, ge=1, le=50)
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+    must_have: Optional[str] = ""
+    must_avoid: Optional[str] = ""
+    vibe: Optional[str] = ""
+    transport_mode: str = "FLIGHT"
+    departure_city: Optional[str] = None
+    accommodation: Optional[str] = None
+    accommodation_location: Optional[str] = None
+
+    office_address: Optional[str] = None
+    work_start_time: Optional[str] = "09:00"
+    work_end_time: Optional[str] = "18:00"
+    work_days: Optional[str] = "Monday,Tuesday,Wednesday,Thursday,Friday"
+
+
+class TripUpdateRequest(SQLModel):
+    """Campi modificabili dall'organizzatore via PATCH /trips/{id}.
+    Tutti opzionali: si aggiornano solo i campi presenti nel body."""
+    name: Optional[str] = None
+    destination: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    budget: Optional[float] = None
+    budget_max: Optional[float] = None
+    num_people: Optional[int] = None
+    accommodation: Optional[str] = None
+    transport_mode: Optional[str] = None
+    notes: Optional[str] = None
+    office_address: Optional[str] = None
+    work_start_time: Optional[str] = None
+    work_end_time: Optional[str] = None
+    work_days: Optional[str] = None
+
+
+class JoinRequest(SQLModel):
+    share_token: str
+    participant_name: str
+
+
+@router.post("/", response_model=Dict)
+async def create_trip(
+    trip_data: TripCreateRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Crea un nuovo viaggio e assegna l'organizzatore"""
+    # Verifica limiti aziendali per trip BUSINESS
+    if trip_data.trip_intent == "BUSINESS" and current_account.company_id:
+        company = session.get(Company, current_account.company_id)
+        if company:
+            check_company_limits(company, session, "create_trip")
+
+    try:
+        # I campi privilegiati non arrivano dal client: TripCreateRequest non li
+        # espone e il Trip parte sempre dai default del modello
+        # (status=PLANNING, is_premium=False, approved_by=None, share_token=None).
+        db_trip = Trip(**trip_data.model_dump())
+        if trip_data.trip_type == "SOLO":
+            db_trip.num_people = 1
+
+        # Il company_id e' sempre quello dell'organizzatore, mai un valore scelto
+        # dal client: e' cio' che tiene separati i tenant B2B.
+        if current_account.company_id and trip_data.trip_intent == "BUSINESS":
+            db_trip.company_id = current_account.company_id
+
+        session.add(db_trip)
+        session.commit()
+        session.refresh(db_trip)
+
+        organizer = Participant(
+            name=current_account.name,
+            is_organizer=True,
+            trip_id=db_trip.id,
+            account_id=current_account.id,
+        )
+        session.add(organizer)
+        session.commit()
+
+        # Notifica manager aziendali alla creazione di un trip BUSINESS
+        if db_trip.trip_intent == "BUSINESS" and current_account.company_id:
+            notify_managers(
+                session=session,
+                company_id=current_account.company_id,
+                type="trip_created",
+                title="Nuovo viaggio aziendale creato",
+                message=f"{current_account.name} ha creato un nuovo viaggio: \"{db_trip.name}\" verso {db_trip.destination or 'destinazione TBD'}.",
+                trip_id=db_trip.id,
+            )
+            session.commit()
+
+        return {"trip_id": db_trip.id, "trip": db_trip}
+    except HTTPException:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] create_trip: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Colonne della proiezione leggera di /my-trips: quanto serve alla lista
+# viaggi, senza blob come events_cache o i campi dell'hotel.
+_COLONNE_TRIP_SUMMARY = (
+    Trip.id,
+    Trip.name,
+    Trip.destination,
+    Trip.start_date,
+    Trip.end_date,
+    Trip.status,
+    Trip.trip_type,
+    Trip.trip_intent,
+    Trip.num_people,
+    Trip.transport_mode,
+)
+
+
+@router.get("/my-trips")
+async def get_my_trips(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Literal["full", "summary"] = "full",
+    skip: int = Query(0, ge=0, description="Deprecato: usare cursor"),
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """
+    Viaggi dell'utente corrente, dal piu' recente, a pagine keyset su Trip.id:
+    `next_cursor` va ripassato come `cursor`. `total` si calcola solo sulla
+    prima pagina. fields=summary restituisce solo le colonne della lista.
+    """
+    try:
+        # Semi-join su Participant: un viaggio compare una volta anche se per
+        # errore l'account ha piu' righe Participant nello stesso viaggio.
+        miei = select(Participant.trip_id).where(
+            Participant.account_id == current_account.id,
+            Participant.is_active == True,
+        )
+        filtro = Trip.id.in_(miei)
+
+        total = None
+        ultimo_id = decodifica_cursore(cursor, 1)
+        if ultimo_id is None:
+            total = session.exec(select(func.count(Trip.id)).where(filtro)).one()
+            if not total:
+                return {"trips": [], "total": 0, "next_cursor": None, "limit": limit}
+
+        colonne = _COLONNE_TRIP_SUMMARY if fields == "summary" else (Trip,)
+        query = select(*colonne).where(filtro).order_by(Trip.id.desc())
+        if ultimo_id is not None:
+            query = query.where(Trip.id < ultimo_id[0])
+        elif skip:
+            query = query.offset(skip)
+        righe = session.exec(query.limit(limit + 1)).all()
+
+        pagina = righe[:limit]
+        if fields == "summary":
+            trips = [dict(r._mapping) for r in pagina]
+        else:
+            trips = list(pagina)
+        prossimo = codifica_cursore([pagina[-1].id]) if len(righe) > limit else None
+
+        return {"trips": trips, "total": total, "next_cursor": prossimo, "limit": limit}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[ERROR] get_my_trips: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stats")
+async def get_user_stats(
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Statistiche aggregate per l'utente corrente (aggregati SQL, in cache per account)."""
+    try:
+        return statistiche_utente(session, current_account.id)
+    except Exception as e:
+        logger.error(f"[ERROR] get_user_stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{trip_id}/complete")
+async def complete_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Segna un viaggio come concluso"""
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        participant = session.exec(
+            select(Participant).where(
+                Participant.trip_id == trip_id,
+                Participant.account_id == current_account.id,
+            )
+        ).first()
+
+        if not participant or not participant.is_organizer:
+            raise HTTPException(
+                status_code=403,
+                detail="Solo l'organizzatore può segnare il viaggio come concluso",
+            )
+
+        trip.status = "COMPLETED"
+        session.add(trip)
+        session.commit()
+        return {"status": "success", "message": "Viaggio archiviato con successo"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] complete_trip: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{trip_id}/hide")
+async def hide_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Nasconde un viaggio dalla cronologia dell'utente (imposta is_active=False per il partecipante)"""
+    try:
+        participant = session.exec(
+            select(Participant).where(
+                Participant.trip_id == trip_id,
+                Participant.account_id == current_account.id,
+            )
+        ).first()
+
+        if not participant:
+            raise HTTPException(
+                status_code=404, detail="Partecipante non trovato in questo viaggio"
+            )
+
+        participant.is_active = False
+        session.add(participant)
+        session.commit()
+        return {"status": "success", "message": "Viaggio nascosto correttamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] hide_trip: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/business-overview")
+async def get_business_overview(
+    session: Session = Depends(get_read_session),
+    current_user: Account = Depends(get_current_user)
+):
+    if not current_user.is_manager:
+        raise HTTPException(403, "Accesso riservato ai manager aziendali")
+
+    # Filtra per company_id se impostato, altrimenti mostra tutti (utile per demo)
+    if current_user.company_id is not None:
+        company_accounts = session.exec(
+            select(Account.id).where(Account.company_id == current_user.company_id)
+        ).all()
+        company_trip_ids = session.exec(
+            select(Participant.trip_id).where(Participant.account_id.in_(company_accounts))
+        ).all()
+        trips = session.exec(
+            select(Trip).where(Trip.trip_intent == "BUSINESS", Trip.id.in_(company_trip_ids))
+        ).all()
+    else:
+        trips = session.exec(select(Trip).where(Trip.trip_intent == "BUSINESS")).all()
+
+    trip_ids_all = [t.id for t in trips]
+
+    # Fetch bulk: organizzatori (1 query invece di N)
+    organizers_bulk = {}
+    if trip_ids_all:
+        for p in session.exec(
+            select(Participant).where(
+                Participant.trip_id.in_(trip_ids_all),
+                Participant.is_organizer == True,
+            )
+        ).all():
+            organizers_bulk[p.trip_id] = p
+
+    # Fetch bulk: proposte vincitrici (1 query invece di N)
+    winning_ids = [t.winning_proposal_id for t in trips if t.winning_proposal_id]
+    proposals_bulk = {}
+    if winning_ids:
+        for prop in session.exec(
+            select(Proposal).where(Proposal.id.in_(winning_ids))
+        ).all():
+            proposals_bulk[prop.id] = prop
+
+    result = []
+    for trip in trips:
+        organizer = organizers_bulk.get(trip.id)
+        organizer_name = organizer.name if organizer else "N/A"
+
+        estimated_cost = None
+        if trip.winning_proposal_id and trip.winning_proposal_id in proposals_bulk:
+            estimated_cost = proposals_bulk[trip.winning_proposal_id].price_estimate
+
+        result.append({
+            "id": trip.id,
+            "name": trip.name,
+            "destination": trip.destination or trip.real_destination or "",
+            "start_date": trip.start_date.isoformat() if trip.start_date else None,
+            "end_date": trip.end_date.isoformat() if trip.end_date else None,
+            "status": trip.status,
+            "num_people": trip.num_people,
+            "organizer_name": organizer_name,
+            "estimated_cost": estimated_cost,
+            "transport_mode": trip.transport_mode,
+        })
+
+    # ── Analytics ─────────────────────────────────────────────────────────────
+
+    # trips_by_status
+    trips_by_status: dict = {}
+    for trip in trips:
+        trips_by_status[trip.status] = trips_by_status.get(trip.status, 0) + 1
+
+    # top_destinations (top 5 per frequenza)
+    dest_count: dict = {}
+    for trip in trips:
+        dest = trip.destination or trip.real_destination or ""
+        if dest:
+            dest_count[dest] = dest_count.get(dest, 0) + 1
+    top_destinations = [
+        {"destination": d, "count": c}
+        for d, c in sorted(dest_count.items(), key=lambda x: -x[1])[:5]
+    ]
+
+    # monthly_spend + employees_traveled: ultimi 6 mesi
+    trip_ids = [t.id for t in trips]
+    monthly_spend_map: dict = {}
+    employees_per_month: dict = {}  # month_key → set of account_ids
+
+    now_dt = datetime.now(timezone.utc)
+
+    if trip_ids:
+        all_expenses = session.exec(
+            select(Expense).where(Expense.trip_id.in_(trip_ids))
+        ).all()
+        for exp in all_expenses:
+            if exp.date:
+                month_key = str(exp.date)[:7]  # "YYYY-MM"
+                monthly_spend_map[month_key] = monthly_spend_map.get(month_key, 0.0) + (exp.amount or 0.0)
+
+        # Partecipanti per trip (per calcolare employees_traveled)
+        all_participants = session.exec(
+            select(Participant).where(Participant.trip_id.in_(trip_ids))
+        ).all()
+        # Mappa trip_id → month_key usando start_date del trip
+        trip_month_map = {}
+        for t in trips:
+            if t.start_date:
+                trip_month_map[t.id] = str(t.start_date)[:7]
+        for p in all_participants:
+            if p.account_id and p.trip_id in trip_month_map:
+                mk = trip_month_map[p.trip_id]
+                employees_per_month.setdefault(mk, set()).add(p.account_id)
+
+    # Genera 6 mesi in ordine cronologico
+    monthly_spend = []
+    for i in range(5, -1, -1):
+        month = (now_dt.month - i - 1) % 12 + 1
+        year = now_dt.year + ((now_dt.month - i - 1) // 12)
+        key = f"{year:04d}-{month:02d}"
+        monthly_spend.append({
+            "month": key,
+            "total": round(monthly_spend_map.get(key, 0.0), 2),
+            "employees_traveled": len(employees_per_month.get(key, set())),
+        })
+
+    return {
+        "trips": result,
+        "analytics": {
+            "trips_by_status": trips_by_status,
+            "top_destinations": top_destinations,
+            "monthly_spend": monthly_spend,
+        },
+    }
+
+
+@router.get("/{trip_id}", response_model=Trip)
+async def read_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
+):
+    """Recupera i dettagli del viaggio verificando l'appartenenza dell'account"""
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    # I manager possono vedere i viaggi BUSINESS *della propria azienda*.
+    # Senza il confronto su company_id un manager qualsiasi leggeva le trasferte
+    # di tutti i clienti B2B. Il manager senza company non ha alcun privilegio.
+    if (
+        current_account.is_manager
+        and trip.trip_intent == "BUSINESS"
+        and current_account.company_id is not None
+        and trip.company_id == current_account.company_id
+    ):
+        condizionale.verifica_viaggio(session, trip_id, "trip")
+        return trip
+
+    participant = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id, Participant.account_id == current_account.id
+        )
+    ).first()
+    if not participant:
+        raise HTTPException(status_code=403, detail="Non partecipi a questo viaggio")
+
+    condizionale.verifica_viaggio(session, trip_id, "trip")
+    return trip
+
+
+@router.get("/{trip_id}/proposals", response_model=List[Proposal])
+async def get_proposals(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
+):
+    """Recupera le proposte generate per un viaggio. Solo per i partecipanti.
+
+    Era pubblico "per le votazioni", ma gli ospiti non registrati passano da
+    GET /trips/share/{token}, che restituisce gia' tutti i dati necessari.
+    Con gli id sequenziali, l'accesso libero permetteva di enumerare le
+    proposte di qualunque viaggio, incluse le trasferte aziendali.
+    """
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    check_participant(trip_id, current_account, session)
+    condizionale.verifica_viaggio(session, trip_id, "proposals")
+    return session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all()
+
+
+@router.post("/{trip_id}/share")
+async def generate_share_token(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Genera o restituisce il token di condivisione del viaggio"""
+    import secrets
+
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    participant = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id, Participant.account_id == current_account.id
+        )
+    ).first()
+    if not participant or not participant.is_organizer:
+        raise HTTPException(
+            status_code=403,
+            detail="Solo l'organizzatore può generare il link di condivisione",
+        )
+
+    if not trip.share_token:
+        trip.share_token = secrets.token_urlsafe(16)
+        session.add(trip)
+        session.commit()
+        session.refresh(trip)
+
+    return {"share_token": trip.share_token}
+
+
+def partecipanti_con_voto(session: Session, trip_id: int) -> list:
+    """
+    Partecipanti del viaggio con il flag has_voted in una sola query
+    (LEFT JOIN sui voti raggruppata per partecipante), invece di un COUNT
+    per ogni partecipante.
+    """
+    righe = session.exec(
+        select(
+            Participant.id,
+            Participant.name,
+            Participant.is_organizer,
+            func.count(Vote.id),
+        )
+        .outerjoin(Vote, Vote.user_id == Participant.id)
+        .where(Participant.trip_id == trip_id)
+        .group_by(Participant.id, Participant.name, Participant.is_organizer)
+        .order_by(Participant.id)
+    ).all()
+    return [
+        {"id": pid, "name": nome, "is_organizer": organizzatore, "has_voted": voti > 0}
+        for pid, nome, organizzatore, voti in righe
+    ]
+
+
+def carica_viaggio_condiviso(session: Session, token: str) -> Optional[dict]:
+    """
+    Payload completo di GET /trips/share/{token} con un numero fisso di query:
+    viaggio, itinerario, spese e foto (selectinload) e partecipanti con voto.
+    """
+    trip = session.exec(
+        select(Trip)
+        .where(Trip.share_token == token)
+        .options(
+            selectinload(Trip.itinerary_items),
+            selectinload(Trip.expenses),
+            selectinload(Trip.photos),
+        )
+    ).first()
+    if not trip:
+        return None
+
+    itinerary = sorted(trip.itinerary_items, key=lambda i: (i.start_time, i.id))
+    return {
+        "trip": trip.model_dump(
+            exclude={
+                "participants",
+                "proposals",
+                "itinerary_items",
+                "expenses",
+                "photos",
+            }
+        ),
+        "itinerary": [i.model_dump() for i in itinerary],
+        "expenses": [e.model_dump() for e in sorted(trip.expenses, key=lambda e: e.id)],
+        "photos": [p.model_dump() for p in sorted(trip.photos, key=lambda p: p.id)],
+        "participants": [
+            {"id": p["id"], "name": p["name"], "has_voted": p["has_voted"]}
+            for p in partecipanti_con_voto(session, trip.id)
+        ],
+    }
+
+
+@router.get("/share/{token}")
+async def get_shared_trip(
+    token: str,
+    session: Session = Depends(get_session),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
+):
+    condizionale.verifica_condivisione(session, token)
+    payload = carica_viaggio_condiviso(session, token)
+    if payload is None:
+        raise HTTPException(
+            status_code=404, detail="Link di condivisione non valido o scaduto"
+        )
+    return payload
+
+
+@router.post("/join/{token}")
+async def join_trip(
+    token: str,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Unisce un utente a un viaggio tramite token di condivisione.
+    Tenta di far corrispondere l'account corrente con un partecipante 'ospite' creato dall'organizzatore.
+    """
+    try:
+        trip = session.exec(select(Trip).where(Trip.share_token == token)).first()
+        if not trip:
+            raise HTTPException(
+                status_code=404, detail="Link di condivisione non valido o scaduto"
+            )
+
+        # P0-6: un utente di un'altra company non può entrare in un trip BUSINESS
+        check_tenant_for_trip(trip, current_account)
+
+        existing = session.exec(
+            select(Participant).where(
+                Participant.trip_id == trip.id,
+                Participant.account_id == current_account.id,
+            )
+        ).first()
+        if existing:
+            return {
+                "status": "success",
+                "message": "Fai già parte di questo viaggio",
+                "trip_id": trip.id,
+            }
+
+        search_names = [
+            current_account.name.strip().lower(),
+            f"{current_account.name} {current_account.surname}".strip().lower(),
+        ]
+
+        guest_participant = None
+        all_guests = session.exec(
+            select(Participant).where(
+                Participant.trip_id == trip.id, Participant.account_id == None
+            )
+        ).all()
+
+        for g in all_guests:
+            g_name = g.name.strip().lower()
+            if g_name in search_names or any(s in g_name for s in search_names):
+                guest_participant = g
+                break
+
+        if guest_participant:
+            guest_participant.account_id = current_account.id
+            guest_participant.name = f"{current_account.name} {current_account.surname}"
+            session.add(guest_participant)
+            session.commit()
+            return {
+                "status": "success",
+                "message": f"Benvenuto a bordo, {current_account.name}!",
+                "trip_id": trip.id,
+            }
+
+        # Nessun segnaposto con un nome compatibile: si entra comunque.
+        # Prima qui c'era un 403 e chi aveva il link restava fuori se
+        # l'organizzatore non aveva digitato il suo nome *esattamente* durante il
+        # survey. Per le trasferte aziendali significava che un collega non
+        # poteva proprio essere aggiunto, rendendo impossibile la trasferta di
+        # gruppo; per i viaggi fra amici era il punto in cui si perdeva l'invitato.
+        # Chi possiede il link di condivisione e' gia' autorizzato, e per i trip
+        # BUSINESS check_tenant_for_trip sopra ha gia' verificato l'azienda.
+        nuovo_partecipante = Participant(
+            name=f"{current_account.name} {current_account.surname}".strip(),
+            trip_id=trip.id,
+            account_id=current_account.id,
+            is_organizer=False,
+        )
+        session.add(nuovo_partecipante)
+
+        # num_people guida la chiusura della votazione: va tenuto allineato ai
+        # partecipanti reali, altrimenti il consenso non si raggiunge mai.
+        conteggio = session.exec(
+            select(func.count(Participant.id)).where(Participant.trip_id == trip.id)
+        ).one()
+        if (trip.num_people or 0) < conteggio + 1:
+            trip.num_people = conteggio + 1
+            session.add(trip)
+
+        session.commit()
+        return {
+            "status": "success",
+            "message": f"Benvenuto a bordo, {current_account.name}!",
+            "trip_id": trip.id,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] join_trip: {e}")
+        raise HTTPException(
+            status_code=500, detail="Errore durante l'adesione al viaggio."
+        )
+
+
+@router.patch("/{trip_id}")
+async def update_trip(
+    trip_id: int,
+    updates: TripUpdateRequest,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Aggiorna parzialmente i dati di un viaggio"""
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        check = session.exec(
+            select(Participant).where(
+                Participant.trip_id == trip_id,
+                Participant.account_id == current_account.id,
+            )
+        ).first()
+        if not check:
+            raise HTTPException(status_code=403, detail="Non autorizzato")
+        if not check.is_organizer:
+            raise HTTPException(status_code=403, detail="Solo l'organizzatore può modificare il viaggio")
+
+        for key, value in updates.model_dump(exclude_none=True).items():
+            setattr(trip, key, value)
+
+        session.add(trip)
+        session.commit()
+        session.refresh(trip)
+        return trip
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/{trip_id}")
+async def delete_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Elimina un viaggio. Solo l'organizzatore può eliminarlo."""
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    member = check_participant(trip_id, current_account, session)
+    if not member.is_organizer:
+        raise HTTPException(status_code=403, detail="Solo l'organizzatore può eliminare il viaggio")
+
+    # Elimina dati collegati
+    session.exec(delete(Photo).where(Photo.trip_id == trip_id))
+    session.exec(delete(ItineraryItem).where(ItineraryItem.trip_id == trip_id))
+    session.exec(delete(Expense).where(Expense.trip_id == trip_id))
+    # Notification.trip_id e' una FK verso trip.id senza ON DELETE: senza questa
+    # riga ogni viaggio con almeno una notifica (tutti i BUSINESS, che notificano
+    # i manager alla creazione) e' ineliminabile con un IntegrityError.
+    unread_counter.cancella(session, Notification.trip_id == trip_id)
+
+    for proposal in session.exec(select(Proposal).where(Proposal.trip_id == trip_id)).all():
+        session.exec(delete(Vote).where(Vote.proposal_id == proposal.id))
+        session.delete(proposal)
+
+    session.exec(delete(Participant).where(Participant.trip_id == trip_id))
+    session.exec(delete(TripChange).where(TripChange.trip_id == trip_id))
+    session.delete(trip)
+    session.commit()
+
+    logger.info(f"Viaggio {trip_id} eliminato da account {current_account.id}")
+    return {"message": "Viaggio eliminato con successo."}
+
+
+@router.get("/{trip_id}/itinerary", response_model=List[ItineraryItem])
+async def get_itinerary(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
+):
+    """Itinerario del viaggio. Solo per i partecipanti: esponeva tappe con
+    coordinate e orari di qualunque viaggio a chiunque conoscesse l'id."""
+    check_participant(trip_id, current_account, session)
+    condizionale.verifica_viaggio(session, trip_id, "itinerary")
+    return session.exec(
+        select(ItineraryItem)
+        .where(ItineraryItem.trip_id == trip_id)
+        .order_by(ItineraryItem.start_time)
+    ).all()
+
+
+@router.get("/{trip_id}/route-geometry")
+async def get_trip_route_geometry(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """
+    Returns the OSRM-encoded polyline for the itinerary route.
+    Called async from the frontend after the itinerary loads — map never blocks.
+    Falls back gracefully: returns {"polyline": null} on any OSRM failure.
+    """
+    check_participant(trip_id, current_account, session)
+    items = session.exec(
+        select(ItineraryItem)
+        .where(ItineraryItem.trip_id == trip_id)
+        .order_by(ItineraryItem.start_time)
+    ).all()
+
+    waypoints = [
+        (i.latitude, i.longitude)
+        for i in items
+        if i.latitude and i.longitude
+    ]
+
+    if len(waypoints) < 2:
+        return {"polyline": None}
+
+    polyline_str = await get_route_geometry(waypoints, profile="foot")
+    return {"polyline": polyline_str}
+
+
+@router.get("/{trip_id}/participants")
+async def get_participants(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+    condizionale: RichiestaCondizionale = Depends(richiesta_condizionale),
+):
+    """Partecipanti al viaggio. Solo per i partecipanti stessi: l'accesso libero
+    esponeva i nomi dei membri di qualunque viaggio, trasferte aziendali incluse.
+    Gli ospiti con link di condivisione li ricevono da GET /trips/share/{token}."""
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    check_participant(trip_id, current_account, session)
+    condizionale.verifica_viaggio(session, trip_id, "participants")
+    return partecipanti_con_voto(session, trip_id)
+
+
+# NOTA: l'endpoint POST /buy-credits e' stato rimosso.
+# Era un residuo della fase demo ("Simula l'acquisto di crediti"): accettava un
+# `amount` arbitrario e lo sommava ai crediti dell'account senza alcun passaggio
+# da Stripe, permettendo a qualunque utente autenticato di ottenere crediti
+# illimitati. L'unico percorso valido per accreditare crediti e'
+# process_successful_checkout() in backend/routers/payments.py, invocato dal
+# webhook Stripe dopo un pagamento verificato.
+
+
+@router.post("/{trip_id}/unlock")
+async def unlock_trip(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Sblocca un viaggio usando 1 credito"""
+    check_participant(trip_id, current_account, session)
+    try:
+        trip = session.get(Trip, trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        if trip.is_premium:
+            return {"status": "error", "message": "Il viaggio è già premium"}
+
+        if current_account.credits < 1:
+            raise HTTPException(
+                status_code=403,
+                detail="Crediti insufficienti. Acquistane altri nel negozio!",
+            )
+
+        current_account.credits -= 1
+        trip.is_premium = True
+
+        session.add(current_account)
+        session.add(trip)
+        session.commit()
+
+        return {
+            "status": "success",
+            "message": "Viaggio sbloccato!",
+            "credits": current_account.credits,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
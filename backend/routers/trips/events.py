@@ -0,0 +1,127 @@
+"""
+Eventi in destinazione durante le date del viaggio (ricerca Gemini).
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from sqlmodel import Session, select
+
+import logging
+import json
+from datetime import datetime, timezone
+import re
+
+from database import get_session
+from auth import get_current_user
+from models import Trip, Participant, Account
+from services.timing import span
+from routers.trips._common import ai_client, AI_MODEL, check_rate_limit, types
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+@router.get("/{trip_id}/events")
+async def get_trip_events(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    check = session.exec(
+        select(Participant).where(
+            Participant.trip_id == trip_id, Participant.account_id == current_account.id
+        )
+    ).first()
+    if not check:
+        raise HTTPException(
+            status_code=403, detail="Non sei un partecipante di questo viaggio."
+        )
+
+    now_utc = datetime.now(timezone.utc)
+    if trip.events_cache and trip.events_cache_date:
+        diff = (
+            now_utc.replace(tzinfo=None) - trip.events_cache_date.replace(tzinfo=None)
+        ).days
+        if diff < 3:
+            logger.info(
+                f"Cache eventi usata per viaggio {trip_id} (età: {diff} giorni)"
+            )
+            return json.loads(trip.events_cache)
+
+    if not ai_client:
+        raise HTTPException(status_code=503, detail="AI non disponibile.")
+
+    await check_rate_limit(current_account, session)
+
+    destination = trip.real_destination or trip.destination
+    lang = current_account.language.upper()
+
+    prompt = f"""
+    Sei un esperto di viaggi e cultura locale. 
+    Il viaggio è a: {destination}
+    Periodo: dal {trip.start_date} al {trip.end_date}
+    
+    Elenca gli eventi REALI e RILEVANTI che potrebbero impattare questo viaggio:
+    - Festività nazionali o locali (musei chiusi, strade affollate)
+    - Grandi eventi sportivi (partite importanti, maratone)
+    - Festival, concerti, fiere famose
+    - Eventi politici o istituzionali (visite di stato, manifestazioni)
+    - Periodi di alta stagione turistica con zone molto affollate
+    - Lavori stradali o chiusure di attrazioni note
+    
+    Per ogni evento indica l'impatto pratico sul viaggiatore.
+    Se non sei sicuro di un evento specifico per quelle date, non inventarlo.
+    
+    RESTITUISCI SOLO JSON puro senza markdown:
+    {{
+        "events": [
+            {{
+                "title": "Nome evento",
+                "type": "festival|concert|sport|political|religious|market|exhibition|disruption|holiday|other",
+                "dates": "es. 15-17 agosto",
+                "impact": "high|medium|low",
+                "description": "Descrizione e impatto pratico",
+                "affected_places": ["luogo1", "luogo2"],
+                "travel_tip": "Consiglio pratico"
+            }}
+        ]
+    }}
+    Massimo 8 eventi. LINGUA: {lang}.
+    """
+
+    try:
+        with span("gemini"):
+            response = await ai_client.aio.models.generate_content(
+                model=AI_MODEL,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    tools=[types.Tool(google_search=types.GoogleSearch())]
+                ),
+            )
+        raw = response.text.strip().replace("```json", "").replace("```", "")
+        json_match = re.search(r"\{.*\}", raw, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
+        else:
+            logger.warning(f"Nessun JSON trovato nella risposta eventi: {raw[:200]}")
+            data = {"events": []}
+
+        trip.events_cache = json.dumps(data)
+        trip.events_cache_date = now_utc
+        session.add(trip)
+        session.commit()
+
+        logger.info(f"Eventi generati e cachati per viaggio {trip_id}")
+        return data
+
+    except json.JSONDecodeError as e:
+        logger.error(f"Errore parsing JSON eventi viaggio {trip_id}: {e}")
+        return {"events": []}
+    except Exception as e:
+        logger.error(f"Errore generazione eventi viaggio {trip_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
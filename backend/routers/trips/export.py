@@ -0,0 +1,240 @@
+"""
+Export PDF del viaggio e della nota spese.
+
+La resa gira fuori dal loop in services/pdf_render (pool di processi con
+limite di coda): l'endpoint raccoglie i dati, li passa come istantanee e
+aspetta il PDF (mode=sync) o risponde subito con un job (mode=job). Dove i
+job sono spenti (pdf_render.PDF_JOBS, default su Vercel) mode=job aspetta
+il PDF come sync: meglio che un id che nessun'altra istanza conosce.
+fpdf e pdf_service si caricano solo alla prima resa, non sul cold start.
+
+I PDF resi restano in services/pdf_cache, con chiave sull'hash dei dati:
+un download ripetuto senza modifiche non rifa' la resa e arriva come file
+con ETag (304 con If-None-Match) e Range. Un PDF gia' in cache arriva
+subito con 200 anche con mode=job: non c'e' niente da aspettare.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+from sqlmodel import Session, select
+
+from database import get_read_session
+from auth import get_current_user
+from models import Trip, Account, Company, Expense
+from utils.access import check_participant
+from routers.trips._common import require_premium
+from services import pdf_cache, pdf_render
+from utils.conditional import etag_corrisponde
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+def _risposta_pdf(pdf: bytes, nome_file: str) -> Response:
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{nome_file}"'},
+    )
+
+
+class _FileDaCache(FileResponse):
+    """FileResponse sul link di invio (pdf_cache.collega), cancellato a fine
+    risposta anche se il client chiude prima."""
+
+    def __init__(self, voce: pdf_cache.Voce, **kwargs):
+        super().__init__(voce.path, stat_result=voce.stat, **kwargs)
+        self.voce = voce
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await asyncio.to_thread(pdf_cache.rilascia, self.voce)
+
+
+async def _risposta_cache(voce: pdf_cache.Voce, nome_file: str, request: Request) -> Optional[Response]:
+    """Il file in cache: 304 se il client ce l'ha gia', Range e If-Range da
+    FileResponse. None se il file e' sparito dopo la ricerca (invalidato o
+    uscito per LRU): il chiamante rifa' la resa."""
+    headers = {"ETag": voce.etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_corrisponde(if_none_match, voce.etag):
+        return Response(status_code=304, headers=headers)
+    invio = await asyncio.to_thread(pdf_cache.collega, voce)
+    if invio is None:
+        return None
+    headers["Content-Disposition"] = f'attachment; filename="{nome_file}"'
+    return _FileDaCache(invio, media_type="application/pdf", headers=headers)
+
+
+def _salva_a_fine_job(chiave: str, future: asyncio.Future):
+    if future.cancelled() or future.exception():
+        return
+    asyncio.get_running_loop().run_in_executor(None, pdf_cache.salva, chiave, future.result())
+
+
+async def _servi_pdf(
+    tipo: str, dati: dict, trip_id: int, account: Account, nome_file: str, mode: str, request: Request,
+):
+    """Dalla cache se c'e'. Altrimenti, modalita' sync: aspetta il PDF dal pool;
+    modalita' job: 202 con l'id da interrogare su /trips/{id}/pdf-jobs/{job_id}."""
+    chiave = pdf_cache.chiave(trip_id, tipo, dati)
+    # Lock della cache e disco (alla prima ricerca anche la scansione della
+    # cartella): fuori dal loop, come salva().
+    voce = await asyncio.to_thread(pdf_cache.cerca, chiave)
+    risposta = await _risposta_cache(voce, nome_file, request) if voce is not None else None
+    if risposta is not None:
+        return risposta
+    try:
+        if mode == "job" and pdf_render.PDF_JOBS:
+            job = pdf_render.avvia_job(tipo, dati, trip_id, account.id, nome_file, chiave=chiave)
+            job.future.add_done_callback(lambda f: _salva_a_fine_job(chiave, f))
+            return JSONResponse(status_code=202, content={
+                "job_id": job.id,
+                "status": job.stato,
+                "status_url": f"/trips/{trip_id}/pdf-jobs/{job.id}",
+            })
+        pdf = await pdf_render.attendi(tipo, dati)
+    except pdf_render.CodaPiena:
+        raise HTTPException(
+            status_code=503,
+            detail="Troppi PDF in preparazione, riprova tra qualche secondo.",
+            headers={"Retry-After": "5"},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Il PDF richiede troppo tempo: riprova con mode=job.",
+        )
+    voce = await asyncio.to_thread(pdf_cache.salva, chiave, pdf)
+    risposta = await _risposta_cache(voce, nome_file, request) if voce is not None else None
+    return risposta or _risposta_pdf(pdf, nome_file)
+
+
+def _dati_nota_spese(trip_id: int, session: Session, current_account: Account) -> tuple:
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    check_participant(trip_id, current_account, session)
+
+    company = None
+    if current_account.company_id:
+        company = session.get(Company, current_account.company_id)
+
+    expenses = session.exec(
+        select(Expense)
+        .where(Expense.trip_id == trip_id)
+        .order_by(Expense.date)
+    ).all()
+    return pdf_render.dati_nota_spese(trip, current_account, company, expenses)
+
+
+@router.get("/{trip_id}/export-pdf")
+async def export_trip_pdf(
+    trip_id: int,
+    request: Request,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+    session: Session = Depends(get_read_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Esporta l'itinerario e le spese del viaggio in formato PDF"""
+    trip = session.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+    # require_premium e' un paywall, NON un controllo di ownership: per i trip
+    # BUSINESS fa return immediato, quindi da solo lasciava scaricare il PDF
+    # completo (itinerario, spese, partecipanti) di qualunque trasferta aziendale.
+    check_participant(trip_id, current_account, session)
+    require_premium(current_account, trip)
+
+    dati = pdf_render.dati_viaggio(trip, trip.itinerary_items, trip.expenses, current_account.language)
+    return await _servi_pdf("trip", dati, trip_id, current_account, f"SplitPlan_{trip_id}.pdf", mode, request)
+
+
+@router.get("/{trip_id}/export-nota-spese")
+async def export_nota_spese(
+    trip_id: int,
+    request: Request,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+    session: Session = Depends(get_read_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """
+    Genera la Nota Spese Ufficiale in PDF (B2B).
+    Include dati dipendente/azienda, dettagli trasferta, tabella spese,
+    e footer con l'analisi previsionale AI se disponibile.
+    """
+    dati = _dati_nota_spese(trip_id, session, current_account)
+    return await _servi_pdf(
+        "nota_spese", dati, trip_id, current_account, f"NotaSpese_SplitPlan_{trip_id}.pdf", mode, request,
+    )
+
+
+@router.get("/{trip_id}/expense-report/pdf")
+async def export_expense_report_pdf(
+    trip_id: int,
+    request: Request,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+    session: Session = Depends(get_read_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """
+    Genera la Nota Spese Ufficiale PDF per un viaggio.
+    Accessibile solo dai partecipanti del viaggio.
+    """
+    dati = _dati_nota_spese(trip_id, session, current_account)
+    return await _servi_pdf(
+        "nota_spese", dati, trip_id, current_account, f"nota-spese-{trip_id}.pdf", mode, request,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Job PDF (mode=job)
+# ---------------------------------------------------------------------------
+
+def _job_o_404(trip_id: int, job_id: str, current_account: Account) -> pdf_render.Job:
+    job = pdf_render.job(job_id, trip_id, current_account.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job PDF non trovato o scaduto.")
+    return job
+
+
+@router.get("/{trip_id}/pdf-jobs/{job_id}")
+async def pdf_job_status(
+    trip_id: int,
+    job_id: str,
+    current_account: Account = Depends(get_current_user),
+):
+    """Stato di un PDF avviato con mode=job: running, done o failed."""
+    job = _job_o_404(trip_id, job_id, current_account)
+    risposta = {"job_id": job.id, "status": job.stato}
+    if job.stato == "done":
+        risposta["download_url"] = f"/trips/{trip_id}/pdf-jobs/{job.id}/download"
+    return risposta
+
+
+@router.get("/{trip_id}/pdf-jobs/{job_id}/download")
+async def pdf_job_download(
+    trip_id: int,
+    job_id: str,
+    request: Request,
+    current_account: Account = Depends(get_current_user),
+):
+    job = _job_o_404(trip_id, job_id, current_account)
+    if job.stato == "running":
+        raise HTTPException(status_code=409, detail="Il PDF non e' ancora pronto.")
+    if job.stato == "failed":
+        raise HTTPException(status_code=500, detail="Generazione del PDF non riuscita.")
+    voce = await asyncio.to_thread(pdf_cache.cerca, job.chiave) if job.chiave else None
+    risposta = await _risposta_cache(voce, job.nome_file, request) if voce is not None else None
+    # Appena finito: la scrittura in cache puo' essere ancora in corso.
+    return risposta or _risposta_pdf(job.pdf, job.nome_file)
@@ -0,0 +1,106 @@
+"""
+Sincronizzazione incrementale dei dati di un viaggio per i client offline.
+
+GET /trips/{trip_id}/changes?since=<cursore> restituisce solo le righe di
+itinerario, spese, partecipanti, foto e voti inserite, modificate o
+cancellate dopo il cursore, lette dal registro TripChange
+(services/trip_changes). Senza cursore, o con un cursore piu' vecchio del
+registro conservato, risponde con "reset": true e lo stato completo: il
+client svuota la copia locale e riparte dal cursore restituito.
+"""
+
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session, func, select
+
+from auth import get_current_user
+from database import get_read_session
+from models import Account, Proposal, TripChange, Vote
+from services.trip_changes import AREE_REGISTRO
+from utils.access import check_participant
+from utils.pagination import codifica_cursore, decodifica_cursore
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+def _righe(session: Session, trip_id: int, area: str, ids: Optional[List[int]] = None) -> List[dict]:
+    """Righe correnti dell'area (tutte o solo `ids`), come dict serializzabili."""
+    modello = AREE_REGISTRO[area]
+    if area == "votes":
+        query = select(Vote).join(Proposal, Vote.proposal_id == Proposal.id).where(Proposal.trip_id == trip_id)
+    else:
+        query = select(modello).where(modello.trip_id == trip_id)
+    if ids is not None:
+        query = query.where(modello.id.in_(ids))
+    return [r.model_dump(mode="json") for r in session.exec(query.order_by(modello.id)).all()]
+
+
+def _istantanea(session: Session, trip_id: int) -> dict:
+    # Il cursore si legge prima delle righe: una modifica concorrente alla
+    # lettura viene riconsegnata al giro dopo (gli upsert sono idempotenti).
+    ultimo = session.exec(
+        select(func.max(TripChange.id)).where(TripChange.trip_id == trip_id)
+    ).one() or 0
+    return {
+        "reset": True,
+        "cursor": codifica_cursore([ultimo]),
+        "has_more": False,
+        "changes": {
+            area: {"upserted": _righe(session, trip_id, area), "deleted": []}
+            for area in AREE_REGISTRO
+        },
+    }
+
+
+@router.get("/{trip_id}/changes")
+async def get_trip_changes(
+    trip_id: int,
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=2000),
+    session: Session = Depends(get_read_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Modifiche ai dati del viaggio dopo il cursore `since`."""
+    check_participant(trip_id, current_account, session)
+
+    valori = decodifica_cursore(since, 1)
+    if valori is None:
+        return _istantanea(session, trip_id)
+    dopo = int(valori[0]) if isinstance(valori[0], int) else -1
+    # Il registro viene potato dal fondo: se manca qualcosa dopo il cursore
+    # il client deve ripartire da zero.
+    primo = session.exec(select(func.min(TripChange.id))).one()
+    if dopo < 0 or (primo is not None and dopo < primo - 1):
+        return _istantanea(session, trip_id)
+
+    voci = session.exec(
+        select(TripChange.id, TripChange.entity, TripChange.entity_id, TripChange.op)
+        .where(TripChange.trip_id == trip_id, TripChange.id > dopo)
+        .order_by(TripChange.id)
+        .limit(limit + 1)
+    ).all()
+    altre = len(voci) > limit
+    voci = voci[:limit]
+
+    # Piu' modifiche della stessa riga: conta l'ultima.
+    ultime: Dict[str, Dict[int, str]] = {}
+    for _, area, entity_id, op in voci:
+        ultime.setdefault(area, {})[entity_id] = op
+
+    modifiche = {}
+    for area, operazioni in ultime.items():
+        if area not in AREE_REGISTRO:
+            continue
+        aggiornate = [i for i, op in operazioni.items() if op == "upsert"]
+        modifiche[area] = {
+            "upserted": _righe(session, trip_id, area, aggiornate) if aggiornate else [],
+            "deleted": sorted(i for i, op in operazioni.items() if op == "delete"),
+        }
+
+    return {
+        "reset": False,
+        "cursor": codifica_cursore([voci[-1][0] if voci else dopo]),
+        "has_more": altre,
+        "changes": modifiche,
+    }
@@ -0,0 +1,131 @@
+"""
+Voto delle proposte di viaggio e simulazione dei voti.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from sqlmodel import Session, select
+from typing import Optional
+
+import logging
+
+from database import get_session
+from auth import get_current_user
+from models import Trip, Participant, Proposal, Account
+from services.vote_tally import chiudi_votazione, registra_voto
+from utils.access import check_participant, check_tenant_for_trip
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/trips", tags=["trips"])
+
+
+@router.post("/vote/{proposal_id}")
+async def vote_proposal(
+    proposal_id: int,
+    score: int,
+    user_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+    current_account: Optional[Account] = Depends(get_current_user, use_cache=True),
+):
+    """Registra il voto (Demo mode con user_id o Secure con token)"""
+    try:
+        proposal = session.get(Proposal, proposal_id)
+        if not proposal:
+            raise HTTPException(status_code=404, detail="Proposta non trovata")
+
+        # P0-6: enforcement tenant sul trip prima del voto
+        trip_for_vote = session.get(Trip, proposal.trip_id)
+        if trip_for_vote:
+            check_tenant_for_trip(trip_for_vote, current_account)
+
+        participant = None
+        if user_id and user_id > 0:
+            participant = session.get(Participant, user_id)
+            # Il participant passato deve appartenere al trip della proposal
+            if participant and participant.trip_id != proposal.trip_id:
+                raise HTTPException(status_code=403, detail="Partecipante non valido")
+        else:
+            participant = session.exec(
+                select(Participant).where(
+                    Participant.trip_id == proposal.trip_id,
+                    Participant.account_id == current_account.id,
+                )
+            ).first()
+
+        if not participant:
+            raise HTTPException(status_code=403, detail="Partecipante non trovato")
+
+        registra_voto(session, proposal, participant.id, score)
+
+        trip = session.get(Trip, proposal.trip_id)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Viaggio non trovato")
+
+        total_voters = trip.voters_count
+        logger.info(f"[DEBUG] Voti: {total_voters}/{trip.num_people}")
+
+        # Solo la richiesta che chiude la votazione accoda la mail di conferma.
+        vincitrice = chiudi_votazione(session, trip)
+        if vincitrice:
+            logger.info(
+                f"[SUCCESS] Consenso raggiunto! Vincitore: {vincitrice.destination}"
+            )
+
+        return {
+            "status": "voted",
+            "current_voters": total_voters,
+            "required": trip.num_people,
+            "trip_status": trip.status,
+            "votes_count": total_voters,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"[ERROR] vote_proposal: {e}")
+        raise HTTPException(status_code=500, detail="Errore interno del server. Riprova.")
+
+
+@router.post("/{trip_id}/simulate-votes")
+async def simulate_votes(
+    trip_id: int,
+    session: Session = Depends(get_session),
+    current_account: Account = Depends(get_current_user),
+):
+    """Simula i voti mancanti per chiudere il viaggio in DEMO"""
+    # Vota al posto di tutti i partecipanti e puo' chiudere la votazione
+    # decidendo la destinazione: riservato all'organizzatore del viaggio.
+    member = check_participant(trip_id, current_account, session)
+    if not member.is_organizer:
+        raise HTTPException(
+            status_code=403,
+            detail="Solo l'organizzatore può simulare i voti mancanti.",
+        )
+    try:
+        trip = session.get(Trip, trip_id)
+        proposals = session.exec(
+            select(Proposal).where(Proposal.trip_id == trip_id)
+        ).all()
+        participants = session.exec(
+            select(Participant).where(Participant.trip_id == trip_id)
+        ).all()
+
+        if not proposals:
+            return {"error": "Nessuna proposta"}
+
+        for p in participants:
+            if not p.has_voted:
+                await vote_proposal(
+                    proposals[0].id,
+                    1,
+                    session=session,
+                    current_account=current_account,
+                    user_id=p.id,
+                )
+
+        return {"status": "votes_simulated", "voters": len(participants)}
+    except Exception as e:
+        logger.error(f"[ERROR] simulate_votes: {e}")
+        return {"status": "error", "message": "Errore durante la simulazione dei voti."}
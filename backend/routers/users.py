@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 from fastapi import APIRouter, Body, Cookie, Depends, HTTPException, Request, Response
 from fastapi_mail import FastMail, MessageSchema, MessageType
 from pydantic import BaseModel
-from sqlalchemy import text, func
+from sqlalchemy import delete, text, func, update
 from sqlmodel import Session, select
 
 from admin_auth import verify_admin_token
@@ -27,7 +27,8 @@ from email_templates import (
     reset_password_email,
     verification_email,
 )
-from models import Account, Company, Notification, Participant, RefreshToken, Trip
+from models import Account, Company, InviteBatch, Notification, NotificationArchive, Participant, RefreshToken, Trip
+from services import quota_service
 from services.redis_service import check_rate_limit
 from utils.email_utils import get_smtp_config
 
@@ -85,7 +86,7 @@ def _clear_refresh_cookie(response: Response) -> None:
 # In ambiente serverless (Vercel) un rate limiter in-memory è inutile perché
 # ogni invocazione può girare su un worker diverso. Lo stato viene quindi
 # mantenuto in Redis (Upstash) tramite `services.redis_service`.
-# Fail-open: se Redis è down l'autenticazione resta disponibile.
+# Se Redis è down decide un limiter in-process (per istanza, più permissivo).
 
 _RATE_LIMITS = {
     "login":           {"max": 10, "window": 900},   # 10 / 15 min
@@ -100,12 +101,17 @@ async def _check_auth_rate_limit(endpoint: str, ip: str):
     if not cfg:
         return
     key = f"rate_limit:{endpoint}:{ip}"
-    exceeded = await check_rate_limit(key, cfg["max"], cfg["window"])
-    if exceeded:
+    esito = await check_rate_limit(key, cfg["max"], cfg["window"], endpoint)
+    if esito.superato:
+        minuti = max(1, -(-esito.retry_after_s // 60))
         raise HTTPException(
             status_code=429,
-            detail=f"Troppi tentativi. Riprova tra {cfg['window'] // 60} minuti.",
-            headers={"Retry-After": str(cfg["window"])},
+            detail=f"Troppi tentativi. Riprova tra {minuti} minuti.",
+            headers={
+                "Retry-After": str(max(1, esito.retry_after_s)),
+                "X-RateLimit-Remaining": str(esito.rimanenti),
+                "X-RateLimit-Reset": str(esito.reset_s),
+            },
         )
 
 
@@ -452,6 +458,14 @@ async def login(
 @router.get("/me", response_model=AccountResponse)
 async def get_me(current_account: Account = Depends(get_current_user)):
     """Restituisce i dati dell'utente autenticato tramite JWT."""
+    # Con Redis l'uso AI di oggi e' nel contatore; la colonna arriva col write-back.
+    uso_oggi = await quota_service.utilizzo_giornaliero(current_account)
+    if uso_oggi is not None:
+        risposta = AccountResponse.model_validate(current_account, from_attributes=True)
+        return risposta.model_copy(update={
+            "daily_ai_usage": uso_oggi,
+            "last_usage_reset": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        })
     return current_account
 
 
@@ -740,7 +754,7 @@ async def delete_account(
       gruppo dove altri utenti hanno ancora interesse legittimo.
     - `events_cache` sui trip interessati viene invalidato perché può
       contenere il nome dell'utente in chiaro (rigenerato al prossimo accesso).
-    - `Notification` e `RefreshToken` vengono eliminate (dati personali,
+    - `Notification` (anche archiviate) e `RefreshToken` vengono eliminate (dati personali,
       nessun valore storico).
     - L'Account viene cancellato per ultimo, tutto nella stessa transazione.
     """
@@ -774,6 +788,9 @@ async def delete_account(
     ).all()
     for n in notifications:
         session.delete(n)
+    session.exec(delete(NotificationArchive).where(NotificationArchive.account_id == account_id))
+    # Gli inviti massivi restano all'azienda, senza autore.
+    session.exec(update(InviteBatch).where(InviteBatch.created_by == account_id).values(created_by=None))
 
     # 4. Cancella refresh token (rimossi anche via FK ON DELETE CASCADE,
     #    ma lo facciamo esplicito per coerenza/leggibilità).
@@ -0,0 +1,456 @@
+"""
+SplitPlan AI — Email in uscita
+===============================
+Gli endpoint non parlano piu' con SMTP: accoda() scrive una riga in
+email_outbox nella stessa transazione della scrittura che motiva la mail
+(voto che chiude la votazione, acquisto, invito, approvazione) e la
+richiesta risponde subito. Se la transazione viene annullata la mail sparisce
+con lei; dopo il COMMIT il worker viene svegliato.
+
+Il worker (ciclo_outbox, avviato nel lifespan) prende in carico le righe
+scadute a blocchi con un UPDATE condizionato, cosi' piu' worker non inviano
+la stessa mail, e le spedisce su un gruppo di al massimo EMAIL_SMTP_CONNECTIONS
+connessioni SMTP in parallelo (ognuna invia una mail alla volta, quindi e'
+anche il tetto al ritmo verso il server). Le connessioni restano aperte tra
+un blocco e l'altro e si chiudono dopo EMAIL_SMTP_IDLE_SECONDS di
+inattivita'. Esiti:
+
+- inviata: SENT;
+- errore temporaneo (4xx, connessione caduta): nuovo tentativo dopo
+  EMAIL_OUTBOX_BACKOFF_SECONDS * 2^(tentativi-1), fino a
+  EMAIL_OUTBOX_MAX_ATTEMPTS;
+- errore permanente (5xx, destinatario rifiutato) o tentativi esauriti: FAILED.
+
+Una riga rimasta in SENDING (worker morto a meta' blocco) torna disponibile
+dopo EMAIL_OUTBOX_CLAIM_TIMEOUT secondi: la consegna e' almeno una volta.
+
+Dove l'istanza non resta viva tra le richieste (Vercel) non c'e' worker:
+SvuotaDopoRispostaMiddleware, finita la risposta di una richiesta che ha
+accodato email, fa un giro di elabora_coda nella stessa invocazione
+(EMAIL_OUTBOX_DRAIN_INLINE, attivo di default su Vercel). Quello che resta
+(blocchi oltre EMAIL_OUTBOX_BATCH, tentativi in backoff) lo prende il cron di
+vercel.json su GET /cron/email-outbox; a mano c'e' POST /admin/email-outbox/flush.
+Il cron e' ogni minuto e prende un blocco per giro: un invio massivo da 5000
+indirizzi (routers/companies) con EMAIL_OUTBOX_BATCH=50 si svuota in circa
+100 minuti. Per farlo prima si alza EMAIL_OUTBOX_BATCH, entro il timeout
+della funzione.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiosmtplib
+from sqlalchemy import and_, bindparam, event, insert, or_, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from models import EmailOutbox, InviteBatch
+from services.metrics import counter
+from utils.email_utils import get_smtp_config
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_BATCH = int(os.getenv("EMAIL_OUTBOX_BATCH", "50"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_BACKOFF_SECONDS = float(os.getenv("EMAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "15"))
+EMAIL_OUTBOX_CLAIM_TIMEOUT = int(os.getenv("EMAIL_OUTBOX_CLAIM_TIMEOUT", "600"))
+EMAIL_SMTP_IDLE_SECONDS = float(os.getenv("EMAIL_SMTP_IDLE_SECONDS", "60"))
+EMAIL_SMTP_CONNECTIONS = max(1, int(os.getenv("EMAIL_SMTP_CONNECTIONS", "4")))
+_BACKOFF_MAX_SECONDS = 3600
+
+EMAIL_OUTBOX_DRAIN_INLINE = os.getenv(
+    "EMAIL_OUTBOX_DRAIN_INLINE", "1" if os.getenv("VERCEL") else "0",
+).lower() in ("1", "true", "yes")
+_CHIAVE_INFO = "email_outbox"
+
+_ESITI = counter(
+    "email_outbox_sends_total",
+    "Invii dalla coda email per esito (sent, retry, failed)",
+    ["result"],
+)
+_CONNESSIONI = counter("email_smtp_connections_total", "Connessioni SMTP aperte dal worker")
+
+
+def accoda(
+    session: Session,
+    destinatario: str,
+    oggetto: str,
+    html: str,
+    tipo: str = "generic",
+    batch_id: Optional[int] = None,
+) -> EmailOutbox:
+    """Accoda una mail HTML gia' renderizzata. Non fa commit: parte con la
+    transazione del chiamante."""
+    voce = EmailOutbox(recipient=destinatario, subject=oggetto, html=html, kind=tipo, batch_id=batch_id)
+    session.add(voce)
+    session.info[_CHIAVE_INFO] = True
+    return voce
+
+
+def accoda_molti(
+    session: Session,
+    destinatari: Iterable[str],
+    oggetto: Optional[str],
+    html: Optional[str],
+    tipo: str = "generic",
+    batch_id: Optional[int] = None,
+) -> int:
+    """Stessa mail a molti destinatari con un solo INSERT multi-riga (inviti
+    massivi: migliaia di righe senza passare dagli oggetti ORM). Con batch_id
+    oggetto e html possono essere None: si leggono dall'InviteBatch all'invio,
+    invece di ripetere lo stesso HTML su ogni riga."""
+    if html is None and batch_id is None:
+        raise ValueError("accoda_molti: senza batch_id servono oggetto e html")
+    adesso = datetime.now(timezone.utc)
+    righe = [
+        {"recipient": d, "subject": oggetto, "html": html, "kind": tipo, "status": "PENDING",
+         "attempts": 0, "next_attempt_at": adesso, "created_at": adesso, "batch_id": batch_id}
+        for d in destinatari
+    ]
+    if righe:
+        session.execute(insert(EmailOutbox), righe)
+        session.info[_CHIAVE_INFO] = True
+    return len(righe)
+
+
+# ---------------------------------------------------------------------------
+# Risveglio del worker dopo il COMMIT
+# ---------------------------------------------------------------------------
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_sveglia: Optional[asyncio.Event] = None
+
+
+def sveglia() -> None:
+    """Fa partire subito un giro del worker (chiamabile da qualunque thread)."""
+    if _loop is not None and _sveglia is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_sveglia.set)
+
+
+# Richiesta in corso (SvuotaDopoRispostaMiddleware): un dict condiviso, cosi'
+# lo marca anche un COMMIT fatto nel threadpool, che lavora su una copia del
+# contesto.
+_richiesta: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("email_outbox_richiesta", default=None)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _dopo_commit(session):
+    if session.info.pop(_CHIAVE_INFO, False):
+        sveglia()
+        richiesta = _richiesta.get()
+        if richiesta is not None:
+            richiesta["accodate"] = True
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _scarta(session):
+    session.info.pop(_CHIAVE_INFO, None)
+
+
+# ---------------------------------------------------------------------------
+# Connessione SMTP
+# ---------------------------------------------------------------------------
+
+class ConnessioneSmtp:
+    """Connessione SMTP riusata tra un invio e l'altro, riaperta se il server
+    la chiude."""
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.mittente = (
+            formataddr((conf.MAIL_FROM_NAME, conf.MAIL_FROM)) if conf.MAIL_FROM_NAME else conf.MAIL_FROM
+        )
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+
+    async def _apri(self):
+        await self.chiudi()
+        conf = self.conf
+        self._smtp = aiosmtplib.SMTP(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            username=conf.MAIL_USERNAME if conf.USE_CREDENTIALS else None,
+            password=conf.MAIL_PASSWORD.get_secret_value() if conf.USE_CREDENTIALS else None,
+            use_tls=conf.MAIL_SSL_TLS,
+            start_tls=conf.MAIL_STARTTLS,
+            validate_certs=conf.VALIDATE_CERTS,
+            timeout=conf.TIMEOUT,
+        )
+        await self._smtp.connect()
+        _CONNESSIONI.inc()
+
+    async def invia(self, messaggio: EmailMessage):
+        if self._smtp is None or not self._smtp.is_connected:
+            await self._apri()
+        try:
+            await self._smtp.send_message(messaggio)
+        except aiosmtplib.SMTPServerDisconnected:
+            # Il server chiude le connessioni inattive: un secondo tentativo su
+            # una connessione nuova.
+            await self._apri()
+            await self._smtp.send_message(messaggio)
+
+    async def chiudi(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.is_connected:
+                    await self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def messaggio(self, destinatario: str, oggetto: str, html: str) -> EmailMessage:
+        messaggio = EmailMessage()
+        messaggio["From"] = self.mittente
+        messaggio["To"] = destinatario
+        messaggio["Subject"] = oggetto
+        messaggio["Message-ID"] = make_msgid(domain=self.conf.MAIL_FROM.split("@")[-1])
+        messaggio.set_content(html, subtype="html")
+        return messaggio
+
+
+def _permanente(errore: Exception) -> bool:
+    if isinstance(errore, aiosmtplib.SMTPRecipientsRefused):
+        return all(e.code >= 500 for e in errore.recipients)
+    if isinstance(errore, aiosmtplib.SMTPResponseException):
+        return errore.code >= 500
+    return False
+
+
+def _ritardo(tentativi: int) -> timedelta:
+    secondi = min(EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (tentativi - 1), _BACKOFF_MAX_SECONDS)
+    # Un po' di jitter: le mail fallite insieme non riprovano tutte insieme.
+    return timedelta(seconds=secondi * random.uniform(1.0, 1.2))
+
+
+# ---------------------------------------------------------------------------
+# Un giro del worker
+# ---------------------------------------------------------------------------
+
+def _disponibili(adesso: datetime):
+    return or_(
+        and_(EmailOutbox.status == "PENDING", EmailOutbox.next_attempt_at <= adesso),
+        and_(
+            EmailOutbox.status == "SENDING",
+            EmailOutbox.claimed_at < adesso - timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT),
+        ),
+    )
+
+
+def _prendi_in_carico(session: Session, limite: int) -> List[EmailOutbox]:
+    adesso = datetime.now(timezone.utc)
+    candidati = (
+        select(EmailOutbox.id)
+        .where(_disponibili(adesso))
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limite)
+        .with_for_update(skip_locked=True)
+    )
+    # La condizione si ripete nell'UPDATE: un altro worker che ha letto gli
+    # stessi id trova le righe gia' in SENDING e non le prende.
+    ids = session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidati), _disponibili(adesso))
+        .values(status="SENDING", claimed_at=adesso)
+        .returning(EmailOutbox.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    session.commit()
+    if not ids:
+        return []
+    return list(session.exec(select(EmailOutbox).where(EmailOutbox.id.in_(ids)).order_by(EmailOutbox.id)).all())
+
+
+def _contenuti(session: Session, voci: List[EmailOutbox]) -> Dict[int, Tuple[str, str]]:
+    """(oggetto, html) di ogni voce: dalla riga, o una sola lettura per
+    InviteBatch per le righe di un invio massivo. Gli oggetti ORM non si
+    toccano: il COMMIT degli esiti riscriverebbe l'HTML su ogni riga."""
+    batch_ids = {v.batch_id for v in voci if v.html is None and v.batch_id is not None}
+    batch = {}
+    if batch_ids:
+        batch = {
+            r.id: (r.subject, r.html)
+            for r in session.exec(
+                select(InviteBatch.id, InviteBatch.subject, InviteBatch.html).where(InviteBatch.id.in_(batch_ids))
+            )
+        }
+    return {
+        v.id: (v.subject, v.html) if v.html is not None else batch.get(v.batch_id, (None, None))
+        for v in voci
+    }
+
+
+def _registra_esiti(session: Session, esiti: List[dict]):
+    if not esiti:
+        return
+    tabella = EmailOutbox.__table__
+    session.connection().execute(
+        update(tabella)
+        .where(tabella.c.id == bindparam("b_id"))
+        .values(
+            status=bindparam("b_status"),
+            attempts=bindparam("b_attempts"),
+            next_attempt_at=bindparam("b_next"),
+            last_error=bindparam("b_error"),
+            sent_at=bindparam("b_sent"),
+            claimed_at=None,
+        ),
+        esiti,
+    )
+    session.commit()
+
+
+async def _invia_voce(connessione: ConnessioneSmtp, voce: EmailOutbox, oggetto: str, html: str) -> dict:
+    adesso = datetime.now(timezone.utc)
+    tentativi = voce.attempts + 1
+    riga = {"b_id": voce.id, "b_attempts": tentativi, "b_next": voce.next_attempt_at,
+            "b_error": None, "b_sent": None}
+    try:
+        if html is None:
+            raise ValueError("contenuto dell'email non trovato")
+        await connessione.invia(connessione.messaggio(voce.recipient, oggetto, html))
+        riga["b_status"] = "SENT"
+        riga["b_sent"] = adesso
+    except Exception as e:
+        riga["b_error"] = str(e)[:500]
+        if _permanente(e) or tentativi >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            riga["b_status"] = "FAILED"
+            logger.error(f"[Outbox] Email {voce.id} a {voce.recipient} scartata: {e}")
+        else:
+            riga["b_status"] = "PENDING"
+            riga["b_next"] = adesso + _ritardo(tentativi)
+            logger.warning(f"[Outbox] Email {voce.id} a {voce.recipient}, nuovo tentativo: {e}")
+    return riga
+
+
+def _connessioni_smtp(conf) -> List[ConnessioneSmtp]:
+    # Si aprono al primo invio: un blocco piccolo ne usa solo quante servono.
+    return [ConnessioneSmtp(conf) for _ in range(EMAIL_SMTP_CONNECTIONS)]
+
+
+async def elabora_coda(
+    session: Session,
+    connessioni: Optional[List[ConnessioneSmtp]] = None,
+    limite: int = EMAIL_OUTBOX_BATCH,
+) -> dict:
+    """
+    Un blocco: prende in carico fino a `limite` email scadute, le distribuisce
+    sulle connessioni (ognuna invia una mail alla volta dalla coda comune) e
+    registra gli esiti con un solo UPDATE. Senza `connessioni` le apre e le
+    chiude alla fine (uso da cron).
+    """
+    esito = {"claimed": 0, "sent": 0, "retry": 0, "failed": 0}
+    proprie = connessioni is None
+    if proprie:
+        _, _, conf = get_smtp_config()
+        if not conf:
+            logger.warning("[Outbox] SMTP non configurato: email lasciate in coda")
+            return esito
+        connessioni = _connessioni_smtp(conf)
+
+    voci = _prendi_in_carico(session, limite)
+    esito["claimed"] = len(voci)
+    contenuti = _contenuti(session, voci)
+    coda: asyncio.Queue = asyncio.Queue()
+    for voce in voci:
+        coda.put_nowait(voce)
+    esiti = []
+
+    async def invia_da(connessione: ConnessioneSmtp):
+        while not coda.empty():
+            voce = coda.get_nowait()
+            riga = await _invia_voce(connessione, voce, *contenuti[voce.id])
+            chiave = {"SENT": "sent", "PENDING": "retry", "FAILED": "failed"}[riga["b_status"]]
+            esito[chiave] += 1
+            _ESITI.inc(result=chiave)
+            esiti.append(riga)
+
+    try:
+        await asyncio.gather(*(invia_da(c) for c in connessioni[:len(voci)]))
+    finally:
+        _registra_esiti(session, esiti)
+        if proprie:
+            await asyncio.gather(*(c.chiudi() for c in connessioni))
+
+    if voci:
+        logger.info(f"[Outbox] Blocco: {esito['sent']} inviate, {esito['retry']} da riprovare, {esito['failed']} fallite")
+    return esito
+
+
+def _nuova_sessione() -> Session:
+    from database import engine
+
+    return Session(engine)
+
+
+class SvuotaDopoRispostaMiddleware:
+    """Senza worker (EMAIL_OUTBOX_DRAIN_INLINE): inviata la risposta, un giro
+    di elabora_coda se la richiesta ha accodato email. Il client non aspetta
+    l'SMTP; l'invocazione serverless resta viva fino alla fine del giro."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not EMAIL_OUTBOX_DRAIN_INLINE:
+            await self.app(scope, receive, send)
+            return
+
+        richiesta = {"accodate": False}
+        token = _richiesta.set(richiesta)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _richiesta.reset(token)
+        if not richiesta["accodate"]:
+            return
+        try:
+            with _nuova_sessione() as session:
+                await elabora_coda(session)
+        except Exception as e:
+            # Le righe restano PENDING (o SENDING fino al timeout): le riprende il cron.
+            logger.error(f"[Outbox] Giro dopo la risposta fallito: {e}")
+
+
+async def ciclo_outbox(session_factory):
+    """Worker per i deploy con processo persistente: gira a ogni risveglio
+    (COMMIT con email accodate) o ogni EMAIL_OUTBOX_POLL_SECONDS."""
+    global _loop, _sveglia
+    _, _, conf = get_smtp_config()
+    if not conf:
+        logger.warning("[Outbox] SMTP non configurato: worker email non avviato")
+        return
+    _loop = asyncio.get_running_loop()
+    _sveglia = asyncio.Event()
+    connessioni = _connessioni_smtp(conf)
+    inattivo_da = _loop.time()
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(_sveglia.wait(), timeout=EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _sveglia.clear()
+            try:
+                while True:
+                    with session_factory() as session:
+                        esito = await elabora_coda(session, connessioni)
+                    if esito["claimed"]:
+                        inattivo_da = _loop.time()
+                    if esito["claimed"] < EMAIL_OUTBOX_BATCH:
+                        break
+                if _loop.time() - inattivo_da > EMAIL_SMTP_IDLE_SECONDS:
+                    await asyncio.gather(*(c.chiudi() for c in connessioni))
+            except Exception as e:
+                logger.error(f"[Outbox] Giro fallito: {e}")
+    finally:
+        await asyncio.gather(*(c.chiudi() for c in connessioni))
+        _loop = None
+        _sveglia = None
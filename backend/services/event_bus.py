@@ -0,0 +1,190 @@
+"""
+SplitPlan AI — Bus eventi
+==========================
+Pub/sub interno che alimenta gli stream SSE (routers/stream.py). I canali
+sono "trip:{id}" e "account:{id}"; un evento e' un dict
+{"channel", "type", "data", "ts"}.
+
+Con un solo worker basta la consegna in-process: ogni iscrizione ha la sua
+coda asyncio e il suo event loop, e pubblica() (chiamabile da qualunque
+thread, anche dagli hook di commit degli endpoint sincroni) vi consegna con
+call_soon_threadsafe. Con piu' worker o istanze avvia() apre un ascolto
+Redis pub/sub su un unico canale: da quel momento pubblica() scrive su Redis
+e ogni worker consegna alle proprie iscrizioni cio' che riceve. Se Redis non
+risponde l'evento viene consegnato almeno in locale.
+
+Gli eventi sono segnali ("e' cambiato qualcosa in quest'area"), non dati: il
+client ricarica cio' che gli serve. Chi perde eventi (coda piena, riconnessione)
+riceve "resync" e ricarica tutto.
+
+Le modifiche arrivano da services/trip_changes, quindi solo dopo il COMMIT.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+from services.metrics import counter, gauge
+from services.trip_changes import Modifiche, su_modifica
+
+logger = logging.getLogger(__name__)
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+CANALE_REDIS = "splitplan:eventi"
+
+_PUBBLICATI = counter("stream_events_published_total", "Eventi pubblicati sul bus", ["channel"])
+_PERSI = counter("stream_events_dropped_total", "Eventi scartati per coda dell'iscritto piena")
+_ISCRITTI = gauge("stream_subscribers", "Stream SSE aperti su questo worker")
+
+
+def canale_trip(trip_id: int) -> str:
+    return f"trip:{trip_id}"
+
+
+def canale_account(account_id: int) -> str:
+    return f"account:{account_id}"
+
+
+class Iscrizione:
+    """Coda di eventi di uno stream, legata all'event loop che la legge."""
+
+    def __init__(self, canali, loop: asyncio.AbstractEventLoop):
+        self.canali = frozenset(canali)
+        self.loop = loop
+        self.coda: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        # Eventi persi per coda piena: lo stream manda "resync" e chiude.
+        self.persa = False
+
+    def _consegna(self, evento: dict):
+        try:
+            self.coda.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.persa = True
+            _PERSI.inc()
+
+
+class BusEventi:
+    def __init__(self):
+        self._iscrizioni: Dict[str, Set[Iscrizione]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ascolto: Optional[asyncio.Task] = None
+
+    @property
+    def distribuito(self) -> bool:
+        return self._redis is not None
+
+    @asynccontextmanager
+    async def iscrivi(self, *canali: str):
+        iscrizione = Iscrizione(canali, asyncio.get_running_loop())
+        with self._lock:
+            for canale in iscrizione.canali:
+                self._iscrizioni.setdefault(canale, set()).add(iscrizione)
+        _ISCRITTI.inc()
+        try:
+            yield iscrizione
+        finally:
+            with self._lock:
+                for canale in iscrizione.canali:
+                    iscritti = self._iscrizioni.get(canale)
+                    if iscritti is not None:
+                        iscritti.discard(iscrizione)
+                        if not iscritti:
+                            del self._iscrizioni[canale]
+            _ISCRITTI.dec()
+
+    def iscritti(self, canale: str) -> int:
+        with self._lock:
+            return len(self._iscrizioni.get(canale, ()))
+
+    def pubblica(self, canale: str, tipo: str, dati: Optional[dict] = None):
+        evento = {"channel": canale, "type": tipo, "data": dati or {}, "ts": time.time()}
+        _PUBBLICATI.inc(channel=canale.split(":", 1)[0])
+        if self._redis is not None and self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._pubblica_redis(evento), self._loop)
+        else:
+            self.consegna_locale(evento)
+
+    async def _pubblica_redis(self, evento: dict):
+        try:
+            await self._redis.publish(CANALE_REDIS, json.dumps(evento))
+        except Exception as e:
+            logger.error(f"[Bus] Publish su Redis fallito, consegna solo locale: {e}")
+            self.consegna_locale(evento)
+
+    def consegna_locale(self, evento: dict):
+        with self._lock:
+            iscritti = list(self._iscrizioni.get(evento["channel"], ()))
+        for iscrizione in iscritti:
+            try:
+                iscrizione.loop.call_soon_threadsafe(iscrizione._consegna, evento)
+            except RuntimeError:
+                # Loop gia' chiuso: lo stream sta terminando.
+                pass
+
+    async def avvia(self, client) -> None:
+        """Passa alla modalita' Redis: da chiamare nel loop principale (lifespan)."""
+        if client is None or self._ascolto is not None:
+            return
+        self._redis = client
+        self._loop = asyncio.get_running_loop()
+        self._ascolto = asyncio.create_task(self._ascolta())
+        logger.info("[Bus] Eventi distribuiti via Redis pub/sub.")
+
+    async def ferma(self) -> None:
+        if self._ascolto is not None:
+            self._ascolto.cancel()
+            try:
+                await self._ascolto
+            except asyncio.CancelledError:
+                pass
+        self._ascolto = None
+        self._redis = None
+        self._loop = None
+
+    async def _ascolta(self):
+        attesa = 1.0
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CANALE_REDIS)
+                attesa = 1.0
+                while True:
+                    messaggio = await pubsub.get_message(timeout=1.0)
+                    if messaggio and messaggio.get("type") == "message":
+                        self.consegna_locale(json.loads(messaggio["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Bus] Ascolto Redis interrotto, riprovo tra {attesa:.0f}s: {e}")
+                await asyncio.sleep(attesa)
+                attesa = min(attesa * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+bus = BusEventi()
+
+
+@su_modifica
+def _pubblica_modifiche(modifiche: Modifiche):
+    for trip_id, aree in modifiche.viaggi.items():
+        bus.pubblica(canale_trip(trip_id), "trip.changed", {"trip_id": trip_id, "areas": sorted(aree)})
+    for account_id in modifiche.account:
+        bus.pubblica(canale_account(account_id), "trips.changed")
+    for account_id in modifiche.notifiche:
+        # Con il nuovo contatore il client aggiorna il badge senza richieste.
+        non_lette = modifiche.non_lette.get(account_id)
+        bus.pubblica(
+            canale_account(account_id), "notifications.changed",
+            {"unread": non_lette} if non_lette is not None else None,
+        )
@@ -24,13 +24,25 @@ Model
 
 import asyncio
 import logging
+import time
 from collections import defaultdict
 from math import atan2, cos, radians, sin, sqrt
 from typing import Optional
 
-from ortools.sat.python import cp_model
-
 from services.maps_service import get_travel_time_matrix
+from services.metrics import histogram
+from utils.lazy import LazyModule
+
+# OR-Tools pesa piu' di tutto il resto del backend: lo si importa solo quando
+# un itinerario va davvero ottimizzato.
+cp_model = LazyModule("ortools.sat.python.cp_model")
+
+_TEMPI_SOLVE = histogram(
+    "optimizer_solve_seconds",
+    "Durata di CpSolver.Solve per giornata, per stato finale",
+    ["status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0),
+)
 
 logger = logging.getLogger(__name__)
 
@@ -231,7 +243,9 @@ def _optimize_single_day(
     # ── Solve ─────────────────────────────────────────────────────────────────
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = SOLVER_TIMEOUT_SECONDS
+    inizio_solve = time.perf_counter()
     status = solver.Solve(model)
+    _TEMPI_SOLVE.observe(time.perf_counter() - inizio_solve, status=solver.StatusName(status))
 
     schedule = []
     dropped = []
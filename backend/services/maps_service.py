@@ -30,6 +30,9 @@ from typing import Optional
 
 import httpx
 
+from services.metrics import counter
+from services.timing import span
+
 logger = logging.getLogger(__name__)
 
 # ── Configuration ──────────────────────────────────────────────────────────────
@@ -40,6 +43,7 @@ MAX_OSRM_LOCATIONS = 25   # guard against URL length limit (~2 KB)
 # ── In-memory cache ────────────────────────────────────────────────────────────
 # {cache_key_str: {(i, j): minutes}}
 _matrix_cache: dict[str, dict[tuple[int, int], int]] = {}
+_CACHE_MATRICI = counter("osrm_matrix_cache_total", "Lookup della cache delle matrici OSRM", ["result"])
 
 
 def _cache_key(locations: list[tuple[float, float]], profile: str) -> str:
@@ -90,11 +94,14 @@ async def get_travel_time_matrix(
 
     key = _cache_key(locations, profile)
     if key in _matrix_cache:
+        _CACHE_MATRICI.inc(result="hit")
         logger.debug(
             f"[OSRM] Cache HIT | profile={profile} | locations={n}"
         )
         return _matrix_cache[key]
 
+    _CACHE_MATRICI.inc(result="miss")
+
     # OSRM expects "lon,lat" (longitude first)
     coord_str = ";".join(
         f"{lon:.6f},{lat:.6f}" for lat, lon in locations
@@ -102,7 +109,7 @@ async def get_travel_time_matrix(
     url = f"{OSRM_BASE_URL}/{profile}/{coord_str}?annotations=duration"
 
     try:
-        async with httpx.AsyncClient(timeout=OSRM_TIMEOUT_SECONDS) as client:
+        async with httpx.AsyncClient(timeout=OSRM_TIMEOUT_SECONDS) as client, span("osrm"):
             resp = await client.get(url)
             resp.raise_for_status()
             data = resp.json()
@@ -187,7 +194,7 @@ async def get_route_geometry(
     )
 
     try:
-        async with httpx.AsyncClient(timeout=OSRM_TIMEOUT_SECONDS) as client:
+        async with httpx.AsyncClient(timeout=OSRM_TIMEOUT_SECONDS) as client, span("osrm"):
             resp = await client.get(url)
             resp.raise_for_status()
             data = resp.json()
@@ -0,0 +1,233 @@
+"""
+SplitPlan AI — Metrics Registry
+================================
+Registro in-process di contatori, gauge e istogrammi, senza dipendenze esterne.
+
+Ogni sottosistema registra le proprie metriche al primo uso:
+
+    from services.metrics import counter, histogram
+
+    _CHIAMATE = counter("ai_calls_total", "Chiamate a Gemini", ["model", "outcome"])
+    _CHIAMATE.inc(model="gemini-3.1-flash-lite", outcome="ok")
+
+Registrare due volte lo stesso nome restituisce la metrica gia' esistente,
+quindi i moduli possono dichiararle a livello di modulo senza preoccuparsi
+dell'ordine di import. I valori vivono nel processo: su Vercel ogni istanza
+ha i suoi e si azzerano a ogni cold start.
+
+render_prometheus() produce il formato testo di Prometheus (0.0.4), servito
+da GET /metrics.
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Bucket di default in secondi: da 5 ms (query) a 60 s (generazione itinerario).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, descrizione: str, etichette: Iterable[str] = ()):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self._lock = threading.Lock()
+        self._valori: Dict[Tuple[str, ...], object] = {}
+
+    def _chiave(self, valori_etichette: dict) -> Tuple[str, ...]:
+        if set(valori_etichette) != set(self.etichette):
+            raise ValueError(
+                f"{self.nome}: etichette attese {self.etichette}, ricevute {tuple(valori_etichette)}"
+            )
+        return tuple(str(valori_etichette[e]) for e in self.etichette)
+
+    def campioni(self) -> List[Tuple[Dict[str, str], object]]:
+        with self._lock:
+            return [(dict(zip(self.etichette, k)), v) for k, v in self._valori.items()]
+
+    def azzera(self):
+        with self._lock:
+            self._valori.clear()
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, quantita: float = 1, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0) + quantita
+
+    def valore(self, **etichette) -> float:
+        with self._lock:
+            return self._valori.get(self._chiave(etichette), 0)
+
+    def set_total(self, valore: float, **etichette):
+        """Per i contatori tenuti altrove (es. StatistichePool): il collettore
+        copia il totale corrente invece di incrementare."""
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = valore
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def set(self, valore: float, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = valore
+
+    def inc(self, quantita: float = 1, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0) + quantita
+
+    def dec(self, quantita: float = 1, **etichette):
+        self.inc(-quantita, **etichette)
+
+    def valore(self, **etichette) -> float:
+        with self._lock:
+            return self._valori.get(self._chiave(etichette), 0)
+
+
+class _Serie:
+    __slots__ = ("conteggi", "somma", "totale")
+
+    def __init__(self, n_bucket: int):
+        self.conteggi = [0] * n_bucket  # non cumulativi; l'ultimo e' +Inf
+        self.somma = 0.0
+        self.totale = 0
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descrizione, etichette=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(nome, descrizione, etichette)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valore: float, **etichette):
+        chiave = self._chiave(etichette)
+        indice = bisect.bisect_left(self.buckets, valore)
+        with self._lock:
+            serie = self._valori.get(chiave)
+            if serie is None:
+                serie = self._valori[chiave] = _Serie(len(self.buckets) + 1)
+            serie.conteggi[indice] += 1
+            serie.somma += valore
+            serie.totale += 1
+
+    def riepilogo(self, **etichette) -> dict:
+        """count, sum e bucket cumulativi di una serie (vuota se mai osservata)."""
+        with self._lock:
+            serie = self._valori.get(self._chiave(etichette))
+            if serie is None:
+                return {"count": 0, "sum": 0.0, "buckets": {}}
+            cumulati, parziale = {}, 0
+            for limite, conteggio in zip(self.buckets + (float("inf"),), serie.conteggi):
+                parziale += conteggio
+                cumulati[limite] = parziale
+            return {"count": serie.totale, "sum": serie.somma, "buckets": cumulati}
+
+
+class Registry:
+    def __init__(self):
+        self._metriche: Dict[str, _Metrica] = {}
+        self._collettori: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _registra(self, classe, nome, descrizione, etichette, **kwargs):
+        with self._lock:
+            esistente = self._metriche.get(nome)
+            if esistente is not None:
+                if not isinstance(esistente, classe) or esistente.etichette != tuple(etichette):
+                    raise ValueError(f"Metrica {nome} gia' registrata con tipo o etichette diversi")
+                return esistente
+            metrica = classe(nome, descrizione, etichette, **kwargs)
+            self._metriche[nome] = metrica
+            return metrica
+
+    def counter(self, nome, descrizione, etichette=()) -> Counter:
+        return self._registra(Counter, nome, descrizione, etichette)
+
+    def gauge(self, nome, descrizione, etichette=()) -> Gauge:
+        return self._registra(Gauge, nome, descrizione, etichette)
+
+    def histogram(self, nome, descrizione, etichette=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._registra(Histogram, nome, descrizione, etichette, buckets=buckets)
+
+    def collettore(self, funzione: Callable[[], None]):
+        """Funzione chiamata prima di ogni lettura, per aggiornare i gauge
+        che fotografano uno stato (es. connessioni in uso nel pool)."""
+        with self._lock:
+            if funzione not in self._collettori:
+                self._collettori.append(funzione)
+        return funzione
+
+    def metriche(self) -> List[_Metrica]:
+        with self._lock:
+            collettori = list(self._collettori)
+            metriche = sorted(self._metriche.values(), key=lambda m: m.nome)
+        for funzione in collettori:
+            funzione()
+        return metriche
+
+    def get(self, nome: str):
+        return self._metriche.get(nome)
+
+
+REGISTRY = Registry()
+
+
+def _formatta_numero(valore: float) -> str:
+    if valore == float("inf"):
+        return "+Inf"
+    if float(valore).is_integer():
+        return str(int(valore))
+    return repr(float(valore))
+
+
+def _formatta_etichette(etichette: dict) -> str:
+    if not etichette:
+        return ""
+    coppie = []
+    for nome, valore in etichette.items():
+        valore = str(valore).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        coppie.append(f'{nome}="{valore}"')
+    return "{" + ",".join(coppie) + "}"
+
+
+def render_prometheus(registro: Registry = None) -> str:
+    """Tutte le metriche del registro nel formato testo di Prometheus."""
+    righe = []
+    for metrica in (registro or REGISTRY).metriche():
+        righe.append(f"# HELP {metrica.nome} {metrica.descrizione}")
+        righe.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        for etichette, valore in metrica.campioni():
+            if isinstance(metrica, Histogram):
+                parziale = 0
+                for limite, conteggio in zip(metrica.buckets + (float("inf"),), valore.conteggi):
+                    parziale += conteggio
+                    con_le = {**etichette, "le": _formatta_numero(limite)}
+                    righe.append(f"{metrica.nome}_bucket{_formatta_etichette(con_le)} {parziale}")
+                righe.append(f"{metrica.nome}_sum{_formatta_etichette(etichette)} {_formatta_numero(valore.somma)}")
+                righe.append(f"{metrica.nome}_count{_formatta_etichette(etichette)} {valore.totale}")
+            else:
+                righe.append(f"{metrica.nome}{_formatta_etichette(etichette)} {_formatta_numero(valore)}")
+    return "\n".join(righe) + "\n"
+
+
+def counter(nome: str, descrizione: str, etichette: Iterable[str] = ()) -> Counter:
+    return REGISTRY.counter(nome, descrizione, etichette)
+
+
+def gauge(nome: str, descrizione: str, etichette: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.gauge(nome, descrizione, etichette)
+
+
+def histogram(nome: str, descrizione: str, etichette: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(nome, descrizione, etichette, buckets)
@@ -1,18 +1,25 @@
 """
 Servizio notifiche SplitPlan.
-Funzioni helper per creare notifiche in-app e inviare email di notifica.
+Funzioni helper per creare notifiche in-app e accodare email di notifica.
 """
 import logging
 import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Boolean, DateTime, Integer, String, delete, insert, literal
 from sqlmodel import Session, select
-from models import Notification, Account
-from email_templates import base_template
-from utils.email_utils import get_smtp_config
+from models import Notification, NotificationArchive, Account
+from services import email_outbox, unread_counter
 
 logger = logging.getLogger(__name__)
 
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://splitplan-ai.vercel.app")
 
+NOTIF_ARCHIVE_DAYS = int(os.getenv("NOTIF_ARCHIVE_DAYS", "90"))
+NOTIF_ARCHIVE_BATCH = int(os.getenv("NOTIF_ARCHIVE_BATCH", "1000"))
+# Tetto di durata di un giro: su Vercel il cron ha il timeout della funzione.
+NOTIF_ARCHIVE_MAX_SECONDS = float(os.getenv("NOTIF_ARCHIVE_MAX_SECONDS", "20"))
+
 
 def create_notification(
     session: Session,
@@ -42,61 +49,92 @@ def notify_managers(
     title: str,
     message: str,
     trip_id: int = None,
-) -> list[Notification]:
-    """Crea notifiche per tutti i manager della company."""
-    managers = session.exec(
-        select(Account).where(
-            Account.company_id == company_id,
-            Account.is_manager == True,
-        )
-    ).all()
-
-    notifications = []
-    for manager in managers:
-        notif = create_notification(
-            session, manager.id, type, title, message, trip_id
+) -> list[int]:
+    """Crea una notifica per ogni manager della company con un solo
+    INSERT ... SELECT, qualunque sia il numero di manager. Non fa commit.
+
+    Restituisce gli id degli account notificati.
+    """
+    adesso = datetime.now(timezone.utc)
+    inserite = session.execute(
+        insert(Notification)
+        .from_select(
+            ["account_id", "type", "title", "message", "trip_id", "is_read", "created_at"],
+            select(
+                Account.id,
+                literal(type, String),
+                literal(title, String),
+                literal(message, String),
+                literal(trip_id, Integer),
+                literal(False, Boolean),
+                literal(adesso, DateTime),
+            ).where(
+                Account.company_id == company_id,
+                Account.is_manager == True,
+            ),
         )
-        notifications.append(notif)
-    return notifications
-
-
-def send_notification_email(account: Account, subject: str, html_content: str):
-    """Invia un'email HTML all'account usando la configurazione SMTP centralizzata."""
-    try:
-        from fastapi_mail import FastMail, MessageSchema, MessageType
-
-        _, _, smtp_conf = get_smtp_config()
-        if not smtp_conf:
-            logger.warning("[NotifEmail] SMTP non configurato, skip email")
-            return
+        .returning(Notification.account_id)
+    )
+    account_ids = list(inserite.scalars())
+    # INSERT massivo: il flush non lo vede, i contatori e lo stream si'.
+    unread_counter.incrementa(session, {a: 1 for a in account_ids})
+    return account_ids
 
-        import asyncio
 
-        message = MessageSchema(
-            subject=subject,
-            recipients=[account.email],
-            body=base_template(html_content),
-            subtype=MessageType.html,
+def archivia_notifiche(
+    session: Session,
+    giorni: int = NOTIF_ARCHIVE_DAYS,
+    batch: int = NOTIF_ARCHIVE_BATCH,
+    max_secondi: float = NOTIF_ARCHIVE_MAX_SECONDS,
+) -> dict:
+    """Sposta in notification_archive le notifiche lette piu' vecchie di
+    `giorni`, a blocchi di `batch` righe con un COMMIT per blocco (lock brevi,
+    nessuna transazione enorme). Si ferma quando non resta nulla o dopo
+    `max_secondi`: il giro successivo riparte da dove si e' fermato.
+
+    Le notifiche lette non entrano nel contatore delle non lette: spostarle
+    non lo tocca.
+    """
+    inizio = time.monotonic()
+    soglia = datetime.now(timezone.utc) - timedelta(days=giorni)
+    spostate = blocchi = 0
+    finito = False
+    colonne = ["id", "account_id", "type", "title", "message", "trip_id", "created_at"]
+    while True:
+        ids = session.exec(
+            select(Notification.id)
+            .where(Notification.is_read == True, Notification.created_at < soglia)
+            .order_by(Notification.id)
+            .limit(batch)
+        ).all()
+        if not ids:
+            finito = True
+            break
+        session.execute(
+            insert(NotificationArchive).from_select(
+                colonne + ["archived_at"],
+                select(
+                    *(getattr(Notification, c) for c in colonne),
+                    literal(datetime.now(timezone.utc), DateTime),
+                ).where(Notification.id.in_(ids)),
+            )
         )
-
-        async def _send():
-            fm = FastMail(smtp_conf)
-            await fm.send_message(message)
-
-        # Esegui la coroutine in un loop dedicato (chiamato da contesto sync)
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    future = pool.submit(asyncio.run, _send())
-                    future.result(timeout=10)
-            else:
-                loop.run_until_complete(_send())
-        except Exception as e:
-            logger.error(f"[NotifEmail] Errore invio email a {account.email}: {e}")
-
-    except Exception as e:
-        logger.error(f"[NotifEmail] Errore critico: {e}")
-
-
+        session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        session.commit()
+        spostate += len(ids)
+        blocchi += 1
+        finito = len(ids) < batch
+        if finito or time.monotonic() - inizio >= max_secondi:
+            break
+
+    secondi = round(time.monotonic() - inizio, 3)
+    if spostate:
+        logger.info(f"[NotifArchive] Archiviate {spostate} notifiche in {blocchi} blocchi, {secondi}s")
+    return {"moved": spostate, "batches": blocchi, "seconds": secondi, "done": finito}
+
+
+def send_notification_email(session: Session, account: Account, subject: str, html_content: str):
+    """Accoda un'email HTML completa (un template di email_templates, gia'
+    dentro il guscio comune) per l'account (services/email_outbox). Parte con
+    il COMMIT del chiamante, insieme alla notifica in-app."""
+    email_outbox.accoda(session, account.email, subject, html_content, tipo="notification")
@@ -27,8 +27,13 @@ import os
 from typing import Optional
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+
+from utils.lazy import LazyModule
+from services.timing import span
+
+# google-genai e' importato al primo scontrino, non all'avvio dell'app.
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
 
 load_dotenv()
 
@@ -77,10 +82,10 @@ Regole generali:
 """.strip()
 
 # ── Singleton client ───────────────────────────────────────────────────────────
-_client: Optional[genai.Client] = None
+_client: Optional["genai.Client"] = None
 
 
-def _get_client() -> Optional[genai.Client]:
+def _get_client() -> Optional["genai.Client"]:
     global _client
     if _client is not None:
         return _client
@@ -133,16 +138,17 @@ async def process_receipt_image(
     )
 
     try:
-        response = await client.aio.models.generate_content(
-            model=_AI_MODEL,
-            contents=[
-                _RECEIPT_PROMPT,
-                types.Part.from_bytes(data=file_content, mime_type=mime_type),
-            ],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-            ),
-        )
+        with span("gemini"):
+            response = await client.aio.models.generate_content(
+                model=_AI_MODEL,
+                contents=[
+                    _RECEIPT_PROMPT,
+                    types.Part.from_bytes(data=file_content, mime_type=mime_type),
+                ],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                ),
+            )
 
         raw: str = response.text or ""
 
@@ -0,0 +1,266 @@
+"""
+SplitPlan AI — Cache dei PDF resi
+==================================
+Manager e dipendenti riscaricano piu' volte la stessa nota spese e lo stesso
+PDF del viaggio: senza cache ogni download rifaceva la resa da capo. Qui i
+PDF gia' resi restano su disco locale (PDF_CACHE_DIR) e si servono come file,
+con ETag e richieste Range (download ripresi, anteprime a pezzi).
+
+- Chiave: viaggio, tipo di report e hash del contenuto, cioe' delle
+  istantanee passate alla resa (services/pdf_render): spese, itinerario,
+  campi del viaggio, lingua, dati di dipendente e azienda. Se cambia uno di
+  questi cambia la chiave, quindi una voce vecchia non viene mai servita.
+- Invalidazione: dopo il COMMIT di una scrittura su viaggio, spese o
+  itinerario (services/trip_changes) i file del viaggio si cancellano
+  subito, senza aspettare che escano per LRU.
+- LRU: oltre PDF_CACHE_MAX_BYTES escono le voci lette meno di recente.
+  L'ordine e' in memoria e si ricostruisce dall'atime dei file, che cerca()
+  aggiorna a ogni lettura; mtime resta quello della resa.
+- ETag forte: hash del contenuto + mtime_ns del file. Due rese degli stessi
+  dati non hanno gli stessi byte (fpdf scrive la data di creazione), quindi
+  una Range ripresa con If-Range su un file poi rigenerato riparte da capo
+  invece di cucire due PDF diversi.
+
+- Invio: ogni risposta serve un hard link privato del file (collega()), non
+  il file in cache. Un'invalidazione o un'uscita per LRU fra la ricerca e
+  l'apertura del file cancella solo il nome in cache: senza il link
+  FileResponse avrebbe gia' mandato gli header e finirebbe in un 500.
+  cerca(), salva() e collega() toccano il disco: dal loop si chiamano con
+  asyncio.to_thread.
+
+Piu' worker sulla stessa cartella si vedono i file (il nome dipende solo
+dalla chiave, la scrittura e' atomica con os.replace), ma ognuno conta solo
+i byte che conosce: il limite e' per processo. Su Vercel la cartella e'
+/tmp dell'istanza e sparisce con lei. PDF_CACHE_MAX_BYTES=0 disattiva.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+
+from services.metrics import counter
+from services.trip_changes import Modifiche, su_modifica
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "splitplan-pdf")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Link di invio rimasti da un processo terminato a meta' risposta: al primo
+# uso si cancellano quelli piu' vecchi di cosi'.
+_INVIO_MAX_SECONDI = 3600
+
+# Da cambiare quando cambia il layout dei PDF (pdf_service): dopo il deploy
+# le voci resi col layout vecchio non corrispondono piu' a nessuna chiave.
+PDF_CACHE_SCHEMA = "1"
+
+_LOOKUP = counter("pdf_cache_total", "Lookup della cache dei PDF resi", ["kind", "result"])
+
+
+@dataclass
+class Voce:
+    path: str
+    stat: os.stat_result
+    etag: str
+
+
+def chiave(trip_id: int, tipo: str, dati: dict) -> str:
+    """Chiave della resa: viaggio, tipo e hash delle istantanee di pdf_render."""
+    contenuto = json.dumps(
+        dati, sort_keys=True, ensure_ascii=False,
+        default=lambda o: vars(o) if isinstance(o, SimpleNamespace) else str(o),
+    )
+    impronta = hashlib.sha256(f"{PDF_CACHE_SCHEMA}|{contenuto}".encode()).hexdigest()[:32]
+    return f"{trip_id}-{tipo}-{impronta}"
+
+
+class _CachePdf:
+    def __init__(self, cartella: str, max_byte: int):
+        self.cartella = cartella
+        self.max_byte = max_byte
+        self._voci: "Optional[OrderedDict[str, int]]" = None   # chiave -> byte, dalla meno recente
+        self._totale = 0
+        self._lock = threading.Lock()
+
+    @property
+    def attiva(self) -> bool:
+        return self.max_byte > 0
+
+    def _path(self, chiave: str) -> str:
+        return os.path.join(self.cartella, f"{chiave}.pdf")
+
+    def _indice(self) -> "OrderedDict[str, int]":
+        # Al primo uso: i file lasciati da questo o da un altro processo,
+        # in ordine di ultima lettura.
+        if self._voci is None:
+            os.makedirs(self.cartella, exist_ok=True)
+            trovati = []
+            for path in glob.glob(os.path.join(self.cartella, "*.pdf")):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                trovati.append((st.st_atime_ns, os.path.basename(path)[:-4], st.st_size))
+            limite = time.time() - _INVIO_MAX_SECONDI
+            for path in glob.glob(os.path.join(self.cartella, "*.invio")):
+                try:
+                    if os.stat(path).st_ctime < limite:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._voci = OrderedDict((c, dimensione) for _, c, dimensione in sorted(trovati))
+            self._totale = sum(self._voci.values())
+        return self._voci
+
+    def cerca(self, chiave: str) -> Optional[Voce]:
+        if not self.attiva:
+            return None
+        tipo = chiave.split("-")[1]
+        path = self._path(chiave)
+        with self._lock:
+            voci = self._indice()
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._dimentica(chiave)
+                _LOOKUP.inc(kind=tipo, result="miss")
+                return None
+            if chiave not in voci:
+                # Scritto da un altro worker.
+                voci[chiave] = st.st_size
+                self._totale += st.st_size
+            voci.move_to_end(chiave)
+        try:
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        _LOOKUP.inc(kind=tipo, result="hit")
+        return self._voce(chiave, path, st)
+
+    def salva(self, chiave: str, pdf: bytes) -> Optional[Voce]:
+        """Scrive il PDF (atomico) e fa uscire le voci meno recenti oltre il limite."""
+        if not self.attiva or len(pdf) > self.max_byte:
+            return None
+        path = self._path(chiave)
+        with self._lock:
+            voci = self._indice()
+            fd, provvisorio = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(pdf)
+                os.replace(provvisorio, path)
+            except OSError as e:
+                logger.warning(f"[PDF] Cache non scrivibile ({self.cartella}): {e}")
+                try:
+                    os.unlink(provvisorio)
+                except OSError:
+                    pass
+                return None
+            self._dimentica(chiave)
+            voci[chiave] = len(pdf)
+            self._totale += len(pdf)
+            while self._totale > self.max_byte:
+                vecchia = next(iter(voci))
+                self._dimentica(vecchia)
+                self._cancella(vecchia)
+            st = os.stat(path)
+        return self._voce(chiave, path, st)
+
+    def collega(self, voce: Voce) -> Optional[Voce]:
+        """Hard link privato al file della voce, da servire al posto del file
+        in cache e da cancellare con rilascia() a fine risposta. None se il
+        file e' gia' stato cancellato: il chiamante rifa' la resa."""
+        privato = f"{voce.path[:-4]}.{uuid.uuid4().hex}.invio"
+        try:
+            os.link(voce.path, privato)
+            st = os.stat(privato)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            # Filesystem senza hard link: si serve il file in cache.
+            logger.warning(f"[PDF] Hard link non riuscito ({self.cartella}): {e}")
+            return voce
+        chiave = os.path.basename(voce.path)[:-4]
+        return self._voce(chiave, privato, st)
+
+    def invalida_viaggio(self, trip_id: int) -> int:
+        """Cancella i PDF del viaggio, anche quelli scritti da altri worker."""
+        if not self.attiva:
+            return 0
+        with self._lock:
+            voci = self._indice()
+            chiavi = {c for c in voci if c.startswith(f"{trip_id}-")}
+            for path in glob.glob(os.path.join(self.cartella, f"{trip_id}-*.pdf")):
+                chiavi.add(os.path.basename(path)[:-4])
+            for c in chiavi:
+                self._dimentica(c)
+                self._cancella(c)
+        return len(chiavi)
+
+    def svuota(self):
+        with self._lock:
+            for path in glob.glob(os.path.join(self.cartella, "*.pdf")) + glob.glob(os.path.join(self.cartella, "*.invio")):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._voci = None
+            self._totale = 0
+
+    def _dimentica(self, chiave: str):
+        dimensione = self._voci.pop(chiave, None)
+        if dimensione is not None:
+            self._totale -= dimensione
+
+    def _cancella(self, chiave: str):
+        try:
+            os.unlink(self._path(chiave))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _voce(chiave: str, path: str, st: os.stat_result) -> Voce:
+        impronta = chiave.rsplit("-", 1)[1]
+        return Voce(path=path, stat=st, etag=f'"{impronta[:20]}-{st.st_mtime_ns:x}"')
+
+
+_cache = _CachePdf(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+
+def cerca(chiave: str) -> Optional[Voce]:
+    return _cache.cerca(chiave)
+
+
+def salva(chiave: str, pdf: bytes) -> Optional[Voce]:
+    return _cache.salva(chiave, pdf)
+
+
+def collega(voce: Voce) -> Optional[Voce]:
+    return _cache.collega(voce)
+
+
+def rilascia(voce: Voce):
+    """Cancella il link di invio a fine risposta."""
+    if voce.path.endswith(".invio"):
+        try:
+            os.unlink(voce.path)
+        except FileNotFoundError:
+            pass
+
+
+@su_modifica
+def _invalida_pdf(modifiche: Modifiche):
+    # Nei PDF entrano solo i campi del viaggio, le spese e l'itinerario.
+    for trip_id, aree in modifiche.viaggi.items():
+        if aree & {"trip", "expenses", "itinerary"}:
+            _cache.invalida_viaggio(trip_id)
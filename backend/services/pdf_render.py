@@ -0,0 +1,238 @@
+"""
+SplitPlan AI — Resa dei PDF fuori dal loop
+===========================================
+fpdf e' Python puro e CPU-bound: un PDF con qualche centinaio di righe
+costruito dentro un endpoint async ferma per tutto quel tempo ogni altra
+richiesta servita dallo stesso worker. Qui la resa gira in un pool di
+processi (PDF_RENDER_WORKERS) e l'endpoint aspetta senza bloccare il loop.
+
+- Le funzioni di pdf_service ricevono istantanee (SimpleNamespace) con i soli
+  campi che usano, non oggetti ORM: devono passare per pickle verso il
+  processo e non devono fare lazy load su una sessione che non c'e'.
+- Al massimo PDF_RENDER_MAX_QUEUE rese tra in corso e in attesa: oltre,
+  CodaPiena e l'endpoint risponde 503 con Retry-After invece di accumulare
+  lavoro che arriverebbe comunque dopo il timeout del client.
+- attendi(): modalita' sincrona, la richiesta aspetta il PDF fino a
+  PDF_RENDER_TIMEOUT secondi.
+- avvia_job(): modalita' job per documenti grandi, risponde subito con un id;
+  lo stato e il file si leggono dopo. I job vivono nella memoria del processo
+  per PDF_JOB_TTL_SECONDS: la richiesta di stato deve arrivare alla stessa
+  istanza. Per questo su Vercel (PDF_JOBS=0 di default) i job sono spenti:
+  lo stato arriverebbe a un'altra istanza (404) e l'istanza congelata dopo
+  la risposta non finirebbe la resa. Li' mode=job si comporta come sync.
+
+Con PDF_RENDER_WORKERS=0 (default su Vercel, dove multiprocessing non ha
+/dev/shm) la resa va in un thread: il loop resta libero, ma il GIL no.
+
+Benchmark dei tempi di resa: python bench_pdf_render.py (cartella backend).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+from services.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+PDF_RENDER_WORKERS = int(os.getenv(
+    "PDF_RENDER_WORKERS", "0" if os.getenv("VERCEL") else str(min(2, os.cpu_count() or 1)),
+))
+PDF_RENDER_MAX_QUEUE = int(os.getenv("PDF_RENDER_MAX_QUEUE", "8"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+PDF_JOB_TTL_SECONDS = int(os.getenv("PDF_JOB_TTL_SECONDS", "600"))
+PDF_JOBS = os.getenv("PDF_JOBS", "0" if os.getenv("VERCEL") else "1") != "0"
+
+_RESE = counter(
+    "pdf_renders_total",
+    "Rese PDF per tipo ed esito (ok, error, rejected)",
+    ["kind", "result"],
+)
+
+
+class CodaPiena(Exception):
+    """Troppe rese in corso: il chiamante risponde 503."""
+
+
+# ---------------------------------------------------------------------------
+# Istantanee dei dati (picklabili, senza sessione)
+# ---------------------------------------------------------------------------
+
+def istantanea(obj, *campi: str) -> Optional[SimpleNamespace]:
+    if obj is None:
+        return None
+    return SimpleNamespace(**{c: getattr(obj, c, None) for c in campi})
+
+
+_CAMPI_SPESA = ("date", "description", "category", "amount")
+
+
+def dati_viaggio(trip, itinerary, expenses, language: str) -> dict:
+    """Argomenti di pdf_service.generate_trip_pdf."""
+    return {
+        "trip": istantanea(
+            trip, "name", "destination", "real_destination", "start_date", "end_date",
+            "accommodation", "accommodation_location",
+        ),
+        "itinerary": [istantanea(i, "start_time", "title", "description") for i in itinerary],
+        "expenses": [istantanea(e, *_CAMPI_SPESA) for e in expenses],
+        "language": language,
+    }
+
+
+def dati_nota_spese(trip, account, company, expenses) -> dict:
+    """Argomenti di pdf_service.generate_nota_spese."""
+    return {
+        "trip": istantanea(
+            trip, "destination", "real_destination", "start_date", "end_date",
+            "accommodation", "budget", "budget_max", "status",
+        ),
+        "account": istantanea(account, "name", "surname", "email"),
+        "company": istantanea(company, "name", "max_budget_per_trip"),
+        "expenses": [istantanea(e, *_CAMPI_SPESA) for e in expenses],
+    }
+
+
+def _funzione(tipo: str) -> Callable[..., bytes]:
+    # Import al primo uso: fpdf resta fuori dal cold start.
+    from services import pdf_service
+
+    return {"trip": pdf_service.generate_trip_pdf, "nota_spese": pdf_service.generate_nota_spese}[tipo]
+
+
+# ---------------------------------------------------------------------------
+# Pool e limite di coda
+# ---------------------------------------------------------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_in_corso = 0
+
+
+def _esecutore() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PDF_RENDER_WORKERS <= 0:
+        return None
+    if _pool is None:
+        # spawn: il processo figlio non eredita thread e connessioni del
+        # server (fork con thread attivi puo' bloccarsi).
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def chiudi() -> None:
+    """Spegne il pool (lifespan)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def in_coda() -> int:
+    return _in_corso
+
+
+def _rendi(tipo: str, dati: dict) -> "asyncio.Future[bytes]":
+    """Accoda una resa e restituisce il future; CodaPiena oltre il limite."""
+    global _in_corso
+    if _in_corso >= PDF_RENDER_MAX_QUEUE:
+        _RESE.inc(kind=tipo, result="rejected")
+        raise CodaPiena()
+    loop = asyncio.get_running_loop()
+    funzione = _funzione(tipo)
+    esecutore = _esecutore()
+    if esecutore is None:
+        future = asyncio.ensure_future(asyncio.to_thread(funzione, **dati))
+    else:
+        future = loop.run_in_executor(esecutore, _chiama, funzione, dati)
+    _in_corso += 1
+    inizio = time.perf_counter()
+
+    def fine(f: asyncio.Future):
+        global _in_corso
+        _in_corso -= 1
+        esito = "error" if f.cancelled() or f.exception() else "ok"
+        _RESE.inc(kind=tipo, result=esito)
+        logger.info(f"[PDF] Resa {tipo} {esito} in {(time.perf_counter() - inizio) * 1000:.0f} ms")
+
+    future.add_done_callback(fine)
+    return future
+
+
+def _chiama(funzione, dati: dict) -> bytes:
+    return funzione(**dati)
+
+
+async def attendi(tipo: str, dati: dict) -> bytes:
+    """Modalita' sincrona: il PDF, o asyncio.TimeoutError dopo PDF_RENDER_TIMEOUT."""
+    future = _rendi(tipo, dati)
+    # shield: scaduto il timeout la resa finisce comunque e libera il posto
+    # in coda quando termina davvero, non prima.
+    return await asyncio.wait_for(asyncio.shield(future), timeout=PDF_RENDER_TIMEOUT)
+
+
+# ---------------------------------------------------------------------------
+# Modalita' job
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Job:
+    id: str
+    tipo: str
+    trip_id: int
+    account_id: int
+    nome_file: str
+    future: "asyncio.Future[bytes]" = field(repr=False)
+    creato: float = field(default_factory=time.monotonic)
+    chiave: Optional[str] = None   # voce in services/pdf_cache, se il PDF ci va salvato
+
+    @property
+    def stato(self) -> str:
+        if not self.future.done():
+            return "running"
+        if self.future.cancelled() or self.future.exception():
+            return "failed"
+        return "done"
+
+    @property
+    def pdf(self) -> bytes:
+        return self.future.result()
+
+
+_jobs: Dict[str, Job] = {}
+
+
+def _pulisci():
+    limite = time.monotonic() - PDF_JOB_TTL_SECONDS
+    for job_id in [j.id for j in _jobs.values() if j.creato < limite and j.future.done()]:
+        del _jobs[job_id]
+
+
+def avvia_job(
+    tipo: str, dati: dict, trip_id: int, account_id: int, nome_file: str, chiave: Optional[str] = None,
+) -> Job:
+    _pulisci()
+    job = Job(
+        id=uuid.uuid4().hex, tipo=tipo, trip_id=trip_id, account_id=account_id,
+        nome_file=nome_file, future=_rendi(tipo, dati), chiave=chiave,
+    )
+    _jobs[job.id] = job
+    return job
+
+
+def job(job_id: str, trip_id: int, account_id: int) -> Optional[Job]:
+    """Il job, solo per chi l'ha avviato e sullo stesso viaggio."""
+    _pulisci()
+    trovato = _jobs.get(job_id)
+    if trovato is None or trovato.trip_id != trip_id or trovato.account_id != account_id:
+        return None
+    return trovato
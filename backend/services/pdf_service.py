@@ -1,7 +1,11 @@
 """
 SplitPlan AI — PDF Service
 ===========================
-Genera la "Nota Spese Ufficiale" in formato PDF per uso amministrativo / B2B.
+Genera la "Nota Spese Ufficiale" in formato PDF per uso amministrativo / B2B
+e il PDF del viaggio (itinerario + spese, generate_trip_pdf).
+
+Le funzioni girano in un processo del pool di services/pdf_render: ricevono
+istantanee dei dati, non oggetti ORM, e restituiscono i byte del PDF.
 
 Layout
 ------
@@ -280,3 +284,246 @@ def generate_nota_spese(
 
     raw = pdf.output()
     return bytes(raw) if isinstance(raw, bytearray) else raw
+
+
+# ── Itinerario e spese del viaggio (GET /trips/{id}/export-pdf) ──────────────
+
+def _pdf_datetime(dt_str):
+    if not dt_str:
+        return ""
+    try:
+        if "T" in dt_str:
+            dt = datetime.fromisoformat(dt_str.replace("Z", ""))
+            return dt
+        return None
+    except:
+        return None
+
+def _pdf_date_only(d_str):
+    if not d_str:
+        return ""
+    try:
+        dt = datetime.strptime(d_str, "%Y-%m-%d")
+        return dt.strftime("%d/%m/%Y")
+    except:
+        return d_str
+
+
+_TRIP_PDF_LABELS = {
+    "it": {
+        "header": "SPLITPLAN",
+        "your_trip": "Il tuo viaggio a",
+        "period": "Periodo",
+        "lodging": "Alloggio",
+        "hotel": "Hotel",
+        "address": "Indirizzo",
+        "itinerary": "Itinerario del Viaggio",
+        "finances": "Riepilogo Spese",
+        "total_spent": "TOTALE SPESE",
+        "per_person": "a persona",
+        "date": "Data",
+        "description": "Descrizione",
+        "category": "Categoria",
+        "amount": "Importo (EUR)",
+        "payer": "Pagato da",
+        "day": "Giorno",
+    },
+    "en": {
+        "header": "SPLITPLAN",
+        "your_trip": "Your trip to",
+        "period": "Period",
+        "lodging": "Accommodation",
+        "hotel": "Hotel",
+        "address": "Address",
+        "itinerary": "Travel Itinerary",
+        "finances": "Expense Summary",
+        "total_spent": "TOTAL EXPENSES",
+        "per_person": "per person",
+        "date": "Date",
+        "description": "Description",
+        "category": "Category",
+        "amount": "Amount (EUR)",
+        "payer": "Paid by",
+        "day": "Day",
+    },
+}
+
+
+def generate_trip_pdf(trip, itinerary: list, expenses: list, language: str = "it") -> bytes:
+    """
+    PDF del viaggio: alloggio, itinerario giorno per giorno e tabella spese.
+
+    Args:
+        trip:      oggetto con name, destination, real_destination, start_date,
+                   end_date, accommodation, accommodation_location.
+        itinerary: tappe (start_time, title, description).
+        expenses:  spese (date, description, category, amount).
+        language:  "it" o "en" per le etichette.
+    """
+    L = _TRIP_PDF_LABELS.get(language, _TRIP_PDF_LABELS["it"])
+
+    itinerary = sorted(itinerary, key=lambda x: (x.start_time))
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    pdf.set_fill_color(25, 42, 86)
+    pdf.rect(0, 0, 210, 40, "F")
+
+    pdf.set_font("Helvetica", "B", 24)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_y(10)
+    pdf.cell(0, 15, L["header"], ln=True, align="C")
+
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(
+        0,
+        10,
+        f"{L['your_trip']} {trip.real_destination or trip.destination}",
+        ln=True,
+        align="C",
+    )
+    pdf.ln(10)
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Helvetica", "B", 18)
+    pdf.cell(0, 10, f"{trip.name}", ln=True)
+
+    pdf.set_font("Helvetica", "I", 11)
+    pdf.set_text_color(100, 100, 100)
+    pdf.cell(
+        0,
+        7,
+        f"{L['period']}: {_pdf_date_only(trip.start_date)} - {_pdf_date_only(trip.end_date)}",
+        ln=True,
+    )
+    pdf.ln(5)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(10)
+
+    if trip.accommodation:
+        pdf.set_font("Helvetica", "B", 16)
+        pdf.set_fill_color(240, 244, 255)
+        pdf.set_text_color(25, 42, 86)
+        pdf.cell(0, 12, f"   {L['lodging']}", ln=True, fill=True)
+        pdf.ln(4)
+
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.cell(0, 8, f"{L['hotel']}: {trip.accommodation}", ln=True)
+        if trip.accommodation_location:
+            pdf.set_font("Helvetica", "", 10)
+            pdf.set_text_color(80, 80, 80)
+            pdf.multi_cell(0, 8, f"{L['address']}: {trip.accommodation_location}")
+        pdf.ln(10)
+
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.set_fill_color(240, 244, 255)
+    pdf.set_text_color(25, 42, 86)
+    pdf.cell(0, 12, f"   {L['itinerary']}", ln=True, fill=True)
+    pdf.ln(5)
+
+    if not itinerary:
+        pdf.set_font("Helvetica", "", 12)
+        pdf.set_text_color(0, 0, 0)
+        pdf.cell(
+            0,
+            10,
+            (
+                "No itinerary generated yet."
+                if language == "en"
+                else "Nessun itinerario generato per questo viaggio."
+            ),
+            ln=True,
+        )
+    else:
+        current_date_str = None
+        day_count = 0
+
+        for item in itinerary:
+            dt = _pdf_datetime(item.start_time)
+            if not dt:
+                continue
+
+            date_str = dt.strftime("%Y-%m-%d")
+
+            if date_str != current_date_str:
+                current_date_str = date_str
+                day_count += 1
+
+                if pdf.get_y() > 240:
+                    pdf.add_page()
+
+                pdf.ln(4)
+                pdf.set_font("Helvetica", "B", 14)
+                pdf.set_text_color(0, 122, 255)
+                pdf.cell(
+                    0,
+                    10,
+                    f"{L['day']} {day_count} - {dt.strftime('%d/%m/%Y')}",
+                    ln=True,
+                )
+                pdf.line(pdf.get_x(), pdf.get_y(), pdf.get_x() + 50, pdf.get_y())
+                pdf.ln(2)
+
+            pdf.set_font("Helvetica", "B", 11)
+            pdf.set_text_color(50, 50, 50)
+            time_display = dt.strftime("%H:%M")
+            pdf.cell(20, 8, f"{time_display}", ln=False)
+
+            pdf.set_font("Helvetica", "B", 11)
+            pdf.set_text_color(0, 0, 0)
+            pdf.cell(0, 8, f"{item.title}", ln=True)
+
+            if item.description:
+                pdf.set_font("Helvetica", "", 9)
+                pdf.set_text_color(100, 100, 100)
+                pdf.set_x(30)
+                pdf.multi_cell(0, 5, f"{item.description}")
+
+            pdf.ln(2)
+
+    pdf.ln(10)
+
+    if expenses:
+        if pdf.get_y() > 180:
+            pdf.add_page()
+        pdf.set_font("Helvetica", "B", 16)
+        pdf.set_fill_color(240, 244, 255)
+        pdf.set_text_color(25, 42, 86)
+        pdf.cell(0, 12, f"   {L['finances']}", ln=True, fill=True)
+        pdf.ln(5)
+
+        total_eur = sum(e.amount for e in expenses)
+
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_fill_color(25, 42, 86)
+        pdf.cell(30, 8, f" {L['date']}", border=0, fill=True)
+        pdf.cell(80, 8, f" {L['description']}", border=0, fill=True)
+        pdf.cell(30, 8, f" {L['category']}", border=0, fill=True)
+        pdf.cell(50, 8, f" {L['amount']}", border=0, fill=True, ln=True)
+
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "", 9)
+        fill = False
+        for e in expenses:
+            (
+                pdf.set_fill_color(245, 247, 250)
+                if fill
+                else pdf.set_fill_color(255, 255, 255)
+            )
+            pdf.cell(30, 8, _pdf_date_only(e.date), border=0, fill=True)
+            pdf.cell(80, 8, f" {str(e.description)[:40]}", border=0, fill=True)
+            pdf.cell(30, 8, f" {str(e.category)}", border=0, fill=True)
+            pdf.cell(50, 8, f" {e.amount:.2f} EUR", border=0, fill=True, ln=True)
+            fill = not fill
+
+        pdf.ln(5)
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.set_text_color(0, 122, 255)
+        pdf.cell(0, 10, f"{L['total_spent']}: {total_eur:.2f} EUR", ln=True, align="R")
+
+    pdf_bytes = pdf.output()
+    return bytes(pdf_bytes) if isinstance(pdf_bytes, bytearray) else pdf_bytes
@@ -0,0 +1,156 @@
+"""
+SplitPlan AI — Request Profiler
+================================
+Cattura un cProfile delle richieste lente, per i casi che in locale non si
+riproducono (export PDF, generazione itinerario, analytics aziendali).
+
+Quando si profila
+-----------------
+- Su richiesta: header `X-Profile: 1` insieme a un `X-Admin-Token` valido.
+  Il profilo viene sempre salvato.
+- Per soglia: con PROFILE_SLOW_MS > 0 una frazione PROFILE_SAMPLE_RATE delle
+  richieste viene profilata e il profilo si tiene solo se la richiesta ha
+  superato la soglia. cProfile rallenta il codice profilato: in produzione
+  conviene un campionamento basso.
+- Mai gli stream SSE (/stream/*): restano aperti per minuti in attesa.
+
+Si profila una richiesta alla volta (cProfile e' uno per processo). Essendo
+il profiler attivo sul thread dell'event loop, il profilo di un endpoint
+async puo' contenere frame di altre richieste concorrenti; per gli endpoint
+sync eseguiti nel threadpool si vede solo l'attesa del thread.
+
+Gli ultimi PROFILE_KEEP profili restano in memoria (e su disco in
+PROFILE_DIR, se configurata). /admin/profiles li elenca e li scarica nel
+formato di pstats: `python -m pstats profilo.prof`.
+"""
+
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from admin_auth import admin_token_valido
+from services.timing import _e_stream, _route_template
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))       # 0 = solo su richiesta
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_DIR = os.getenv("PROFILE_DIR")                           # es. /tmp/profiles
+
+_profili = deque(maxlen=PROFILE_KEEP)
+_contatore = itertools.count(1)
+_in_corso = threading.Lock()
+
+
+def elenco_profili() -> list:
+    """Metadati dei profili salvati, dal piu' recente."""
+    return [{k: v for k, v in p.items() if k != "dati"} for p in reversed(_profili)]
+
+
+def profilo(id_profilo: int) -> Optional[dict]:
+    for p in _profili:
+        if p["id"] == id_profilo:
+            return p
+    return None
+
+
+class _StatsSalvate:
+    # pstats.Stats accetta qualunque oggetto con create_stats() e .stats
+    def __init__(self, dati: bytes):
+        self.stats = marshal.loads(dati)
+
+    def create_stats(self):
+        pass
+
+
+def testo_profilo(voce: dict, righe: int = 40) -> str:
+    """Riepilogo leggibile (le funzioni piu' costose per tempo cumulativo)."""
+    buffer = io.StringIO()
+    statistiche = pstats.Stats(_StatsSalvate(voce["dati"]), stream=buffer)
+    statistiche.sort_stats("cumulative").print_stats(righe)
+    return buffer.getvalue()
+
+
+def _salva(profiler: cProfile.Profile, metadati: dict):
+    statistiche = pstats.Stats(profiler)
+    # Stesso contenuto di Stats.dump_stats(): pstats.Stats(file) lo rilegge.
+    dati = marshal.dumps(statistiche.stats)
+    voce = {"id": next(_contatore), **metadati, "size_bytes": len(dati), "dati": dati}
+    _profili.append(voce)
+
+    if PROFILE_DIR:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"profile-{voce['id']}.prof"), "wb") as f:
+                f.write(dati)
+        except OSError as e:
+            logger.warning(f"[Profiler] Impossibile scrivere il profilo su disco: {e}")
+
+    logger.info(
+        f"[Profiler] Profilo {voce['id']} salvato: {metadati['method']} {metadati['path']} "
+        f"{metadati['duration_ms']}ms ({metadati['reason']})"
+    )
+
+
+def _richiesto_da_header(scope) -> bool:
+    header = {k.lower(): v for k, v in scope.get("headers", [])}
+    if header.get(b"x-profile", b"").strip() not in (b"1", b"true"):
+        return False
+    token = header.get(b"x-admin-token", b"").decode("latin-1")
+    return admin_token_valido(token)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Gli stream SSE durano minuti: il profilo sarebbe solo attesa e
+        # terrebbe occupato per tutto il tempo l'unico posto del profiler.
+        if scope["type"] != "http" or _e_stream(scope):
+            await self.app(scope, receive, send)
+            return
+
+        richiesto = _richiesto_da_header(scope)
+        campionato = PROFILE_SLOW_MS > 0 and random.random() < PROFILE_SAMPLE_RATE
+        if not (richiesto or campionato) or not _in_corso.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        stato = {"status": 500}
+
+        async def send_con_stato(messaggio):
+            if messaggio["type"] == "http.response.start":
+                stato["status"] = messaggio["status"]
+            await send(messaggio)
+
+        profiler = cProfile.Profile()
+        inizio = time.perf_counter()
+        try:
+            profiler.enable()
+            await self.app(scope, receive, send_con_stato)
+        finally:
+            profiler.disable()
+            _in_corso.release()
+            durata_ms = round((time.perf_counter() - inizio) * 1000, 1)
+            if richiesto or durata_ms >= PROFILE_SLOW_MS:
+                _salva(profiler, {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": _route_template(scope),
+                    "status": stato["status"],
+                    "duration_ms": durata_ms,
+                    "reason": "header" if richiesto else "slow",
+                })
@@ -0,0 +1,329 @@
+"""
+SplitPlan AI — Quote AI
+========================
+Contatori atomici delle chiamate AI:
+
+- B2C free: chiamate per account al giorno (FREE_LIMIT).
+- B2B: chiamate per account al mese (solo tracciamento) e per azienda al
+  mese (cap Company.max_ai_calls_per_month).
+- B2C Pro: nessun limite, nessun tracciamento.
+
+Con Redis controllo e incremento sono un solo script Lua: un round-trip,
+nessun lock e nessun COMMIT sul database nel percorso della richiesta. Le
+colonne Account.daily_ai_usage / monthly_ai_usage e Company.monthly_ai_usage
+restano la copia per report e dashboard: gli account toccati finiscono in un
+set "dirty" e sincronizza_quote() riscrive i loro contatori (job periodico:
+ciclo_sincronizzazione fuori da Vercel, su Vercel il cron di vercel.json su
+GET /cron/quotas-sync; POST /admin/quotas/sync resta per l'uso manuale).
+
+Se Redis non e' configurato o non risponde si usa il database con UPDATE
+condizionali su una sola riga (account o azienda), sempre O(1). A differenza
+del rate limit di login qui non si fa fail-open: le chiamate AI costano.
+
+Alla prima chiamata del periodo il contatore Redis parte dal valore nelle
+colonne, cosi' un riavvio di Redis o un periodo passato sul fallback non
+azzerano l'uso gia' registrato.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, bindparam, case, update
+from sqlmodel import Session, select
+
+from models import Account, Company
+from services.metrics import counter
+from services.redis_service import esegui_script, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+FREE_LIMIT = 20
+QUOTA_SYNC_SECONDS = int(os.getenv("QUOTA_SYNC_SECONDS", "60"))
+QUOTA_SYNC_BATCH = 500
+
+# Hash tag {ai}: tutte le chiavi nello stesso slot, come richiede uno script
+# multi-chiave su Redis Cluster.
+_PREFISSO = "quota:{ai}"
+_CHIAVE_DIRTY = f"{_PREFISSO}:dirty"
+_TTL_GIORNO = 2 * 86400
+_TTL_MESE = 35 * 86400
+
+_ESITI = counter(
+    "ai_quota_checks_total",
+    "Controlli di quota AI per backend (redis, db) ed esito (allowed, rejected)",
+    ["backend", "result"],
+)
+
+# KEYS[1..n]: contatori, KEYS[n+1]: set dirty.
+# ARGV[1]: membro del set dirty; per ogni contatore i, da ARGV[2 + (i-1)*3]:
+# ttl, limite (-1 = nessuno), valore iniziale se la chiave non esiste.
+# Tutti i limiti si controllano prima di incrementare: passano tutti o nessuno.
+# Ritorna {1, 0, nuovo valore del primo contatore} oppure {0, i, valore}
+# con i = contatore che ha bloccato.
+_SCRIPT_CONSUMA = """
+local n = #KEYS - 1
+local correnti = {}
+for i = 1, n do
+  local base = 2 + (i - 1) * 3
+  local corrente = tonumber(redis.call('GET', KEYS[i]) or ARGV[base + 2])
+  local limite = tonumber(ARGV[base + 1])
+  if limite >= 0 and corrente >= limite then
+    return {0, i, corrente}
+  end
+  correnti[i] = corrente
+end
+for i = 1, n do
+  redis.call('SET', KEYS[i], correnti[i] + 1, 'EX', ARGV[2 + (i - 1) * 3])
+end
+redis.call('SADD', KEYS[n + 1], ARGV[1])
+return {1, 0, correnti[1] + 1}
+"""
+
+
+def _periodi() -> Tuple[str, str]:
+    adesso = datetime.now(timezone.utc)
+    return adesso.strftime("%Y-%m-%d"), adesso.strftime("%Y-%m")
+
+
+def _chiave_account_giorno(account_id: int, giorno: str) -> str:
+    return f"{_PREFISSO}:a:{account_id}:d:{giorno}"
+
+
+def _chiave_account_mese(account_id: int, mese: str) -> str:
+    return f"{_PREFISSO}:a:{account_id}:m:{mese}"
+
+
+def _chiave_azienda_mese(company_id: int, mese: str) -> str:
+    return f"{_PREFISSO}:c:{company_id}:m:{mese}"
+
+
+def _contatori(account: Account, company: Optional[Company], giorno: str, mese: str) -> List[tuple]:
+    """(chiave, ttl, limite, valore iniziale) dei contatori da incrementare."""
+    if account.company_id is None:
+        iniziale = account.daily_ai_usage if account.last_usage_reset == giorno else 0
+        return [(_chiave_account_giorno(account.id, giorno), _TTL_GIORNO, FREE_LIMIT, iniziale)]
+
+    iniziale = account.monthly_ai_usage if account.last_monthly_reset == mese else 0
+    contatori = [(_chiave_account_mese(account.id, mese), _TTL_MESE, -1, iniziale)]
+    if company is not None:
+        iniziale = company.monthly_ai_usage if company.last_monthly_reset == mese else 0
+        contatori.append(
+            (_chiave_azienda_mese(company.id, mese), _TTL_MESE, company.max_ai_calls_per_month, iniziale)
+        )
+    return contatori
+
+
+async def _consuma_redis(client, contatori: List[tuple], account_id: int) -> Tuple[bool, int, int]:
+    chiavi = [c[0] for c in contatori] + [_CHIAVE_DIRTY]
+    argomenti = [str(account_id)]
+    for _, ttl, limite, iniziale in contatori:
+        argomenti += [ttl, limite, iniziale]
+    consentito, bloccante, valore = await esegui_script(client, _SCRIPT_CONSUMA, chiavi, argomenti)
+    return bool(int(consentito)), int(bloccante), int(valore)
+
+
+def _consuma_db(account: Account, company: Optional[Company], session: Session, giorno: str, mese: str) -> Tuple[bool, int, int]:
+    """Fallback senza Redis: UPDATE condizionali, una riga per tabella."""
+    if account.company_id is None:
+        risultato = session.execute(
+            update(Account)
+            .where(
+                Account.id == account.id,
+                # Passa solo se e' un nuovo giorno OPPURE siamo ancora sotto il limite
+                (Account.last_usage_reset != giorno)
+                | (Account.last_usage_reset.is_(None))
+                | (Account.daily_ai_usage < FREE_LIMIT),
+            )
+            .values(
+                daily_ai_usage=case(
+                    (Account.last_usage_reset == giorno, Account.daily_ai_usage + 1),
+                    else_=1,
+                ),
+                last_usage_reset=giorno,
+            )
+        )
+        session.commit()
+        return risultato.rowcount > 0, 1, FREE_LIMIT
+
+    if company is not None:
+        risultato = session.execute(
+            update(Company)
+            .where(
+                Company.id == company.id,
+                (Company.last_monthly_reset != mese)
+                | (Company.last_monthly_reset.is_(None))
+                | (Company.monthly_ai_usage < Company.max_ai_calls_per_month),
+            )
+            .values(
+                monthly_ai_usage=case(
+                    (Company.last_monthly_reset == mese, Company.monthly_ai_usage + 1),
+                    else_=1,
+                ),
+                last_monthly_reset=mese,
+            )
+        )
+        if risultato.rowcount == 0:
+            session.rollback()
+            return False, 2, company.max_ai_calls_per_month
+
+    session.execute(
+        update(Account)
+        .where(Account.id == account.id)
+        .values(
+            monthly_ai_usage=case(
+                (Account.last_monthly_reset == mese, Account.monthly_ai_usage + 1),
+                else_=1,
+            ),
+            last_monthly_reset=mese,
+        )
+    )
+    session.commit()
+    return True, 0, 0
+
+
+async def consuma_chiamata_ai(account: Account, session: Session) -> None:
+    """
+    Conta una chiamata AI e solleva 429 se l'account (B2C free) o la sua
+    azienda (B2B) hanno esaurito la quota del periodo.
+    """
+    if account.company_id is None and account.is_subscribed:
+        return
+
+    giorno, mese = _periodi()
+    company = session.get(Company, account.company_id) if account.company_id else None
+    contatori = _contatori(account, company, giorno, mese)
+
+    esito = None
+    backend = "redis"
+    client = get_redis_client()
+    if client is not None:
+        try:
+            esito = await _consuma_redis(client, contatori, account.id)
+        except Exception as e:
+            logger.error(f"[Quota] Redis non disponibile, uso il database: {e}")
+    if esito is None:
+        backend = "db"
+        esito = _consuma_db(account, company, session, giorno, mese)
+
+    consentito, bloccante, valore = esito
+    _ESITI.inc(backend=backend, result="allowed" if consentito else "rejected")
+    if consentito:
+        return
+
+    if account.company_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Hai raggiunto il limite giornaliero di {FREE_LIMIT} chiamate AI per utenti Free. Passa a Pro per navigare senza limiti!",
+        )
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=(
+            f"Limite mensile AI raggiunto: la tua azienda ha eseguito "
+            f"{valore}/{company.max_ai_calls_per_month} chiamate AI questo mese."
+        ),
+    )
+
+
+async def utilizzo_giornaliero(account: Account) -> Optional[int]:
+    """Uso di oggi letto da Redis (piu' fresco della colonna), None se non disponibile."""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        valore = await client.get(_chiave_account_giorno(account.id, _periodi()[0]))
+    except Exception as e:
+        logger.warning(f"[Quota] Lettura uso giornaliero fallita: {e}")
+        return None
+    return int(valore) if valore is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Write-back delle colonne
+# ---------------------------------------------------------------------------
+
+def _aggiorna_colonne(session: Session, tabella, colonna: str, colonna_periodo: str, righe: List[dict]):
+    """
+    UPDATE in executemany. Non si scende mai sotto il valore gia' presente per
+    lo stesso periodo: durante un'interruzione di Redis il fallback puo' aver
+    contato piu' di quanto risulta nella chiave.
+    """
+    if not righe:
+        return
+    valore, periodo = tabella.c[colonna], tabella.c[colonna_periodo]
+    session.connection().execute(
+        update(tabella)
+        .where(tabella.c.id == bindparam("b_id"))
+        .values({
+            colonna: case(
+                (and_(periodo == bindparam("b_periodo"), valore > bindparam("b_valore")), valore),
+                else_=bindparam("b_valore"),
+            ),
+            colonna_periodo: bindparam("b_periodo"),
+        }),
+        righe,
+    )
+
+
+async def sincronizza_quote(session: Session) -> dict:
+    """Riscrive nelle colonne i contatori degli account toccati dall'ultimo giro."""
+    client = get_redis_client()
+    if client is None:
+        return {"accounts": 0, "companies": 0}
+
+    membri = await client.spop(_CHIAVE_DIRTY, QUOTA_SYNC_BATCH) or []
+    if not membri:
+        return {"accounts": 0, "companies": 0}
+
+    try:
+        giorno, mese = _periodi()
+        account_ids = [int(m) for m in membri]
+        righe = session.exec(
+            select(Account.id, Account.company_id).where(Account.id.in_(account_ids))
+        ).all()
+        company_ids = sorted({c for _, c in righe if c is not None})
+
+        chiavi = []
+        for account_id, _ in righe:
+            chiavi += [_chiave_account_giorno(account_id, giorno), _chiave_account_mese(account_id, mese)]
+        chiavi += [_chiave_azienda_mese(c, mese) for c in company_ids]
+        valori = await client.mget(chiavi) if chiavi else []
+
+        giornalieri, mensili, aziende = [], [], []
+        for i, (account_id, _) in enumerate(righe):
+            giorno_val, mese_val = valori[2 * i], valori[2 * i + 1]
+            if giorno_val is not None:
+                giornalieri.append({"b_id": account_id, "b_valore": int(giorno_val), "b_periodo": giorno})
+            if mese_val is not None:
+                mensili.append({"b_id": account_id, "b_valore": int(mese_val), "b_periodo": mese})
+        for company_id, valore in zip(company_ids, valori[2 * len(righe):]):
+            if valore is not None:
+                aziende.append({"b_id": company_id, "b_valore": int(valore), "b_periodo": mese})
+
+        account_t, company_t = Account.__table__, Company.__table__
+        _aggiorna_colonne(session, account_t, "daily_ai_usage", "last_usage_reset", giornalieri)
+        _aggiorna_colonne(session, account_t, "monthly_ai_usage", "last_monthly_reset", mensili)
+        _aggiorna_colonne(session, company_t, "monthly_ai_usage", "last_monthly_reset", aziende)
+        session.commit()
+    except Exception:
+        session.rollback()
+        # Rimessi nel set: li riprende il giro successivo.
+        await client.sadd(_CHIAVE_DIRTY, *membri)
+        raise
+
+    logger.info(f"[Quota] Write-back: {len(righe)} account, {len(aziende)} aziende")
+    return {"accounts": len(righe), "companies": len(aziende)}
+
+
+async def ciclo_sincronizzazione(session_factory):
+    """Write-back periodico per i deploy con processo persistente (non Vercel)."""
+    while True:
+        await asyncio.sleep(QUOTA_SYNC_SECONDS)
+        try:
+            with session_factory() as session:
+                await sincronizza_quote(session)
+        except Exception as e:
+            logger.error(f"[Quota] Write-back fallito: {e}")
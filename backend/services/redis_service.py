@@ -5,13 +5,27 @@ In ambiente serverless (Vercel) un rate limiter in-memory è inefficace
 perché ogni invocazione può finire su un container diverso. Questo modulo
 centralizza le chiamate a Redis (Upstash) usando `redis.asyncio`.
 
-Strategia fail-open: se Redis non è raggiungibile il rate limiter NON
-blocca le richieste (preferiamo disponibilità a un hard-lock che
-chiuderebbe l'autenticazione).
+Rate limiting: GCRA (Generic Cell Rate Algorithm) in un solo script Lua,
+quindi un round-trip per controllo. Rispetto alla finestra fissa non
+permette il doppio burst a cavallo di due finestre: le richieste si
+"ricaricano" una ogni window/max secondi.
+
+Se Redis non risponde, o non c'e' (REDIS_URL assente, libreria mancante),
+si ripiega su un limiter in-process con lo stesso algoritmo e un numero
+massimo di chiavi: per istanza, quindi piu' permissivo, ma non del tutto
+aperto.
 """
+import hashlib
 import logging
+import math
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from services.metrics import counter
 
 try:
     from redis.asyncio import Redis  # type: ignore
@@ -22,6 +36,17 @@ except Exception:  # pragma: no cover - libreria opzionale
 
 logger = logging.getLogger(__name__)
 
+_CONTROLLI = counter(
+    "rate_limit_checks_total",
+    "Controlli di rate limit per ambito ed esito (allowed, rejected)",
+    ["scope", "result"],
+)
+_FALLBACK = counter(
+    "rate_limit_fallback_total",
+    "Controlli di rate limit decisi dal limiter in-process perche' Redis non ha risposto",
+    ["scope"],
+)
+
 _redis_client: Optional["Redis"] = None
 _init_attempted = False
 
@@ -39,12 +64,12 @@ def get_redis_client() -> Optional["Redis"]:
     _init_attempted = True
 
     if not _REDIS_IMPORTED:
-        logger.error("[Redis] libreria 'redis' non installata: rate limiting disabilitato.")
+        logger.error("[Redis] libreria 'redis' non installata: rate limiting solo in-process.")
         return None
 
     url = os.getenv("REDIS_URL")
     if not url:
-        logger.warning("[Redis] REDIS_URL non configurato: rate limiting disabilitato.")
+        logger.warning("[Redis] REDIS_URL non configurato: rate limiting solo in-process.")
         return None
 
     try:
@@ -62,24 +87,127 @@ def get_redis_client() -> Optional["Redis"]:
         return None
 
 
-async def check_rate_limit(key: str, max_attempts: int, window_seconds: int) -> bool:
+async def esegui_script(client, script: str, chiavi: Sequence[str], argomenti: Sequence) -> list:
+    """
+    Esegue uno script Lua con EVALSHA (lo SHA si calcola in locale, quindi
+    di norma basta un round-trip) e ripiega su EVAL se il server non ha
+    ancora lo script in cache.
+    """
+    sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+    try:
+        return await client.evalsha(sha, len(chiavi), *chiavi, *argomenti)
+    except Exception as e:
+        if "NOSCRIPT" not in str(e):
+            raise
+        return await client.eval(script, len(chiavi), *chiavi, *argomenti)
+
+
+@dataclass
+class EsitoLimite:
+    superato: bool
+    rimanenti: int         # richieste ancora ammesse subito
+    retry_after_s: int     # attesa prima della prossima richiesta ammessa (0 se ammessa)
+    reset_s: int           # secondi al ripristino completo del limite
+
+
+# GCRA. KEYS[1]: chiave; ARGV: max tentativi, finestra in ms.
+# La chiave contiene il TAT (theoretical arrival time) in ms, con l'ora del
+# server Redis: nessuna dipendenza dall'orologio delle istanze.
+# Ritorna {ammesso 0/1, rimanenti, retry_after_ms, reset_ms}.
+_SCRIPT_GCRA = """
+local massimo = tonumber(ARGV[1])
+local finestra = tonumber(ARGV[2])
+local intervallo = finestra / massimo
+local t = redis.call('TIME')
+local adesso = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or adesso)
+if tat < adesso then tat = adesso end
+-- Si confrontano distanze dal presente, non istanti assoluti: con un
+-- intervallo frazionario (tat + i) - f puo' differire da tat - (f - i).
+local attesa = (tat - adesso) - (finestra - intervallo)
+if attesa > 0 then
+  return {0, 0, math.ceil(attesa), math.ceil(tat - adesso)}
+end
+redis.call('SET', KEYS[1], tat + intervallo, 'PX', math.ceil(tat + intervallo - adesso))
+local rimanenti = math.floor(-attesa / intervallo + 1e-9)
+return {1, rimanenti, 0, math.ceil(tat + intervallo - adesso)}
+"""
+
+
+def _gcra(tat: Optional[float], adesso: float, massimo: int, finestra: float):
+    """Stesso calcolo dello script, in secondi: (esito, nuovo tat o None)."""
+    intervallo = finestra / massimo
+    tat = max(tat or adesso, adesso)
+    attesa = (tat - adesso) - (finestra - intervallo)
+    if attesa > 0:
+        return EsitoLimite(True, 0, math.ceil(attesa), math.ceil(tat - adesso)), None
+    rimanenti = int(-attesa / intervallo + 1e-9)
+    return EsitoLimite(False, rimanenti, 0, math.ceil(tat + intervallo - adesso)), tat + intervallo
+
+
+class LimiterLocale:
     """
-    Incrementa il contatore associato a `key`. Al primo INCR imposta la
-    scadenza della chiave a `window_seconds` (finestra fissa).
+    GCRA in memoria per quando Redis non risponde. Tiene al massimo
+    `max_chiavi` chiavi (LRU): una chiave scartata riparte da zero, che per
+    un limiter di riserva e' un compromesso accettabile.
+    """
+
+    def __init__(self, max_chiavi: int = 10_000):
+        self.max_chiavi = max_chiavi
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def controlla(self, key: str, max_attempts: int, window_seconds: int) -> EsitoLimite:
+        with self._lock:
+            adesso = time.monotonic()
+            esito, nuovo_tat = _gcra(self._tat.get(key), adesso, max_attempts, window_seconds)
+            if nuovo_tat is not None:
+                self._tat[key] = nuovo_tat
+            if key in self._tat:
+                self._tat.move_to_end(key)
+            while len(self._tat) > self.max_chiavi:
+                self._tat.popitem(last=False)
+            return esito
+
+
+_limiter_locale = LimiterLocale(int(os.getenv("RATE_LIMIT_FALLBACK_KEYS", "10000")))
+
+
+async def check_rate_limit(key: str, max_attempts: int, window_seconds: int, ambito: str) -> EsitoLimite:
+    """
+    Conta un tentativo su `key`: al massimo `max_attempts` ogni
+    `window_seconds`, con ricarica graduale (GCRA). `ambito` (es. "login")
+    e' l'etichetta delle metriche: lo passa il chiamante, perche' dalla
+    chiave non si ricava (un IPv6 contiene ":"), e l'identificativo nelle
+    etichette farebbe una serie per ogni IP.
 
     Returns:
-        True  → limite superato (il chiamante deve rispondere 429)
-        False → richiesta ammessa (anche in caso di Redis down: fail-open)
+        EsitoLimite: `superato` True -> il chiamante risponde 429 usando
+        `retry_after_s` per l'header Retry-After.
     """
     client = get_redis_client()
     if client is None:
-        return False
+        # Senza Redis (REDIS_URL assente o libreria mancante) non si apre
+        # tutto: vale il limiter locale, per processo.
+        _FALLBACK.inc(scope=ambito)
+        esito = _limiter_locale.controlla(key, max_attempts, window_seconds)
+        _CONTROLLI.inc(scope=ambito, result="rejected" if esito.superato else "allowed")
+        return esito
 
     try:
-        count = await client.incr(key)
-        if count == 1:
-            await client.expire(key, window_seconds)
-        return count > max_attempts
+        ammesso, rimanenti, retry_ms, reset_ms = await esegui_script(
+            client, _SCRIPT_GCRA, [key], [max_attempts, window_seconds * 1000]
+        )
+        esito = EsitoLimite(
+            superato=not int(ammesso),
+            rimanenti=int(rimanenti),
+            retry_after_s=math.ceil(int(retry_ms) / 1000),
+            reset_s=math.ceil(int(reset_ms) / 1000),
+        )
     except Exception as e:
-        logger.error(f"[Redis] Errore durante rate limit su '{key}': {e}")
-        return False
+        logger.error(f"[Redis] Errore durante rate limit su '{key}', uso il limiter locale: {e}")
+        _FALLBACK.inc(scope=ambito)
+        esito = _limiter_locale.controlla(key, max_attempts, window_seconds)
+
+    _CONTROLLI.inc(scope=ambito, result="rejected" if esito.superato else "allowed")
+    return esito
@@ -0,0 +1,192 @@
+"""
+SplitPlan AI — Statistiche utente
+==================================
+Numeri della pagina profilo (GET /trips/stats) calcolati con aggregati SQL e
+tenuti in una cache per account.
+
+La cache e' in-process (come quella delle matrici OSRM): ogni voce ricorda
+gli id dei viaggi da cui e' stata calcolata e viene scartata al COMMIT di
+una scrittura su quei viaggi, sulle loro spese o sui loro partecipanti
+(services/trip_changes). Le altre istanze non vedono l'invalidazione: per
+loro vale STATS_CACHE_SECONDS come limite di vecchiaia.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import Date, Integer, case, cast, func
+from sqlmodel import Session, select
+
+from models import Expense, Participant, Trip
+from services.metrics import counter
+from services.trip_changes import Modifiche, su_modifica
+
+STATS_CACHE_SECONDS = int(os.getenv("STATS_CACHE_SECONDS", "300"))
+STATS_CACHE_MAX = 10_000
+
+_CACHE_STATS = counter("user_stats_cache_total", "Lookup della cache delle statistiche utente", ["result"])
+
+STATISTICHE_VUOTE = {
+    "total_trips": 0,
+    "completed_trips": 0,
+    "total_spent": 0.0,
+    "total_days": 0,
+    "unique_cities": 0,
+    "cities_list": [],
+}
+
+
+class _CacheStatistiche:
+    def __init__(self, max_voci: int):
+        self.max_voci = max_voci
+        self._voci: "OrderedDict[int, tuple]" = OrderedDict()   # account -> (scadenza, dati, trip_ids)
+        self._per_viaggio: Dict[int, Set[int]] = {}            # trip_id -> account in cache
+        self._lock = threading.Lock()
+        # Avanza a ogni invalidazione: un calcolo iniziato prima di una
+        # scrittura non deve finire in cache dopo di essa.
+        self.generazione = 0
+
+    def leggi(self, account_id: int) -> Optional[dict]:
+        with self._lock:
+            voce = self._voci.get(account_id)
+            if voce is None or voce[0] < time.monotonic():
+                return None
+            self._voci.move_to_end(account_id)
+            return voce[1]
+
+    def scrivi(self, account_id: int, dati: dict, trip_ids, generazione: int):
+        with self._lock:
+            if generazione != self.generazione:
+                return
+            self._rimuovi(account_id)
+            self._voci[account_id] = (time.monotonic() + STATS_CACHE_SECONDS, dati, frozenset(trip_ids))
+            for trip_id in trip_ids:
+                self._per_viaggio.setdefault(trip_id, set()).add(account_id)
+            while len(self._voci) > self.max_voci:
+                self._rimuovi(next(iter(self._voci)))
+
+    def invalida(self, account_ids=(), trip_ids=()):
+        with self._lock:
+            self.generazione += 1
+            bersagli = set(account_ids)
+            for trip_id in trip_ids:
+                bersagli |= self._per_viaggio.get(trip_id, set())
+            for account_id in bersagli:
+                self._rimuovi(account_id)
+
+    def svuota(self):
+        with self._lock:
+            self._voci.clear()
+            self._per_viaggio.clear()
+
+    def _rimuovi(self, account_id: int):
+        voce = self._voci.pop(account_id, None)
+        if voce is None:
+            return
+        for trip_id in voce[2]:
+            account = self._per_viaggio.get(trip_id)
+            if account is not None:
+                account.discard(account_id)
+                if not account:
+                    del self._per_viaggio[trip_id]
+
+
+_cache = _CacheStatistiche(STATS_CACHE_MAX)
+
+
+@su_modifica
+def _invalida_statistiche(modifiche: Modifiche):
+    # Cambiano le statistiche solo trip (stato, costi, date), spese e partecipanti.
+    toccati = [
+        trip_id for trip_id, aree in modifiche.viaggi.items()
+        if aree & {"trip", "expenses", "participants"}
+    ]
+    if not toccati and not modifiche.account:
+        return
+    _cache.invalida(account_ids=modifiche.account, trip_ids=toccati)
+
+
+def _giorni_tra(session: Session, inizio, fine):
+    """Differenza in giorni di calendario tra due colonne datetime."""
+    if session.get_bind().dialect.name == "sqlite":
+        return cast(func.julianday(func.date(fine)) - func.julianday(func.date(inizio)), Integer)
+    return cast(fine, Date) - cast(inizio, Date)
+
+
+def calcola_statistiche(session: Session, account_id: int) -> tuple:
+    """(statistiche, id dei viaggi) dei viaggi attivi dell'account, senza caricare righe Trip."""
+    trip_ids = session.exec(
+        select(Participant.trip_id).where(
+            Participant.account_id == account_id,
+            Participant.is_active == True,
+            Participant.trip_id.is_not(None),
+        )
+    ).all()
+    if not trip_ids:
+        return dict(STATISTICHE_VUOTE), []
+
+    miei = Trip.id.in_(
+        select(Participant.trip_id).where(
+            Participant.account_id == account_id,
+            Participant.is_active == True,
+        )
+    )
+    completato = Trip.status == "COMPLETED"
+    persone = func.coalesce(func.nullif(Trip.num_people, 0), 1)
+    giorni = func.abs(_giorni_tra(session, Trip.start_date, Trip.end_date)) + 1
+
+    totale, completati, quota_costi, totale_giorni = session.exec(
+        select(
+            func.count(Trip.id),
+            func.coalesce(func.sum(case((completato, 1), else_=0)), 0),
+            # Trasporto e hotel divisi tra i partecipanti del viaggio
+            func.coalesce(
+                func.sum((func.coalesce(Trip.transport_cost, 0.0) + func.coalesce(Trip.hotel_cost, 0.0)) / persone),
+                0.0,
+            ),
+            func.coalesce(
+                func.sum(case(
+                    (completato & Trip.start_date.is_not(None) & Trip.end_date.is_not(None), giorni),
+                    else_=0,
+                )),
+                0,
+            ),
+        ).where(miei)
+    ).one()
+
+    # Spese pagate dall'account nei viaggi in cui e' attivo
+    spese = session.exec(
+        select(func.coalesce(func.sum(Expense.amount), 0.0))
+        .join(Participant, Expense.payer_id == Participant.id)
+        .where(Participant.account_id == account_id, Participant.is_active == True)
+    ).one()
+
+    citta = func.coalesce(func.nullif(Trip.destination, ""), Trip.real_destination)
+    elenco_citta = [
+        c for c in session.exec(select(citta).distinct().where(miei, completato)).all() if c
+    ]
+
+    dati = {
+        "total_trips": totale,
+        "completed_trips": completati,
+        "total_spent": round(float(spese) + float(quota_costi), 2),
+        "total_days": int(totale_giorni),
+        "unique_cities": len(elenco_citta),
+        "cities_list": sorted(elenco_citta),
+    }
+    return dati, trip_ids
+
+
+def statistiche_utente(session: Session, account_id: int) -> dict:
+    dati = _cache.leggi(account_id)
+    if dati is not None:
+        _CACHE_STATS.inc(result="hit")
+        return dati
+    _CACHE_STATS.inc(result="miss")
+    generazione = _cache.generazione
+    dati, trip_ids = calcola_statistiche(session, account_id)
+    _cache.scrivi(account_id, dati, trip_ids, generazione)
+    return dati
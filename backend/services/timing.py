@@ -0,0 +1,215 @@
+"""
+SplitPlan AI — Request Timing
+==============================
+Misura dove passa il tempo ogni richiesta.
+
+- TimingMiddleware (ASGI puro): istogramma della latenza per metodo, route e
+  status, header `Server-Timing` sulla risposta e una riga di log per le
+  richieste lente con il dettaglio degli stage.
+- span(nome): context manager o decoratore (sync e async) per gli stage
+  esterni: gemini, osrm, nominatim, overpass, duffel, stripe. Le query SQL
+  sono misurate come span "db" dagli eventi dell'engine (traccia_query).
+
+Le durate degli span finiscono sia nell'istogramma `span_duration_seconds`
+del registro metriche, sia nel raccoglitore della richiesta corrente (una
+ContextVar), da cui nascono Server-Timing e log delle richieste lente.
+Fuori da una richiesta (script, job) gli span aggiornano solo il registro.
+
+Gli stream SSE (/stream/*, o qualsiasi risposta text/event-stream) restano
+aperti per minuti: non entrano nell'istogramma ne' nel log delle lente.
+
+Configurazione:
+  SERVER_TIMING_HEADER  "0" per non esporre l'header (default attivo)
+  SLOW_REQUEST_MS       soglia del log delle richieste lente (default 1000)
+"""
+
+import functools
+import inspect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from services.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") != "0"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+REQUEST_DURATION = histogram(
+    "http_request_duration_seconds",
+    "Latenza delle richieste HTTP per metodo, route e status",
+    ["method", "route", "status"],
+)
+SPAN_DURATION = histogram(
+    "span_duration_seconds",
+    "Durata degli stage di una richiesta (servizi esterni e database)",
+    ["span"],
+)
+
+
+class RaccoltaSpan:
+    """Span di una singola richiesta, aggregati per nome: {nome: [ms, conteggio]}."""
+
+    def __init__(self):
+        self.stage = {}
+
+    def aggiungi(self, nome: str, secondi: float):
+        # Niente lock: gli endpoint sync girano in un thread, ma gli span di
+        # una stessa richiesta si chiudono uno alla volta.
+        voce = self.stage.setdefault(nome, [0.0, 0])
+        voce[0] += secondi * 1000
+        voce[1] += 1
+
+
+_raccolta: ContextVar[Optional[RaccoltaSpan]] = ContextVar("raccolta_span", default=None)
+
+
+def registra_span(nome: str, secondi: float):
+    """Registra una durata gia' misurata (usato anche dagli eventi SQLAlchemy)."""
+    SPAN_DURATION.observe(secondi, span=nome)
+    raccolta = _raccolta.get()
+    if raccolta is not None:
+        raccolta.aggiungi(nome, secondi)
+
+
+class span:
+    """Misura uno stage. Si usa come context manager o come decoratore:
+
+        with span("stripe"):
+            stripe.checkout.Session.create(...)
+
+        @span("optimizer")
+        async def ottimizza(...): ...
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._inizio = None
+
+    def __enter__(self):
+        self._inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registra_span(self.nome, time.perf_counter() - self._inizio)
+        return False
+
+    # Anche async, per affiancarlo al client HTTP nello stesso `async with`.
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+    def __call__(self, funzione):
+        nome = self.nome
+        if inspect.iscoroutinefunction(funzione):
+            @functools.wraps(funzione)
+            async def wrapper_async(*args, **kwargs):
+                with span(nome):
+                    return await funzione(*args, **kwargs)
+            return wrapper_async
+
+        @functools.wraps(funzione)
+        def wrapper(*args, **kwargs):
+            with span(nome):
+                return funzione(*args, **kwargs)
+        return wrapper
+
+
+def traccia_query(engine):
+    """Misura ogni query eseguita sull'engine come span "db"."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inizio_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_inizi_query", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fine_query(conn, cursor, statement, parameters, context, executemany):
+        inizi = conn.info.get("_inizi_query")
+        if inizi:
+            registra_span("db", time.perf_counter() - inizi.pop())
+
+
+def _header_server_timing(raccolta: RaccoltaSpan, totale_ms: float) -> str:
+    parti = [
+        f'{nome};dur={ms:.1f};desc="{conteggio}x"'
+        for nome, (ms, conteggio) in sorted(raccolta.stage.items())
+    ]
+    parti.append(f"total;dur={totale_ms:.1f}")
+    return ", ".join(parti)
+
+
+def _route_template(scope) -> str:
+    # FastAPI mette in scope la route che ha gestito la richiesta: si usa il
+    # path con i parametri (/trips/{trip_id}) per non avere una serie per id.
+    route = scope.get("route")
+    percorso = getattr(route, "path_format", None) or getattr(route, "path", None)
+    return percorso or "<unmatched>"
+
+
+def _e_stream(scope) -> bool:
+    # Dal path, prima della risposta: serve anche al profiler, che decide
+    # all'inizio. root_path c'e' dietro il prefisso /api di Vercel.
+    percorso = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and percorso.startswith(root_path):
+        percorso = percorso[len(root_path):]
+    return percorso.startswith("/stream/")
+
+
+def _content_type_stream(messaggio) -> bool:
+    for nome, valore in messaggio.get("headers", []):
+        if nome.lower() == b"content-type":
+            return valore.split(b";")[0].strip().lower() == b"text/event-stream"
+    return False
+
+
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _e_stream(scope):
+            await self.app(scope, receive, send)
+            return
+
+        raccolta = RaccoltaSpan()
+        token = _raccolta.set(raccolta)
+        inizio = time.perf_counter()
+        stato = {"status": 500, "stream": False}
+
+        async def send_con_timing(messaggio):
+            if messaggio["type"] == "http.response.start":
+                stato["status"] = messaggio["status"]
+                stato["stream"] = _content_type_stream(messaggio)
+                if SERVER_TIMING_HEADER:
+                    totale_ms = (time.perf_counter() - inizio) * 1000
+                    header = _header_server_timing(raccolta, totale_ms).encode("latin-1")
+                    messaggio = {
+                        **messaggio,
+                        "headers": list(messaggio.get("headers", [])) + [(b"server-timing", header)],
+                    }
+            await send(messaggio)
+
+        try:
+            await self.app(scope, receive, send_con_timing)
+        finally:
+            _raccolta.reset(token)
+            durata = time.perf_counter() - inizio
+            route = _route_template(scope)
+            if not stato["stream"]:
+                REQUEST_DURATION.observe(durata, method=scope["method"], route=route, status=stato["status"])
+            if durata * 1000 >= SLOW_REQUEST_MS and not stato["stream"]:
+                dettaglio = " ".join(
+                    f"{nome}={ms:.0f}ms({conteggio})"
+                    for nome, (ms, conteggio) in sorted(raccolta.stage.items(), key=lambda v: -v[1][0])
+                )
+                logger.warning(
+                    f"[Timing] Richiesta lenta {scope['method']} {route} {stato['status']} "
+                    f"in {durata * 1000:.0f}ms: {dettaglio or 'nessuno stage misurato'}"
+                )
@@ -0,0 +1,203 @@
+"""
+SplitPlan AI — Modifiche ai viaggi
+===================================
+Raccoglie, a ogni flush della sessione, quali viaggi sono stati toccati e in
+quale area (trip, partecipanti, spese, itinerario, proposte, foto) e di quali
+account sono cambiate le notifiche e, solo dopo il COMMIT, avvisa chi si e'
+registrato con su_modifica(). Serve alle cache derivate dai dati del viaggio
+e agli stream di eventi (services/event_bus): reagiscono quando la scrittura
+e' definitiva, mai su una transazione poi annullata.
+
+Le DELETE/UPDATE massive (session.exec(delete(...))) non passano dal flush:
+chi le usa senza toccare anche un oggetto del viaggio chiama
+segnala_modifica() (o segnala_notifiche()). I voti non hanno un trip_id:
+li segnala services/vote_tally con l'area "votes".
+
+Nella stessa transazione della scrittura incrementa anche Trip.version e
+aggiorna Trip.updated_at: sono la base di ETag e Last-Modified delle letture
+del viaggio (utils/conditional.py). Per itinerario, spese, partecipanti e
+foto scrive inoltre una riga di TripChange per ogni riga toccata: e' il
+registro letto da GET /trips/{id}/changes. Le cancellazioni massive passano
+da cancella_in_blocco(), che registra gli id cancellati; i voti li registra
+services/vote_tally con registra().
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Set
+
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session as OrmSession
+
+from models import Expense, ItineraryItem, Notification, Participant, Photo, Proposal, Trip, TripChange, Vote
+
+logger = logging.getLogger(__name__)
+
+_AREE = {
+    Trip: "trip",
+    Participant: "participants",
+    Expense: "expenses",
+    ItineraryItem: "itinerary",
+    Proposal: "proposals",
+    Photo: "photos",
+}
+# Aree con una riga di registro per ogni riga modificata (sincronizzazione).
+AREE_REGISTRO = {
+    "itinerary": ItineraryItem,
+    "expenses": Expense,
+    "participants": Participant,
+    "photos": Photo,
+    "votes": Vote,
+}
+_AREA_REGISTRO = {modello: area for area, modello in AREE_REGISTRO.items()}
+_CHIAVE_INFO = "modifiche_viaggi"
+
+# Oltre questa eta' le righe di TripChange si cancellano (pota_registro, dal
+# cron giornaliero su GET /cron/trip-changes-prune).
+CHANGELOG_RETENTION_DAYS = int(os.getenv("CHANGELOG_RETENTION_DAYS", "30"))
+
+
+@dataclass
+class Modifiche:
+    viaggi: Dict[int, Set[str]] = field(default_factory=dict)   # trip_id -> aree
+    account: Set[int] = field(default_factory=set)             # account entrati/usciti da un viaggio
+    notifiche: Set[int] = field(default_factory=set)           # account con notifiche nuove o lette
+    non_lette: Dict[int, int] = field(default_factory=dict)    # account -> nuovo contatore non lette
+
+    def aggiungi(self, trip_id: int, area: str):
+        self.viaggi.setdefault(trip_id, set()).add(area)
+
+
+_ascoltatori: List[Callable[[Modifiche], None]] = []
+
+
+def su_modifica(funzione: Callable[[Modifiche], None]):
+    """Registra una funzione chiamata dopo ogni COMMIT che tocca dei viaggi."""
+    if funzione not in _ascoltatori:
+        _ascoltatori.append(funzione)
+    return funzione
+
+
+def _incrementa_versione(session: OrmSession, trip_ids: Iterable[int]):
+    # UPDATE Core sulla tabella: non passa dal flush e non tocca gli oggetti
+    # Trip in sessione (i loro version/updated_at si rileggono dopo il commit).
+    tabella = Trip.__table__
+    session.connection().execute(
+        update(tabella)
+        .where(tabella.c.id.in_(list(trip_ids)))
+        .values(version=tabella.c.version + 1, updated_at=datetime.now(timezone.utc))
+    )
+
+
+def segnala_modifica(session: OrmSession, trip_id: int, *aree: str):
+    modifiche = session.info.setdefault(_CHIAVE_INFO, Modifiche())
+    for area in aree:
+        modifiche.aggiungi(trip_id, area)
+    _incrementa_versione(session, [trip_id])
+
+
+def registra(session: OrmSession, righe: Iterable[tuple]):
+    """Scrive nel registro le righe (trip_id, area, entity_id, op). Va chiamata
+    dopo segnala_modifica() sugli stessi viaggi: l'UPDATE della versione prende
+    il lock sulla riga del viaggio, e solo dopo l'id di registro e' in ordine
+    con gli altri scrittori dello stesso viaggio."""
+    adesso = datetime.now(timezone.utc)
+    valori = [
+        {"trip_id": t, "entity": area, "entity_id": e, "op": op, "created_at": adesso}
+        for t, area, e, op in righe
+    ]
+    if valori:
+        session.connection().execute(insert(TripChange.__table__), valori)
+
+
+def cancella_in_blocco(session: OrmSession, trip_id: int, modello, *condizioni) -> int:
+    """DELETE massiva sui dati del viaggio che lascia traccia nel registro
+    e segnala la modifica. Restituisce quante righe ha cancellato."""
+    area = _AREA_REGISTRO[modello]
+    ids = session.execute(
+        delete(modello).where(*condizioni).returning(modello.id)
+    ).scalars().all()
+    if ids:
+        # Prima la versione (lock sulla riga del viaggio), poi il registro:
+        # cosi' gli id di TripChange crescono nell'ordine dei COMMIT.
+        segnala_modifica(session, trip_id, area)
+        registra(session, [(trip_id, area, i, "delete") for i in ids])
+    return len(ids)
+
+
+def pota_registro(session: OrmSession, giorni: int = CHANGELOG_RETENTION_DAYS) -> int:
+    """Cancella le righe di registro piu' vecchie di `giorni`. L'ultima resta
+    sempre: da essa /changes capisce quali cursori sono ancora validi."""
+    soglia = datetime.now(timezone.utc) - timedelta(days=giorni)
+    ultima = session.execute(select(func.max(TripChange.id))).scalar()
+    if ultima is None:
+        return 0
+    cancellate = session.execute(
+        delete(TripChange).where(TripChange.created_at < soglia, TripChange.id < ultima)
+    ).rowcount
+    session.commit()
+    return cancellate
+
+
+def segnala_notifiche(session: OrmSession, *account_ids: int):
+    session.info.setdefault(_CHIAVE_INFO, Modifiche()).notifiche.update(account_ids)
+
+
+def segnala_non_lette(session: OrmSession, conteggi: Dict[int, int]):
+    """Nuovi valori del contatore notifiche non lette (services/unread_counter)."""
+    modifiche = session.info.setdefault(_CHIAVE_INFO, Modifiche())
+    modifiche.notifiche.update(conteggi)
+    modifiche.non_lette.update(conteggi)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _raccogli(session, flush_context):
+    modifiche = None
+    toccati = set()
+    registro = []
+    cancellati = {obj.id for obj in session.deleted if type(obj) is Trip}
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if type(obj) is Notification:
+            if modifiche is None:
+                modifiche = session.info.setdefault(_CHIAVE_INFO, Modifiche())
+            modifiche.notifiche.add(obj.account_id)
+            continue
+        area = _AREE.get(type(obj))
+        if area is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        trip_id = obj.id if area == "trip" else obj.trip_id
+        if trip_id is None:
+            continue
+        if modifiche is None:
+            modifiche = session.info.setdefault(_CHIAVE_INFO, Modifiche())
+        modifiche.aggiungi(trip_id, area)
+        if area == "participants" and obj.account_id is not None:
+            modifiche.account.add(obj.account_id)
+        toccati.add(trip_id)
+        if area in AREE_REGISTRO and trip_id not in cancellati:
+            registro.append((trip_id, area, obj.id, "delete" if obj in session.deleted else "upsert"))
+    if toccati:
+        _incrementa_versione(session, toccati)
+    registra(session, registro)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _notifica(session):
+    modifiche = session.info.pop(_CHIAVE_INFO, None)
+    if not modifiche or not (modifiche.viaggi or modifiche.account or modifiche.notifiche):
+        return
+    for funzione in list(_ascoltatori):
+        try:
+            funzione(modifiche)
+        except Exception as e:
+            logger.error(f"[Modifiche] Ascoltatore {funzione.__name__} fallito: {e}")
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _scarta(session):
+    session.info.pop(_CHIAVE_INFO, None)
@@ -0,0 +1,214 @@
+"""
+SplitPlan AI — Contatore notifiche non lette
+=============================================
+GET /notifications/unread-count e' interrogato da ogni scheda aperta: invece
+di un COUNT(*) sulla tabella notification a ogni richiesta legge un
+contatore per account.
+
+- Account.unread_notifications e' la copia sul database, aggiornata nella
+  stessa transazione di ogni inserimento, lettura o cancellazione di
+  notifiche: le scritture ORM passano dall'hook di flush qui sotto, quelle
+  massive chiamano incrementa() / cancella(). Anche "segna tutte come
+  lette" sottrae le righe marcate invece di scrivere 0: una notifica
+  arrivata in parallelo, non vista dall'UPDATE, resta contata.
+- In Redis la chiave "notif:unread:{account_id}" riceve il nuovo valore dopo
+  il COMMIT (mai da una transazione annullata) e ha un TTL: un SET perso o
+  arrivato fuori ordine dura al massimo NOTIF_UNREAD_TTL secondi.
+
+La lettura prova Redis e, se la chiave manca o Redis non risponde, usa la
+colonna dell'account gia' caricato per l'autenticazione: nessuna query in
+piu' in entrambi i casi. Il nuovo valore viaggia anche nell'evento
+notifications.changed dello stream /stream/me.
+
+riconcilia() ricalcola la colonna dove diverge dal COUNT reale (job
+giornaliero: cron di vercel.json su GET /cron/notifications-reconcile;
+POST /admin/notifications/reconcile per l'uso manuale).
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session as OrmSession
+
+from models import Account, Notification
+from services.metrics import counter
+from services.trip_changes import Modifiche, segnala_non_lette, su_modifica
+
+logger = logging.getLogger(__name__)
+
+NOTIF_UNREAD_TTL = int(os.getenv("NOTIF_UNREAD_TTL", "300"))
+
+_LETTURE = counter(
+    "notification_unread_reads_total",
+    "Letture del contatore notifiche non lette per sorgente (redis, db)",
+    ["source"],
+)
+
+_redis = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _chiave(account_id: int) -> str:
+    return f"notif:unread:{account_id}"
+
+
+def avvia(client) -> None:
+    """Abilita la copia in Redis: da chiamare nel loop principale (lifespan)."""
+    global _redis, _loop
+    if client is None:
+        return
+    _redis = client
+    _loop = asyncio.get_running_loop()
+
+
+def ferma() -> None:
+    global _redis, _loop
+    _redis = None
+    _loop = None
+
+
+# ---------------------------------------------------------------------------
+# Copia sul database (nella transazione della scrittura)
+# ---------------------------------------------------------------------------
+
+def incrementa(session: OrmSession, delta: Dict[int, int]) -> Dict[int, int]:
+    """Somma `delta` ai contatori degli account e restituisce i nuovi valori.
+    Un UPDATE per valore distinto di delta: il fan-out di notify_managers
+    (tutti +1) resta una sola istruzione."""
+    per_valore: Dict[int, list] = defaultdict(list)
+    for account_id, quanto in delta.items():
+        if quanto:
+            per_valore[quanto].append(account_id)
+    nuovi = {}
+    account = Account.__table__
+    for quanto, account_ids in per_valore.items():
+        nuovi.update(session.connection().execute(
+            update(account)
+            .where(account.c.id.in_(account_ids))
+            .values(unread_notifications=account.c.unread_notifications + quanto)
+            .returning(account.c.id, account.c.unread_notifications)
+        ).all())
+    if nuovi:
+        segnala_non_lette(session, nuovi)
+    return nuovi
+
+
+def cancella(session: OrmSession, *condizioni) -> int:
+    """DELETE massiva di notifiche che scala i contatori delle non lette."""
+    righe = session.execute(
+        Notification.__table__.delete()
+        .where(*condizioni)
+        .returning(Notification.account_id, Notification.is_read)
+    ).all()
+    delta: Dict[int, int] = defaultdict(int)
+    for account_id, letta in righe:
+        if not letta:
+            delta[account_id] -= 1
+    incrementa(session, delta)
+    return len(righe)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _conta(session, flush_context):
+    delta: Dict[int, int] = defaultdict(int)
+    for obj in session.new:
+        if type(obj) is Notification and not obj.is_read:
+            delta[obj.account_id] += 1
+    for obj in session.dirty:
+        if type(obj) is not Notification:
+            continue
+        storia = inspect(obj).attrs.is_read.history
+        if storia.deleted and bool(storia.deleted[0]) != bool(obj.is_read):
+            delta[obj.account_id] += -1 if obj.is_read else 1
+    for obj in session.deleted:
+        if type(obj) is Notification and not obj.is_read:
+            delta[obj.account_id] -= 1
+    if delta:
+        incrementa(session, delta)
+
+
+# ---------------------------------------------------------------------------
+# Copia in Redis (dopo il COMMIT)
+# ---------------------------------------------------------------------------
+
+async def _scrivi(conteggi: Dict[int, int]):
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            for account_id, valore in conteggi.items():
+                pipe.set(_chiave(account_id), max(valore, 0), ex=NOTIF_UNREAD_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"[Notifiche] Aggiornamento contatori su Redis fallito: {e}")
+
+
+@su_modifica
+def _aggiorna_redis(modifiche: Modifiche):
+    # Chiamata anche da thread del threadpool (endpoint sincroni): la
+    # scrittura va nel loop principale, dove vive il client Redis.
+    if _redis is None or _loop is None or _loop.is_closed() or not modifiche.non_lette:
+        return
+    asyncio.run_coroutine_threadsafe(_scrivi(dict(modifiche.non_lette)), _loop)
+
+
+async def leggi(account: Account) -> int:
+    """Notifiche non lette dell'account: chiave Redis, altrimenti la colonna."""
+    if _redis is not None:
+        try:
+            valore = await _redis.get(_chiave(account.id))
+            if valore is not None:
+                _LETTURE.inc(source="redis")
+                return int(valore)
+            # NX: se nel frattempo e' arrivato il SET di un COMMIT, il valore
+            # letto con l'account (forse piu' vecchio) non lo sovrascrive.
+            await _redis.set(_chiave(account.id), account.unread_notifications, ex=NOTIF_UNREAD_TTL, nx=True)
+        except Exception as e:
+            logger.warning(f"[Notifiche] Redis non disponibile, uso il database: {e}")
+    _LETTURE.inc(source="db")
+    return max(account.unread_notifications, 0)
+
+
+# ---------------------------------------------------------------------------
+# Riconciliazione
+# ---------------------------------------------------------------------------
+
+def riconcilia(session: OrmSession) -> dict:
+    """
+    Riallinea Account.unread_notifications al COUNT reale dove diverge (UPDATE
+    sfuggiti agli hook, righe cancellate a mano). Il valore si ricalcola nello
+    stesso UPDATE, non da quello letto prima, per non perdere le notifiche
+    arrivate nel frattempo. Gli account corretti ricevono anche la nuova
+    chiave Redis e l'evento sullo stream.
+    """
+    non_lette = (
+        select(Notification.account_id, func.count().label("n"))
+        .where(Notification.is_read == False)
+        .group_by(Notification.account_id)
+        .subquery()
+    )
+    divergenti = session.execute(
+        select(Account.id)
+        .outerjoin(non_lette, non_lette.c.account_id == Account.id)
+        .where(Account.unread_notifications != func.coalesce(non_lette.c.n, 0))
+    ).scalars().all()
+    if not divergenti:
+        return {"fixed": 0}
+
+    reale = (
+        select(func.count(Notification.id))
+        .where(Notification.account_id == Account.id, Notification.is_read == False)
+        .scalar_subquery()
+    )
+    corretti = session.execute(
+        update(Account)
+        .where(Account.id.in_(divergenti))
+        .values(unread_notifications=reale)
+        .returning(Account.id, Account.unread_notifications)
+    ).all()
+    segnala_non_lette(session, dict(corretti))
+    session.commit()
+    logger.info(f"[Notifiche] Contatori riallineati: {len(corretti)} account")
+    return {"fixed": len(corretti)}
@@ -0,0 +1,197 @@
+"""
+SplitPlan AI — Conteggio dei voti
+==================================
+Tiene il risultato della votazione sulle righe invece di ricalcolarlo a ogni
+voto:
+
+- Proposal.vote_score: somma dei punteggi della proposta, aggiornata con
+  UPDATE ... SET vote_score = vote_score + delta;
+- Participant.has_voted / Trip.voters_count: il primo voto di un partecipante
+  nel viaggio passa has_voted da false a true con un UPDATE condizionato e
+  solo chi lo vince incrementa il contatore del viaggio. Gli UPDATE Core non
+  passano dal flush: le righe di partecipante toccate finiscono nel registro
+  di /changes con registra().
+
+La chiusura della votazione e' un unico UPDATE condizionato sul viaggio
+(winning_proposal_id ancora NULL e voters_count >= num_people): con piu' voti
+concorrenti una sola richiesta ottiene rowcount 1, e solo quella accoda la
+mail di conferma (services/email_outbox), nella stessa transazione.
+"""
+
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from email_templates import booking_confirmation_email
+from models import Account, Participant, Proposal, Trip, Vote
+from services import email_outbox
+from services.metrics import counter
+from services.trip_changes import cancella_in_blocco, registra, segnala_modifica
+
+logger = logging.getLogger(__name__)
+
+_VOTI = counter("votes_total", "Voti registrati", ["kind"])
+_CONSENSI = counter("votes_consensus_total", "Votazioni chiuse con un vincitore")
+
+
+def _scrivi_voto(session: Session, proposal: Proposal, participant_id: int, score: int) -> tuple:
+    """Inserisce o aggiorna il voto; restituisce (id del voto, variazione del punteggio)."""
+    # Lock sulla riga del voto: due aggiornamenti concorrenti dello stesso
+    # partecipante non calcolano il delta dallo stesso punteggio di partenza.
+    esistente = session.exec(
+        select(Vote)
+        .where(Vote.proposal_id == proposal.id, Vote.user_id == participant_id)
+        .with_for_update()
+    ).first()
+    if esistente:
+        delta = score - esistente.score
+        esistente.score = score
+        session.add(esistente)
+        _VOTI.inc(kind="update")
+        return esistente.id, delta
+    voto = Vote(proposal_id=proposal.id, user_id=participant_id, score=score)
+    session.add(voto)
+    session.flush()
+    _VOTI.inc(kind="new")
+    return voto.id, score
+
+
+def registra_voto(session: Session, proposal: Proposal, participant_id: int, score: int) -> None:
+    """Registra il voto e aggiorna punteggio e numero di votanti nella stessa transazione."""
+    try:
+        voto_id, delta = _scrivi_voto(session, proposal, participant_id, score)
+    except IntegrityError:
+        # Voto concorrente dello stesso partecipante inserito per primo:
+        # si ripete come aggiornamento.
+        session.rollback()
+        voto_id, delta = _scrivi_voto(session, proposal, participant_id, score)
+
+    if delta:
+        session.execute(
+            update(Proposal)
+            .where(Proposal.id == proposal.id)
+            .values(vote_score=Proposal.vote_score + delta)
+        )
+    primo_voto = session.execute(
+        update(Participant)
+        .where(Participant.id == participant_id, Participant.has_voted == False)
+        .values(has_voted=True)
+        .returning(Participant.id)
+    ).scalars().all()
+    if primo_voto:
+        session.execute(
+            update(Trip)
+            .where(Trip.id == proposal.trip_id)
+            .values(voters_count=Trip.voters_count + 1)
+        )
+    # Prima la versione del viaggio (lock sulla sua riga), poi il registro:
+    # gli id di TripChange seguono l'ordine dei COMMIT sullo stesso viaggio.
+    aree = ("votes", "participants") if primo_voto else ("votes",)
+    segnala_modifica(session, proposal.trip_id, *aree)
+    registra(
+        session,
+        [(proposal.trip_id, "votes", voto_id, "upsert")]
+        + [(proposal.trip_id, "participants", p, "upsert") for p in primo_voto],
+    )
+    session.commit()
+
+
+def chiudi_votazione(session: Session, trip: Trip) -> Optional[Proposal]:
+    """
+    Proclama la proposta vincente se hanno votato tutti. Restituisce la
+    proposta solo alla richiesta che ha effettivamente chiuso la votazione.
+    """
+    session.refresh(trip)
+    if trip.winning_proposal_id is not None or trip.voters_count < trip.num_people:
+        return None
+
+    # A parita' di punteggio vince la proposta meno recente, come prima.
+    vincitrice = session.exec(
+        select(Proposal)
+        .where(Proposal.trip_id == trip.id)
+        .order_by(Proposal.vote_score.desc(), Proposal.id)
+        .limit(1)
+    ).first()
+    if not vincitrice:
+        return None
+
+    chiusa = session.execute(
+        update(Trip)
+        .where(
+            Trip.id == trip.id,
+            Trip.winning_proposal_id.is_(None),
+            Trip.voters_count >= Trip.num_people,
+        )
+        .values(
+            winning_proposal_id=vincitrice.id,
+            destination=vincitrice.destination,
+            real_destination=vincitrice.real_destination,
+            destination_iata=vincitrice.destination_iata,
+            status="BOOKED",
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if chiusa:
+        segnala_modifica(session, trip.id, "trip")
+        # La mail parte con lo stesso COMMIT: chiusa una volta, accodata una volta.
+        accoda_conferma(session, trip, vincitrice)
+    session.commit()
+    session.refresh(trip)
+    if not chiusa:
+        return None
+    _CONSENSI.inc()
+    return vincitrice
+
+
+def azzera_votazione(session: Session, trip_id: int) -> None:
+    """Cancella voti e contatori del viaggio (proposte rigenerate). Non fa commit."""
+    # Versione (lock sul viaggio) prima di ogni riga di registro.
+    segnala_modifica(session, trip_id, "trip")
+    proposte = select(Proposal.id).where(Proposal.trip_id == trip_id)
+    cancella_in_blocco(session, trip_id, Vote, Vote.proposal_id.in_(proposte))
+    azzerati = session.execute(
+        update(Participant)
+        .where(Participant.trip_id == trip_id, Participant.has_voted == True)
+        .values(has_voted=False)
+        .returning(Participant.id)
+    ).scalars().all()
+    if azzerati:
+        segnala_modifica(session, trip_id, "participants")
+        registra(session, [(trip_id, "participants", p, "upsert") for p in azzerati])
+    session.execute(
+        update(Trip)
+        .where(Trip.id == trip_id)
+        .values(voters_count=0, winning_proposal_id=None)
+    )
+
+
+def accoda_conferma(session: Session, trip: Trip, proposal: Proposal) -> bool:
+    """Accoda la mail di conferma all'organizzatore (services/email_outbox).
+    Non fa commit: parte con la chiusura della votazione."""
+    organizzatore = session.exec(
+        select(Account)
+        .join(Participant, Participant.account_id == Account.id)
+        .where(Participant.trip_id == trip.id, Participant.is_organizer == True)
+    ).first()
+    if not organizzatore:
+        return False
+    frontend_url = os.getenv("FRONTEND_URL", "https://splitplan-ai.vercel.app")
+    email_outbox.accoda(
+        session,
+        organizzatore.email,
+        f"SplitPlan: Viaggio Confermato! ✈️ {trip.name}",
+        booking_confirmation_email(
+            name=organizzatore.name,
+            trip_name=trip.name,
+            destination=proposal.destination,
+            dates=f"{trip.start_date} - {trip.end_date}",
+            price=f"€{proposal.price_estimate}",
+            itinerary_url=f"{frontend_url}/dashboard/{trip.id}",
+        ),
+        tipo="vote_confirmation",
+    )
+    return True
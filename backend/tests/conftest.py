@@ -1,14 +1,33 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.pool import StaticPool
-from database import get_session
+from database import get_session, get_read_session
 from main import app
+from services import pdf_cache, pdf_render, redis_service, stats_service
 
 # Setup in-memory SQLite database for testing
 DATABASE_URL = "sqlite://"
 
 
+@pytest.fixture(autouse=True)
+def pdf_isolati(monkeypatch, tmp_path):
+    # I PDF dei test si rendono in un thread (il pool di processi ha il suo
+    # test in test_pdf_render.py) e la cache e' una cartella per test.
+    monkeypatch.setattr(pdf_render, "PDF_RENDER_WORKERS", 0)
+    monkeypatch.setattr(pdf_cache, "_cache", pdf_cache._CachePdf(str(tmp_path / "pdf"), 10 * 1024 * 1024))
+
+
+@pytest.fixture(autouse=True)
+def limiter_isolato(monkeypatch):
+    # Senza Redis il rate limit di login/registrazione e' il limiter locale:
+    # uno nuovo per test, o i tentativi si sommerebbero fra un test e l'altro.
+    monkeypatch.setattr(redis_service, "_limiter_locale", redis_service.LimiterLocale())
+
+
 @pytest.fixture(name="session")
 def session_fixture():
     engine = create_engine(
@@ -17,6 +36,8 @@ def session_fixture():
         poolclass=StaticPool,
     )
     SQLModel.metadata.create_all(engine)
+    # Ogni test ha un database nuovo con gli stessi id: niente cache tra un test e l'altro.
+    stats_service._cache.svuota()
     with Session(engine) as session:
         yield session
     SQLModel.metadata.drop_all(engine)
@@ -28,6 +49,93 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    # Nei test non c'e' replica: le letture pesanti usano lo stesso database.
+    app.dependency_overrides[get_read_session] = get_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+
+
+class ServerSmtpLocale:
+    """
+    Server SMTP minimo su localhost al posto di quello vero (stile aiosmtpd):
+    accetta AUTH PLAIN, registra i messaggi ricevuti e conta le connessioni.
+    `rifiuta` associa un destinatario alla risposta da dare al suo RCPT.
+    """
+
+    def __init__(self):
+        self.messaggi = []      # (mittente, destinatari, dati grezzi)
+        self.connessioni = 0
+        self.rifiuta = {}
+
+    async def _gestisci(self, reader, writer):
+        self.connessioni += 1
+
+        def scrivi(risposta):
+            writer.write(f"{risposta}\r\n".encode())
+
+        scrivi("220 localhost ESMTP")
+        mittente, destinatari = None, []
+        while True:
+            await writer.drain()
+            riga = await reader.readline()
+            if not riga:
+                break
+            comando = riga.decode().strip()
+            verbo = comando.split(" ", 1)[0].upper()
+            if verbo in ("EHLO", "HELO"):
+                writer.write(b"250-localhost\r\n250-8BITMIME\r\n250 AUTH PLAIN\r\n")
+            elif verbo == "AUTH":
+                scrivi("235 2.7.0 Authentication successful")
+            elif verbo == "MAIL":
+                mittente, destinatari = comando[10:].strip("<> "), []
+                scrivi("250 OK")
+            elif verbo == "RCPT":
+                indirizzo = comando[8:].strip("<> ")
+                if indirizzo in self.rifiuta:
+                    scrivi(self.rifiuta[indirizzo])
+                else:
+                    destinatari.append(indirizzo)
+                    scrivi("250 OK")
+            elif verbo == "DATA":
+                scrivi("354 End data with <CR><LF>.<CR><LF>")
+                await writer.drain()
+                dati = []
+                while True:
+                    riga = await reader.readline()
+                    if not riga or riga in (b".\r\n", b".\n"):
+                        break
+                    dati.append(riga)
+                self.messaggi.append((mittente, destinatari, b"".join(dati)))
+                scrivi("250 OK")
+            elif verbo in ("RSET", "NOOP"):
+                scrivi("250 OK")
+            elif verbo == "QUIT":
+                scrivi("221 Bye")
+                await writer.drain()
+                break
+            else:
+                scrivi("502 Command not implemented")
+        writer.close()
+
+
+@pytest.fixture
+def smtp_locale(monkeypatch):
+    """`async with smtp_locale() as server:` avvia il server nel loop del
+    test e punta la configurazione SMTP (utils/email_utils) su di lui."""
+
+    @asynccontextmanager
+    async def avvia():
+        server = ServerSmtpLocale()
+        ascolto = await asyncio.start_server(server._gestisci, "127.0.0.1", 0)
+        monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+        monkeypatch.setenv("SMTP_PORT", str(ascolto.sockets[0].getsockname()[1]))
+        monkeypatch.setenv("SMTP_USER", "outbox@splitplan.it")
+        monkeypatch.setenv("SMTP_PASSWORD", "segreta")
+        try:
+            yield server
+        finally:
+            ascolto.close()
+            await ascolto.wait_closed()
+
+    return avvia
@@ -0,0 +1,95 @@
+"""
+Test lista membri aziendali: paginazione keyset, ricerca, ordinamento e
+conteggi per la testata della dashboard.
+"""
+from sqlalchemy import event
+
+from auth import create_access_token
+from models import Account, Company
+
+
+def _setup(session, n_membri=7):
+    company = Company(name="MembriCo", max_active_users=30)
+    session.add(company)
+    session.commit()
+    manager = Account(
+        name="Marta", surname="Zeta", email="manager@membri.co",
+        is_verified=True, is_manager=True, company_id=company.id,
+        hashed_password="hash-segreto",
+    )
+    session.add(manager)
+    for i in range(n_membri):
+        session.add(Account(
+            name=f"Nome{i}", surname=f"Cognome{i}", email=f"dip{i}@membri.co",
+            is_verified=True, company_id=company.id, hashed_password="hash-segreto",
+        ))
+    session.add(Account(name="Altro", surname="Estraneo", email="x@altro.co", is_verified=True))
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': manager.email})}"}
+    return company, headers
+
+
+def test_paginazione_keyset_senza_buchi_ne_doppioni(client, session):
+    company, headers = _setup(session)
+    visti, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        res = client.get(f"/companies/{company.id}/members", params=params, headers=headers)
+        assert res.status_code == 200
+        pagina = res.json()
+        assert len(pagina["members"]) <= 3
+        visti += [m["email"] for m in pagina["members"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            break
+
+    # Ordinati per cognome, nome; l'estraneo non compare.
+    assert visti == [f"dip{i}@membri.co" for i in range(7)] + ["manager@membri.co"]
+
+
+def test_ricerca_ordinamento_e_proiezione(client, session):
+    company, headers = _setup(session)
+    statement = []
+    event.listen(session.get_bind(), "before_cursor_execute",
+                 lambda conn, cur, sql, *a: statement.append(sql))
+
+    res = client.get(
+        f"/companies/{company.id}/members",
+        params={"q": "DIP1", "sort": "email", "desc": True},
+        headers=headers,
+    )
+    assert [m["email"] for m in res.json()["members"]] == ["dip1@membri.co"]
+
+    res = client.get(f"/companies/{company.id}/members", params={"sort": "email", "desc": True, "limit": 2}, headers=headers)
+    assert [m["email"] for m in res.json()["members"]] == ["manager@membri.co", "dip6@membri.co"]
+
+    liste = [s for s in statement if "FROM account" in s and "LIMIT" in s]
+    assert liste and all("hashed_password" not in s and "google_calendar_token" not in s for s in liste)
+
+
+def test_summary_e_dashboard(client, session):
+    company, headers = _setup(session, n_membri=60)
+
+    summary = client.get(f"/companies/{company.id}/members/summary", headers=headers).json()
+    assert summary == {"total_members": 61, "managers": 1, "employees": 60, "max_active_users": 30}
+
+    dashboard = client.get(f"/companies/{company.id}/dashboard", headers=headers).json()
+    assert dashboard["total_members"] == 61
+    assert len(dashboard["members"]) == 50
+    seconda = client.get(
+        f"/companies/{company.id}/members",
+        params={"cursor": dashboard["members_next_cursor"]},
+        headers=headers,
+    ).json()
+    assert len(seconda["members"]) == 11
+    assert seconda["next_cursor"] is None
+
+
+def test_accesso_e_cursore_non_valido(client, session):
+    company, headers = _setup(session)
+    dipendente = {"Authorization": f"Bearer {create_access_token({'sub': 'dip0@membri.co'})}"}
+    assert client.get(f"/companies/{company.id}/members", headers=dipendente).status_code == 403
+    assert client.get(f"/companies/{company.id}/members/summary", headers=dipendente).status_code == 403
+
+    res = client.get(f"/companies/{company.id}/members", params={"cursor": "non-valido"}, headers=headers)
+    assert res.status_code == 400
@@ -0,0 +1,87 @@
+"""
+Test GET condizionali: ETag/Last-Modified dalla versione del viaggio, 304
+senza le query del payload, versione incrementata da ogni scrittura.
+"""
+from sqlalchemy import event
+
+from auth import create_access_token
+from models import Account, Expense, Participant, Proposal, Trip
+from services import vote_tally
+
+
+def _viaggio(session):
+    account = Account(name="Ugo", surname="B", email="ugo@etag.it", is_verified=True)
+    estraneo = Account(name="Eva", surname="C", email="eva@etag.it", is_verified=True)
+    trip = Trip(name="Versionato", trip_type="GROUP", share_token="tok-etag")
+    session.add_all([account, estraneo, trip])
+    session.commit()
+    partecipante = Participant(name="Ugo", trip_id=trip.id, account_id=account.id, is_organizer=True)
+    session.add(partecipante)
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'ugo@etag.it'})}"}
+    return trip.id, partecipante.id, headers
+
+
+def test_304_e_nuovo_etag_dopo_una_scrittura(client, session):
+    trip_id, partecipante_id, headers = _viaggio(session)
+
+    prima = client.get(f"/expenses/{trip_id}", headers=headers)
+    assert prima.status_code == 200
+    etag = prima.headers["ETag"]
+    assert prima.headers["Last-Modified"].endswith("GMT")
+
+    statement = []
+    ascolta = lambda conn, cur, sql, *a: statement.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", ascolta)
+    non_modificata = client.get(f"/expenses/{trip_id}", headers={**headers, "If-None-Match": etag})
+    event.remove(session.get_bind(), "before_cursor_execute", ascolta)
+    assert non_modificata.status_code == 304
+    assert non_modificata.content == b""
+    assert non_modificata.headers["ETag"] == etag
+    assert not any("FROM expense" in s for s in statement)
+
+    session.add(Expense(trip_id=trip_id, payer_id=partecipante_id, description="Treno", amount=20, date="2026-05-01"))
+    session.commit()
+    dopo = client.get(f"/expenses/{trip_id}", headers={**headers, "If-None-Match": etag})
+    assert dopo.status_code == 200
+    assert dopo.headers["ETag"] != etag
+    assert [e["description"] for e in dopo.json()] == ["Treno"]
+
+
+def test_etag_per_risorsa_e_voti(client, session):
+    trip_id, partecipante_id, headers = _viaggio(session)
+    proposta = Proposal(trip_id=trip_id, destination="Oslo", description="", price_estimate=0, image_url="")
+    session.add(proposta)
+    session.commit()
+
+    url_risorse = [
+        f"/trips/{trip_id}", f"/trips/{trip_id}/proposals", f"/trips/{trip_id}/itinerary",
+        f"/trips/{trip_id}/participants", f"/trips/{trip_id}/photos", f"/expenses/{trip_id}/balances",
+    ]
+    etag = {url: client.get(url, headers=headers).headers["ETag"] for url in url_risorse}
+    assert len(set(etag.values())) == len(url_risorse)
+    for url in url_risorse:
+        assert client.get(url, headers={**headers, "If-None-Match": etag[url]}).status_code == 304
+
+    # I voti passano da UPDATE massivi: incrementano comunque la versione.
+    vote_tally.registra_voto(session, proposta, partecipante_id, 1)
+    res = client.get(f"/trips/{trip_id}/proposals", headers={**headers, "If-None-Match": etag[url_risorse[1]]})
+    assert res.status_code == 200
+    assert res.json()[0]["vote_score"] == 1
+
+
+def test_condivisione_if_modified_since_e_accesso(client, session):
+    trip_id, _, _ = _viaggio(session)
+
+    res = client.get("/trips/share/tok-etag")
+    assert res.status_code == 200
+    ultima_modifica = res.headers["Last-Modified"]
+    assert client.get("/trips/share/tok-etag", headers={"If-Modified-Since": ultima_modifica}).status_code == 304
+    assert client.get("/trips/share/tok-etag", headers={"If-None-Match": '"altro"'}).status_code == 200
+
+    # Chi non partecipa riceve 403 anche con l'ETag giusto.
+    etag = client.get(f"/trips/{trip_id}/itinerary", headers={
+        "Authorization": f"Bearer {create_access_token({'sub': 'ugo@etag.it'})}"
+    }).headers["ETag"]
+    estraneo = {"Authorization": f"Bearer {create_access_token({'sub': 'eva@etag.it'})}", "If-None-Match": etag}
+    assert client.get(f"/trips/{trip_id}/itinerary", headers=estraneo).status_code == 403
@@ -0,0 +1,89 @@
+"""
+Test strumentazione del pool di connessioni (database.py) e di /health/db-pool.
+
+Il pool strumentato e' lo stesso usato con Postgres, qui montato su un file
+SQLite: basta per verificare attese, connessioni in uso, overflow e timeout.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc as sa_exc
+from sqlmodel import create_engine
+
+import database
+from database import StatistichePool, _classe_pool, parametri_pool, strumenta_engine
+from main import app
+
+
+@pytest.fixture(name="pool_engine")
+def pool_engine_fixture(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "POOL_STATS", {})
+    statistiche = StatistichePool("test")
+    eng = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=_classe_pool(statistiche),
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    strumenta_engine(eng, "test", statistiche)
+    yield eng, statistiche
+    eng.dispose()
+
+
+def test_contatori_in_uso_overflow_e_timeout(pool_engine):
+    eng, statistiche = pool_engine
+
+    prima = eng.connect()
+    seconda = eng.connect()  # oltre pool_size: usa l'overflow
+    stato = statistiche.snapshot(eng.pool)
+    assert stato["in_use"] == 2
+    assert stato["overflow"] == 1
+    assert stato["checkout_wait"]["count"] == 2
+
+    # Pool e overflow esauriti: il terzo checkout va in timeout ed e' contato.
+    with pytest.raises(sa_exc.TimeoutError):
+        eng.connect()
+    assert statistiche.timeouts == 1
+
+    prima.close()
+    seconda.close()
+    stato = statistiche.snapshot(eng.pool)
+    assert stato["in_use"] == 0
+    assert stato["checkouts"] == 2
+    assert stato["checkins"] == 2
+    assert stato["connects"] == 2
+
+
+def test_le_statistiche_sopravvivono_al_dispose(pool_engine):
+    eng, statistiche = pool_engine
+    eng.connect().close()
+    eng.dispose()
+    eng.connect().close()
+    assert statistiche.snapshot(eng.pool)["checkout_wait"]["count"] == 2
+
+
+def test_parametri_pool_da_ambiente(monkeypatch):
+    assert parametri_pool("postgresql://db.example:5432/x")["pool_size"] == 5
+    assert parametri_pool("postgresql://x.pooler.supabase.com:6543/x")["max_overflow"] == -1
+
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("DB_READ_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2.5")
+    assert parametri_pool("postgresql://db.example:5432/x")["pool_size"] == 12
+    replica = parametri_pool("postgresql://db.example:5432/x", ("DB_READ", "DB"))
+    assert replica["pool_size"] == 20
+    assert replica["pool_timeout"] == 2.5
+
+
+def test_endpoint_db_pool_protetto(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    client = TestClient(app)
+
+    assert client.get("/health/db-pool", headers={"X-Admin-Token": "sbagliato"}).status_code == 403
+
+    res = client.get("/health/db-pool", headers={"X-Admin-Token": "segreto"})
+    assert res.status_code == 200
+    primario = res.json()["pools"]["primario"]
+    assert "checkout_wait" in primario
+    assert "timeouts" in primario
@@ -0,0 +1,244 @@
+"""
+Test coda email: accodamento nella transazione della richiesta, invio a
+blocchi su una connessione SMTP (server locale di prova), tentativi con
+backoff, errori permanenti, righe prese in carico e abbandonate, risveglio
+del worker dopo il COMMIT, giro dopo la risposta senza worker, cron Vercel.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes, policy
+
+import httpx
+from sqlmodel import Session, select
+
+from auth import create_access_token
+from main import app
+from models import Account, Company, EmailOutbox, InviteBatch
+from services import email_outbox
+
+
+def _coda(session, *destinatari):
+    for d in destinatari:
+        email_outbox.accoda(session, d, f"Oggetto per {d} ✈️", f"<p>Ciao {d}</p>", tipo="test")
+    session.commit()
+
+
+def _stati(session):
+    session.expire_all()
+    return {v.recipient: v for v in session.exec(select(EmailOutbox)).all()}
+
+
+def test_accodate_con_la_transazione(client, session):
+    company = Company(name="Coda")
+    session.add(company)
+    session.commit()
+    manager = Account(name="M", surname="G", email="mgr@coda.it", is_verified=True, is_manager=True, company_id=company.id)
+    session.add(manager)
+    session.commit()
+
+    res = client.post(
+        f"/companies/{company.id}/invite-bulk",
+        json={"emails": ["a@coda.it", "b@coda.it"]},
+        headers={"Authorization": f"Bearer {create_access_token({'sub': 'mgr@coda.it'})}"},
+    )
+    assert res.json()["sent"] == 2
+    voci = session.exec(select(EmailOutbox)).all()
+    assert [(v.recipient, v.kind, v.status) for v in voci] == [
+        ("a@coda.it", "invite", "PENDING"), ("b@coda.it", "invite", "PENDING"),
+    ]
+    # L'HTML dell'invito sta una volta sul batch, non su ogni riga.
+    batch = session.get(InviteBatch, voci[0].batch_id)
+    assert all(v.html is None and v.subject is None for v in voci)
+    assert batch.subject == "Sei invitato a Coda su SplitPlan" and "Coda" in batch.html
+
+    # Transazione annullata: la mail sparisce con lei.
+    email_outbox.accoda(session, "mai@coda.it", "x", "<p>x</p>")
+    session.rollback()
+    assert len(session.exec(select(EmailOutbox)).all()) == 2
+
+
+def test_inviti_con_il_contenuto_del_batch(session, smtp_locale):
+    batch = InviteBatch(company_id=1, created_by=1, total=2, subject="Invito Acme", html="<p>Entra in Acme</p>")
+    session.add(batch)
+    session.flush()
+    email_outbox.accoda_molti(session, ["x@coda.it", "y@coda.it"], None, None, tipo="invite", batch_id=batch.id)
+    _coda(session, "singola@coda.it")
+
+    async def main():
+        async with smtp_locale() as server:
+            esito = await email_outbox.elabora_coda(session)
+        return server, esito
+
+    server, esito = asyncio.run(main())
+    assert esito["sent"] == 3
+    inviati = {m[1][0]: message_from_bytes(m[2], policy=policy.default) for m in server.messaggi}
+    assert inviati["x@coda.it"]["Subject"] == "Invito Acme"
+    assert "Entra in Acme" in inviati["y@coda.it"].get_content()
+    assert "Ciao singola@coda.it" in inviati["singola@coda.it"].get_content()
+    # Le righe restano senza HTML anche dopo il COMMIT degli esiti.
+    assert all(v.html is None for v in _stati(session).values() if v.batch_id)
+
+
+def test_blocco_su_una_connessione(session, smtp_locale, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_SMTP_CONNECTIONS", 1)
+    _coda(session, *[f"u{i}@coda.it" for i in range(5)])
+
+    async def main():
+        async with smtp_locale() as server:
+            esito = await email_outbox.elabora_coda(session)
+        return server, esito
+
+    server, esito = asyncio.run(main())
+    assert esito == {"claimed": 5, "sent": 5, "retry": 0, "failed": 0}
+    assert server.connessioni == 1
+    assert [m[1] for m in server.messaggi] == [[f"u{i}@coda.it"] for i in range(5)]
+    primo = message_from_bytes(server.messaggi[0][2], policy=policy.default)
+    assert primo["Subject"] == "Oggetto per u0@coda.it ✈️"
+    assert primo["From"] == "outbox@splitplan.it"
+    assert all(v.status == "SENT" and v.sent_at and v.attempts == 1 for v in _stati(session).values())
+
+
+def test_connessioni_in_parallelo(session, smtp_locale, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_SMTP_CONNECTIONS", 3)
+    destinatari = [f"p{i:02d}@coda.it" for i in range(12)]
+    email_outbox.accoda_molti(session, destinatari, "Invito", "<p>Ciao</p>", tipo="invite")
+    session.commit()
+
+    async def main():
+        async with smtp_locale() as server:
+            esito = await email_outbox.elabora_coda(session)
+        return server, esito
+
+    server, esito = asyncio.run(main())
+    assert esito["sent"] == 12
+    assert server.connessioni == 3
+    assert sorted(m[1][0] for m in server.messaggi) == destinatari
+
+    # Blocco piccolo: si aprono solo le connessioni che servono.
+    _coda(session, "sola@coda.it")
+    server, _ = asyncio.run(main())
+    assert server.connessioni == 1
+
+
+def test_tentativi_e_errori_permanenti(session, smtp_locale):
+    _coda(session, "ok@coda.it", "dopo@coda.it", "mai@coda.it")
+
+    async def main(**rifiuti):
+        async with smtp_locale() as server:
+            server.rifiuta = rifiuti
+            return await email_outbox.elabora_coda(session)
+
+    esito = asyncio.run(main(**{
+        "dopo@coda.it": "451 4.3.0 Riprova piu' tardi",
+        "mai@coda.it": "550 5.1.1 Utente inesistente",
+    }))
+    assert esito == {"claimed": 3, "sent": 1, "retry": 1, "failed": 1}
+    stati = _stati(session)
+    assert stati["ok@coda.it"].status == "SENT"
+    assert stati["mai@coda.it"].status == "FAILED" and "550" in stati["mai@coda.it"].last_error
+    dopo = stati["dopo@coda.it"]
+    assert dopo.status == "PENDING" and dopo.attempts == 1
+    minimo = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=email_outbox.EMAIL_OUTBOX_BACKOFF_SECONDS - 1)
+    assert dopo.next_attempt_at.replace(tzinfo=None) > minimo
+
+    # Non ancora scaduta: il giro successivo non la tocca.
+    assert asyncio.run(main())["claimed"] == 0
+
+    # Ultimo tentativo fallito: scartata.
+    dopo.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    dopo.attempts = email_outbox.EMAIL_OUTBOX_MAX_ATTEMPTS - 1
+    session.add(dopo)
+    session.commit()
+    assert asyncio.run(main(**{"dopo@coda.it": "451 4.3.0 Ancora no"}))["failed"] == 1
+    assert _stati(session)["dopo@coda.it"].status == "FAILED"
+
+
+def test_presa_in_carico_abbandonata(session, smtp_locale):
+    _coda(session, "orfana@coda.it", "in-corso@coda.it")
+    stati = _stati(session)
+    adesso = datetime.now(timezone.utc)
+    stati["orfana@coda.it"].status = "SENDING"
+    stati["orfana@coda.it"].claimed_at = adesso - timedelta(seconds=email_outbox.EMAIL_OUTBOX_CLAIM_TIMEOUT + 60)
+    stati["in-corso@coda.it"].status = "SENDING"
+    stati["in-corso@coda.it"].claimed_at = adesso
+    session.add_all(stati.values())
+    session.commit()
+
+    async def main():
+        async with smtp_locale() as server:
+            await email_outbox.elabora_coda(session)
+        return server
+
+    server = asyncio.run(main())
+    assert [m[1] for m in server.messaggi] == [["orfana@coda.it"]]
+    assert _stati(session)["in-corso@coda.it"].status == "SENDING"
+
+
+def test_worker_svegliato_dal_commit(session, smtp_locale, monkeypatch):
+    # Senza risveglio il worker aspetterebbe il prossimo giro di polling.
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_POLL_SECONDS", 30)
+    engine = session.get_bind()
+
+    async def main():
+        async with smtp_locale() as server:
+            worker = asyncio.create_task(email_outbox.ciclo_outbox(lambda: Session(engine)))
+            while email_outbox._sveglia is None:
+                await asyncio.sleep(0.01)
+
+            def richiesta():
+                with Session(engine) as altra:
+                    _coda(altra, "subito@coda.it")
+
+            await asyncio.to_thread(richiesta)
+            for _ in range(200):
+                if server.messaggi:
+                    break
+                await asyncio.sleep(0.01)
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        return server
+
+    server = asyncio.run(main())
+    assert [m[1] for m in server.messaggi] == [["subito@coda.it"]]
+    assert email_outbox._loop is None
+
+
+def test_svuotata_dopo_la_risposta_senza_worker(client, session, smtp_locale, monkeypatch):
+    # Vercel: nessun worker, la coda si svuota a risposta inviata.
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_DRAIN_INLINE", True)
+    monkeypatch.setattr(email_outbox, "_nuova_sessione", lambda: Session(session.get_bind()))
+    company = Company(name="Serverless")
+    session.add(company)
+    session.commit()
+    manager = Account(name="M", surname="V", email="mgr@vercel.it", is_verified=True, is_manager=True, company_id=company.id)
+    session.add(manager)
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'mgr@vercel.it'})}"}
+
+    async def main():
+        async with smtp_locale() as server:
+            trasporto = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=trasporto, base_url="http://test") as c:
+                res = await c.post(f"/companies/{company.id}/invite-bulk", json={"emails": ["x@vercel.it"]}, headers=headers)
+                # Niente accodato: nessun giro.
+                await c.get("/notifications", headers=headers)
+        return res, server
+
+    res, server = asyncio.run(main())
+    assert res.json()["sent"] == 1
+    assert [m[1] for m in server.messaggi] == [["x@vercel.it"]]
+    assert server.connessioni == 1
+    assert [v.status for v in _stati(session).values()] == ["SENT"]
+
+
+def test_cron_email_outbox(client, monkeypatch):
+    monkeypatch.delenv("CRON_SECRET", raising=False)
+    assert client.get("/cron/email-outbox").status_code == 503
+    monkeypatch.setenv("CRON_SECRET", "segreto-cron")
+    assert client.get("/cron/email-outbox", headers={"Authorization": "Bearer altro"}).status_code == 403
+    res = client.get("/cron/email-outbox", headers={"Authorization": "Bearer segreto-cron"})
+    assert res.status_code == 200
+    assert res.json() == {"claimed": 0, "sent": 0, "retry": 0, "failed": 0}
@@ -0,0 +1,52 @@
+"""
+Test template email: compilazione al primo uso, resa in blocco uguale alla
+resa singola, valori comuni fissati una volta, guscio condiviso.
+"""
+import pytest
+
+import email_templates
+from email_templates import APPROVAL_REQUESTED, COMPANY_INVITE, Modello, base_template
+
+
+def test_compilato_una_volta_al_primo_uso():
+    modello = Modello("<p>{saluto} {nome}</p>")
+    assert modello._funzione is None
+    assert "<p>Ciao Anna</p>" in modello.rendi(saluto="Ciao", nome="Anna")
+    funzione = modello._funzione
+    modello.rendi(saluto="Ciao", nome="Bruno")
+    assert modello._funzione is funzione
+    assert modello.slot == ("saluto", "nome")
+
+
+def test_guscio_comune():
+    html = email_templates.welcome_email(name="Rita", login_url="https://x/login")
+    prima, dopo = base_template("|").split("|")
+    assert html.startswith(prima) and html.endswith(dopo)
+    assert html.count("<!DOCTYPE html>") == 1
+    assert "Rita" in html and 'href="https://x/login"' in html
+
+
+def test_blocco_uguale_alla_resa_singola():
+    comuni = {"trip_name": "Offsite", "requester_name": "Giulia B", "manager_url": "https://x/manager"}
+    nomi = ["Anna", "Bruno", "{non_uno_slot}"]
+    blocco = APPROVAL_REQUESTED.rendi_molti([{"manager_name": n} for n in nomi], **comuni)
+    singole = [email_templates.email_approval_requested(manager_name=n, **comuni) for n in nomi]
+    assert blocco == singole
+
+    # Fissati i comuni resta solo lo slot del destinatario; le graffe nei
+    # valori non diventano slot.
+    assert APPROVAL_REQUESTED.vincola(**comuni).slot == ("manager_name",)
+    assert Modello("{a}|{b}", guscio=None).vincola(a="{b}").rendi(b="x") == "{b}|x"
+
+
+def test_blocco_senza_slot_per_destinatario():
+    email = COMPANY_INVITE.rendi_molti([{}] * 3, company_name="Acme", invite_url="https://x/join")
+    assert email[0] == email_templates.company_invite_email(company_name="Acme", invite_url="https://x/join")
+    assert email[0] is email[1] is email[2]
+
+
+def test_slot_mancante_o_non_valido():
+    with pytest.raises(TypeError):
+        COMPANY_INVITE.rendi(company_name="Acme")
+    with pytest.raises(ValueError):
+        Modello("{a or 'b'}", guscio=None).rendi(a=1)
@@ -0,0 +1,99 @@
+"""
+Test endpoint /metrics e metriche registrate dai sottosistemi.
+"""
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.trips import _common
+from services import maps_service, redis_service
+from services.metrics import Registry, render_prometheus
+
+
+def test_metrics_protetto_da_admin_token(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    client = TestClient(app)
+    assert client.get("/metrics", headers={"X-Admin-Token": "no"}).status_code == 403
+
+    client.get("/health")
+    res = client.get("/metrics", headers={"X-Admin-Token": "segreto"})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in res.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in res.text
+    assert 'db_pool_connections_in_use{pool="primario"}' in res.text
+
+
+def test_formato_testo_prometheus():
+    registro = Registry()
+    registro.counter("eventi_total", "Eventi", ["tipo"]).inc(tipo='a"b')
+    registro.histogram("durata_seconds", "Durata", buckets=(1.0,)).observe(0.5)
+
+    testo = render_prometheus(registro)
+    assert '# TYPE eventi_total counter\neventi_total{tipo="a\\"b"} 1' in testo
+    assert 'durata_seconds_bucket{le="1"} 1' in testo
+    assert 'durata_seconds_bucket{le="+Inf"} 1' in testo
+    assert "durata_seconds_count 1" in testo
+
+
+def test_gemini_fallback_conteggiato(monkeypatch):
+    chiamate = []
+
+    async def generate_content(model, contents, **kwargs):
+        chiamate.append(model)
+        if model == _common.AI_MODELS[0]:
+            raise RuntimeError("503 UNAVAILABLE")
+        return SimpleNamespace(text="ok")
+
+    async def niente(_):
+        return None
+
+    finto = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    monkeypatch.setattr(_common, "ai_client", finto)
+    monkeypatch.setattr(_common._asyncio, "sleep", niente)
+
+    riserva = _common.AI_MODELS[1]
+    prima_fallback = _common.AI_REQUESTS.valore(served_by="fallback")
+    prima_transient = _common.AI_CALLS.valore(model=_common.AI_MODELS[0], outcome="transient")
+
+    risposta = asyncio.run(_common._gemini_call_with_retry("ciao"))
+
+    assert risposta.text == "ok"
+    assert _common.AI_REQUESTS.valore(served_by="fallback") - prima_fallback == 1
+    assert _common.AI_CALLS.valore(model=_common.AI_MODELS[0], outcome="transient") - prima_transient == 2
+    assert chiamate[-1] == riserva
+
+
+def test_cache_osrm_conteggiata(monkeypatch):
+    posizioni = [(45.0, 9.0), (45.1, 9.1)]
+    monkeypatch.setitem(maps_service._matrix_cache, maps_service._cache_key(posizioni, "foot"), {(0, 1): 5})
+    prima = maps_service._CACHE_MATRICI.valore(result="hit")
+
+    assert asyncio.run(maps_service.get_travel_time_matrix(posizioni)) == {(0, 1): 5}
+    assert maps_service._CACHE_MATRICI.valore(result="hit") - prima == 1
+
+
+class _RedisFinto:
+    def __init__(self):
+        self.valori = {}
+
+    async def incr(self, chiave):
+        self.valori[chiave] = self.valori.get(chiave, 0) + 1
+        return self.valori[chiave]
+
+    async def expire(self, chiave, secondi):
+        return True
+
+
+def test_rifiuti_rate_limit_conteggiati(monkeypatch):
+    monkeypatch.setattr(redis_service, "_redis_client", _RedisFinto())
+    prima = redis_service._CONTROLLI.valore(scope="login", result="rejected")
+
+    # Limite 2: il terzo tentativo e' rifiutato. L'IPv6 non entra nell'etichetta.
+    for _ in range(3):
+        asyncio.run(redis_service.check_rate_limit("rate_limit:login:2001:db8::1", 2, 60, "login"))
+
+    assert redis_service._CONTROLLI.valore(scope="login", result="rejected") - prima == 1
+    assert redis_service._CONTROLLI.valore(scope="rate_limit:login:2001:db8:", result="rejected") == 0
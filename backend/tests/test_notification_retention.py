@@ -0,0 +1,85 @@
+"""
+Test notifiche: paginazione keyset della lista e archiviazione a blocchi
+delle notifiche lette vecchie nella tabella fredda.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import select
+
+from auth import create_access_token
+from models import Account, Notification, NotificationArchive
+from services.notification_service import archivia_notifiche
+
+
+def _account(session):
+    account = Account(name="Rita", surname="A", email="rita@archivio.it", is_verified=True)
+    session.add(account)
+    session.commit()
+    return account.id, {"Authorization": f"Bearer {create_access_token({'sub': 'rita@archivio.it'})}"}
+
+
+def test_paginazione_keyset(client, session):
+    account_id, headers = _account(session)
+    adesso = datetime.now(timezone.utc)
+    # Due coppie con lo stesso created_at: l'id fa da spareggio.
+    for i in range(7):
+        session.add(Notification(
+            account_id=account_id, type="INFO", title=f"n{i}", message="m",
+            is_read=i % 2 == 0, created_at=adesso + timedelta(minutes=i // 2),
+        ))
+    session.commit()
+
+    titoli, cursore = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursore} if cursore else {})}
+        pagina = client.get("/notifications", params=params, headers=headers).json()
+        titoli += [n["title"] for n in pagina["notifications"]]
+        cursore = pagina["next_cursor"]
+        if cursore is None:
+            break
+    assert titoli == ["n6", "n5", "n4", "n3", "n2", "n1", "n0"]
+
+    non_lette = client.get("/notifications", params={"unread_only": True}, headers=headers).json()
+    assert [n["title"] for n in non_lette["notifications"]] == ["n5", "n3", "n1"]
+    assert client.get("/notifications", params={"cursor": "rotto"}, headers=headers).status_code == 400
+
+
+def test_archiviazione_a_blocchi(session):
+    account_id, _ = _account(session)
+    vecchia = datetime.now(timezone.utc) - timedelta(days=120)
+    for i in range(5):
+        session.add(Notification(account_id=account_id, type="INFO", title=f"v{i}", message="m", is_read=True, created_at=vecchia))
+    session.add(Notification(account_id=account_id, type="INFO", title="vecchia non letta", message="m", created_at=vecchia))
+    session.add(Notification(account_id=account_id, type="INFO", title="recente", message="m", is_read=True))
+    session.commit()
+
+    esito = archivia_notifiche(session, giorni=90, batch=2)
+    assert esito["moved"] == 5 and esito["batches"] == 3 and esito["done"] is True
+    assert esito["seconds"] >= 0
+
+    rimaste = session.exec(select(Notification.title).order_by(Notification.id)).all()
+    assert rimaste == ["vecchia non letta", "recente"]
+    archiviate = session.exec(select(NotificationArchive).order_by(NotificationArchive.id)).all()
+    assert [a.title for a in archiviate] == [f"v{i}" for i in range(5)]
+    assert all(a.account_id == account_id and a.archived_at for a in archiviate)
+
+    # Tetto di tempo: si ferma dopo il primo blocco e lo dice.
+    for i in range(3):
+        session.add(Notification(account_id=account_id, type="INFO", title="x", message="m", is_read=True, created_at=vecchia))
+    session.commit()
+    esito = archivia_notifiche(session, giorni=90, batch=2, max_secondi=0)
+    assert (esito["moved"], esito["batches"], esito["done"]) == (2, 1, False)
+    assert archivia_notifiche(session, giorni=90, batch=2)["moved"] == 1
+
+
+def test_archiviazione_dal_cron(client, session, monkeypatch):
+    account_id, _ = _account(session)
+    vecchia = datetime.now(timezone.utc) - timedelta(days=120)
+    session.add(Notification(account_id=account_id, type="INFO", title="v", message="m", is_read=True, created_at=vecchia))
+    session.commit()
+    monkeypatch.setenv("CRON_SECRET", "segreto-cron")
+
+    assert client.get("/cron/notifications-archive").status_code == 403
+    res = client.get("/cron/notifications-archive", headers={"Authorization": "Bearer segreto-cron"})
+    assert (res.json()["moved"], res.json()["done"]) == (1, True)
+    assert session.exec(select(Notification)).all() == []
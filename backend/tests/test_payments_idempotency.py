@@ -13,7 +13,7 @@ import pytest
 from sqlmodel import Session, select
 
 import routers.payments as payments
-from models import Account, ProcessedStripeEvent
+from models import Account, EmailOutbox, ProcessedStripeEvent
 
 
 def make_account(session: Session, email="payer@test.com", credits=0) -> Account:
@@ -38,9 +38,8 @@ def run(coro):
 # --- 1. Idempotenza ------------------------------------------------------
 
 
-def test_stesso_checkout_accredita_una_sola_volta(session: Session, monkeypatch):
+def test_stesso_checkout_accredita_una_sola_volta(session: Session):
     """Webhook e verify-session sullo stesso pagamento: crediti accreditati 1 volta."""
-    monkeypatch.setattr(payments, "get_smtp_config", lambda: (None, None, None))
     account = make_account(session)
     key = payments._checkout_idempotency_key("cs_test_123")
 
@@ -52,11 +51,12 @@ def test_stesso_checkout_accredita_una_sola_volta(session: Session, monkeypatch)
 
     assert dopo_webhook == 3, "il primo accredito deve dare 3 crediti"
     assert account.credits == 3, "il secondo passaggio non deve riaccreditare"
+    ricevute = session.exec(select(EmailOutbox).where(EmailOutbox.kind == "receipt")).all()
+    assert len(ricevute) == 1, "la ricevuta va accodata una sola volta"
 
 
-def test_checkout_diversi_accreditano_entrambi(session: Session, monkeypatch):
+def test_checkout_diversi_accreditano_entrambi(session: Session):
     """Due acquisti distinti non devono essere scambiati per un duplicato."""
-    monkeypatch.setattr(payments, "get_smtp_config", lambda: (None, None, None))
     account = make_account(session)
 
     run(payments.process_successful_checkout(
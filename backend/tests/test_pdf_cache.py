@@ -0,0 +1,220 @@
+"""
+Test cache dei PDF: download ripetuto senza nuova resa, ETag e 304, Range e
+If-Range, invalidazione alla scrittura di spese e itinerario, chiave diversa
+per dipendente, LRU su disco anche dopo un riavvio, job salvati in cache.
+"""
+import asyncio
+import os
+
+import httpx
+
+from auth import create_access_token
+from main import app
+from models import Account, Expense, ItineraryItem, Participant, Trip
+from services import pdf_cache, pdf_render
+
+
+def _viaggio(session):
+    account = Account(name="Ca", surname="Che", email="cache@pdf.it", is_verified=True)
+    trip = Trip(name="Cache", trip_type="BUSINESS", trip_intent="BUSINESS", destination="Bari", status="APPROVED")
+    session.add_all([account, trip])
+    session.commit()
+    part = Participant(name="Ca", trip_id=trip.id, account_id=account.id, is_organizer=True)
+    session.add(part)
+    session.commit()
+    session.add(ItineraryItem(trip_id=trip.id, title="Visita", start_time="2026-05-02T10:00", type="ACTIVITY"))
+    session.add(Expense(
+        trip_id=trip.id, payer_id=part.id, description="Cena", amount=42.0, date="2026-05-02", category="Cibo",
+    ))
+    session.commit()
+    return trip, account
+
+
+def _auth(account):
+    return {"Authorization": f"Bearer {create_access_token({'sub': account.email})}"}
+
+
+def _conta_rese(monkeypatch):
+    rese = []
+    originale = pdf_render._funzione
+
+    def conta(tipo):
+        funzione = originale(tipo)
+
+        def resa(**dati):
+            rese.append(tipo)
+            return funzione(**dati)
+
+        return resa
+
+    monkeypatch.setattr(pdf_render, "_funzione", conta)
+    return rese
+
+
+def test_download_ripetuto_dalla_cache(client, session, monkeypatch):
+    rese = _conta_rese(monkeypatch)
+    trip, account = _viaggio(session)
+    url = f"/trips/{trip.id}/export-nota-spese"
+
+    primo = client.get(url, headers=_auth(account))
+    secondo = client.get(url, headers=_auth(account))
+    assert rese == ["nota_spese"]
+    assert primo.status_code == secondo.status_code == 200
+    assert primo.content == secondo.content and primo.content[:4] == b"%PDF"
+    assert secondo.headers["content-type"] == "application/pdf"
+    assert secondo.headers["content-disposition"] == f'attachment; filename="NotaSpese_SplitPlan_{trip.id}.pdf"'
+    etag = secondo.headers["etag"]
+    assert etag == primo.headers["etag"] and not etag.startswith("W/")
+
+    non_modificato = client.get(url, headers={**_auth(account), "If-None-Match": etag})
+    assert non_modificato.status_code == 304
+    assert non_modificato.headers["etag"] == etag
+
+    # Stessi dati, altro nome file: il secondo endpoint usa la stessa voce.
+    report = client.get(f"/trips/{trip.id}/expense-report/pdf", headers=_auth(account))
+    assert report.content == primo.content
+    assert rese == ["nota_spese"]
+    # I link di invio si cancellano a fine risposta.
+    assert not [f for f in os.listdir(pdf_cache._cache.cartella) if f.endswith(".invio")]
+
+
+def test_range_e_if_range(client, session):
+    trip, account = _viaggio(session)
+    url = f"/trips/{trip.id}/export-pdf"
+    intero = client.get(url, headers=_auth(account))
+    etag = intero.headers["etag"]
+    dimensione = len(intero.content)
+
+    pezzo = client.get(url, headers={**_auth(account), "Range": "bytes=0-3", "If-Range": etag})
+    assert pezzo.status_code == 206
+    assert pezzo.content == b"%PDF"
+    assert pezzo.headers["content-range"] == f"bytes 0-3/{dimensione}"
+
+    coda = client.get(url, headers={**_auth(account), "Range": f"bytes={dimensione - 10}-"})
+    assert coda.status_code == 206 and coda.content == intero.content[-10:]
+
+    # File cambiato da quando il client ha iniziato: riparte con il file intero.
+    cambiato = client.get(url, headers={**_auth(account), "Range": "bytes=0-3", "If-Range": '"altro"'})
+    assert cambiato.status_code == 200 and cambiato.content == intero.content
+
+
+def test_invalidata_da_spese_e_itinerario(client, session, monkeypatch):
+    rese = _conta_rese(monkeypatch)
+    trip, account = _viaggio(session)
+    url = f"/trips/{trip.id}/export-pdf"
+    primo = client.get(url, headers=_auth(account))
+
+    session.add(Expense(
+        trip_id=trip.id, payer_id=trip.participants[0].id, description="Taxi",
+        amount=30.0, date="2026-05-04", category="Trasporti",
+    ))
+    session.commit()
+    # Il COMMIT cancella subito i file del viaggio.
+    assert pdf_cache._cache.invalida_viaggio(trip.id) == 0
+
+    secondo = client.get(url, headers=_auth(account))
+    assert secondo.headers["etag"] != primo.headers["etag"]
+    assert rese == ["trip", "trip"]
+
+    voce = session.get(ItineraryItem, trip.itinerary_items[0].id)
+    voce.title = "Visita guidata"
+    session.add(voce)
+    session.commit()
+    client.get(url, headers=_auth(account))
+    assert rese == ["trip", "trip", "trip"]
+
+
+def test_chiave_per_dipendente_e_lingua(session):
+    trip, account = _viaggio(session)
+    nota = pdf_render.dati_nota_spese(trip, account, None, trip.expenses)
+    chiave = pdf_cache.chiave(trip.id, "nota_spese", nota)
+    assert chiave == pdf_cache.chiave(trip.id, "nota_spese", pdf_render.dati_nota_spese(trip, account, None, trip.expenses))
+    nota["account"].email = "altro@pdf.it"
+    assert pdf_cache.chiave(trip.id, "nota_spese", nota) != chiave
+
+    it = pdf_cache.chiave(trip.id, "trip", pdf_render.dati_viaggio(trip, trip.itinerary_items, trip.expenses, "it"))
+    en = pdf_cache.chiave(trip.id, "trip", pdf_render.dati_viaggio(trip, trip.itinerary_items, trip.expenses, "en"))
+    assert it != en and it.startswith(f"{trip.id}-trip-")
+
+
+def test_lru_su_disco(tmp_path):
+    cache = pdf_cache._CachePdf(str(tmp_path / "lru"), 250)
+    cache.salva("1-trip-aaaa", b"a" * 100)
+    cache.salva("2-trip-bbbb", b"b" * 100)
+    assert cache.cerca("1-trip-aaaa").stat.st_size == 100
+
+    # Riavvio: l'ordine si ricostruisce dall'ultima lettura dei file.
+    riavviata = pdf_cache._CachePdf(str(tmp_path / "lru"), 250)
+    riavviata.salva("3-trip-cccc", b"c" * 100)
+    assert riavviata.cerca("2-trip-bbbb") is None
+    assert riavviata.cerca("1-trip-aaaa") is not None
+    assert riavviata.cerca("3-trip-cccc") is not None
+
+    # Oltre il limite da solo non entra; con limite 0 la cache e' spenta.
+    assert riavviata.salva("4-trip-dddd", b"d" * 300) is None
+    spenta = pdf_cache._CachePdf(str(tmp_path / "spenta"), 0)
+    assert spenta.salva("1-trip-aaaa", b"a") is None and spenta.cerca("1-trip-aaaa") is None
+
+
+def test_job_salvato_in_cache(client, session, monkeypatch):
+    rese = _conta_rese(monkeypatch)
+    trip, account = _viaggio(session)
+    url = f"/trips/{trip.id}/export-nota-spese"
+
+    async def main():
+        trasporto = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=trasporto, base_url="http://test") as c:
+            avvio = await c.get(f"{url}?mode=job", headers=_auth(account))
+            assert avvio.status_code == 202
+            job = pdf_render._jobs[avvio.json()["job_id"]]
+            await job.future
+            for _ in range(100):
+                if pdf_cache.cerca(job.chiave):
+                    break
+                await asyncio.sleep(0.01)
+            scaricato = await c.get(f"/trips/{trip.id}/pdf-jobs/{job.id}/download", headers=_auth(account))
+            # Gia' in cache: anche mode=job risponde subito con il file.
+            di_nuovo = await c.get(f"{url}?mode=job", headers=_auth(account))
+            return scaricato, di_nuovo
+
+    scaricato, di_nuovo = asyncio.run(main())
+    assert rese == ["nota_spese"]
+    assert scaricato.status_code == 200 and "etag" in scaricato.headers
+    assert di_nuovo.status_code == 200 and di_nuovo.content == scaricato.content
+
+
+def test_file_sparito_dopo_la_ricerca(client, session, monkeypatch):
+    rese = _conta_rese(monkeypatch)
+    trip, account = _viaggio(session)
+    url = f"/trips/{trip.id}/export-pdf"
+    primo = client.get(url, headers=_auth(account))
+
+    # Invalidazione (o LRU) fra la ricerca e l'invio: si rifa' la resa, non 500.
+    cerca = pdf_cache.cerca
+
+    def cerca_poi_cancella(chiave):
+        voce = cerca(chiave)
+        if voce is not None:
+            os.unlink(voce.path)
+        return voce
+
+    monkeypatch.setattr(pdf_cache, "cerca", cerca_poi_cancella)
+    secondo = client.get(url, headers=_auth(account))
+    assert secondo.status_code == 200 and secondo.content[:4] == b"%PDF"
+    assert rese == ["trip", "trip"]
+    assert primo.status_code == 200
+
+
+def test_invio_da_link_privato(tmp_path):
+    cache = pdf_cache._CachePdf(str(tmp_path / "invio"), 1000)
+    voce = cache.salva("1-trip-aaaa", b"%PDF-uno")
+    invio = cache.collega(voce)
+    assert invio.path.endswith(".invio") and invio.etag == voce.etag
+
+    # Invalidato mentre la risposta e' in corso: il link resta leggibile.
+    assert cache.invalida_viaggio(1) == 1
+    with open(invio.path, "rb") as f:
+        assert f.read() == b"%PDF-uno"
+    pdf_cache.rilascia(invio)
+    assert os.listdir(tmp_path / "invio") == []
+    assert cache.collega(voce) is None
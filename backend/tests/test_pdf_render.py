@@ -0,0 +1,164 @@
+"""
+Test resa PDF fuori dal loop: istantanee picklabili nel pool di processi,
+loop libero durante la resa, limite di coda (503), timeout (504), modalita'
+job con stato e download riservati a chi l'ha avviato.
+"""
+import asyncio
+import time
+
+import httpx
+
+from auth import create_access_token
+from main import app
+from models import Account, Expense, ItineraryItem, Participant, Trip
+from services import pdf_render
+
+
+def _viaggio(session, email="pdf@render.it", spese=3):
+    account = Account(name="Pia", surname="Df", email=email, is_verified=True)
+    trip = Trip(name="Render", trip_type="BUSINESS", trip_intent="BUSINESS", destination="Torino", status="APPROVED")
+    session.add_all([account, trip])
+    session.commit()
+    part = Participant(name="Pia", trip_id=trip.id, account_id=account.id, is_organizer=True)
+    session.add(part)
+    session.commit()
+    session.add(ItineraryItem(trip_id=trip.id, title="Visita", start_time="2026-05-02T10:00", type="ACTIVITY"))
+    for i in range(spese):
+        session.add(Expense(
+            trip_id=trip.id, payer_id=part.id, description=f"Spesa {i}",
+            amount=10.0 + i, date=f"2026-05-0{i + 1}", category="Cibo",
+        ))
+    session.commit()
+    return trip, account
+
+
+def _auth(account):
+    return {"Authorization": f"Bearer {create_access_token({'sub': account.email})}"}
+
+
+def _resa_lenta(monkeypatch, secondi):
+    def lenta(**_):
+        time.sleep(secondi)
+        return b"%PDF-lento"
+
+    monkeypatch.setattr(pdf_render, "_funzione", lambda tipo: lenta)
+
+
+def test_pool_di_processi(session, monkeypatch):
+    # Le istantanee devono passare per pickle e bastare alla resa nel figlio.
+    monkeypatch.setattr(pdf_render, "PDF_RENDER_WORKERS", 1)
+    trip, account = _viaggio(session)
+    dati = pdf_render.dati_nota_spese(trip, account, None, trip.expenses)
+    try:
+        pdf = asyncio.run(pdf_render.attendi("nota_spese", dati))
+    finally:
+        pdf_render.chiudi()
+    assert pdf[:4] == b"%PDF"
+    assert pdf_render.in_coda() == 0
+
+
+def test_loop_libero_durante_la_resa(monkeypatch):
+    _resa_lenta(monkeypatch, 0.3)
+
+    async def main():
+        battiti = 0
+
+        async def battito():
+            nonlocal battiti
+            while True:
+                await asyncio.sleep(0.01)
+                battiti += 1
+
+        compito = asyncio.create_task(battito())
+        pdf = await pdf_render.attendi("trip", {})
+        compito.cancel()
+        return pdf, battiti
+
+    pdf, battiti = asyncio.run(main())
+    assert pdf == b"%PDF-lento"
+    assert battiti >= 10
+
+
+def test_export_pdf_sincrono(client, session):
+    trip, account = _viaggio(session)
+    res = client.get(f"/trips/{trip.id}/export-pdf", headers=_auth(account))
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/pdf"
+    assert res.headers["content-disposition"] == f'attachment; filename="SplitPlan_{trip.id}.pdf"'
+    assert res.content[:4] == b"%PDF"
+
+
+def test_coda_piena_e_timeout(client, session, monkeypatch):
+    trip, account = _viaggio(session)
+    monkeypatch.setattr(pdf_render, "PDF_RENDER_MAX_QUEUE", 0)
+    res = client.get(f"/trips/{trip.id}/export-nota-spese", headers=_auth(account))
+    assert res.status_code == 503
+    assert res.headers["retry-after"] == "5"
+
+    monkeypatch.setattr(pdf_render, "PDF_RENDER_MAX_QUEUE", 8)
+    monkeypatch.setattr(pdf_render, "PDF_RENDER_TIMEOUT", 0.05)
+    _resa_lenta(monkeypatch, 0.3)
+    res = client.get(f"/trips/{trip.id}/expense-report/pdf", headers=_auth(account))
+    assert res.status_code == 504
+
+
+def test_modalita_job(client, session):
+    trip, account = _viaggio(session, spese=20)
+    altro = Account(name="Al", surname="Tro", email="altro@render.it", is_verified=True)
+    session.add(altro)
+    session.commit()
+
+    # Il job vive nel loop del server: un solo loop per tutte le richieste,
+    # come sotto uvicorn.
+    async def main():
+        trasporto = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=trasporto, base_url="http://test") as c:
+            avvio = await c.get(f"/trips/{trip.id}/export-nota-spese?mode=job", headers=_auth(account))
+            assert avvio.status_code == 202
+            url = avvio.json()["status_url"]
+
+            estraneo = await c.get(url, headers=_auth(altro))
+            assert estraneo.status_code == 404
+
+            for _ in range(200):
+                stato = (await c.get(url, headers=_auth(account))).json()
+                if stato["status"] != "running":
+                    break
+                await asyncio.sleep(0.02)
+            assert stato["status"] == "done"
+            return await c.get(stato["download_url"], headers=_auth(account))
+
+    pdf = asyncio.run(main())
+    assert pdf.status_code == 200
+    assert pdf.headers["content-disposition"] == f'attachment; filename="NotaSpese_SplitPlan_{trip.id}.pdf"'
+    assert pdf.content[:4] == b"%PDF"
+
+
+def test_job_non_pronto(client, session, monkeypatch):
+    trip, account = _viaggio(session)
+    _resa_lenta(monkeypatch, 0.3)
+
+    async def main():
+        trasporto = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=trasporto, base_url="http://test") as c:
+            avvio = await c.get(f"/trips/{trip.id}/export-pdf?mode=job", headers=_auth(account))
+            job_id = avvio.json()["job_id"]
+            presto = await c.get(f"/trips/{trip.id}/pdf-jobs/{job_id}/download", headers=_auth(account))
+            altro_viaggio = await c.get(f"/trips/{trip.id + 1}/pdf-jobs/{job_id}", headers=_auth(account))
+            await pdf_render._jobs[job_id].future
+            return presto, altro_viaggio
+
+    presto, altro_viaggio = asyncio.run(main())
+    assert presto.status_code == 409
+    assert altro_viaggio.status_code == 404
+
+
+def test_job_spenti_come_sync(client, session, monkeypatch):
+    # Su Vercel lo stato arriverebbe a un'altra istanza: niente job.
+    monkeypatch.setattr(pdf_render, "PDF_JOBS", False)
+    monkeypatch.setattr(pdf_render, "_jobs", {})
+    trip, account = _viaggio(session)
+    res = client.get(f"/trips/{trip.id}/export-nota-spese?mode=job", headers=_auth(account))
+    assert res.status_code == 200
+    assert res.content[:4] == b"%PDF"
+    assert pdf_render._jobs == {}
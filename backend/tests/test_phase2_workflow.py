@@ -5,8 +5,12 @@ Copertura:
 - Notifiche create correttamente su request_approval, approve, reject
 - Notifications router: unread-count, list, mark-read, mark-all-read
 """
+from sqlalchemy import event
+from sqlmodel import select
+
 from models import Account, Trip, Participant, Company, Notification
 from auth import get_password_hash, create_access_token
+from services.notification_service import notify_managers
 
 
 # ---------------------------------------------------------------------------
@@ -201,6 +205,45 @@ def test_mark_all_read(client, session):
     assert count_res.json()["count"] == 0
 
 
+def test_notify_managers_e_read_all_con_una_sola_istruzione(session):
+    company = make_company(session, name="FanOutCo")
+    for i in range(30):
+        make_account(session, email=f"mgr{i}@fanout.co", is_manager=True, company_id=company.id)
+    dipendente = make_account(session, email="dip@fanout.co", company_id=company.id)
+
+    statement = []
+    ascolta = lambda conn, cur, sql, *a: statement.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", ascolta)
+    notificati = notify_managers(session, company.id, "test", "T", "m", trip_id=None)
+    event.remove(session.get_bind(), "before_cursor_execute", ascolta)
+    session.commit()
+
+    assert len(notificati) == 30 and dipendente.id not in notificati
+    # Un INSERT per le notifiche e un UPDATE per i contatori non lette.
+    scritture = [s for s in statement if s.startswith(("INSERT", "UPDATE"))]
+    assert len(scritture) == 2
+    assert scritture[0].startswith("INSERT INTO notification")
+    assert scritture[1].startswith("UPDATE account SET unread_notifications")
+    righe = session.exec(select(Notification)).all()
+    assert len(righe) == 30 and all(not n.is_read and n.created_at for n in righe)
+
+
+def test_read_all_con_un_solo_update(client, session):
+    user = make_account(session, email="tante@test.com")
+    session.add_all(Notification(account_id=user.id, type="test", title="T", message="m") for _ in range(200))
+    session.commit()
+
+    statement = []
+    ascolta = lambda conn, cur, sql, *a: statement.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", ascolta)
+    res = client.post("/notifications/read-all", headers=auth(user))
+    event.remove(session.get_bind(), "before_cursor_execute", ascolta)
+
+    assert res.json()["marked"] == 200
+    scritture = [s for s in statement if s.startswith(("UPDATE notification", "SELECT notification"))]
+    assert len(scritture) == 1 and scritture[0].startswith("UPDATE notification")
+
+
 def test_cannot_read_others_notification(client, session):
     owner = make_account(session, email="owner_notif@test.com")
     other = make_account(session, email="other_notif@test.com")
@@ -5,10 +5,15 @@ Copertura:
 - POST /companies/{id}/invite-bulk: 200 con lista inviati per manager
 - POST /companies/{id}/invite-bulk: 403 per non-manager
 - POST /companies/{id}/invite-bulk: ignora email vuote/malformate
-- POST /companies/{id}/invite-bulk: rispetta il cap di 50 email
+- POST /companies/{id}/invite-bulk: oltre INVITE_BULK_MAX indirizzi risponde 400
+- POST /companies/{id}/invite-bulk/csv + GET .../invite-bulk/{job_id}: stato
+  per destinatario
 """
-from models import Account, Company
+from sqlmodel import select
+
+from models import Account, Company, EmailOutbox
 from auth import get_password_hash, create_access_token
+from routers import companies
 
 
 # ---------------------------------------------------------------------------
@@ -85,10 +90,11 @@ def test_bulk_invite_filters_invalid_emails(client, session):
     assert len(data["failed"]) >= 1  # notanemail e altri
 
 
-def test_bulk_invite_caps_at_50(client, session):
+def test_bulk_invite_cap(client, session, monkeypatch):
     company = make_company(session, "BulkCap")
     manager = make_account(session, email="mgr_cap@test.com", is_manager=True, company_id=company.id)
 
+    # Il vecchio tetto di 50 non c'e' piu'.
     emails = [f"user{i}@test.com" for i in range(60)]
     res = client.post(
         f"/companies/{company.id}/invite-bulk",
@@ -96,8 +102,15 @@ def test_bulk_invite_caps_at_50(client, session):
         headers=auth(manager),
     )
     assert res.status_code == 200
-    data = res.json()
-    assert data["sent"] <= 50
+    assert res.json()["sent"] == 60
+
+    monkeypatch.setattr(companies, "INVITE_BULK_MAX", 50)
+    res = client.post(
+        f"/companies/{company.id}/invite-bulk",
+        json={"emails": emails},
+        headers=auth(manager),
+    )
+    assert res.status_code == 400
 
 
 def test_bulk_invite_wrong_company_gets_403(client, session):
@@ -111,3 +124,62 @@ def test_bulk_invite_wrong_company_gets_403(client, session):
         headers=auth(manager_a),
     )
     assert res.status_code == 403
+
+
+def test_bulk_invite_csv_e_stato_per_destinatario(client, session):
+    company = make_company(session, "BulkCsv")
+    manager = make_account(session, email="mgr_csv@test.com", is_manager=True, company_id=company.id)
+
+    csv_file = "Nome;Email\nAnna;anna@test.com\nBruno;BRUNO@test.com\nCarla;non-valida\nAnna;anna@test.com\n"
+    res = client.post(
+        f"/companies/{company.id}/invite-bulk/csv",
+        files={"file": ("team.csv", csv_file.encode(), "text/csv")},
+        headers=auth(manager),
+    )
+    assert res.status_code == 200
+    data = res.json()
+    assert data["sent"] == 2  # duplicato rimosso
+    assert data["failed"] == ["non-valida"]
+
+    # Nessun worker nel test: si simula un rifiuto permanente per bruno,
+    # anna resta in coda (PENDING).
+    bruno = session.exec(select(EmailOutbox).where(EmailOutbox.recipient == "bruno@test.com")).one()
+    bruno.status, bruno.attempts, bruno.last_error = "FAILED", 1, "550 Utente inesistente"
+    session.add(bruno)
+    session.commit()
+
+    stato = client.get(f"/companies/{company.id}/invite-bulk/{data['job_id']}", headers=auth(manager)).json()
+    assert (stato["total"], stato["invalid"], stato["done"]) == (2, 1, False)
+    assert stato["counts"] == {"PENDING": 1, "FAILED": 1}
+    assert [r["email"] for r in stato["recipients"]] == ["anna@test.com", "bruno@test.com"]
+
+    falliti = client.get(
+        f"/companies/{company.id}/invite-bulk/{data['job_id']}",
+        params={"status": "FAILED"},
+        headers=auth(manager),
+    ).json()["recipients"]
+    assert falliti == [{"email": "bruno@test.com", "status": "FAILED", "attempts": 1, "error": "550 Utente inesistente"}]
+
+    pagina = client.get(
+        f"/companies/{company.id}/invite-bulk/{data['job_id']}", params={"limit": 1}, headers=auth(manager),
+    ).json()
+    seguente = client.get(
+        f"/companies/{company.id}/invite-bulk/{data['job_id']}",
+        params={"limit": 1, "cursor": pagina["next_cursor"]},
+        headers=auth(manager),
+    ).json()
+    assert [r["email"] for r in pagina["recipients"] + seguente["recipients"]] == ["anna@test.com", "bruno@test.com"]
+    assert seguente["next_cursor"] is None
+
+
+def test_bulk_invite_stato_di_altra_azienda_404(client, session):
+    company_a = make_company(session, "BulkJobA")
+    company_b = make_company(session, "BulkJobB")
+    manager_a = make_account(session, email="mgr_job_a@test.com", is_manager=True, company_id=company_a.id)
+    manager_b = make_account(session, email="mgr_job_b@test.com", is_manager=True, company_id=company_b.id)
+
+    job_id = client.post(
+        f"/companies/{company_a.id}/invite-bulk", json={"emails": ["x@test.com"]}, headers=auth(manager_a),
+    ).json()["job_id"]
+    res = client.get(f"/companies/{company_b.id}/invite-bulk/{job_id}", headers=auth(manager_b))
+    assert res.status_code == 404
@@ -0,0 +1,92 @@
+"""
+Test profiler opt-in e download dei profili da /admin/profiles.
+"""
+import asyncio
+import pstats
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import profiler
+
+ADMIN = {"X-Admin-Token": "segreto"}
+
+
+def _svuota(monkeypatch):
+    monkeypatch.setattr(profiler, "_profili", type(profiler._profili)(maxlen=5))
+
+
+def test_profilo_su_richiesta_e_download(monkeypatch, tmp_path):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    _svuota(monkeypatch)
+    client = TestClient(app)
+
+    assert client.get("/health", headers={**ADMIN, "X-Profile": "1"}).status_code == 200
+
+    elenco = client.get("/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert len(elenco) == 1
+    assert elenco[0]["route"] == "/health"
+    assert elenco[0]["reason"] == "header"
+
+    res = client.get(f"/admin/profiles/{elenco[0]['id']}", headers=ADMIN)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/octet-stream"
+    file_prof = tmp_path / "profilo.prof"
+    file_prof.write_bytes(res.content)
+    # Il file si apre con pstats come uno scritto da dump_stats().
+    assert pstats.Stats(str(file_prof)).total_calls > 0
+
+    testo = client.get(f"/admin/profiles/{elenco[0]['id']}?format=text", headers=ADMIN)
+    assert "cumulative" in testo.text
+
+
+def test_header_senza_token_valido_ignorato(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    _svuota(monkeypatch)
+    client = TestClient(app)
+
+    client.get("/health", headers={"X-Profile": "1", "X-Admin-Token": "sbagliato"})
+    client.get("/health", headers={"X-Profile": "1"})
+    assert profiler.elenco_profili() == []
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "sbagliato"}).status_code == 403
+
+
+def test_profilo_per_soglia_e_limite_memoria(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    _svuota(monkeypatch)
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_RATE", 1.0)
+    client = TestClient(app)
+
+    # Soglia altissima: profilata ma scartata.
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 10_000_000)
+    client.get("/health")
+    assert profiler.elenco_profili() == []
+
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 0.0001)
+    for _ in range(7):
+        client.get("/health")
+    profili = profiler.elenco_profili()
+    assert len(profili) == 5
+    assert all(p["reason"] == "slow" for p in profili)
+    assert client.get("/admin/profiles/999999", headers=ADMIN).status_code == 404
+
+
+def test_stream_sse_non_profilati(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "segreto")
+    _svuota(monkeypatch)
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 0.0001)
+
+    async def sse(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def invia(messaggio):
+        pass
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/stream/me", "root_path": "",
+        "headers": [(b"x-profile", b"1"), (b"x-admin-token", b"segreto")],
+    }
+    asyncio.run(profiler.ProfilingMiddleware(sse)(scope, None, invia))
+    assert profiler.elenco_profili() == []
@@ -0,0 +1,197 @@
+"""
+Test quote AI (services/quota_service): fallback su database, percorso Redis,
+write-back delle colonne e quota applicata sugli endpoint AI.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from auth import create_access_token
+from models import Account, Company, Participant, Trip
+from routers.trips import events
+from services import quota_service, redis_service
+from utils.access import check_company_limits
+
+
+def make_account(session, email, company_id=None, is_subscribed=False):
+    acc = Account(
+        name="Test", surname="User", email=email,
+        is_verified=True, company_id=company_id, is_subscribed=is_subscribed,
+    )
+    session.add(acc)
+    session.commit()
+    session.refresh(acc)
+    return acc
+
+
+def consuma(account, session):
+    asyncio.run(quota_service.consuma_chiamata_ai(account, session))
+
+
+def test_free_limite_giornaliero_su_db(session):
+    acc = make_account(session, "free@example.com")
+    for _ in range(quota_service.FREE_LIMIT):
+        consuma(acc, session)
+
+    with pytest.raises(HTTPException) as exc:
+        consuma(acc, session)
+    assert exc.value.status_code == 429
+
+    session.refresh(acc)
+    assert acc.daily_ai_usage == quota_service.FREE_LIMIT
+    assert acc.last_usage_reset == datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def test_pro_non_tracciato(session):
+    acc = make_account(session, "pro@example.com", is_subscribed=True)
+    for _ in range(quota_service.FREE_LIMIT + 5):
+        consuma(acc, session)
+    session.refresh(acc)
+    assert acc.daily_ai_usage == 0
+
+
+def test_b2b_cap_aziendale_su_una_riga(session):
+    company = Company(name="QuotaCo", max_ai_calls_per_month=3)
+    session.add(company)
+    session.commit()
+    a = make_account(session, "a@quota.co", company_id=company.id)
+    b = make_account(session, "b@quota.co", company_id=company.id)
+
+    consuma(a, session)
+    consuma(a, session)
+    consuma(b, session)
+    with pytest.raises(HTTPException) as exc:
+        consuma(b, session)
+    assert exc.value.status_code == 429
+
+    session.refresh(company)
+    session.refresh(a)
+    session.refresh(b)
+    assert company.monthly_ai_usage == 3
+    assert (a.monthly_ai_usage, b.monthly_ai_usage) == (2, 1)
+    # Il controllo preventivo legge la stessa colonna.
+    with pytest.raises(HTTPException):
+        check_company_limits(company, session, "ai_call")
+
+
+def test_eventi_rispettano_la_quota(client, session, monkeypatch):
+    class _GeminiVietato:
+        @property
+        def models(self):
+            raise AssertionError("Gemini chiamato oltre la quota")
+
+    monkeypatch.setattr(events, "ai_client", _GeminiVietato())
+    acc = make_account(session, "eventi@example.com")
+    acc.daily_ai_usage = quota_service.FREE_LIMIT
+    acc.last_usage_reset = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    trip = Trip(name="Eventi", trip_type="GROUP", destination="Roma")
+    session.add_all([acc, trip])
+    session.commit()
+    session.add(Participant(name="Test", trip_id=trip.id, account_id=acc.id))
+    session.commit()
+
+    res = client.get(
+        f"/trips/{trip.id}/events",
+        headers={"Authorization": f"Bearer {create_access_token({'sub': acc.email})}"},
+    )
+    assert res.status_code == 429
+
+
+class _RedisFinto:
+    """Registra gli script eseguiti e risponde con esiti preimpostati."""
+
+    def __init__(self, esito=(1, 0, 1)):
+        self.esito = list(esito)
+        self.chiamate = []
+        self.valori = {}
+        self.dirty = set()
+
+    async def evalsha(self, sha, n_chiavi, *argomenti):
+        self.chiamate.append((argomenti[:n_chiavi], argomenti[n_chiavi:]))
+        return self.esito
+
+    async def spop(self, chiave, quanti):
+        membri, self.dirty = list(self.dirty), set()
+        return membri
+
+    async def sadd(self, chiave, *membri):
+        self.dirty.update(membri)
+
+    async def mget(self, chiavi):
+        return [self.valori.get(c) for c in chiavi]
+
+
+def test_redis_un_solo_script_e_nessuna_scrittura_db(session, monkeypatch):
+    company = Company(name="RedisCo", max_ai_calls_per_month=50)
+    session.add(company)
+    session.commit()
+    acc = make_account(session, "r@redis.co", company_id=company.id)
+    finto = _RedisFinto(esito=(0, 2, 50))
+    monkeypatch.setattr(redis_service, "_redis_client", finto)
+
+    with pytest.raises(HTTPException) as exc:
+        consuma(acc, session)
+    assert exc.value.status_code == 429
+    assert "50/50" in exc.value.detail
+
+    chiavi, argomenti = finto.chiamate[0]
+    mese = datetime.now(timezone.utc).strftime("%Y-%m")
+    assert chiavi == (
+        f"quota:{{ai}}:a:{acc.id}:m:{mese}",
+        f"quota:{{ai}}:c:{company.id}:m:{mese}",
+        "quota:{ai}:dirty",
+    )
+    # ttl, limite, valore iniziale per ciascun contatore
+    assert argomenti[1:] == (35 * 86400, -1, 0, 35 * 86400, 50, 0)
+
+    session.refresh(company)
+    assert company.monthly_ai_usage == 0
+
+
+def test_write_back_non_scende_sotto_il_db(session, monkeypatch):
+    company = Company(name="SyncCo")
+    session.add(company)
+    session.commit()
+    giorno = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    mese = giorno[:7]
+    a = make_account(session, "a@sync.co", company_id=company.id)
+    b = make_account(session, "b@sync.co")
+    b.daily_ai_usage, b.last_usage_reset = 9, giorno
+    session.add(b)
+    session.commit()
+
+    finto = _RedisFinto()
+    finto.dirty = {str(a.id), str(b.id)}
+    finto.valori = {
+        f"quota:{{ai}}:a:{a.id}:m:{mese}": "4",
+        f"quota:{{ai}}:c:{company.id}:m:{mese}": "7",
+        # Piu' basso della colonna (chiamate contate dal fallback): si tiene 9.
+        f"quota:{{ai}}:a:{b.id}:d:{giorno}": "5",
+    }
+    monkeypatch.setattr(redis_service, "_redis_client", finto)
+
+    assert asyncio.run(quota_service.sincronizza_quote(session)) == {"accounts": 2, "companies": 1}
+    session.refresh(a)
+    session.refresh(b)
+    session.refresh(company)
+    assert (a.monthly_ai_usage, a.last_monthly_reset) == (4, mese)
+    assert company.monthly_ai_usage == 7
+    assert b.daily_ai_usage == 9
+
+
+def test_write_back_dal_cron(client, session, monkeypatch):
+    acc = make_account(session, "cron@sync.co")
+    mese = datetime.now(timezone.utc).strftime("%Y-%m")
+    finto = _RedisFinto()
+    finto.dirty = {str(acc.id)}
+    finto.valori = {f"quota:{{ai}}:a:{acc.id}:m:{mese}": "3"}
+    monkeypatch.setattr(redis_service, "_redis_client", finto)
+    monkeypatch.setenv("CRON_SECRET", "segreto-cron")
+
+    assert client.get("/cron/quotas-sync").status_code == 403
+    res = client.get("/cron/quotas-sync", headers={"Authorization": "Bearer segreto-cron"})
+    assert res.json() == {"accounts": 1, "companies": 0}
+    session.refresh(acc)
+    assert acc.monthly_ai_usage == 3
@@ -0,0 +1,67 @@
+"""
+Test rate limiter GCRA (services/redis_service) e fallback in-process.
+"""
+from routers import users
+from services import redis_service
+from services.redis_service import LimiterLocale, _gcra
+
+
+def test_gcra_niente_doppio_burst():
+    # 10 richieste ogni 100 s: il burst iniziale consuma tutto...
+    tat = None
+    for i in range(10):
+        esito, tat = _gcra(tat, 0.0, 10, 100)
+        assert not esito.superato
+        assert esito.rimanenti == 9 - i
+    esito, _ = _gcra(tat, 0.0, 10, 100)
+    assert esito.superato
+    assert esito.retry_after_s == 10
+    assert esito.reset_s == 100
+
+    # ...e dopo 10 s se ne ricarica una sola, non un'intera finestra.
+    esito, tat = _gcra(tat, 10.0, 10, 100)
+    assert not esito.superato and esito.rimanenti == 0
+    assert _gcra(tat, 10.0, 10, 100)[0].superato
+
+
+def test_limiter_locale_limitato_in_chiavi():
+    limiter = LimiterLocale(max_chiavi=3)
+    for i in range(5):
+        limiter.controlla(f"k{i}", 1, 60)
+    assert list(limiter._tat) == ["k2", "k3", "k4"]
+    assert limiter.controlla("k4", 1, 60).superato
+
+
+class _RedisGiu:
+    async def evalsha(self, *args):
+        raise ConnectionError("redis down")
+
+
+def test_redis_giu_usa_il_limiter_locale_con_retry_after(client, monkeypatch):
+    monkeypatch.setattr(redis_service, "_redis_client", _RedisGiu())
+    monkeypatch.setattr(redis_service, "_limiter_locale", LimiterLocale())
+    monkeypatch.setitem(users._RATE_LIMITS, "login", {"max": 2, "window": 900})
+    credenziali = {"email": "nessuno@example.com", "password": "Password1"}
+
+    for _ in range(2):
+        assert client.post("/users/login", json=credenziali).status_code != 429
+
+    res = client.post("/users/login", json=credenziali)
+    assert res.status_code == 429
+    # Una richiesta si ricarica ogni 900/2 s: Retry-After e' quello, non la finestra intera.
+    assert 449 <= int(res.headers["Retry-After"]) <= 450
+    assert res.headers["X-RateLimit-Remaining"] == "0"
+    assert redis_service._FALLBACK.valore(scope="login") >= 3
+
+
+def test_senza_redis_limiter_locale(client, monkeypatch):
+    monkeypatch.setattr(redis_service, "get_redis_client", lambda: None)
+    monkeypatch.setitem(users._RATE_LIMITS, "register", {"max": 1, "window": 3600})
+    prima = redis_service._FALLBACK.valore(scope="register")
+
+    dati = {"name": "A", "surname": "B", "email": "x@limite.it", "password": "Password1"}
+    assert client.post("/users/register", json=dati).status_code != 429
+    res = client.post("/users/register", json={**dati, "email": "y@limite.it"})
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) > 0
+    assert redis_service._FALLBACK.valore(scope="register") - prima == 2
@@ -0,0 +1,109 @@
+"""
+Test instradamento letture sulla replica (DATABASE_READ_URL).
+
+La replica e' simulata con un secondo file SQLite: primario e replica hanno lo
+stesso schema ma contenuti diversi, cosi' dal risultato di una query si capisce
+su quale database e' andata.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import database
+from auth import create_access_token, get_password_hash
+from database import ReadSession, get_session
+from main import app
+from models import Account, Company, Participant, Trip
+
+
+@pytest.fixture(name="engines")
+def engines_fixture(tmp_path, monkeypatch):
+    primario = create_engine(
+        f"sqlite:///{tmp_path / 'primario.db'}", connect_args={"check_same_thread": False}
+    )
+    replica = create_engine(
+        f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(primario)
+    SQLModel.metadata.create_all(replica)
+    monkeypatch.setattr(database, "engine", primario)
+    monkeypatch.setattr(database, "read_engine", replica)
+    yield primario, replica
+    primario.dispose()
+    replica.dispose()
+
+
+def _nomi_aziende(session):
+    return [c.name for c in session.exec(select(Company)).all()]
+
+
+def test_le_select_vanno_sulla_replica(engines):
+    primario, replica = engines
+    with Session(primario) as s:
+        s.add(Company(name="dal-primario"))
+        s.commit()
+    with Session(replica) as s:
+        s.add(Company(name="dalla-replica"))
+        s.commit()
+
+    with ReadSession() as s:
+        assert _nomi_aziende(s) == ["dalla-replica"]
+
+
+def test_dopo_una_scrittura_legge_dal_primario(engines):
+    primario, replica = engines
+    with Session(replica) as s:
+        s.add(Company(name="dalla-replica"))
+        s.commit()
+
+    with ReadSession() as s:
+        s.add(Company(name="appena-scritta"))
+        s.flush()
+        # La riga appena scritta non e' ancora sulla replica: la lettura
+        # successiva nella stessa sessione deve restare sul primario.
+        assert _nomi_aziende(s) == ["appena-scritta"]
+        s.commit()
+
+    with Session(primario) as s:
+        assert _nomi_aziende(s) == ["appena-scritta"]
+
+
+def test_business_overview_legge_dalla_replica(engines):
+    primario, replica = engines
+    company = Company(id=1, name="ReplicaCo")
+    manager = Account(
+        id=1, name="Man", surname="Ager", email="manager@replica.test",
+        hashed_password=get_password_hash("Password1"),
+        is_verified=True, is_manager=True, company_id=1,
+    )
+    # L'autenticazione passa dal primario, la dashboard dalla replica: il
+    # viaggio esiste solo sulla replica.
+    with Session(primario) as s:
+        s.add(Company(id=1, name="ReplicaCo"))
+        s.add(Account.model_validate(manager.model_dump()))
+        s.commit()
+    with Session(replica) as s:
+        s.add(company)
+        s.add(manager)
+        s.commit()
+        trip = Trip(name="Solo in replica", trip_type="GROUP", trip_intent="BUSINESS", company_id=1)
+        s.add(trip)
+        s.commit()
+        s.add(Participant(name="Man", trip_id=trip.id, account_id=1, is_organizer=True))
+        s.commit()
+
+    def primario_override():
+        with Session(primario) as s:
+            yield s
+
+    app.dependency_overrides[get_session] = primario_override
+    try:
+        res = TestClient(app).get(
+            "/trips/business-overview",
+            headers={"Authorization": f"Bearer {create_access_token({'sub': 'manager@replica.test'})}"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert res.status_code == 200
+    assert [t["name"] for t in res.json()["trips"]] == ["Solo in replica"]
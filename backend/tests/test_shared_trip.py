@@ -0,0 +1,82 @@
+"""
+Test GET /trips/share/{token} e GET /trips/{id}/participants: payload
+invariato e numero di query costante al crescere dei partecipanti.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from auth import create_access_token
+from models import Account, Expense, ItineraryItem, Participant, Photo, Proposal, Trip, Vote
+
+
+def _viaggio(session, n_partecipanti, token):
+    organizzatore = Account(name="Org", surname="X", email=f"org-{token}@example.com", is_verified=True)
+    session.add(organizzatore)
+    trip = Trip(name="Condiviso", trip_type="GROUP", share_token=token)
+    session.add(trip)
+    session.commit()
+    proposta = Proposal(trip_id=trip.id, destination="Lisbona", description="", price_estimate=0, image_url="")
+    session.add(proposta)
+
+    partecipanti = [
+        Participant(name=f"P{i}", trip_id=trip.id, account_id=organizzatore.id if i == 0 else None, is_organizer=i == 0)
+        for i in range(n_partecipanti)
+    ]
+    session.add_all(partecipanti)
+    session.commit()
+    # Votano i partecipanti con indice pari.
+    session.add_all(Vote(proposal_id=proposta.id, user_id=p.id) for p in partecipanti[::2])
+    session.add_all([
+        ItineraryItem(trip_id=trip.id, title="Cena", start_time="2026-05-01T20:00", type="FOOD"),
+        ItineraryItem(trip_id=trip.id, title="Museo", start_time="2026-05-01T10:00", type="CULTURE"),
+        Expense(trip_id=trip.id, payer_id=partecipanti[0].id, description="Taxi", amount=12.0, date="2026-05-01"),
+        Photo(trip_id=trip.id, url="https://example.com/1.jpg"),
+    ])
+    session.commit()
+    return trip, organizzatore
+
+
+@contextmanager
+def _conta_query(session):
+    query = []
+    ascolta = lambda conn, cur, sql, *a: query.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", ascolta)
+    try:
+        yield query
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", ascolta)
+
+
+def test_payload_condiviso(client, session):
+    _viaggio(session, 3, "tok-payload")
+    data = client.get("/trips/share/tok-payload").json()
+
+    assert data["trip"]["name"] == "Condiviso"
+    assert [i["title"] for i in data["itinerary"]] == ["Museo", "Cena"]
+    assert [e["description"] for e in data["expenses"]] == ["Taxi"]
+    assert len(data["photos"]) == 1
+    assert [(p["name"], p["has_voted"]) for p in data["participants"]] == [
+        ("P0", True), ("P1", False), ("P2", True),
+    ]
+    assert client.get("/trips/share/inesistente").status_code == 404
+
+
+def test_query_costanti_al_crescere_dei_partecipanti(client, session):
+    conteggi = {}
+    for n, token in ((2, "tok-pochi"), (25, "tok-tanti")):
+        trip, organizzatore = _viaggio(session, n, token)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': organizzatore.email})}"}
+        trip_id = trip.id
+        session.expunge_all()
+
+        with _conta_query(session) as condivisione:
+            assert len(client.get(f"/trips/share/{token}").json()["participants"]) == n
+        with _conta_query(session) as partecipanti:
+            res = client.get(f"/trips/{trip_id}/participants", headers=headers).json()
+        assert len(res) == n
+        assert sum(p["has_voted"] for p in res) == (n + 1) // 2
+        conteggi[n] = (len(condivisione), len(partecipanti))
+        session.expunge_all()
+
+    assert conteggi[2] == conteggi[25]
@@ -0,0 +1,49 @@
+"""
+Test regressione sul cold start: `import main` non deve caricare gli SDK pesanti
+e deve restare sotto un tetto di tempo.
+
+Il tetto e' volutamente largo (le macchine di CI sono lente e rumorose): serve a
+intercettare chi reintroduce un import da centinaia di millisecondi, non a
+misurare. Si puo' stringere con STARTUP_IMPORT_BUDGET_MS.
+"""
+import os
+
+from profile_imports import HEAVY_SDKS, misura_import, sdk_caricati, totale_ms
+from utils.lazy import LazyModule, LazyObject
+
+BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "4000"))
+
+
+def test_import_main_non_carica_sdk_pesanti_e_resta_nel_budget():
+    # Due misure, vale la migliore: la prima puo' pagare la cache del disco.
+    misure = [misura_import("main") for _ in range(2)]
+    migliore = min(misure, key=totale_ms)
+
+    assert sdk_caricati(migliore) == [], f"SDK importati all'avvio (usare utils/lazy.py): {HEAVY_SDKS}"
+    assert totale_ms(migliore) < BUDGET_MS
+
+
+def test_lazy_module_importa_al_primo_accesso():
+    caricati = []
+    modulo = LazyModule("colorsys", on_load=lambda m: caricati.append(m.__name__))
+    assert not modulo.caricato
+
+    assert modulo.rgb_to_hsv(1, 0, 0)[0] == 0
+    assert modulo.caricato
+    modulo.ONE_THIRD  # il secondo accesso non richiama on_load
+    assert caricati == ["colorsys"]
+
+
+def test_lazy_object_crea_una_volta_sola():
+    creati = []
+
+    def factory():
+        creati.append(1)
+        return {"a": 1}
+
+    oggetto = LazyObject(factory)
+    assert oggetto  # un proxy non ancora creato e' comunque "vero" (if not ai_client)
+    assert creati == []
+    assert oggetto.get("a") == 1
+    assert oggetto.keys() is not None
+    assert creati == [1]
@@ -0,0 +1,155 @@
+"""
+Test stream SSE e bus eventi: pubblicazione dopo il commit delle scritture,
+consegna in-process e via Redis pub/sub, endpoint /stream.
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from auth import create_access_token
+from models import Account, Expense, Notification, Participant, Trip
+from routers import stream
+from services.event_bus import BusEventi, bus, canale_account, canale_trip
+
+
+def _eventi_durante(canale, azione):
+    """Eventi ricevuti su `canale` mentre `azione` gira in un altro thread."""
+    async def main():
+        async with bus.iscrivi(canale) as iscrizione:
+            await asyncio.to_thread(azione)
+            await asyncio.sleep(0)
+            eventi = []
+            while not iscrizione.coda.empty():
+                eventi.append(iscrizione.coda.get_nowait())
+            return eventi
+    return asyncio.run(main())
+
+
+def _viaggio(session):
+    account = Account(name="Ada", surname="L", email="ada@stream.it", is_verified=True)
+    trip = Trip(name="Live", trip_type="GROUP")
+    session.add_all([account, trip])
+    session.commit()
+    partecipante = Participant(name="Ada", trip_id=trip.id, account_id=account.id, is_organizer=True)
+    session.add(partecipante)
+    session.commit()
+    return trip.id, account.id, partecipante.id
+
+
+def test_scritture_pubblicano_dopo_il_commit(session):
+    trip_id, account_id, partecipante_id = _viaggio(session)
+
+    def spesa():
+        session.add(Expense(trip_id=trip_id, payer_id=partecipante_id, description="Cena", amount=30, date="2026-05-01"))
+        session.commit()
+
+    eventi = _eventi_durante(canale_trip(trip_id), spesa)
+    assert [(e["type"], e["data"]["areas"]) for e in eventi] == [("trip.changed", ["expenses"])]
+
+    def notifica():
+        session.add(Notification(account_id=account_id, type="INFO", title="t", message="m"))
+        session.commit()
+
+    eventi = _eventi_durante(canale_account(account_id), notifica)
+    assert [e["type"] for e in eventi] == ["notifications.changed"]
+
+    def annullata():
+        session.add(Expense(trip_id=trip_id, payer_id=partecipante_id, description="X", amount=1, date="2026-05-01"))
+        session.flush()
+        session.rollback()
+
+    assert _eventi_durante(canale_trip(trip_id), annullata) == []
+
+
+class _PubSubFinto:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def subscribe(self, canale):
+        self.coda = asyncio.Queue()
+        self.redis.iscritti.append(self.coda)
+
+    async def get_message(self, timeout):
+        try:
+            return await asyncio.wait_for(self.coda.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        pass
+
+
+class _RedisFinto:
+    def __init__(self):
+        self.iscritti = []
+
+    def pubsub(self, **kwargs):
+        return _PubSubFinto(self)
+
+    async def publish(self, canale, messaggio):
+        for coda in self.iscritti:
+            coda.put_nowait({"type": "message", "data": messaggio})
+
+
+def test_modalita_redis_consegna_tramite_pubsub():
+    async def main():
+        locale = BusEventi()
+        redis = _RedisFinto()
+        await locale.avvia(redis)
+        await asyncio.sleep(0)
+        async with locale.iscrivi("trip:7") as iscrizione:
+            locale.pubblica("trip:7", "trip.changed", {"areas": ["votes"]})
+            evento = await asyncio.wait_for(iscrizione.coda.get(), 1)
+        await locale.ferma()
+        return evento, locale.distribuito
+
+    evento, distribuito = asyncio.run(main())
+    assert evento["data"] == {"areas": ["votes"]}
+    assert not distribuito
+
+
+@pytest.fixture
+def stream_brevi(monkeypatch):
+    monkeypatch.setattr(stream, "STREAM_MAX_SECONDS", 0.5)
+    monkeypatch.setattr(stream, "STREAM_HEARTBEAT_SECONDS", 0.1)
+
+
+def test_endpoint_sse(client, session, stream_brevi):
+    trip_id, _, _ = _viaggio(session)
+    token = create_access_token({"sub": "ada@stream.it"})
+
+    # Il TestClient restituisce la risposta solo a stream chiuso: l'evento
+    # arriva da un altro thread mentre lo stream e' aperto.
+    def pubblica_quando_iscritto():
+        while not bus.iscritti(canale_trip(trip_id)):
+            time.sleep(0.01)
+        bus.pubblica(canale_trip(trip_id), "trip.changed", {"areas": ["itinerary"]})
+
+    editore = threading.Thread(target=pubblica_quando_iscritto, daemon=True)
+    editore.start()
+    res = client.get(f"/stream/trips/{trip_id}", params={"access_token": token})
+    editore.join(1)
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    righe = res.text.splitlines()
+
+    assert righe[0] == "retry: 3000"
+    i = righe.index("event: trip.changed")
+    assert json.loads(righe[i + 1][len("data: "):]) == {"areas": ["itinerary"], "channel": f"trip:{trip_id}"}
+    assert ": ping" in righe
+
+
+def test_endpoint_sse_accesso(client, session, stream_brevi):
+    trip_id, _, _ = _viaggio(session)
+    session.add(Account(name="Eve", surname="X", email="eve@stream.it", is_verified=True))
+    session.commit()
+    estraneo = {"Authorization": f"Bearer {create_access_token({'sub': 'eve@stream.it'})}"}
+
+    assert client.get(f"/stream/trips/{trip_id}").status_code == 401
+    assert client.get(f"/stream/trips/{trip_id}", headers=estraneo).status_code == 403
+    res = client.get("/stream/me", headers=estraneo)
+    assert res.status_code == 200
+    assert "event: ready" in res.text
@@ -0,0 +1,93 @@
+"""
+Test middleware di timing, span e registro metriche.
+"""
+import asyncio
+import logging
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import timing
+from services.metrics import Registry
+from services.timing import REQUEST_DURATION, SPAN_DURATION, span
+
+
+def test_server_timing_con_span_db(client):
+    res = client.get("/health")
+    assert res.status_code == 200
+    header = res.headers["server-timing"]
+    assert header.startswith("db;dur=")
+    assert "total;dur=" in header
+
+
+def test_latenza_registrata_per_route_e_status(client):
+    prima = REQUEST_DURATION.riepilogo(method="GET", route="/trips/{trip_id}", status="401")["count"]
+    client.get("/trips/123")
+    client.get("/trips/456")
+    dopo = REQUEST_DURATION.riepilogo(method="GET", route="/trips/{trip_id}", status="401")["count"]
+    # Una sola serie per la route, non una per id.
+    assert dopo - prima == 2
+
+
+def test_span_context_manager_e_decoratore():
+    prima = SPAN_DURATION.riepilogo(span="test-stage")["count"]
+
+    with span("test-stage"):
+        pass
+
+    @span("test-stage")
+    def sincrona():
+        return 1
+
+    @span("test-stage")
+    async def asincrona():
+        return 2
+
+    assert sincrona() == 1
+    assert asyncio.run(asincrona()) == 2
+    assert SPAN_DURATION.riepilogo(span="test-stage")["count"] - prima == 3
+
+
+def test_log_richiesta_lenta(monkeypatch, caplog):
+    monkeypatch.setattr(timing, "SLOW_REQUEST_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="services.timing"):
+        TestClient(app).get("/")
+    assert any("[Timing] Richiesta lenta GET / 200" in r.message for r in caplog.records)
+
+
+def test_stream_sse_esclusi(monkeypatch, caplog):
+    async def sse(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": b"data: {}\n\n"})
+
+    async def ricevi():
+        return {"type": "http.disconnect"}
+
+    async def invia(messaggio):
+        pass
+
+    monkeypatch.setattr(timing, "SLOW_REQUEST_MS", 0)
+    middleware = timing.TimingMiddleware(sse)
+    prima = REQUEST_DURATION.riepilogo(method="GET", route="<unmatched>", status="200")["count"]
+    with caplog.at_level(logging.WARNING, logger="services.timing"):
+        # Dal path (anche dietro il root_path /api) e dal content-type.
+        for path, root_path in (("/stream/me", ""), ("/api/stream/trips/1", "/api"), ("/altro-sse", "")):
+            scope = {"type": "http", "method": "GET", "path": path, "root_path": root_path, "headers": []}
+            asyncio.run(middleware(scope, ricevi, invia))
+    assert REQUEST_DURATION.riepilogo(method="GET", route="<unmatched>", status="200")["count"] == prima
+    assert not any("[Timing]" in r.message for r in caplog.records)
+
+
+def test_registry_istogramma_e_etichette():
+    registro = Registry()
+    istogramma = registro.histogram("durata", "test", ["stage"], buckets=(0.1, 1.0))
+    istogramma.observe(0.05, stage="a")
+    istogramma.observe(0.5, stage="a")
+    istogramma.observe(5, stage="a")
+
+    riepilogo = istogramma.riepilogo(stage="a")
+    assert riepilogo["count"] == 3
+    assert riepilogo["buckets"] == {0.1: 1, 1.0: 2, float("inf"): 3}
+    # Stesso nome: stessa metrica, anche se dichiarata da un altro modulo.
+    assert registro.histogram("durata", "test", ["stage"]) is istogramma
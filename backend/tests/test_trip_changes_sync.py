@@ -0,0 +1,144 @@
+"""
+Test GET /trips/{id}/changes: istantanea iniziale, delta dal cursore
+(inserimenti, modifiche, cancellazioni anche massive, voti), paginazione e
+ripartenza con cursore potato.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+from sqlmodel import select
+
+from auth import create_access_token
+from models import Account, Expense, ItineraryItem, Participant, Photo, Proposal, Trip, TripChange
+from services import trip_changes, vote_tally
+
+
+def _viaggio(session):
+    account = Account(name="Lia", surname="R", email="lia@sync.it", is_verified=True)
+    trip = Trip(name="Offline", trip_type="GROUP")
+    session.add_all([account, trip])
+    session.commit()
+    partecipante = Participant(name="Lia", trip_id=trip.id, account_id=account.id, is_organizer=True)
+    session.add(partecipante)
+    session.add(ItineraryItem(trip_id=trip.id, title="Museo", start_time="2026-05-01T10:00", type="CULTURE"))
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'lia@sync.it'})}"}
+    return trip.id, partecipante.id, headers
+
+
+def _changes(client, trip_id, headers, **params):
+    res = client.get(f"/trips/{trip_id}/changes", params=params, headers=headers)
+    assert res.status_code == 200
+    return res.json()
+
+
+def test_istantanea_poi_solo_il_delta(client, session):
+    trip_id, partecipante_id, headers = _viaggio(session)
+
+    iniziale = _changes(client, trip_id, headers)
+    assert iniziale["reset"] is True
+    assert [i["title"] for i in iniziale["changes"]["itinerary"]["upserted"]] == ["Museo"]
+    assert len(iniziale["changes"]["participants"]["upserted"]) == 1
+    cursore = iniziale["cursor"]
+
+    assert _changes(client, trip_id, headers, since=cursore)["changes"] == {}
+
+    museo = session.exec(select(ItineraryItem)).one()
+    museo.title = "Museo Egizio"
+    spesa = Expense(trip_id=trip_id, payer_id=partecipante_id, description="Pranzo", amount=15, date="2026-05-01")
+    foto = Photo(trip_id=trip_id, url="https://example.com/a.jpg")
+    session.add_all([museo, spesa, foto])
+    session.commit()
+    foto_id = foto.id
+    session.delete(foto)
+    session.commit()
+
+    delta = _changes(client, trip_id, headers, since=cursore)
+    assert delta["reset"] is False
+    modifiche = delta["changes"]
+    assert [i["title"] for i in modifiche["itinerary"]["upserted"]] == ["Museo Egizio"]
+    assert [e["description"] for e in modifiche["expenses"]["upserted"]] == ["Pranzo"]
+    assert modifiche["photos"] == {"upserted": [], "deleted": [foto_id]}
+    assert "participants" not in modifiche
+
+
+def test_cancellazioni_massive_e_voti(client, session):
+    trip_id, partecipante_id, headers = _viaggio(session)
+    proposta = Proposal(trip_id=trip_id, destination="Bari", description="", price_estimate=0, image_url="")
+    session.add(proposta)
+    session.commit()
+    cursore = _changes(client, trip_id, headers)["cursor"]
+    museo_id = session.exec(select(ItineraryItem.id)).one()
+
+    trip_changes.cancella_in_blocco(session, trip_id, ItineraryItem, ItineraryItem.trip_id == trip_id)
+    session.commit()
+    vote_tally.registra_voto(session, proposta, partecipante_id, 2)
+
+    modifiche = _changes(client, trip_id, headers, since=cursore)["changes"]
+    assert modifiche["itinerary"] == {"upserted": [], "deleted": [museo_id]}
+    assert [(v["user_id"], v["score"]) for v in modifiche["votes"]["upserted"]] == [(partecipante_id, 2)]
+    # has_voted cambia con un UPDATE Core: arriva comunque nel delta.
+    assert [(p["id"], p["has_voted"]) for p in modifiche["participants"]["upserted"]] == [(partecipante_id, True)]
+    cursore = _changes(client, trip_id, headers, since=cursore)["cursor"]
+
+    vote_tally.azzera_votazione(session, trip_id)
+    session.commit()
+    modifiche = _changes(client, trip_id, headers, since=cursore)["changes"]
+    assert [(p["id"], p["has_voted"]) for p in modifiche["participants"]["upserted"]] == [(partecipante_id, False)]
+    assert len(modifiche["votes"]["deleted"]) == 1
+
+
+def test_registro_dopo_il_lock_sul_viaggio(session):
+    # L'UPDATE della versione (lock sulla riga del viaggio) precede l'INSERT
+    # nel registro: l'id di TripChange e' preso gia' in fila con gli altri
+    # scrittori dello stesso viaggio.
+    trip_id, partecipante_id, _ = _viaggio(session)
+    proposta = Proposal(trip_id=trip_id, destination="Bari", description="", price_estimate=0, image_url="")
+    session.add(proposta)
+    session.commit()
+    istruzioni = []
+
+    def annota(conn, cursor, statement, *_):
+        istruzioni.append(" ".join(statement.split()).lower())
+
+    motore = session.get_bind()
+    event.listen(motore, "before_cursor_execute", annota)
+    try:
+        vote_tally.registra_voto(session, proposta, partecipante_id, 1)
+        trip_changes.cancella_in_blocco(session, trip_id, ItineraryItem, ItineraryItem.trip_id == trip_id)
+        session.commit()
+    finally:
+        event.remove(motore, "before_cursor_execute", annota)
+
+    for inizio in (0, max(i for i, s in enumerate(istruzioni) if s.startswith("delete from itineraryitem"))):
+        resto = istruzioni[inizio:]
+        versione = next(i for i, s in enumerate(resto) if s.startswith("update trip set version"))
+        registro = next(i for i, s in enumerate(resto) if s.startswith("insert into tripchange"))
+        assert versione < registro
+
+
+def test_paginazione_e_cursore_potato(client, session, monkeypatch):
+    trip_id, partecipante_id, headers = _viaggio(session)
+    cursore = _changes(client, trip_id, headers)["cursor"]
+    for i in range(5):
+        session.add(Expense(trip_id=trip_id, payer_id=partecipante_id, description=f"S{i}", amount=1, date="2026-05-01"))
+        session.commit()
+
+    viste, pagina = [], {"has_more": True, "cursor": cursore}
+    while pagina["has_more"]:
+        pagina = _changes(client, trip_id, headers, since=pagina["cursor"], limit=2)
+        viste += [e["description"] for e in pagina["changes"].get("expenses", {}).get("upserted", [])]
+    assert viste == [f"S{i}" for i in range(5)]
+
+    # Il registro viene potato: chi era rimasto indietro riparte dallo stato completo.
+    for voce in session.exec(select(TripChange)).all():
+        voce.created_at = datetime.now(timezone.utc) - timedelta(days=60)
+        session.add(voce)
+    session.commit()
+    monkeypatch.setenv("CRON_SECRET", "segreto-cron")
+    potato = client.get("/cron/trip-changes-prune", headers={"Authorization": "Bearer segreto-cron"})
+    assert potato.json()["deleted"] > 0
+    assert _changes(client, trip_id, headers, since=cursore)["reset"] is True
+    assert _changes(client, trip_id, headers, since=pagina["cursor"])["reset"] is False
+
+    assert client.get(f"/trips/{trip_id}/changes", params={"since": "rotto"}, headers=headers).status_code == 400
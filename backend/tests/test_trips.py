@@ -78,3 +78,50 @@ def test_get_trips(client, session):
     assert data["total"] == 1
     assert len(data["trips"]) == 1
     assert data["trips"][0]["name"] == "Old Trip"
+
+
+def test_my_trips_cursore_e_proiezione_summary(client, session):
+    from auth import create_access_token
+
+    account = Account(name="C", surname="D", email="cursor@example.com", is_verified=True)
+    altro = Account(name="E", surname="F", email="altro@example.com", is_verified=True)
+    session.add(account)
+    session.add(altro)
+    session.commit()
+    for i in range(5):
+        trip = Trip(name=f"Trip {i}", trip_type="GROUP", events_cache="[" + "x" * 1000 + "]")
+        session.add(trip)
+        session.commit()
+        session.add(Participant(name="C", trip_id=trip.id, account_id=account.id))
+        if i == 2:
+            # Riga duplicata: il viaggio deve comparire comunque una volta sola.
+            session.add(Participant(name="C bis", trip_id=trip.id, account_id=account.id))
+        if i == 4:
+            session.add(Participant(name="C", trip_id=trip.id, account_id=account.id, is_active=False))
+    estraneo = Trip(name="Non mio", trip_type="GROUP")
+    session.add(estraneo)
+    session.commit()
+    session.add(Participant(name="E", trip_id=estraneo.id, account_id=altro.id))
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': account.email})}"}
+
+    nomi, cursor, pagine = [], None, 0
+    while True:
+        params = {"limit": 2, "fields": "summary", **({"cursor": cursor} if cursor else {})}
+        data = client.get("/trips/my-trips", params=params, headers=headers).json()
+        if pagine == 0:
+            assert data["total"] == 5
+        for t in data["trips"]:
+            assert "events_cache" not in t
+            assert set(t) >= {"id", "name", "destination", "start_date", "end_date", "status"}
+        nomi += [t["name"] for t in data["trips"]]
+        pagine += 1
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert nomi == [f"Trip {i}" for i in reversed(range(5))]
+    assert pagine == 3
+
+    completo = client.get("/trips/my-trips", params={"limit": 1}, headers=headers).json()
+    assert completo["trips"][0]["events_cache"] == "[" + "x" * 1000 + "]"
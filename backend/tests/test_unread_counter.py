@@ -0,0 +1,208 @@
+"""
+Test contatore notifiche non lette: colonna aggiornata da inserimenti,
+letture e cancellazioni (anche massive), endpoint senza COUNT, copia in
+Redis dopo il commit, riconciliazione.
+"""
+import asyncio
+
+from sqlalchemy import event, update
+from sqlmodel import select
+
+from auth import create_access_token
+from models import Account, Company, Notification, Trip
+from services import unread_counter
+from services.event_bus import bus, canale_account
+from services.notification_service import create_notification, notify_managers
+
+
+def _eventi_durante(canale, azione):
+    async def main():
+        async with bus.iscrivi(canale) as iscrizione:
+            await asyncio.to_thread(azione)
+            await asyncio.sleep(0)
+            eventi = []
+            while not iscrizione.coda.empty():
+                eventi.append(iscrizione.coda.get_nowait())
+            return eventi
+    return asyncio.run(main())
+
+
+def _account(session, email, **campi):
+    account = Account(name="N", surname="C", email=email, is_verified=True, **campi)
+    session.add(account)
+    session.commit()
+    return account
+
+
+def _auth(email):
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+
+def _contatore(session, account_id):
+    return session.exec(select(Account.unread_notifications).where(Account.id == account_id)).one()
+
+
+def test_contatore_segue_scritture_e_letture(client, session):
+    company = Company(name="Contatori")
+    session.add(company)
+    session.commit()
+    manager = _account(session, "mgr@unread.it", is_manager=True, company_id=company.id)
+    for i in range(3):
+        create_notification(session, manager.id, "INFO", f"t{i}", "m")
+    notify_managers(session, company.id, "INFO", "t", "m")
+    session.commit()
+    assert _contatore(session, manager.id) == 4
+
+    statement = []
+    ascolta = lambda conn, cur, sql, *a: statement.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", ascolta)
+    res = client.get("/notifications/unread-count", headers=_auth("mgr@unread.it"))
+    event.remove(session.get_bind(), "before_cursor_execute", ascolta)
+    assert res.json() == {"count": 4}
+    assert not any("FROM notification" in s for s in statement)
+
+    prima = session.exec(select(Notification.id)).first()
+    client.post(f"/notifications/{prima}/read", headers=_auth("mgr@unread.it"))
+    assert client.get("/notifications/unread-count", headers=_auth("mgr@unread.it")).json() == {"count": 3}
+    client.post("/notifications/read-all", headers=_auth("mgr@unread.it"))
+    assert client.get("/notifications/unread-count", headers=_auth("mgr@unread.it")).json() == {"count": 0}
+
+    # Cancellazione massiva (eliminazione di un viaggio): scala solo le non lette.
+    trip = Trip(name="Da cancellare", trip_type="GROUP")
+    session.add(trip)
+    session.commit()
+    create_notification(session, manager.id, "INFO", "t", "m", trip_id=trip.id)
+    create_notification(session, manager.id, "INFO", "t", "m", trip_id=trip.id)
+    session.commit()
+    assert _contatore(session, manager.id) == 2
+    assert unread_counter.cancella(session, Notification.trip_id == trip.id) == 2
+    session.commit()
+    assert _contatore(session, manager.id) == 0
+
+
+def test_segna_tutte_con_notifica_concorrente(client, session):
+    account = _account(session, "race@unread.it")
+    create_notification(session, account.id, "INFO", "t", "m")
+    create_notification(session, account.id, "INFO", "t", "m")
+    session.commit()
+    # Notifica di un'altra transazione: il contatore e' gia' salito ma la
+    # riga non e' fra quelle che l'UPDATE di read-all vede.
+    session.execute(
+        update(Account).where(Account.id == account.id)
+        .values(unread_notifications=Account.unread_notifications + 1)
+    )
+    session.commit()
+
+    res = client.post("/notifications/read-all", headers=_auth("race@unread.it"))
+    assert res.json() == {"marked": 2}
+    assert _contatore(session, account.id) == 1
+
+
+def test_evento_stream_porta_il_contatore(session):
+    account = _account(session, "ev@unread.it")
+    account_id = account.id
+
+    def notifica():
+        create_notification(session, account_id, "INFO", "t", "m")
+        session.commit()
+
+    eventi = _eventi_durante(canale_account(account_id), notifica)
+    assert [(e["type"], e["data"]) for e in eventi] == [("notifications.changed", {"unread": 1})]
+
+
+def test_riconciliazione(session):
+    account = _account(session, "drift@unread.it")
+    create_notification(session, account.id, "INFO", "t", "m")
+    session.commit()
+    # Scrittura che aggira gli hook: il contatore resta indietro.
+    session.execute(update(Notification).values(is_read=True))
+    session.commit()
+    assert _contatore(session, account.id) == 1
+
+    assert unread_counter.riconcilia(session) == {"fixed": 1}
+    assert _contatore(session, account.id) == 0
+    assert unread_counter.riconcilia(session) == {"fixed": 0}
+
+
+def test_riconciliazione_dal_cron(client, session, monkeypatch):
+    account = _account(session, "cron@unread.it")
+    session.execute(update(Account).where(Account.id == account.id).values(unread_notifications=4))
+    session.commit()
+    monkeypatch.setenv("CRON_SECRET", "segreto-cron")
+
+    assert client.get("/cron/notifications-reconcile").status_code == 403
+    res = client.get("/cron/notifications-reconcile", headers={"Authorization": "Bearer segreto-cron"})
+    assert res.json() == {"fixed": 1}
+    assert _contatore(session, account.id) == 0
+
+
+class _PipelineFinta:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, chiave, valore, ex=None):
+        self.redis.valori[chiave] = str(valore)
+
+    async def execute(self):
+        pass
+
+
+class _RedisFinto:
+    def __init__(self):
+        self.valori = {}
+
+    async def get(self, chiave):
+        return self.valori.get(chiave)
+
+    async def set(self, chiave, valore, ex=None, nx=False):
+        if nx and chiave in self.valori:
+            return None
+        self.valori[chiave] = str(valore)
+
+    def pipeline(self, transaction=True):
+        return _PipelineFinta(self)
+
+
+def test_copia_redis_dopo_il_commit(session):
+    account = _account(session, "redis@unread.it")
+    account_id = account.id
+    redis = _RedisFinto()
+
+    async def main():
+        unread_counter.avvia(redis)
+        try:
+            # Chiave assente: risponde la colonna e la chiave viene popolata.
+            assert await unread_counter.leggi(account) == 0
+            assert redis.valori[f"notif:unread:{account_id}"] == "0"
+
+            def notifica():
+                create_notification(session, account_id, "INFO", "t", "m")
+                create_notification(session, account_id, "INFO", "t", "m")
+                session.commit()
+
+            await asyncio.to_thread(notifica)
+            await asyncio.sleep(0.05)
+            assert redis.valori[f"notif:unread:{account_id}"] == "2"
+
+            # La lettura viene da Redis anche con la colonna in memoria vecchia.
+            assert await unread_counter.leggi(Account(id=account_id, name="N", surname="C", email="x")) == 2
+
+            # SET del COMMIT arrivato fra GET e ripopolamento: il valore
+            # vecchio dell'account non lo sovrascrive.
+            async def get_in_ritardo(chiave):
+                redis.valori[chiave] = "3"
+                return None
+
+            redis.get = get_in_ritardo
+            assert await unread_counter.leggi(Account(id=account_id, name="N", surname="C", email="x")) == 0
+            assert redis.valori[f"notif:unread:{account_id}"] == "3"
+        finally:
+            unread_counter.ferma()
+
+    asyncio.run(main())
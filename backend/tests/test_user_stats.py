@@ -0,0 +1,85 @@
+"""
+Test GET /trips/stats: aggregati SQL e invalidazione della cache per account.
+"""
+from datetime import datetime, timezone
+
+from auth import create_access_token
+from models import Account, Expense, Participant, Trip
+from services.stats_service import _CACHE_STATS
+
+
+def _data(giorno):
+    return datetime(2026, 3, giorno, 10, 0, tzinfo=timezone.utc)
+
+
+def _setup(session):
+    io = Account(name="Io", surname="X", email="stats@example.com", is_verified=True)
+    amico = Account(name="Amico", surname="Y", email="amico@example.com", is_verified=True)
+    session.add(io)
+    session.add(amico)
+    session.commit()
+
+    roma = Trip(name="Roma", trip_type="GROUP", destination="Roma", status="COMPLETED",
+                start_date=_data(1), end_date=_data(4), num_people=2,
+                transport_cost=100.0, hotel_cost=300.0)
+    parigi = Trip(name="Parigi", trip_type="GROUP", destination="", real_destination="Parigi",
+                  status="COMPLETED", start_date=_data(10), end_date=_data(10), num_people=0)
+    bozza = Trip(name="Bozza", trip_type="GROUP", status="PLANNING")
+    session.add_all([roma, parigi, bozza])
+    session.commit()
+
+    mio_roma = Participant(name="Io", trip_id=roma.id, account_id=io.id)
+    session.add_all([
+        mio_roma,
+        Participant(name="Io", trip_id=parigi.id, account_id=io.id),
+        Participant(name="Io", trip_id=bozza.id, account_id=io.id),
+        Participant(name="Amico", trip_id=roma.id, account_id=amico.id),
+    ])
+    session.commit()
+    session.add(Expense(trip_id=roma.id, payer_id=mio_roma.id, description="Cena", amount=50.0, date="2026-03-02"))
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': io.email})}"}
+    return roma, mio_roma, headers
+
+
+def test_statistiche_aggregate(client, session):
+    _setup(session)
+    res = client.get("/trips/stats", headers={"Authorization": f"Bearer {create_access_token({'sub': 'stats@example.com'})}"})
+    assert res.status_code == 200
+    assert res.json() == {
+        "total_trips": 3,
+        "completed_trips": 2,
+        # 50 di spese + (100 + 300) / 2 di trasporto e hotel
+        "total_spent": 250.0,
+        # Roma 1-4 marzo (4 giorni) + Parigi in giornata (1)
+        "total_days": 5,
+        "unique_cities": 2,
+        "cities_list": ["Parigi", "Roma"],
+    }
+
+
+def test_cache_invalidata_da_spese_e_viaggi(client, session):
+    roma, mio_roma, headers = _setup(session)
+
+    prima_hit = _CACHE_STATS.valore(result="hit")
+    assert client.get("/trips/stats", headers=headers).json()["total_spent"] == 250.0
+    assert client.get("/trips/stats", headers=headers).json()["total_spent"] == 250.0
+    assert _CACHE_STATS.valore(result="hit") - prima_hit == 1
+
+    session.add(Expense(trip_id=roma.id, payer_id=mio_roma.id, description="Museo", amount=20.0, date="2026-03-03"))
+    session.commit()
+    assert client.get("/trips/stats", headers=headers).json()["total_spent"] == 270.0
+
+    roma.hotel_cost = 500.0
+    session.add(roma)
+    session.commit()
+    assert client.get("/trips/stats", headers=headers).json()["total_spent"] == 370.0
+
+    # Un rollback non invalida nulla (e non ci sono scritture da vedere).
+    prima_hit = _CACHE_STATS.valore(result="hit")
+    roma.hotel_cost = 0.0
+    session.add(roma)
+    session.flush()
+    session.rollback()
+    assert client.get("/trips/stats", headers=headers).json()["total_spent"] == 370.0
+    assert _CACHE_STATS.valore(result="hit") - prima_hit == 1
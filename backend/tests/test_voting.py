@@ -0,0 +1,100 @@
+"""
+Test votazione: punteggi e votanti incrementali, chiusura unica della
+votazione e mail di conferma accodata una sola volta.
+"""
+from sqlmodel import Session, select
+
+from auth import create_access_token
+from models import Account, EmailOutbox, Participant, Proposal, Trip, Vote
+from services import vote_tally
+
+
+def _conferme(session):
+    return session.exec(select(EmailOutbox).where(EmailOutbox.kind == "vote_confirmation")).all()
+
+
+def _viaggio(session, n=3):
+    organizzatore = Account(name="Org", surname="X", email="org@voto.it", is_verified=True)
+    session.add(organizzatore)
+    trip = Trip(name="Gita", trip_type="GROUP", num_people=n, status="VOTING")
+    session.add(trip)
+    session.commit()
+    proposte = [
+        Proposal(trip_id=trip.id, destination=d, description="", price_estimate=100, image_url="")
+        for d in ("Lisbona", "Praga")
+    ]
+    partecipanti = [
+        Participant(name=f"P{i}", trip_id=trip.id, is_organizer=i == 0,
+                    account_id=organizzatore.id if i == 0 else None)
+        for i in range(n)
+    ]
+    session.add_all(proposte + partecipanti)
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': organizzatore.email})}"}
+    return trip, proposte, partecipanti, headers
+
+
+def _vota(client, headers, proposta, partecipante, score=1):
+    res = client.post(
+        f"/trips/vote/{proposta.id}",
+        params={"score": score, "user_id": partecipante.id},
+        headers=headers,
+    )
+    assert res.status_code == 200
+    return res.json()
+
+
+def test_conteggi_incrementali_e_consenso(client, session):
+    trip, (lisbona, praga), (p0, p1, p2), headers = _viaggio(session)
+
+    assert _vota(client, headers, lisbona, p0)["current_voters"] == 1
+    # Cambiare voto o votare un'altra proposta non conta un nuovo votante.
+    assert _vota(client, headers, lisbona, p0, score=2)["current_voters"] == 1
+    assert _vota(client, headers, praga, p0)["current_voters"] == 1
+    assert _vota(client, headers, praga, p1, score=3)["trip_status"] == "VOTING"
+    assert _conferme(session) == []
+
+    finale = _vota(client, headers, lisbona, p2)
+    assert finale == {
+        "status": "voted", "current_voters": 3, "required": 3,
+        "trip_status": "BOOKED", "votes_count": 3,
+    }
+    session.expire_all()
+    assert (lisbona.vote_score, praga.vote_score) == (3, 4)
+    assert session.get(Trip, trip.id).winning_proposal_id == praga.id
+    conferme = _conferme(session)
+    assert [m.recipient for m in conferme] == ["org@voto.it"]
+    assert "Praga" in conferme[0].html and conferme[0].status == "PENDING"
+
+    # Voti successivi alla chiusura non rieleggono ne' rimandano la mail.
+    _vota(client, headers, lisbona, p1, score=5)
+    assert session.get(Trip, trip.id).winning_proposal_id == praga.id
+    assert len(_conferme(session)) == 1
+    assert len(session.exec(select(Vote)).all()) == 5
+
+
+def test_chiusura_concorrente_una_sola_volta(session):
+    trip, (lisbona, _), partecipanti, _ = _viaggio(session, n=2)
+    for p in partecipanti:
+        vote_tally.registra_voto(session, lisbona, p.id, 1)
+
+    # Due richieste che hanno letto entrambe il viaggio prima della chiusura.
+    with Session(session.get_bind()) as altra:
+        trip_altra = altra.get(Trip, trip.id)
+        assert vote_tally.chiudi_votazione(session, session.get(Trip, trip.id)).id == lisbona.id
+        assert vote_tally.chiudi_votazione(altra, trip_altra) is None
+        assert trip_altra.status == "BOOKED"
+
+
+def test_azzera_votazione(session):
+    trip, (lisbona, _), partecipanti, _ = _viaggio(session, n=2)
+    for p in partecipanti:
+        vote_tally.registra_voto(session, lisbona, p.id, 1)
+    vote_tally.chiudi_votazione(session, trip)
+
+    vote_tally.azzera_votazione(session, trip.id)
+    session.commit()
+    session.expire_all()
+    assert (trip.voters_count, trip.winning_proposal_id) == (0, None)
+    assert not any(p.has_voted for p in partecipanti)
+    assert session.exec(select(Vote)).all() == []
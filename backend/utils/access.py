@@ -131,16 +131,12 @@ def check_company_limits(company: Company, session: Session, action: str):
             )
 
     elif action == "ai_call":
-        # Conta le chiamate AI di questo mese per la company (somma monthly_ai_usage dei membri)
-        company_members = session.exec(
-            select(Account).where(Account.company_id == company.id)
-        ).all()
-
+        # Contatore mensile aziendale (services/quota_service): lettura O(1).
+        # Il percorso delle chiamate AI lo controlla e incrementa in modo
+        # atomico; qui resta per i controlli preventivi.
         current_month = datetime.now(timezone.utc).strftime("%Y-%m")
-        total_this_month = sum(
-            m.monthly_ai_usage
-            for m in company_members
-            if m.last_monthly_reset == current_month
+        total_this_month = (
+            company.monthly_ai_usage if company.last_monthly_reset == current_month else 0
         )
 
         if total_this_month >= company.max_ai_calls_per_month:
@@ -0,0 +1,96 @@
+"""
+GET condizionali (ETag / Last-Modified) per le letture dei dati di viaggio.
+
+Trip.version e Trip.updated_at cambiano a ogni scrittura sul viaggio o sui
+suoi dati (services/trip_changes), quindi bastano a dire se una risposta gia'
+in mano al client e' ancora buona senza rieseguire le query del payload:
+
+    @router.get("/{trip_id}/expenses")
+    async def get_expenses(..., condizionale: RichiestaCondizionale = Depends(richiesta_condizionale)):
+        check_participant(trip_id, current_user, session)   # prima i permessi
+        condizionale.verifica_viaggio(session, trip_id, "expenses")   # 304 qui
+        return ...query pesanti...
+
+verifica_viaggio() fa una sola SELECT (id, version, updated_at): se il client
+ha gia' la versione corrente solleva un 304 senza corpo, altrimenti aggiunge
+ETag e Last-Modified alla risposta. Va chiamata dopo il controllo di accesso,
+cosi' un 304 non dice nulla a chi non puo' leggere.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlmodel import Session, select
+
+from models import Trip
+
+# Da cambiare quando cambia la forma delle risposte: invalida gli ETag gia'
+# in mano ai client dopo un deploy.
+ETAG_SCHEMA = "1"
+
+
+def _utc(momento: Optional[datetime]) -> Optional[datetime]:
+    if momento is None:
+        return None
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return momento.replace(microsecond=0)
+
+
+def etag_corrisponde(if_none_match: str, etag: str) -> bool:
+    """Confronto debole (RFC 9110 13.1.2) di If-None-Match: W/"x" e "x" coincidono."""
+    candidati = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in candidati or etag.removeprefix("W/") in candidati
+
+
+class RichiestaCondizionale:
+    def __init__(self, request: Request, response: Response):
+        self.request = request
+        self.response = response
+
+    def _corrisponde(self, etag: str, ultima_modifica: Optional[datetime]) -> bool:
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_corrisponde(if_none_match, etag)
+        if_modified_since = self.request.headers.get("if-modified-since")
+        if if_modified_since and ultima_modifica is not None:
+            try:
+                return ultima_modifica <= _utc(parsedate_to_datetime(if_modified_since))
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def verifica(self, tag: str, ultima_modifica: Optional[datetime] = None) -> None:
+        """304 se il client ha gia' `tag`, altrimenti imposta gli header di validazione."""
+        etag = f'W/"{ETAG_SCHEMA}-{tag}"'
+        ultima_modifica = _utc(ultima_modifica)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if ultima_modifica is not None:
+            headers["Last-Modified"] = format_datetime(ultima_modifica, usegmt=True)
+        if self._corrisponde(etag, ultima_modifica):
+            raise HTTPException(status_code=304, headers=headers)
+        self.response.headers.update(headers)
+
+    def verifica_viaggio(self, session: Session, trip_id: int, risorsa: str) -> None:
+        riga = session.exec(
+            select(Trip.version, Trip.updated_at).where(Trip.id == trip_id)
+        ).first()
+        if riga is None:
+            return
+        versione, ultima_modifica = riga
+        self.verifica(f"{risorsa}-{trip_id}-{versione}", ultima_modifica)
+
+    def verifica_condivisione(self, session: Session, token: str) -> None:
+        riga = session.exec(
+            select(Trip.id, Trip.version, Trip.updated_at).where(Trip.share_token == token)
+        ).first()
+        if riga is None:
+            return
+        trip_id, versione, ultima_modifica = riga
+        self.verifica(f"share-{trip_id}-{versione}", ultima_modifica)
+
+
+def richiesta_condizionale(request: Request, response: Response) -> RichiestaCondizionale:
+    return RichiestaCondizionale(request, response)
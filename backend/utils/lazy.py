@@ -0,0 +1,94 @@
+"""
+Import differiti per gli SDK pesanti (google-genai, stripe, supabase, ortools, ...).
+
+Su Vercel ogni cold start importa main.py e quindi tutti i router: se ogni
+router importa il proprio SDK in testa al file, anche /health paga centinaia
+di millisecondi di import che non usera' mai. Con LazyModule il modulo vero
+viene importato solo al primo accesso a un suo attributo:
+
+    genai = LazyModule("google.genai")
+    ...
+    genai.Client(api_key=...)   # qui, e solo qui, parte l'import
+
+Per gli oggetti costosi da costruire (es. il client Gemini) c'e' LazyObject,
+che chiama la factory al primo uso e poi si comporta come l'oggetto creato.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """Proxy di un modulo, importato al primo accesso a un attributo.
+
+    on_load riceve il modulo appena importato: serve per la configurazione che
+    prima stava subito dopo l'import (es. stripe.api_key).
+    """
+
+    def __init__(self, nome: str, on_load=None):
+        object.__setattr__(self, "_nome", nome)
+        object.__setattr__(self, "_on_load", on_load)
+        object.__setattr__(self, "_modulo", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _carica(self):
+        modulo = self._modulo
+        if modulo is None:
+            with self._lock:
+                modulo = self._modulo
+                if modulo is None:
+                    modulo = importlib.import_module(self._nome)
+                    if self._on_load:
+                        self._on_load(modulo)
+                    object.__setattr__(self, "_modulo", modulo)
+        return modulo
+
+    @property
+    def caricato(self) -> bool:
+        return self._modulo is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._carica(), attr)
+
+    def __setattr__(self, attr, valore):
+        setattr(self._carica(), attr, valore)
+
+    def __delattr__(self, attr):
+        delattr(self._carica(), attr)
+
+    def __dir__(self):
+        return dir(self._carica())
+
+    def __repr__(self):
+        stato = "caricato" if self.caricato else "non ancora importato"
+        return f"<LazyModule {self._nome!r} ({stato})>"
+
+
+class LazyObject:
+    """Proxy di un oggetto creato da factory() al primo accesso a un attributo."""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_oggetto", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _carica(self):
+        oggetto = self._oggetto
+        if oggetto is None:
+            with self._lock:
+                oggetto = self._oggetto
+                if oggetto is None:
+                    oggetto = self._factory()
+                    object.__setattr__(self, "_oggetto", oggetto)
+        return oggetto
+
+    def __getattr__(self, attr):
+        return getattr(self._carica(), attr)
+
+    def __setattr__(self, attr, valore):
+        setattr(self._carica(), attr, valore)
+
+    def __repr__(self):
+        if self._oggetto is None:
+            return "<LazyObject (non ancora creato)>"
+        return repr(self._oggetto)
@@ -0,0 +1,44 @@
+"""
+Paginazione keyset (seek) con cursori opachi.
+
+Il cursore contiene i valori delle colonne di ordinamento dell'ultima riga
+restituita; la pagina successiva parte da `(col1, col2, ..., id) > valori`.
+Al contrario di OFFSET il costo non cresce con la pagina e nessuna riga
+salta o si ripete se nel frattempo ne vengono inserite altre.
+"""
+
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def codifica_cursore(valori: Sequence[Any]) -> str:
+    grezzo = json.dumps(list(valori), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(grezzo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodifica_cursore(cursore: Optional[str], n_valori: int) -> Optional[List[Any]]:
+    """Valori del cursore, None se assente. 400 se malformato o di un altro ordinamento."""
+    if not cursore:
+        return None
+    try:
+        riempimento = "=" * (-len(cursore) % 4)
+        valori = json.loads(base64.urlsafe_b64decode(cursore + riempimento))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore di paginazione non valido.")
+    if not isinstance(valori, list) or len(valori) != n_valori:
+        raise HTTPException(status_code=400, detail="Cursore di paginazione non valido.")
+    return valori
+
+
+def dopo_cursore(colonne: Sequence, valori: Sequence[Any], discendente: bool = False):
+    """Condizione WHERE per le righe successive al cursore nell'ordinamento dato."""
+    riga = tuple_(*colonne)
+    return riga < tuple_(*valori) if discendente else riga > tuple_(*valori)
+
+
+def ordinamento(colonne: Sequence, discendente: bool = False) -> list:
+    return [c.desc() if discendente else c.asc() for c in colonne]
@@ -529,8 +529,10 @@ export const exportTripPDF = async (tripId) => {
     document.body.removeChild(a);
 };
 
-export const getUserTrips = async (skip = 0, limit = 20) => {
-    const response = await safeApiFetch(`${API_URL}/trips/my-trips?skip=${skip}&limit=${limit}`, {
+export const getUserTrips = async (cursor = null, limit = 20) => {
+    const params = new URLSearchParams({ limit, fields: "summary" });
+    if (cursor) params.set("cursor", cursor);
+    const response = await safeApiFetch(`${API_URL}/trips/my-trips?${params}`, {
         headers: getAuthHeaders()
     });
     return handleResponse(response);
@@ -855,6 +857,28 @@ export const getUnreadCount = async () => {
     return handleResponse(response);
 };
 
+// Stream SSE (/stream/...): `onEvent(tipo, dati)` riceve "ready" a ogni
+// (ri)connessione e poi gli eventi del canale. Restituisce la funzione che
+// chiude lo stream, oppure null se il browser non supporta EventSource
+// (in quel caso il chiamante resta sul polling).
+const STREAM_EVENTS = ['ready', 'resync', 'trip.changed', 'trips.changed', 'notifications.changed'];
+
+const subscribeStream = (path, onEvent) => {
+    const token = localStorage.getItem('token');
+    if (typeof EventSource === 'undefined' || !token) return null;
+    const source = new EventSource(`${API_URL}${path}?access_token=${encodeURIComponent(token)}`);
+    STREAM_EVENTS.forEach(tipo => source.addEventListener(tipo, (e) => {
+        let dati = {};
+        try { dati = JSON.parse(e.data); } catch (_) {}
+        onEvent(tipo, dati);
+    }));
+    return () => source.close();
+};
+
+export const subscribeTripEvents = (tripId, onEvent) => subscribeStream(`/stream/trips/${tripId}`, onEvent);
+
+export const subscribeAccountEvents = (onEvent) => subscribeStream('/stream/me', onEvent);
+
 export const getNotifications = async () => {
     const response = await safeApiFetch(`${API_URL}/notifications`, {
         headers: getAuthHeaders()
@@ -885,6 +909,18 @@ export const getCompanyDashboardData = async (companyId) => {
     return handleResponse(response);
 };
 
+export const getCompanyMembers = async (companyId, { cursor, q, sort, limit } = {}) => {
+    const params = new URLSearchParams();
+    if (cursor) params.set("cursor", cursor);
+    if (q) params.set("q", q);
+    if (sort) params.set("sort", sort);
+    if (limit) params.set("limit", limit);
+    const response = await safeApiFetch(`${API_URL}/companies/${companyId}/members?${params}`, {
+        headers: getAuthHeaders()
+    });
+    return handleResponse(response);
+};
+
 export const getInviteToken = async () => {
     const response = await safeApiFetch(`${API_URL}/companies/invite-token`, {
         headers: getAuthHeaders()
@@ -69,19 +69,42 @@ const Navbar = ({ user: propUser }) => {
         return () => document.removeEventListener('mousedown', handleClickOutside);
     }, [showUserMenu, showNotifications]);
 
-    // Polling notifiche ogni 30s (solo se loggato)
+    // Contatore notifiche: ricaricato dagli eventi dello stream dell'account,
+    // polling ogni 30s solo se lo stream non e' disponibile (solo se loggato)
     useEffect(() => {
         if (!user) return;
+        let api;
+        let interval;
+        let closeStream;
+        let cancelled = false;
         const fetchCount = async () => {
             try {
-                const api = await import('../api');
                 const data = await api.getUnreadCount();
                 setUnreadCount(data.count ?? 0);
             } catch (_) {}
         };
-        fetchCount();
-        const interval = setInterval(fetchCount, 30000);
-        return () => clearInterval(interval);
+        import('../api').then((mod) => {
+            if (cancelled) return;
+            api = mod;
+            closeStream = api.subscribeAccountEvents((tipo, dati) => {
+                if (tipo === 'trips.changed') return;
+                // L'evento porta gia' il nuovo contatore quando il server lo conosce
+                if (tipo === 'notifications.changed' && typeof dati.unread === 'number') {
+                    setUnreadCount(dati.unread);
+                } else {
+                    fetchCount();
+                }
+            });
+            if (!closeStream) {
+                fetchCount();
+                interval = setInterval(fetchCount, 30000);
+            }
+        });
+        return () => {
+            cancelled = true;
+            clearInterval(interval);
+            if (closeStream) closeStream();
+        };
     }, [user]);
 
     const handleOpenNotifications = async () => {
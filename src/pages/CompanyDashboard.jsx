@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getBusinessOverview, approveTrip, rejectTrip, getInviteToken, exportCompanyExpensesCSV, bulkInviteMembers, getCompanyDashboardData, updateCompanySettings } from '../api';
+import { getBusinessOverview, approveTrip, rejectTrip, getInviteToken, exportCompanyExpensesCSV, bulkInviteMembers, getCompanyDashboardData, getCompanyMembers, updateCompanySettings } from '../api';
 import { useToast } from '../context/ToastContext';
 import { motion } from 'framer-motion';
 import { CheckCircle2, XCircle, Clock, Briefcase, Users, MapPin, Calendar, TrendingUp, ExternalLink, Link2, Copy } from 'lucide-react';
@@ -32,7 +32,11 @@ const CompanyDashboard = () => {
     const [analytics, setAnalytics] = useState(null);
     const [totalMembers, setTotalMembers] = useState(1);
     const [members, setMembers] = useState([]);
+    const [membersCursor, setMembersCursor] = useState(null);
+    const [membersLoading, setMembersLoading] = useState(false);
     const [memberSearch, setMemberSearch] = useState('');
+    // Ultima ricerca membri partita: le risposte di ricerche superate si scartano.
+    const membersQuery = useRef(0);
     const [activeSection, setActiveSection] = useState('trips'); // 'trips' | 'members' | 'settings'
     const [settingsForm, setSettingsForm] = useState({ max_budget_per_trip: '', billing_email: '', vat_number: '', billing_address: '' });
     const [settingsSaving, setSettingsSaving] = useState(false);
@@ -73,7 +77,12 @@ const CompanyDashboard = () => {
                 try {
                     const companyData = await getCompanyDashboardData(currentUser.company_id);
                     setTotalMembers(companyData.total_members ?? 1);
-                    setMembers(companyData.members || []);
+                    // La dashboard porta la prima pagina: le altre solo con "Carica altri"
+                    // o cercando (q lato server).
+                    if (!memberSearch.trim()) {
+                        setMembers(companyData.members || []);
+                        setMembersCursor(companyData.members_next_cursor || null);
+                    }
                     setSettingsForm({
                         max_budget_per_trip: companyData.max_budget_per_trip ?? '',
                         billing_email: companyData.billing_email ?? '',
@@ -99,6 +108,37 @@ const CompanyDashboard = () => {
         fetchData();
     }, []);
 
+    const loadMembers = async ({ reset }) => {
+        if (!user?.company_id) return;
+        const query = ++membersQuery.current;
+        setMembersLoading(true);
+        try {
+            const page = await getCompanyMembers(user.company_id, {
+                q: memberSearch.trim() || undefined,
+                cursor: reset ? undefined : membersCursor,
+            });
+            if (query !== membersQuery.current) return;
+            setMembers(prev => (reset ? page.members || [] : prev.concat(page.members || [])));
+            setMembersCursor(page.next_cursor || null);
+        } catch (err) {
+            if (query === membersQuery.current) showToast('Errore caricamento membri: ' + err.message, 'error');
+        } finally {
+            if (query === membersQuery.current) setMembersLoading(false);
+        }
+    };
+
+    // Ricerca lato server (q) con un piccolo debounce: la lista non e' mai
+    // tutta in memoria, quindi non si filtra sul client.
+    const searchStarted = useRef(false);
+    useEffect(() => {
+        if (!searchStarted.current) {
+            searchStarted.current = true;
+            return;
+        }
+        const timer = setTimeout(() => loadMembers({ reset: true }), 300);
+        return () => clearTimeout(timer);
+    }, [memberSearch]);
+
     const handleApprove = async (tripId) => {
         setProcessingId(tripId);
         try {
@@ -182,7 +222,7 @@ const CompanyDashboard = () => {
         setBulkLoading(true);
         try {
             const res = await bulkInviteMembers(user?.company_id, emails);
-            showToast(`Inviti inviati: ${res.sent}${res.failed?.length ? `, falliti: ${res.failed.length}` : ''}`, 'success');
+            showToast(`Inviti in invio: ${res.sent}${res.failed?.length ? `, indirizzi non validi: ${res.failed.length}` : ''}`, 'success');
             setBulkModal(false);
             setBulkEmails('');
         } catch (err) {
@@ -529,7 +569,7 @@ const CompanyDashboard = () => {
                             />
                         </div>
 
-                        {members.length === 0 ? (
+                        {members.length === 0 && !memberSearch.trim() ? (
                             <div className="text-center py-20 text-[var(--text-muted)]">
                                 <Users className="w-10 h-10 mx-auto mb-4 opacity-30" />
                                 <p className="text-sm font-bold uppercase tracking-widest">Nessun membro trovato</p>
@@ -537,14 +577,6 @@ const CompanyDashboard = () => {
                         ) : (
                             <div className="space-y-2">
                                 {members
-                                    .filter(m => {
-                                        const q = memberSearch.trim().toLowerCase();
-                                        if (!q) return true;
-                                        return (
-                                            `${m.name} ${m.surname}`.toLowerCase().includes(q) ||
-                                            m.email.toLowerCase().includes(q)
-                                        );
-                                    })
                                     .map(m => (
                                         <div
                                             key={m.id}
@@ -570,12 +602,21 @@ const CompanyDashboard = () => {
                                         </div>
                                     ))
                                 }
-                                {memberSearch && members.filter(m => {
-                                    const q = memberSearch.trim().toLowerCase();
-                                    return `${m.name} ${m.surname}`.toLowerCase().includes(q) || m.email.toLowerCase().includes(q);
-                                }).length === 0 && (
+                                {memberSearch.trim() && members.length === 0 && !membersLoading && (
                                     <p className="text-center text-[var(--text-muted)] text-sm py-10">Nessun membro corrisponde alla ricerca.</p>
                                 )}
+                                {membersCursor && (
+                                    <div className="flex justify-center pt-4">
+                                        <Button
+                                            variant="outline"
+                                            onClick={() => loadMembers({ reset: false })}
+                                            disabled={membersLoading}
+                                            className="text-[10px] font-black uppercase tracking-widest"
+                                        >
+                                            {membersLoading ? 'Caricamento...' : 'Carica altri'}
+                                        </Button>
+                                    </div>
+                                )}
                             </div>
                         )}
                     </motion.div>
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, lazy, Suspense, useCallback } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getTrip, generateProposals, getItinerary, optimizeItinerary, generateShareLink, getProposals, getParticipants, resetHotel, unlockTrip, exportTripPDF, completeTrip, getRouteGeometry, exportNotaSpese, exportExpenseReportPDF } from '../api';
+import { getTrip, generateProposals, getItinerary, optimizeItinerary, generateShareLink, getProposals, getParticipants, resetHotel, unlockTrip, exportTripPDF, completeTrip, getRouteGeometry, exportNotaSpese, exportExpenseReportPDF, subscribeTripEvents } from '../api';
 import { useToast } from '../context/ToastContext';
 import { useModal } from '../context/ModalContext';
 import { Sparkles, Lock, CheckCircle2, FileDown, Map as MapIcon, Wallet, Camera, X, CalendarDays, Share2, ChevronRight, UserPlus } from 'lucide-react';
@@ -162,14 +162,22 @@ const Dashboard = () => {
     useEffect(() => {
         let interval;
         if (trip?.status === 'VOTING') {
-            interval = setInterval(async () => {
+            const checkStatus = async () => {
                 try {
                     const data = await getTrip(id);
                     if (data.status !== 'VOTING') fetchTrip();
                 } catch (e) {
                     console.error("Polling error", e);
                 }
-            }, 5000);
+            };
+            // Con lo stream del viaggio si controlla solo quando arriva un voto
+            // o cambia il viaggio; senza EventSource resta il polling.
+            const closeStream = subscribeTripEvents(id, (tipo, dati) => {
+                const aree = dati.areas || [];
+                if (tipo !== 'trip.changed' || aree.includes('trip') || aree.includes('votes')) checkStatus();
+            });
+            if (closeStream) return closeStream;
+            interval = setInterval(checkStatus, 5000);
         }
         return () => clearInterval(interval);
     }, [trip?.status, id]);
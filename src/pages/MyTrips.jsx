@@ -16,7 +16,7 @@ const MyTrips = () => {
 
     const [trips, setTrips] = useState([]);
     const [totalTrips, setTotalTrips] = useState(0);
-    const [skip, setSkip] = useState(0);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loadingMore, setLoadingMore] = useState(false);
     const [stats, setStats] = useState(null);
     const [loading, setLoading] = useState(true);
@@ -32,12 +32,12 @@ const MyTrips = () => {
         setLoading(true);
         try {
             const [tripsData, statsData] = await Promise.all([
-                getUserTrips(0, PAGE_LIMIT),
+                getUserTrips(null, PAGE_LIMIT),
                 getUserStats()
             ]);
             setTrips(tripsData.trips);
             setTotalTrips(tripsData.total);
-            setSkip(PAGE_LIMIT);
+            setNextCursor(tripsData.next_cursor);
             setStats(statsData);
         } catch (error) {
             console.error("Error fetching data:", error);
@@ -50,9 +50,9 @@ const MyTrips = () => {
     const loadMore = async () => {
         setLoadingMore(true);
         try {
-            const data = await getUserTrips(skip, PAGE_LIMIT);
+            const data = await getUserTrips(nextCursor, PAGE_LIMIT);
             setTrips(prev => [...prev, ...data.trips]);
-            setSkip(prev => prev + PAGE_LIMIT);
+            setNextCursor(data.next_cursor);
         } catch (error) {
             showToast("Errore nel caricamento: " + error.message, "error");
         } finally {
@@ -370,7 +370,7 @@ const MyTrips = () => {
                         </motion.div>
 
                         {/* Load More */}
-                        {trips.length < totalTrips && !searchQuery && typeFilter === 'ALL' && statusFilter === 'ALL' && (
+                        {nextCursor && !searchQuery && typeFilter === 'ALL' && statusFilter === 'ALL' && (
                             <div className="mt-10 text-center">
                                 <button
                                     onClick={loadMore}